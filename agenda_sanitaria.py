@@ -0,0 +1,138 @@
+"""
+Agenda sanitária: doses a vencer e vencidas por produto, lote e área.
+
+Cada animal pode ter vários registros do mesmo produto; só o mais recente
+define a próxima dose (uma aplicação nova substitui a data prevista da
+anterior, e um registro sem `data_proxima` encerra o esquema). A agenda é
+montada em uma única consulta com `row_number()` por animal, tipo e produto,
+restrita pelo índice de `data_proxima` aos animais com alguma dose no
+período, e agrupada em memória por lote ou área.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from app import db
+from models import Animal, Area, Lote, RegistroSanitario
+
+# Horizonte padrão da agenda, em dias
+DIAS_AGENDA_PADRAO = 30
+
+# Agrupamentos disponíveis: nome -> (coluna do id, coluna do nome)
+AGRUPAMENTOS_AGENDA = {'lote': ('lote_id', 'lote'), 'area': ('area_id', 'area')}
+
+
+def consultar_agenda(fim, inicio=None, tipo=None, produto=None, lote_id=None, area_id=None, propriedade_id=None):
+    """
+    Doses previstas até `fim` considerando só o último registro de cada animal e produto
+
+    Args:
+        fim (date): Último dia da agenda
+        inicio (date): Primeiro dia; sem início inclui todas as doses vencidas
+        tipo (str): Tipo de registro (vacinação, vermifugação...)
+        produto (str): Produto aplicado
+        lote_id, area_id, propriedade_id (int): Restringem os animais
+
+    Returns:
+        list: Linhas ordenadas por data_proxima, com dados do animal, lote e área
+    """
+    filtros = [Animal.status == 'Ativo']
+    if tipo:
+        filtros.append(RegistroSanitario.tipo == tipo)
+    if produto:
+        filtros.append(RegistroSanitario.produto == produto)
+    if lote_id is not None:
+        filtros.append(Animal.lote_id == lote_id)
+    if area_id is not None:
+        filtros.append(Animal.area_id == area_id)
+    if propriedade_id is not None:
+        filtros.append(Animal.propriedade_id == propriedade_id)
+
+    # Só animais com alguma dose prevista até o fim do período (índice de data_proxima)
+    com_dose = select(RegistroSanitario.animal_id).where(RegistroSanitario.data_proxima <= fim)
+    if inicio is not None:
+        com_dose = com_dose.where(RegistroSanitario.data_proxima >= inicio)
+
+    ultimos = (
+        select(
+            RegistroSanitario.id, RegistroSanitario.animal_id, RegistroSanitario.tipo,
+            RegistroSanitario.produto, RegistroSanitario.dose, RegistroSanitario.unidade_dose,
+            RegistroSanitario.data_aplicacao, RegistroSanitario.data_proxima,
+            Animal.codigo, Animal.nome, Animal.lote_id, Animal.area_id,
+            func.row_number().over(
+                partition_by=(RegistroSanitario.animal_id, RegistroSanitario.tipo, RegistroSanitario.produto),
+                order_by=(RegistroSanitario.data_aplicacao.desc(), RegistroSanitario.id.desc())
+            ).label('ordem')
+        )
+        .join(Animal, RegistroSanitario.animal_id == Animal.id)
+        .where(RegistroSanitario.animal_id.in_(com_dose), *filtros)
+        .subquery()
+    )
+
+    consulta = (
+        select(ultimos, Lote.nome.label('lote'), Area.nome.label('area'))
+        .outerjoin(Lote, ultimos.c.lote_id == Lote.id)
+        .outerjoin(Area, ultimos.c.area_id == Area.id)
+        .where(ultimos.c.ordem == 1, ultimos.c.data_proxima <= fim)
+        .order_by(ultimos.c.data_proxima, ultimos.c.codigo)
+    )
+    if inicio is not None:
+        consulta = consulta.where(ultimos.c.data_proxima >= inicio)
+    return db.session.execute(consulta).all()
+
+
+def agrupar_agenda(linhas, agrupamento='lote', hoje=None):
+    """
+    Agrupa a agenda por lote ou área, com totais por produto
+
+    Args:
+        linhas (list): Resultado de `consultar_agenda`
+        agrupamento (str): Chave de `AGRUPAMENTOS_AGENDA`
+        hoje (date): Referência para doses vencidas (padrão: hoje)
+
+    Returns:
+        list: Grupos com animais, vencidas, a vencer e dose total por produto
+        e unidade (doses de um produto em unidades diferentes não são somadas)
+    """
+    hoje = hoje or datetime.now().date()
+    coluna_id, coluna_nome = AGRUPAMENTOS_AGENDA[agrupamento]
+    grupos = {}
+
+    for linha in linhas:
+        chave = getattr(linha, coluna_id)
+        grupo = grupos.setdefault(chave, {
+            f'{agrupamento}_id': chave,
+            'nome': getattr(linha, coluna_nome),
+            'vencidas': 0,
+            'a_vencer': 0,
+            'produtos': {},
+            'animais': []
+        })
+        vencida = linha.data_proxima < hoje
+        grupo['vencidas' if vencida else 'a_vencer'] += 1
+
+        nome_produto = linha.produto or linha.tipo
+        produto = grupo['produtos'].setdefault((nome_produto, linha.unidade_dose), {
+            'tipo': linha.tipo, 'animais': 0, 'dose_total': 0.0, 'unidade_dose': linha.unidade_dose
+        })
+        produto['animais'] += 1
+        produto['dose_total'] += linha.dose or 0
+
+        grupo['animais'].append({
+            'animal_id': linha.animal_id,
+            'codigo': linha.codigo,
+            'nome': linha.nome,
+            'tipo': linha.tipo,
+            'produto': linha.produto,
+            'dose': linha.dose,
+            'unidade_dose': linha.unidade_dose,
+            'ultima_aplicacao': linha.data_aplicacao.isoformat() if linha.data_aplicacao else None,
+            'data_proxima': linha.data_proxima.isoformat(),
+            'vencida': vencida
+        })
+
+    for grupo in grupos.values():
+        grupo['produtos'] = [dict(produto=nome, **dados) for (nome, _), dados in grupo['produtos'].items()]
+    return list(grupos.values())
+
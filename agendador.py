@@ -0,0 +1,146 @@
+"""
+Agendador de tarefas periódicas em segundo plano.
+
+As tarefas rodam em uma thread daemon dentro do processo web, cada execução
+com seu próprio contexto de aplicação. Com workers gevent o laço do agendador
+é uma greenlet e cada execução vai para uma thread nativa
+(`threads_nativas`), para que tarefas que usam CPU não travem as conexões do
+worker. Com vários workers do gunicorn apenas
+um deles executa as tarefas: a liderança é decidida por um lock de arquivo
+(`AGENDADOR_LOCK`), que outro worker assume se o líder encerrar.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from threads_nativas import executar_em_thread
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem eleição de líder
+    fcntl = None
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+
+class Tarefa:
+    """Tarefa periódica registrada no agendador"""
+
+    def __init__(self, nome, intervalo, funcao):
+        self.nome = nome
+        self.intervalo = intervalo
+        self.funcao = funcao
+        self.proxima_execucao = time.monotonic() + intervalo
+        self.ultima_execucao = None
+        self.ultimo_erro = None
+
+
+class Agendador:
+    """
+    Executa funções em intervalos fixos (em segundos).
+
+    As tarefas podem ser registradas antes ou depois de `iniciar()`.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.tarefas = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._parar = threading.Event()
+        self._arquivo_lock = None
+
+    def agendar(self, nome, intervalo, funcao):
+        """
+        Registra (ou substitui) uma tarefa periódica
+
+        Args:
+            nome (str): Identificador único da tarefa
+            intervalo (float): Intervalo entre execuções, em segundos
+            funcao (callable): Função sem argumentos a executar
+        """
+        with self._lock:
+            self.tarefas[nome] = Tarefa(nome, intervalo, funcao)
+        logger.info(f"Tarefa agendada: {nome} (a cada {intervalo}s)")
+
+    def cancelar(self, nome):
+        """Remove uma tarefa agendada"""
+        with self._lock:
+            self.tarefas.pop(nome, None)
+
+    def _obter_lideranca(self):
+        if fcntl is None:
+            return True
+        if self._arquivo_lock is not None:
+            return True
+
+        caminho = self.app.config.get('AGENDADOR_LOCK')
+        arquivo = open(caminho, 'a')
+        try:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            arquivo.close()
+            return False
+
+        self._arquivo_lock = arquivo
+        logger.info(f"Agendador ativo no processo {os.getpid()}")
+        return True
+
+    def executar(self, tarefa):
+        """Executa uma tarefa dentro do contexto da aplicação"""
+        from app import db
+
+        with self.app.app_context():
+            try:
+                tarefa.funcao()
+                tarefa.ultimo_erro = None
+            except Exception as e:
+                db.session.rollback()
+                tarefa.ultimo_erro = str(e)
+                logger.error(f"Erro na tarefa agendada {tarefa.nome}: {str(e)}", exc_info=True)
+            finally:
+                tarefa.ultima_execucao = time.time()
+
+    def _laco(self):
+        while not self._parar.wait(1):
+            if not self._obter_lideranca():
+                # Outro worker é o líder; tentar novamente mais tarde
+                self._parar.wait(30)
+                continue
+
+            agora = time.monotonic()
+            with self._lock:
+                pendentes = [t for t in self.tarefas.values() if t.proxima_execucao <= agora]
+
+            for tarefa in pendentes:
+                executar_em_thread(self.executar, tarefa)
+                tarefa.proxima_execucao = time.monotonic() + tarefa.intervalo
+
+    def iniciar(self, app):
+        """Inicia a thread do agendador (uma vez por processo)"""
+        self.app = app
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._laco, name='agendador', daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+
+# Instância única do agendador por processo
+agendador = Agendador()
+
+
+def init_app(app):
+    app.config.setdefault(
+        'AGENDADOR_LOCK', os.path.join(tempfile.gettempdir(), 'farmgestor-agendador.lock')
+    )
+    if not app.config.get('AGENDADOR_ATIVO', True):
+        logger.info("Agendador de tarefas desativado")
+        return
+    agendador.iniciar(app)
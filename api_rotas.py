@@ -10,10 +10,12 @@ from datetime import datetime
 from flask import Blueprint, request, jsonify
 from app import db
 from models import (
-    Propriedade, Animal, HistoricoLocalizacao, RegistroPeso, 
-    BalancaDigital, EstacaoMeteorologica, LeituraMeteorologica
+    Propriedade, Animal, RegistroPeso, 
+    BalancaDigital, EstacaoMeteorologica
 )
 from lora_communication import process_lora_message
+from ingestao import registrar_posicoes
+from leituras_estacoes import registrar_leitura_estacao
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
@@ -75,31 +77,16 @@ def receber_localizacao_lora():
         if not propriedade:
             return jsonify({"erro": "Token de API inválido"}), 401
         
-        # Buscar o animal pelo ID do dispositivo
-        animal = Animal.query.filter_by(id_dispositivo=data['id']).first()
-        if not animal:
+        # Atualizar localização do animal e registrar no histórico
+        animais, _ = registrar_posicoes([{
+            'device_id': data['id'],
+            'latitude': data['lat'],
+            'longitude': data['lon'],
+            'bateria': data.get('bat')
+        }])
+        if not animais:
             return jsonify({"erro": f"Dispositivo não encontrado: {data['id']}"}), 404
-        
-        # Atualizar localização do animal
-        animal.ultima_latitude = data['lat']
-        animal.ultima_longitude = data['lon']
-        animal.ultima_atualizacao = datetime.now()
-        
-        # Atualizar bateria, se fornecida
-        if 'bat' in data:
-            animal.bateria = data['bat']
-        
-        # Registrar no histórico
-        historico = HistoricoLocalizacao(
-            animal_id=animal.id,
-            device_id=data['id'],
-            latitude=data['lat'],
-            longitude=data['lon'],
-            bateria=data.get('bat')
-        )
-        
-        db.session.add(historico)
-        db.session.commit()
+        animal = animais[0]
         
         logger.info(f"Localização recebida via API para animal {animal.codigo}: lat={data['lat']}, lon={data['lon']}")
         
@@ -150,39 +137,79 @@ def receber_localizacao_lora_get():
         if not propriedade:
             return jsonify({"erro": "Token de API inválido"}), 401
         
-        # Buscar o animal pelo ID do dispositivo
-        animal = Animal.query.filter_by(id_dispositivo=device_id).first()
-        if not animal:
+        # Atualizar localização do animal e registrar no histórico
+        animais, _ = registrar_posicoes([{
+            'device_id': device_id,
+            'latitude': latitude,
+            'longitude': longitude,
+            'bateria': bateria
+        }])
+        if not animais:
             return jsonify({"erro": f"Dispositivo não encontrado: {device_id}"}), 404
+        animal = animais[0]
         
-        # Atualizar localização do animal
-        animal.ultima_latitude = latitude
-        animal.ultima_longitude = longitude
-        animal.ultima_atualizacao = datetime.now()
+        logger.info(f"Localização recebida via API GET para animal {animal.codigo}: lat={latitude}, lon={longitude}")
         
-        # Atualizar bateria, se fornecida
-        if bateria is not None:
-            animal.bateria = bateria
+        return jsonify({"status": "sucesso", "animal": animal.codigo})
+    
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao processar localização LoRa via GET: {str(e)}")
+        return jsonify({"erro": str(e)}), 500
+
+@api_bp.route('/lora/localizacao/lote', methods=['POST'])
+def receber_localizacoes_lora_lote():
+    """
+    Endpoint para receber um lote de posições de vários dispositivos LoRa
+    (ex.: encaminhadas pelo gateway) em uma única transação.
+    
+    Formato esperado:
+    {
+        "tkn": "TOKEN_API",
+        "posicoes": [
+            {"id": "ID_DISPOSITIVO", "lat": LATITUDE, "lon": LONGITUDE, "bat": BATERIA (opcional)},
+            ...
+        ]
+    }
+    """
+    try:
+        data = request.get_json() or {}
         
-        # Registrar no histórico
-        historico = HistoricoLocalizacao(
-            animal_id=animal.id,
-            device_id=device_id,
-            latitude=latitude,
-            longitude=longitude,
-            bateria=bateria
-        )
+        # Verificar autenticação
+        propriedade = verificar_token(data.get('tkn'))
+        if not propriedade:
+            return jsonify({"erro": "Token de API inválido"}), 401
         
-        db.session.add(historico)
-        db.session.commit()
+        posicoes = []
+        for item in data.get('posicoes') or []:
+            if not all(campo in item for campo in ['id', 'lat', 'lon']):
+                return jsonify({"erro": "Cada posição deve conter id, lat e lon"}), 400
+            try:
+                posicoes.append({
+                    'device_id': item['id'],
+                    'latitude': float(item['lat']),
+                    'longitude': float(item['lon']),
+                    'bateria': float(item['bat']) if item.get('bat') is not None else None
+                })
+            except (TypeError, ValueError):
+                return jsonify({"erro": f"Valores inválidos para o dispositivo {item['id']}"}), 400
         
-        logger.info(f"Localização recebida via API GET para animal {animal.codigo}: lat={latitude}, lon={longitude}")
+        if not posicoes:
+            return jsonify({"erro": "Nenhuma posição enviada"}), 400
         
-        return jsonify({"status": "sucesso", "animal": animal.codigo})
+        animais, nao_encontrados = registrar_posicoes(posicoes)
+        
+        logger.info(f"Lote de {len(posicoes)} posições recebido via API ({len(animais)} animais atualizados)")
+        
+        return jsonify({
+            "status": "sucesso",
+            "processadas": len(posicoes) - len(nao_encontrados),
+            "nao_encontrados": nao_encontrados
+        })
     
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Erro ao processar localização LoRa via GET: {str(e)}")
+        logger.error(f"Erro ao processar lote de localizações LoRa: {str(e)}")
         return jsonify({"erro": str(e)}), 500
 
 @api_bp.route('/balanca/pesagem', methods=['POST'])
@@ -426,28 +453,16 @@ def receber_leitura_estacao():
         if not estacao:
             return jsonify({"erro": f"Estação não encontrada: {estacao_id}"}), 404
         
-        # Atualizar dados da estação
-        estacao.ultimo_contato = datetime.now()
-        
-        # Atualizar bateria, se fornecida
-        if bateria is not None:
-            estacao.bateria = bateria
-        
-        # Registrar leitura
-        leitura = LeituraMeteorologica(
-            estacao_id=estacao.id,
-            data_hora=datetime.now(),
-            temperatura=temperatura,
-            umidade=umidade,
-            pressao=pressao,
-            precipitacao=precipitacao,
-            velocidade_vento=velocidade_vento,
-            direcao_vento=direcao_vento,
-            bateria=bateria
-        )
-        
-        db.session.add(leitura)
-        db.session.commit()
+        # Registrar leitura (atualiza contato, bateria e resumo da estação)
+        leitura = registrar_leitura_estacao(estacao, {
+            'temperatura': temperatura,
+            'umidade': umidade,
+            'pressao': pressao,
+            'precipitacao': precipitacao,
+            'velocidade_vento': velocidade_vento,
+            'direcao_vento': direcao_vento,
+            'bateria': bateria
+        })
         
         logger.info(f"Leitura recebida via API para estação {estacao.codigo}")
         
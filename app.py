@@ -8,6 +8,16 @@ from flask_login import LoginManager
 # Configuração de logging
 logging.basicConfig(level=logging.DEBUG)
 
+# Com workers gevent do gunicorn as consultas do psycopg2 precisam ceder o
+# loop de eventos, senão uma consulta lenta bloqueia todas as conexões do worker
+try:
+    from gevent import monkey
+    if monkey.is_module_patched('socket'):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+except ImportError:
+    pass
+
 class Base(DeclarativeBase):
     pass
 
@@ -26,6 +36,67 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 }
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Tempo de vida (segundos) do snapshot de indicadores do dashboard
+app.config["PAINEL_CACHE_TTL"] = int(os.environ.get("PAINEL_CACHE_TTL", 30))
+
+# Registrar em log as rotas que excedem o orçamento de consultas SQL declarado
+app.config["VERIFICAR_ORCAMENTO_CONSULTAS"] = os.environ.get("VERIFICAR_ORCAMENTO_CONSULTAS", "0") == "1"
+
+# Stream ao vivo das posições (SSE): intervalo de coalescência, duração de cada
+# conexão (o navegador reconecta ao fim, o que redistribui os clientes entre
+# os workers) e limite da fila por cliente
+app.config["MAPA_STREAM_INTERVALO"] = float(os.environ.get("MAPA_STREAM_INTERVALO", 2))  # em segundos
+app.config["MAPA_STREAM_DURACAO"] = int(os.environ.get("MAPA_STREAM_DURACAO", 100))  # em segundos
+app.config["MAPA_STREAM_MAX_PENDENTES"] = int(os.environ.get("MAPA_STREAM_MAX_PENDENTES", 5000))
+
+# Exportação de relatórios: acima deste número de linhas o relatório é gerado
+# em segundo plano; threads do pool, validade dos arquivos e diretório
+app.config["RELATORIOS_LIMITE_SINCRONO"] = int(os.environ.get("RELATORIOS_LIMITE_SINCRONO", 20000))
+app.config["RELATORIOS_WORKERS"] = int(os.environ.get("RELATORIOS_WORKERS", 2))
+app.config["RELATORIOS_VALIDADE_HORAS"] = int(os.environ.get("RELATORIOS_VALIDADE_HORAS", 24))
+if os.environ.get("RELATORIOS_DIR"):
+    app.config["RELATORIOS_DIR"] = os.environ["RELATORIOS_DIR"]
+
+# Curvas de crescimento: modelo, peso alvo de abate (kg), hora do recálculo
+# noturno e número de animais a partir do qual o ajuste usa um pool de processos
+app.config["CRESCIMENTO_MODELO"] = os.environ.get("CRESCIMENTO_MODELO", "gompertz")
+app.config["PESO_ABATE_ALVO"] = float(os.environ.get("PESO_ABATE_ALVO", 540))
+app.config["CRESCIMENTO_HORA_NOTURNA"] = int(os.environ.get("CRESCIMENTO_HORA_NOTURNA", 2))
+app.config["CRESCIMENTO_LIMITE_PROCESSOS"] = int(os.environ.get("CRESCIMENTO_LIMITE_PROCESSOS", 5000))
+app.config["CRESCIMENTO_PROCESSOS"] = int(os.environ["CRESCIMENTO_PROCESSOS"]) if os.environ.get("CRESCIMENTO_PROCESSOS") else None
+
+# Alertas meteorológicos: um alerta aberto sem novas ocorrências por este
+# período é finalizado automaticamente
+app.config["ALERTAS_PERIODO_SILENCIO"] = int(os.environ.get("ALERTAS_PERIODO_SILENCIO", 60))  # em minutos
+
+# Buffer em memória das leituras recentes de cada estação (por worker)
+app.config["BUFFER_LEITURAS_CAPACIDADE"] = int(os.environ.get("BUFFER_LEITURAS_CAPACIDADE", 1440))  # leituras por estação
+app.config["BUFFER_LEITURAS_AQUECER"] = os.environ.get("BUFFER_LEITURAS_AQUECER", "1") == "1"
+
+# Previsão de troca de baterias: percentual que exige troca, janela de
+# histórico usada no ajuste da descarga e intervalo entre recálculos
+app.config["BATERIA_LIMITE"] = float(os.environ.get("BATERIA_LIMITE", 20))
+app.config["BATERIA_JANELA_DIAS"] = int(os.environ.get("BATERIA_JANELA_DIAS", 30))
+app.config["BATERIA_INTERVALO_HORAS"] = int(os.environ.get("BATERIA_INTERVALO_HORAS", 6))
+
+# Monitor de conexão: intervalo esperado entre contatos dos dispositivos LoRa
+# e número de intervalos sem contato para considerar um dispositivo offline
+app.config["DISPOSITIVOS_INTERVALO_LORA"] = int(os.environ.get("DISPOSITIVOS_INTERVALO_LORA", 15))  # em minutos
+app.config["DISPOSITIVOS_FATOR_ATRASO"] = float(os.environ.get("DISPOSITIVOS_FATOR_ATRASO", 3))
+
+# Grafo de contatos entre animais: distância máxima do contato e duração dos
+# intervalos de tempo em que as posições são agrupadas
+app.config["CONTATO_RAIO_METROS"] = float(os.environ.get("CONTATO_RAIO_METROS", 10))
+app.config["CONTATO_INTERVALO_MINUTOS"] = int(os.environ.get("CONTATO_INTERVALO_MINUTOS", 5))
+
+# Agendador de tarefas em segundo plano
+app.config["AGENDADOR_ATIVO"] = os.environ.get("AGENDADOR_ATIVO", "1") == "1"
+
+# Simulação de telemetria LoRa (ambientes de demonstração/homologação)
+app.config["SIMULACAO_LORA_ATIVA"] = os.environ.get("SIMULACAO_LORA_ATIVA", "0") == "1"
+app.config["SIMULACAO_LORA_INTERVALO"] = int(os.environ.get("SIMULACAO_LORA_INTERVALO", 60))  # em segundos
+app.config["SIMULACAO_LORA_DISPOSITIVOS"] = int(os.environ.get("SIMULACAO_LORA_DISPOSITIVOS", 5))
+
 # Inicialização do banco de dados
 db.init_app(app)
 
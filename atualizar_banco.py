@@ -110,6 +110,324 @@ def verificar_tabela_balancas():
             logger.error(f"Erro ao verificar/criar tabela balancas_digitais: {str(e)}")
             return False
 
+def executar_ddl(descricao, comandos):
+    """Executa comandos DDL idempotentes (IF NOT EXISTS) em uma transação"""
+    with app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                for comando in comandos:
+                    conn.execute(text(comando))
+            logger.info(f"{descricao}: concluído")
+            return True
+        except Exception as e:
+            logger.error(f"Erro em '{descricao}': {str(e)}")
+            return False
+
+def criar_indices_listagem_animais():
+    """Cria os índices usados pela listagem paginada e filtrada de animais"""
+    return executar_ddl("Índices da listagem de animais", [
+        "CREATE INDEX IF NOT EXISTS ix_animais_codigo_id ON animais (codigo, id)",
+        "CREATE INDEX IF NOT EXISTS ix_animais_status ON animais (status)",
+        "CREATE INDEX IF NOT EXISTS ix_animais_raca_id ON animais (raca_id)",
+        "CREATE INDEX IF NOT EXISTS ix_animais_area_id ON animais (area_id)",
+        "CREATE INDEX IF NOT EXISTS ix_animais_lote_id ON animais (lote_id)",
+    ])
+
+def adicionar_campos_delta_mapa():
+    """Adiciona a coluna e os índices usados pela consulta incremental do mapa"""
+    return executar_ddl("Consulta incremental do mapa", [
+        "ALTER TABLE animais ADD COLUMN IF NOT EXISTS data_alteracao_mapa TIMESTAMP",
+        "CREATE INDEX IF NOT EXISTS ix_animais_ultima_atualizacao ON animais (ultima_atualizacao)",
+        "CREATE INDEX IF NOT EXISTS ix_animais_data_alteracao_mapa ON animais (data_alteracao_mapa)",
+    ])
+
+def criar_indice_series_estacoes():
+    """Cria o índice usado pelas séries de leituras por estação e intervalo"""
+    return executar_ddl("Índice das séries meteorológicas", [
+        "CREATE INDEX IF NOT EXISTS ix_leituras_meteorologicas_estacao_data "
+        "ON leituras_meteorologicas (estacao_id, data_hora)",
+    ])
+
+def criar_resumos_estacoes():
+    """Cria a tabela de resumos de estações e calcula o resumo de cada estação"""
+    ok = executar_ddl("Tabela de resumos de estações", [
+        """
+        CREATE TABLE IF NOT EXISTS resumos_estacoes (
+            estacao_id INTEGER PRIMARY KEY REFERENCES estacoes_meteorologicas(id) ON DELETE CASCADE,
+            data_hora TIMESTAMP,
+            temperatura FLOAT,
+            umidade FLOAT,
+            pressao FLOAT,
+            velocidade_vento FLOAT,
+            direcao_vento FLOAT,
+            precipitacao FLOAT,
+            radiacao_solar FLOAT,
+            umidade_solo FLOAT,
+            temperatura_solo FLOAT,
+            bateria FLOAT,
+            sinal_lora FLOAT,
+            temperatura_min_24h FLOAT,
+            temperatura_max_24h FLOAT,
+            umidade_min_24h FLOAT,
+            umidade_max_24h FLOAT,
+            precipitacao_24h FLOAT,
+            leituras_24h INTEGER DEFAULT 0,
+            alertas_ativos INTEGER DEFAULT 0,
+            ultimo_contato TIMESTAMP,
+            data_calculo TIMESTAMP
+        )
+        """,
+    ])
+    if not ok:
+        return False
+    
+    from leituras_estacoes import recalcular_resumos
+    with app.app_context():
+        try:
+            total = recalcular_resumos()
+            logger.info(f"Resumos calculados para {total} estações")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao calcular resumos de estações: {str(e)}")
+            return False
+
+def criar_tabela_tarefas_relatorios():
+    """Cria a tabela da fila de relatórios gerados em segundo plano"""
+    return executar_ddl("Tabela de tarefas de relatórios", [
+        """
+        CREATE TABLE IF NOT EXISTS tarefas_relatorios (
+            id SERIAL PRIMARY KEY,
+            relatorio VARCHAR(30) NOT NULL,
+            formato VARCHAR(10) NOT NULL,
+            filtros TEXT,
+            chave VARCHAR(64) NOT NULL,
+            status VARCHAR(20) DEFAULT 'Pendente',
+            total_linhas INTEGER,
+            linhas_processadas INTEGER DEFAULT 0,
+            arquivo VARCHAR(255),
+            nome_arquivo VARCHAR(100),
+            erro TEXT,
+            usuario_id INTEGER REFERENCES usuarios(id),
+            data_criacao TIMESTAMP,
+            data_inicio TIMESTAMP,
+            data_conclusao TIMESTAMP,
+            data_expiracao TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_tarefas_relatorios_chave ON tarefas_relatorios (chave)",
+        "CREATE INDEX IF NOT EXISTS ix_tarefas_relatorios_status ON tarefas_relatorios (status)",
+        "CREATE INDEX IF NOT EXISTS ix_tarefas_relatorios_data_expiracao ON tarefas_relatorios (data_expiracao)",
+    ])
+
+def criar_indice_pesagens_animal():
+    """Cria o índice das pesagens por animal e data usado pela análise de GMD"""
+    return executar_ddl("Índice de pesagens por animal", [
+        "CREATE INDEX IF NOT EXISTS ix_registros_peso_animal_data ON registros_peso (animal_id, data_pesagem)",
+    ])
+
+def adicionar_versao_pesagens():
+    """Adiciona a versão das pesagens usada pelo cache da análise de GMD"""
+    return executar_ddl("Versão das pesagens por propriedade", [
+        "ALTER TABLE propriedades ADD COLUMN IF NOT EXISTS versao_pesagens INTEGER NOT NULL DEFAULT 0",
+    ])
+
+def criar_tabela_previsoes_crescimento():
+    """Cria a tabela das curvas de crescimento e previsões de peso alvo"""
+    return executar_ddl("Tabela de previsões de crescimento", [
+        """
+        CREATE TABLE IF NOT EXISTS previsoes_crescimento (
+            animal_id INTEGER PRIMARY KEY REFERENCES animais(id) ON DELETE CASCADE,
+            lote_id INTEGER REFERENCES lotes(id),
+            modelo VARCHAR(20) NOT NULL,
+            peso_assintotico FLOAT,
+            parametro_b FLOAT,
+            taxa_k FLOAT,
+            rmse FLOAT,
+            pesagens INTEGER,
+            peso_alvo FLOAT,
+            data_peso_alvo DATE,
+            data_calculo TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_previsoes_crescimento_lote_id ON previsoes_crescimento (lote_id)",
+        "CREATE INDEX IF NOT EXISTS ix_previsoes_crescimento_data_peso_alvo ON previsoes_crescimento (data_peso_alvo)",
+    ])
+
+def criar_indices_agenda_sanitaria():
+    """Cria os índices da agenda sanitária (próxima dose e último registro por produto)"""
+    return executar_ddl("Índices da agenda sanitária", [
+        "CREATE INDEX IF NOT EXISTS ix_registros_sanitarios_data_proxima ON registros_sanitarios (data_proxima)",
+        "CREATE INDEX IF NOT EXISTS ix_registros_sanitarios_animal_produto ON registros_sanitarios (animal_id, tipo, produto, data_aplicacao)",
+    ])
+
+def criar_tabela_regras_alertas():
+    """Cria a tabela de regras de alerta com as regras padrão (antes fixas no código)"""
+    return executar_ddl("Tabela de regras de alertas", [
+        """
+        CREATE TABLE IF NOT EXISTS regras_alertas (
+            id SERIAL PRIMARY KEY,
+            tipo VARCHAR(50) NOT NULL,
+            descricao TEXT,
+            nivel VARCHAR(20) NOT NULL DEFAULT 'Atenção',
+            unidade VARCHAR(10),
+            campo VARCHAR(30) NOT NULL,
+            operador VARCHAR(2) NOT NULL DEFAULT '>',
+            limite FLOAT NOT NULL,
+            leituras_consecutivas INTEGER DEFAULT 1,
+            janela_variacao INTEGER,
+            estacao_id INTEGER REFERENCES estacoes_meteorologicas(id) ON DELETE CASCADE,
+            propriedade_id INTEGER REFERENCES propriedades(id),
+            ativa BOOLEAN DEFAULT TRUE,
+            data_criacao TIMESTAMP DEFAULT NOW(),
+            data_alteracao TIMESTAMP DEFAULT NOW()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_regras_alertas_estacao_id ON regras_alertas (estacao_id)",
+        "CREATE INDEX IF NOT EXISTS ix_regras_alertas_propriedade_id ON regras_alertas (propriedade_id)",
+        """
+        INSERT INTO regras_alertas (tipo, descricao, nivel, unidade, campo, operador, limite)
+        SELECT * FROM (VALUES
+            ('Temperatura Alta', 'Temperatura acima do limite estabelecido', 'Atenção', '°C', 'temperatura', '>', 30.0),
+            ('Chuva Forte', 'Precipitação acima do limite estabelecido', 'Alerta', 'mm', 'precipitacao', '>', 10.0)
+        ) AS padrao
+        WHERE NOT EXISTS (SELECT 1 FROM regras_alertas)
+        """,
+    ])
+
+def adicionar_campos_agrupamento_alertas():
+    """Adiciona os campos de agrupamento de ocorrências aos alertas meteorológicos"""
+    return executar_ddl("Agrupamento de alertas meteorológicos", [
+        "ALTER TABLE alertas_meteorologicos ADD COLUMN IF NOT EXISTS valor_pico FLOAT",
+        "ALTER TABLE alertas_meteorologicos ADD COLUMN IF NOT EXISTS ultima_ocorrencia TIMESTAMP",
+        "ALTER TABLE alertas_meteorologicos ADD COLUMN IF NOT EXISTS ocorrencias INTEGER DEFAULT 1",
+        "ALTER TABLE alertas_meteorologicos ADD COLUMN IF NOT EXISTS data_finalizacao TIMESTAMP",
+        """
+        UPDATE alertas_meteorologicos
+        SET valor_pico = valor_medido, ultima_ocorrencia = data_hora, ocorrencias = 1
+        WHERE ultima_ocorrencia IS NULL
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_alertas_meteorologicos_estacao_status "
+        "ON alertas_meteorologicos (estacao_id, status)",
+    ])
+
+def criar_tabela_estresse_termico():
+    """Cria a tabela dos resumos diários de estresse térmico por estação"""
+    return executar_ddl("Tabela de estresse térmico diário", [
+        """
+        CREATE TABLE IF NOT EXISTS estresse_termico_diario (
+            id SERIAL PRIMARY KEY,
+            estacao_id INTEGER NOT NULL REFERENCES estacoes_meteorologicas(id) ON DELETE CASCADE,
+            data DATE NOT NULL,
+            leituras INTEGER,
+            horas INTEGER,
+            itu_medio FLOAT,
+            itu_maximo FLOAT,
+            ponto_orvalho_medio FLOAT,
+            temperatura_maxima FLOAT,
+            carga_termica FLOAT,
+            horas_alerta INTEGER,
+            horas_perigo INTEGER,
+            horas_emergencia INTEGER,
+            categoria VARCHAR(20),
+            data_calculo TIMESTAMP,
+            CONSTRAINT uq_estresse_termico_estacao_data UNIQUE (estacao_id, data)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_estresse_termico_diario_data ON estresse_termico_diario (data)",
+    ])
+
+def criar_tabela_previsoes_baterias():
+    """Cria a tabela das previsões de troca de baterias e o índice do histórico por dispositivo"""
+    return executar_ddl("Tabela de previsões de baterias", [
+        """
+        CREATE TABLE IF NOT EXISTS previsoes_baterias (
+            id SERIAL PRIMARY KEY,
+            tipo VARCHAR(20) NOT NULL,
+            referencia_id INTEGER NOT NULL,
+            codigo VARCHAR(50),
+            descricao VARCHAR(100),
+            propriedade_id INTEGER REFERENCES propriedades(id) ON DELETE CASCADE,
+            area_id INTEGER REFERENCES areas(id) ON DELETE SET NULL,
+            latitude FLOAT,
+            longitude FLOAT,
+            bateria FLOAT,
+            data_bateria TIMESTAMP,
+            taxa_descarga FLOAT,
+            pontos INTEGER,
+            limite FLOAT,
+            data_limite TIMESTAMP,
+            data_calculo TIMESTAMP,
+            CONSTRAINT uq_previsoes_baterias_tipo_referencia UNIQUE (tipo, referencia_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_previsoes_baterias_propriedade_id ON previsoes_baterias (propriedade_id)",
+        "CREATE INDEX IF NOT EXISTS ix_previsoes_baterias_data_limite ON previsoes_baterias (data_limite)",
+        "CREATE INDEX IF NOT EXISTS ix_historico_localizacao_device_data ON historico_localizacao (device_id, data_hora)",
+    ])
+
+def criar_tabelas_monitor_conexao():
+    """Cria as tabelas de eventos de conexão e disponibilidade e os índices de último contato"""
+    return executar_ddl("Tabelas do monitor de conexão", [
+        """
+        CREATE TABLE IF NOT EXISTS eventos_conexao (
+            id SERIAL PRIMARY KEY,
+            tipo_dispositivo VARCHAR(20) NOT NULL,
+            referencia_id INTEGER NOT NULL,
+            codigo VARCHAR(50),
+            propriedade_id INTEGER REFERENCES propriedades(id) ON DELETE CASCADE,
+            intervalo_esperado INTEGER,
+            data_inicio TIMESTAMP NOT NULL,
+            data_deteccao TIMESTAMP NOT NULL,
+            data_fim TIMESTAMP,
+            duracao FLOAT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_eventos_conexao_dispositivo ON eventos_conexao (tipo_dispositivo, referencia_id, data_fim)",
+        "CREATE INDEX IF NOT EXISTS ix_eventos_conexao_data_fim ON eventos_conexao (data_fim)",
+        """
+        CREATE TABLE IF NOT EXISTS disponibilidade_dispositivos (
+            tipo_dispositivo VARCHAR(20) NOT NULL,
+            referencia_id INTEGER NOT NULL,
+            eventos_offline INTEGER DEFAULT 0,
+            tempo_offline FLOAT DEFAULT 0,
+            maior_interrupcao FLOAT DEFAULT 0,
+            offline_desde TIMESTAMP,
+            data_atualizacao TIMESTAMP,
+            PRIMARY KEY (tipo_dispositivo, referencia_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_estacoes_meteorologicas_intervalo_contato ON estacoes_meteorologicas (intervalo_leitura, ultimo_contato)",
+        "CREATE INDEX IF NOT EXISTS ix_dispositivos_lora_ultimo_contato ON dispositivos_lora (ultimo_contato)",
+    ])
+
+def criar_indice_trilhas_animais():
+    """Cria o índice das trilhas de cada animal por data"""
+    return executar_ddl("Índice de trilhas dos animais", [
+        "CREATE INDEX IF NOT EXISTS ix_historico_localizacao_animal_data ON historico_localizacao (animal_id, data_hora)",
+    ])
+
+def criar_tabela_contatos_animais():
+    """Cria a tabela do grafo de contatos diários entre animais"""
+    return executar_ddl("Tabela de contatos entre animais", [
+        """
+        CREATE TABLE IF NOT EXISTS contatos_animais (
+            id SERIAL PRIMARY KEY,
+            data DATE NOT NULL,
+            animal_id INTEGER NOT NULL REFERENCES animais(id) ON DELETE CASCADE,
+            contato_id INTEGER NOT NULL REFERENCES animais(id) ON DELETE CASCADE,
+            encontros INTEGER,
+            duracao INTEGER,
+            primeiro_contato TIMESTAMP,
+            ultimo_contato TIMESTAMP,
+            distancia_minima FLOAT,
+            data_calculo TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_contatos_animais_data ON contatos_animais (data)",
+        "CREATE INDEX IF NOT EXISTS ix_contatos_animais_animal_data ON contatos_animais (animal_id, data)",
+    ])
+
 if __name__ == "__main__":
     logger.info("Iniciando migração do banco de dados")
     
@@ -118,4 +436,21 @@ if __name__ == "__main__":
         # Adicionar campos à tabela registros_peso
         adicionar_campos_registro_peso()
     
+    criar_indices_listagem_animais()
+    adicionar_campos_delta_mapa()
+    criar_indice_series_estacoes()
+    criar_resumos_estacoes()
+    criar_tabela_tarefas_relatorios()
+    criar_indice_pesagens_animal()
+    adicionar_versao_pesagens()
+    criar_tabela_previsoes_crescimento()
+    criar_indices_agenda_sanitaria()
+    criar_tabela_regras_alertas()
+    adicionar_campos_agrupamento_alertas()
+    criar_tabela_estresse_termico()
+    criar_tabela_previsoes_baterias()
+    criar_tabelas_monitor_conexao()
+    criar_indice_trilhas_animais()
+    criar_tabela_contatos_animais()
+    
     logger.info("Migração concluída")
\ No newline at end of file
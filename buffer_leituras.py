@@ -0,0 +1,357 @@
+"""
+Buffer circular em memória das leituras recentes de cada estação.
+
+Cada worker mantém, por estação, as leituras das últimas 24 horas em arrays
+NumPy de tamanho fixo (`BUFFER_LEITURAS_CAPACIDADE` posições; a leitura mais
+antiga é sobrescrita quando o buffer enche). O buffer é alimentado por
+`registrar_leitura_estacao` após o commit e carregado do banco no início do
+worker, e responde às consultas mais frequentes (últimas N leituras,
+estatísticas das últimas 24 horas e séries recentes) sem ler
+`leituras_meteorologicas`.
+
+Leituras gravadas por outro worker são detectadas pela data da última
+leitura no resumo da estação (`ResumoEstacao.data_hora`), informada pelo
+chamador como `referencia`: se ela difere da última leitura do buffer, são
+lidas as leituras com id acima do último visto menos `MARGEM_IDS` (INSERTs
+concorrentes podem confirmar ids menores depois), ignorando as que o buffer
+já tem. Leituras atrasadas
+(anteriores à última do buffer) descartam o buffer da estação, que é
+recarregado; todo buffer é recarregado após `VALIDADE_BUFFER`.
+
+Quando o buffer não pode garantir a resposta (mais leituras do que as que
+guarda, ou um intervalo anterior às leituras que ainda tem), os métodos
+retornam None e o chamador consulta o banco.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+from app import app, db
+from models import LeituraMeteorologica
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+CAMPOS_BUFFER = (
+    'temperatura', 'umidade', 'pressao', 'velocidade_vento', 'direcao_vento',
+    'precipitacao', 'radiacao_solar', 'umidade_solo', 'temperatura_solo',
+    'bateria', 'sinal_lora',
+)
+
+# Leitura devolvida pelo buffer (mesmos atributos das linhas do banco)
+LeituraRecente = namedtuple('LeituraRecente', ('data_hora',) + CAMPOS_BUFFER)
+
+# Período mantido no buffer
+JANELA_BUFFER = timedelta(hours=24)
+
+# Uma leitura por minuto durante a janela
+CAPACIDADE_PADRAO = 1440
+
+# Leituras recentes exibidas por padrão nas telas e na API
+LEITURAS_RECENTES_PADRAO = 10
+
+# Tempo máximo de uso de um buffer antes de recarregá-lo do banco
+VALIDADE_BUFFER = 60 * 60  # em segundos
+
+# Ids abaixo do maior já lido que ainda podem ser confirmados por outras
+# transações (INSERTs concorrentes); são relidos na sincronização
+MARGEM_IDS = 2000
+
+
+def _tempo(data_hora):
+    return np.datetime64(data_hora, 'ms')
+
+
+class BufferEstacao:
+    """Leituras recentes de uma estação em ordem cronológica (arrays circulares)"""
+
+    __slots__ = ('tempos', 'ids', 'valores', 'inicio', 'tamanho', 'completo_desde', 'ultimo_id', 'validade')
+
+    def __init__(self, capacidade, completo_desde):
+        self.tempos = np.zeros(capacidade, dtype='datetime64[ms]')
+        self.ids = np.zeros(capacidade, dtype=np.int64)
+        self.valores = np.full((capacidade, len(CAMPOS_BUFFER)), np.nan)
+        self.inicio = 0
+        self.tamanho = 0
+        # A partir desse momento o buffer tem todas as leituras da estação
+        self.completo_desde = _tempo(completo_desde)
+        self.ultimo_id = 0
+        self.validade = time.monotonic() + VALIDADE_BUFFER
+
+    @property
+    def ultimo_tempo(self):
+        if not self.tamanho:
+            return None
+        return self.tempos[(self.inicio + self.tamanho - 1) % len(self.tempos)]
+
+    def adicionar(self, id, data_hora, valores):
+        """
+        Acrescenta uma leitura ao fim do buffer
+
+        Returns:
+            bool: False se a leitura é anterior à última do buffer (o buffer
+            precisa ser recarregado); leituras já vistas ou anteriores a
+            `completo_desde` são ignoradas
+        """
+        tempo = _tempo(data_hora)
+        if id <= self.ultimo_id and (tempo < self.completo_desde or (self.ids[:self.tamanho] == id).any()):
+            return True
+        if self.tamanho and tempo < self.ultimo_tempo:
+            return False
+
+        capacidade = len(self.tempos)
+        if self.tamanho == capacidade:
+            posicao = self.inicio
+            self.inicio = (self.inicio + 1) % capacidade
+            # A leitura mais antiga saiu: o buffer só está completo a partir da seguinte
+            self.completo_desde = max(self.completo_desde, self.tempos[self.inicio])
+        else:
+            posicao = (self.inicio + self.tamanho) % capacidade
+            self.tamanho += 1
+
+        self.tempos[posicao] = tempo
+        self.ids[posicao] = id
+        self.valores[posicao] = valores
+        self.ultimo_id = max(self.ultimo_id, id)
+        return True
+
+    def preencher(self, ids, tempos, valores):
+        """Carrega leituras em ordem cronológica em um buffer vazio"""
+        if len(tempos) > len(self.tempos):
+            # Só as mais recentes cabem: o buffer fica completo a partir da primeira mantida
+            ids, tempos, valores = ids[-len(self.tempos):], tempos[-len(self.tempos):], valores[-len(self.tempos):]
+            self.completo_desde = max(self.completo_desde, tempos[0])
+        self.tamanho = len(tempos)
+        self.tempos[:self.tamanho] = tempos
+        self.ids[:self.tamanho] = ids
+        self.valores[:self.tamanho] = valores
+        self.ultimo_id = int(ids.max())
+
+    def ordem(self):
+        """Posições das leituras em ordem cronológica"""
+        return (self.inicio + np.arange(self.tamanho)) % len(self.tempos)
+
+
+class BuffersEstacoes:
+    """Buffers das estações do worker, com sincronização incremental pelo banco"""
+
+    def __init__(self):
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def capacidade(self):
+        return app.config.get('BUFFER_LEITURAS_CAPACIDADE', CAPACIDADE_PADRAO)
+
+    def _consulta(self):
+        colunas = [getattr(LeituraMeteorologica, campo) for campo in CAMPOS_BUFFER]
+        return select(
+            LeituraMeteorologica.estacao_id, LeituraMeteorologica.id, LeituraMeteorologica.data_hora, *colunas
+        )
+
+    def carregar(self, estacao_ids=None):
+        """
+        Carrega do banco as leituras das últimas 24 horas (todas as estações
+        com leituras na janela, ou as informadas) em uma consulta
+
+        Returns:
+            int: Número de buffers carregados
+        """
+        agora = datetime.now()
+        consulta = self._consulta().where(LeituraMeteorologica.data_hora >= agora - JANELA_BUFFER)
+        if estacao_ids is not None:
+            consulta = consulta.where(LeituraMeteorologica.estacao_id.in_(estacao_ids))
+        with db.session.no_autoflush:
+            linhas = db.session.execute(
+                consulta.order_by(LeituraMeteorologica.estacao_id, LeituraMeteorologica.data_hora, LeituraMeteorologica.id)
+            ).all()
+
+        capacidade = self.capacidade
+        novos = {id: BufferEstacao(capacidade, agora - JANELA_BUFFER) for id in estacao_ids or ()}
+        estacoes = np.fromiter((linha[0] for linha in linhas), dtype=np.int64, count=len(linhas))
+        ids = np.fromiter((linha[1] for linha in linhas), dtype=np.int64, count=len(linhas))
+        tempos = np.array([linha[2] for linha in linhas], dtype='datetime64[ms]')
+        valores = np.array([linha[3:] for linha in linhas], dtype=np.float64).reshape(len(linhas), len(CAMPOS_BUFFER))
+
+        limites = np.flatnonzero(np.diff(estacoes)) + 1
+        for inicio, fim in zip(np.r_[0, limites], np.r_[limites, len(linhas)]):
+            if inicio == fim:
+                continue
+            buffer = novos.setdefault(int(estacoes[inicio]), BufferEstacao(capacidade, agora - JANELA_BUFFER))
+            buffer.preencher(ids[inicio:fim], tempos[inicio:fim], valores[inicio:fim])
+
+        with self._lock:
+            if estacao_ids is None:
+                self._buffers = novos
+            else:
+                self._buffers.update(novos)
+        return len(novos)
+
+    def _sincronizar(self, estacao_id, referencia):
+        """Buffer da estação atualizado até a leitura `referencia` (data do resumo)"""
+        buffer = self._buffers.get(estacao_id)
+        if buffer is None or time.monotonic() > buffer.validade:
+            self.carregar([estacao_id])
+            return self._buffers[estacao_id]
+
+        if referencia is None or buffer.ultimo_tempo == _tempo(referencia):
+            return buffer
+
+        with db.session.no_autoflush:
+            linhas = db.session.execute(
+                self._consulta()
+                .where(
+                    LeituraMeteorologica.estacao_id == estacao_id,
+                    # Volta à margem de ids: as já presentes no buffer são ignoradas
+                    LeituraMeteorologica.id > max(buffer.ultimo_id - MARGEM_IDS, 0),
+                    # Leituras posteriores ao resumo ainda podem estar na transação atual
+                    LeituraMeteorologica.data_hora <= referencia
+                )
+                .order_by(LeituraMeteorologica.id)
+            ).all()
+        with self._lock:
+            for linha in linhas:
+                if not buffer.adicionar(linha[1], linha[2], linha[3:]):
+                    break
+            else:
+                return buffer
+
+        # Leitura atrasada: recarrega a estação
+        self.carregar([estacao_id])
+        return self._buffers[estacao_id]
+
+    def adicionar(self, leitura):
+        """Acrescenta uma leitura confirmada no banco (chamado após o commit)"""
+        estacao_id, id, data_hora, valores = leitura
+        with self._lock:
+            buffer = self._buffers.get(estacao_id)
+            if buffer is not None and not buffer.adicionar(id, data_hora, valores):
+                del self._buffers[estacao_id]
+
+    def descartar(self, estacao_id=None):
+        """Descarta o buffer de uma estação (ou todos), recarregado no próximo acesso"""
+        with self._lock:
+            if estacao_id is None:
+                self._buffers.clear()
+            else:
+                self._buffers.pop(estacao_id, None)
+
+    def ultimas(self, estacao_id, n, referencia, ate=None):
+        """
+        Últimas `n` leituras da estação, da mais antiga para a mais recente
+
+        Args:
+            estacao_id (int): ID da estação
+            n (int): Número de leituras
+            referencia (datetime): Data da última leitura da estação (resumo)
+            ate (datetime): Considera só leituras até esse momento (opcional)
+
+        Returns:
+            list: `LeituraRecente` com `data_hora` e os campos de
+            `CAMPOS_BUFFER` (None se ausentes), ou None se o buffer não tem
+            leituras suficientes
+        """
+        buffer = self._sincronizar(estacao_id, referencia)
+        with self._lock:
+            ordem = buffer.ordem()
+            if ate is not None:
+                ordem = ordem[buffer.tempos[ordem] <= _tempo(ate)]
+            if len(ordem) < n:
+                return None
+            ordem = ordem[len(ordem) - n:]
+            tempos = buffer.tempos[ordem]
+            valores = buffer.valores[ordem]
+
+        return [
+            LeituraRecente(tempo, *(None if math.isnan(valor) else valor for valor in linha))
+            for tempo, linha in zip(tempos.tolist(), valores.tolist())
+        ]
+
+    def intervalo(self, estacao_id, inicio, fim, referencia, campos=CAMPOS_BUFFER):
+        """
+        Leituras da estação entre `inicio` e `fim` (inclusive)
+
+        Returns:
+            tuple: (tempos datetime64[ms], matriz leituras x campos com NaN
+            para ausentes), ou None se o intervalo começa antes das leituras
+            garantidas pelo buffer
+        """
+        # Intervalo anterior ao que o buffer pode cobrir: não o carrega à toa
+        buffer = self._buffers.get(estacao_id)
+        desde = buffer.completo_desde if buffer is not None else _tempo(datetime.now() - JANELA_BUFFER)
+        if _tempo(inicio) < desde:
+            return None
+
+        buffer = self._sincronizar(estacao_id, referencia)
+        colunas = [CAMPOS_BUFFER.index(campo) for campo in campos]
+        with self._lock:
+            if _tempo(inicio) < buffer.completo_desde:
+                return None
+            ordem = buffer.ordem()
+            tempos = buffer.tempos[ordem]
+            selecionadas = (tempos >= _tempo(inicio)) & (tempos <= _tempo(fim))
+            return tempos[selecionadas], buffer.valores[ordem[selecionadas]][:, colunas]
+
+    def estatisticas(self, estacao_id, referencia, janela=JANELA_BUFFER):
+        """
+        Mínimo, máximo, média e último valor de cada campo na janela
+
+        Returns:
+            dict: `leituras`, `inicio`, `fim`, `precipitacao_total` e, por
+            campo com dados, {'minimo', 'maximo', 'media', 'ultimo'}; None se
+            a janela começa antes das leituras garantidas pelo buffer
+        """
+        fim = datetime.now()
+        dados = self.intervalo(estacao_id, fim - janela, fim, referencia)
+        if dados is None:
+            return None
+        tempos, valores = dados
+
+        resultado = {
+            'leituras': len(tempos),
+            'inicio': (fim - janela).isoformat(),
+            'fim': fim.isoformat(),
+            'precipitacao_total': round(float(np.nansum(valores[:, CAMPOS_BUFFER.index('precipitacao')])), 2),
+            'campos': {}
+        }
+        presentes = ~np.isnan(valores)
+        for coluna, campo in enumerate(CAMPOS_BUFFER):
+            if not presentes[:, coluna].any():
+                continue
+            serie = valores[presentes[:, coluna], coluna]
+            resultado['campos'][campo] = {
+                'minimo': round(float(serie.min()), 2),
+                'maximo': round(float(serie.max()), 2),
+                'media': round(float(serie.mean()), 2),
+                'ultimo': round(float(serie[-1]), 2)
+            }
+        return resultado
+
+
+# Buffers compartilhados pelas requisições do worker
+buffers_estacoes = BuffersEstacoes()
+
+
+def _carregar_no_inicio(app):
+    with app.app_context():
+        try:
+            total = buffers_estacoes.carregar()
+            logger.info(f"Buffers de leituras carregados para {total} estações")
+        except Exception as e:
+            # Sem banco ainda (instalação): os buffers são carregados no primeiro acesso
+            logger.warning(f"Buffers de leituras não carregados no início: {str(e)}")
+        finally:
+            db.session.remove()
+
+
+def init_app(app):
+    """Carrega os buffers deste worker em segundo plano"""
+    if app.config.get('BUFFER_LEITURAS_AQUECER', True):
+        threading.Thread(target=_carregar_no_inicio, args=(app,), name='buffer-leituras', daemon=True).start()
@@ -0,0 +1,67 @@
+"""
+Cache em memória com expiração por tempo.
+
+Cada worker do gunicorn mantém sua própria instância do cache. Os valores
+armazenados devem ser estruturas simples (dicts, listas, tuplas) e nunca
+objetos ORM, que ficariam desanexados da sessão após o fim da requisição.
+"""
+
+import threading
+import time
+
+
+class CacheTemporario:
+    """
+    Cache chave/valor com tempo de vida (TTL) e proteção contra recálculo
+    simultâneo da mesma chave por várias threads.
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._valores = {}
+        self._lock = threading.Lock()
+        self._locks_chave = {}
+
+    def _lock_da_chave(self, chave):
+        with self._lock:
+            return self._locks_chave.setdefault(chave, threading.Lock())
+
+    def obter(self, chave, gerar, ttl=None):
+        """
+        Retorna o valor em cache para a chave ou o calcula com `gerar()`
+
+        Args:
+            chave: Identificador do valor
+            gerar (callable): Função sem argumentos que produz o valor
+            ttl (float): Tempo de vida em segundos (padrão do cache se None)
+
+        Returns:
+            O valor armazenado ou recém-calculado
+        """
+        agora = time.monotonic()
+        item = self._valores.get(chave)
+        if item and item[0] > agora:
+            return item[1]
+
+        with self._lock_da_chave(chave):
+            # Outra thread pode ter recalculado enquanto aguardávamos
+            item = self._valores.get(chave)
+            if item and item[0] > time.monotonic():
+                return item[1]
+
+            valor = gerar()
+            validade = time.monotonic() + (self.ttl if ttl is None else ttl)
+            self._valores[chave] = (validade, valor)
+            return valor
+
+    def definir(self, chave, valor, ttl=None):
+        """Armazena um valor diretamente no cache"""
+        validade = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._valores[chave] = (validade, valor)
+
+    def invalidar(self, chave=None):
+        """Remove uma chave do cache, ou todas se nenhuma for informada"""
+        if chave is None:
+            self._valores.clear()
+        else:
+            self._valores.pop(chave, None)
@@ -0,0 +1,167 @@
+"""
+Consultas reutilizáveis sobre o rebanho.
+
+Perfis de carregamento antecipado (eager loading): cada tela ou serializador
+que percorre relacionamentos linha a linha declara um perfil nomeado, que
+carrega esses relacionamentos na mesma consulta (ou em uma consulta extra
+por relacionamento), evitando o padrão N+1.
+
+Listagem paginada de animais com paginação por chave (keyset): a página
+seguinte é buscada a partir do último par (chave de ordenação, id) visto,
+em vez de OFFSET, de modo que o custo de cada página é constante mesmo em
+propriedades com dezenas de milhares de cabeças.
+"""
+
+import base64
+import json
+from datetime import date
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import joinedload
+
+from models import Animal, Atividade, EstacaoMeteorologica
+
+# Perfis de carregamento: nome -> função que gera as opções da consulta
+# (funções porque os relacionamentos via backref só existem após a
+# configuração dos mapeamentos)
+PERFIS_CARREGAMENTO = {
+    # Mapa e API de posições: nome da raça
+    'animal_mapa': lambda: (joinedload(Animal.raca),),
+    # Listagens e relatórios de animais: raça, área e lote
+    'animal_completo': lambda: (
+        joinedload(Animal.raca),
+        joinedload(Animal.area),
+        joinedload(Animal.lote),
+    ),
+    # Listagens e relatórios de atividades: nome da área
+    'atividade_area': lambda: (joinedload(Atividade.area),),
+    # Listagem e detalhes de estações: resumo mantido a cada leitura
+    'estacao_resumo': lambda: (joinedload(EstacaoMeteorologica.resumo),),
+}
+
+
+def com_perfil(query, perfil):
+    """
+    Aplica um perfil de carregamento antecipado a uma consulta
+
+    Args:
+        query: Consulta SQLAlchemy (ex.: Animal.query)
+        perfil (str): Nome do perfil em `PERFIS_CARREGAMENTO`
+    """
+    return query.options(*PERFIS_CARREGAMENTO[perfil]())
+
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 200
+
+# Colunas permitidas para ordenação (colunas anuláveis recebem um valor padrão
+# para que a comparação por tupla do keyset seja bem definida)
+ORDENACOES_ANIMAIS = {
+    'codigo': Animal.codigo,
+    'nome': func.coalesce(Animal.nome, ''),
+    'peso_atual': func.coalesce(Animal.peso_atual, 0.0),
+    'data_nascimento': func.coalesce(Animal.data_nascimento, date(1900, 1, 1)),
+}
+
+# Filtros aceitos: nome do parâmetro -> (coluna, conversor)
+FILTROS_ANIMAIS = {
+    'status': (Animal.status, str),
+    'sexo': (Animal.sexo, str),
+    'raca_id': (Animal.raca_id, int),
+    'area_id': (Animal.area_id, int),
+    'lote_id': (Animal.lote_id, int),
+}
+
+
+def codificar_cursor(valor, id):
+    """Codifica a posição (valor da ordenação, id) em um token opaco"""
+    if isinstance(valor, date):
+        valor = valor.isoformat()
+    bruto = json.dumps([valor, id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, ordenacao):
+    """
+    Decodifica um cursor gerado por `codificar_cursor`
+
+    Raises:
+        ValueError: Se o cursor for inválido
+    """
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valor, id = json.loads(bruto)
+        if ordenacao == 'data_nascimento':
+            valor = date.fromisoformat(valor)
+        elif ordenacao == 'peso_atual':
+            valor = float(valor)
+        return valor, int(id)
+    except Exception:
+        raise ValueError('Cursor de paginação inválido')
+
+
+def _valor_ordenacao(animal, ordenacao):
+    if ordenacao == 'codigo':
+        return animal.codigo
+    if ordenacao == 'nome':
+        return animal.nome or ''
+    if ordenacao == 'peso_atual':
+        return animal.peso_atual or 0.0
+    return animal.data_nascimento or date(1900, 1, 1)
+
+
+def listar_animais_paginado(filtros=None, ordem='codigo', cursor=None, limite=LIMITE_PADRAO):
+    """
+    Lista uma página de animais com filtros aplicados no banco
+
+    Args:
+        filtros (dict): Valores dos filtros de `FILTROS_ANIMAIS` (vazios são ignorados)
+        ordem (str): Coluna de ordenação; prefixo '-' para ordem decrescente
+        cursor (str): Cursor retornado pela página anterior
+        limite (int): Tamanho da página (máximo `LIMITE_MAXIMO`)
+
+    Returns:
+        tuple: (lista de Animal com raça, área e lote carregados, próximo cursor ou None)
+
+    Raises:
+        ValueError: Para ordenação, filtro ou cursor inválidos
+    """
+    decrescente = ordem.startswith('-')
+    ordenacao = ordem.lstrip('-')
+    if ordenacao not in ORDENACOES_ANIMAIS:
+        raise ValueError(f'Ordenação inválida: {ordem}')
+    chave = ORDENACOES_ANIMAIS[ordenacao]
+    limite = max(1, min(int(limite or LIMITE_PADRAO), LIMITE_MAXIMO))
+
+    # Raça, área e lote vêm na mesma consulta (LEFT OUTER JOIN)
+    query = com_perfil(Animal.query, 'animal_completo')
+
+    for nome, valor in (filtros or {}).items():
+        if valor in (None, '', 'Todos', '0') or nome not in FILTROS_ANIMAIS:
+            continue
+        coluna, conversor = FILTROS_ANIMAIS[nome]
+        try:
+            query = query.filter(coluna == conversor(valor))
+        except (TypeError, ValueError):
+            raise ValueError(f'Valor inválido para o filtro {nome}: {valor}')
+
+    if cursor:
+        posicao = decodificar_cursor(cursor, ordenacao)
+        if decrescente:
+            query = query.filter(tuple_(chave, Animal.id) < posicao)
+        else:
+            query = query.filter(tuple_(chave, Animal.id) > posicao)
+
+    if decrescente:
+        query = query.order_by(chave.desc(), Animal.id.desc())
+    else:
+        query = query.order_by(chave.asc(), Animal.id.asc())
+
+    animais = query.limit(limite + 1).all()
+
+    proximo_cursor = None
+    if len(animais) > limite:
+        animais = animais[:limite]
+        ultimo = animais[-1]
+        proximo_cursor = codificar_cursor(_valor_ordenacao(ultimo, ordenacao), ultimo.id)
+
+    return animais, proximo_cursor
@@ -0,0 +1,364 @@
+"""
+Grafo de contatos entre animais (rastreamento de doenças).
+
+As posições de `HistoricoLocalizacao` são distribuídas em células de
+espaço-tempo (hash espacial): o tempo em intervalos de
+`CONTATO_INTERVALO_MINUTOS` e o espaço em uma grade de
+`CONTATO_RAIO_METROS` (projeção equirretangular local). Cada posição vale
+para o seu intervalo e os seguintes até a próxima posição do animal (no
+máximo `VALIDADE_POSICAO` intervalos), de modo que animais com transmissões
+em minutos diferentes se encontrem no mesmo intervalo.
+
+Dois animais a até um raio de distância estão na mesma célula ou em células
+vizinhas; os pares candidatos saem de uma busca ordenada (`searchsorted`)
+das chaves das células em metade da vizinhança 3x3, sem comparar todos os
+animais entre si. Os pares a até um raio são somados por dia em
+`ContatoAnimal` (intervalos em contato, duração, primeiro e último contato e
+menor distância), gravados nos dois sentidos.
+
+O recálculo roda de hora em hora para os últimos dias, um dia por vez; o
+grafo é consultado a partir de um animal, com contatos indiretos até alguns
+níveis (contatos dos contatos).
+"""
+
+import logging
+import math
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+
+from app import app, db
+from models import Animal, ContatoAnimal, HistoricoLocalizacao, Lote
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Intervalos seguintes em que uma posição ainda vale (sem posição mais nova)
+VALIDADE_POSICAO = 3
+
+# Período recalculado a cada execução e carga inicial
+DIAS_RECALCULO = 2
+DIAS_CARGA_INICIAL = 30
+
+# Linhas por bloco lidas do cursor no servidor
+TAMANHO_BLOCO = 50000
+
+# Intervalos processados por vez (limita a memória dos pares candidatos)
+INTERVALOS_POR_BLOCO = 12
+
+# Níveis máximos de contatos indiretos na consulta
+NIVEIS_MAXIMOS = 3
+
+RAIO_TERRA = 6371008.8
+
+# Metade da vizinhança 3x3: cada par de células vizinhas é visitado uma vez
+_VIZINHANCA = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+
+def _valor(array, i, casas=2):
+    return None if np.isnan(array[i]) else round(float(array[i]), casas)
+
+
+def _carregar_posicoes(inicio, fim):
+    """Posições do período ordenadas por animal e data: (animais, tempos, latitudes, longitudes)"""
+    consulta = (
+        select(
+            HistoricoLocalizacao.animal_id, HistoricoLocalizacao.data_hora,
+            HistoricoLocalizacao.latitude, HistoricoLocalizacao.longitude
+        )
+        .where(HistoricoLocalizacao.data_hora >= inicio, HistoricoLocalizacao.data_hora < fim)
+        .order_by(HistoricoLocalizacao.animal_id, HistoricoLocalizacao.data_hora)
+        .execution_options(yield_per=TAMANHO_BLOCO)
+    )
+
+    animais, tempos, coordenadas = [], [], []
+    for bloco in db.session.execute(consulta).partitions():
+        animais.append(np.fromiter((linha[0] for linha in bloco), dtype=np.int64, count=len(bloco)))
+        tempos.append(np.array([linha[1] for linha in bloco], dtype='datetime64[s]'))
+        coordenadas.append(np.array([linha[2:] for linha in bloco], dtype=np.float64))
+
+    if not animais:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype='datetime64[s]'), np.empty(0), np.empty(0)
+    coordenadas = np.concatenate(coordenadas)
+    return np.concatenate(animais), np.concatenate(tempos), coordenadas[:, 0], coordenadas[:, 1]
+
+
+def ocupacao_intervalos(animais, intervalos, validade=VALIDADE_POSICAO):
+    """
+    Expande cada posição para os intervalos em que ela vale
+
+    Args:
+        animais (np.ndarray): Animal de cada posição (ordenado por animal e data)
+        intervalos (np.ndarray): Intervalo de tempo de cada posição
+        validade (int): Intervalos seguintes em que a posição ainda vale
+
+    Returns:
+        tuple: (índice da posição, intervalo), um por animal e intervalo; a
+        última posição de cada intervalo prevalece
+    """
+    total = len(animais)
+    proximo = np.empty(total, dtype=np.int64)
+    proximo[:-1] = intervalos[1:]
+    mesmo_animal = np.zeros(total, dtype=bool)
+    mesmo_animal[:-1] = animais[1:] == animais[:-1]
+    limite = intervalos + 1 + validade
+    fim = np.where(mesmo_animal, np.minimum(proximo, limite), limite)
+
+    duracao = np.maximum(fim - intervalos, 0)
+    indices = np.repeat(np.arange(total), duracao)
+    deslocamento = np.arange(len(indices)) - np.repeat(np.cumsum(duracao) - duracao, duracao)
+    return indices, intervalos[indices] + deslocamento
+
+
+def pares_proximos(intervalos, x, y, raio):
+    """
+    Pares de ocupações no mesmo intervalo a até `raio` metros (hash espacial)
+
+    Args:
+        intervalos (np.ndarray): Intervalo de cada ocupação
+        x, y (np.ndarray): Posição em metros
+        raio (float): Distância máxima
+
+    Returns:
+        tuple: (i, j, distância), índices das ocupações de cada par (i != j,
+        cada par uma vez)
+    """
+    celula_x = np.floor(x / raio).astype(np.int64)
+    celula_y = np.floor(y / raio).astype(np.int64)
+    celula_x -= celula_x.min() - 1
+    celula_y -= celula_y.min() - 1
+    largura = int(celula_x.max()) + 2
+    altura = int(celula_y.max()) + 2
+
+    def chave(intervalo, cx, cy):
+        return (intervalo * altura + cy) * largura + cx
+
+    chaves = chave(intervalos, celula_x, celula_y)
+    ordem = np.argsort(chaves, kind='stable')
+    chaves_ordenadas = chaves[ordem]
+
+    todos_i, todos_j = [], []
+    for dx, dy in _VIZINHANCA:
+        vizinha = chave(intervalos, celula_x + dx, celula_y + dy)
+        inicio = np.searchsorted(chaves_ordenadas, vizinha, side='left')
+        quantidade = np.searchsorted(chaves_ordenadas, vizinha, side='right') - inicio
+        i = np.repeat(np.arange(len(chaves)), quantidade)
+        deslocamento = np.arange(len(i)) - np.repeat(np.cumsum(quantidade) - quantidade, quantidade)
+        j = ordem[inicio[i] + deslocamento]
+        # Na própria célula cada par aparece nos dois sentidos (e com ele mesmo)
+        mantidos = i < j if (dx, dy) == (0, 0) else np.ones(len(i), dtype=bool)
+        todos_i.append(i[mantidos])
+        todos_j.append(j[mantidos])
+
+    i, j = np.concatenate(todos_i), np.concatenate(todos_j)
+    distancias = np.hypot(x[i] - x[j], y[i] - y[j])
+    dentro = distancias <= raio
+    return i[dentro], j[dentro], distancias[dentro]
+
+
+def contatos_do_dia(animais, intervalos, latitudes, longitudes, raio):
+    """
+    Soma os contatos de um dia por par de animais
+
+    Args:
+        animais (np.ndarray): Animal de cada ocupação (um por animal e intervalo)
+        intervalos (np.ndarray): Intervalo de cada ocupação
+        latitudes, longitudes (np.ndarray): Posição de cada ocupação
+        raio (float): Distância máxima do contato, em metros
+
+    Returns:
+        dict: Arrays por par (animal_a < animal_b): `animal_a`, `animal_b`,
+        `encontros` (intervalos em contato), `primeiro`, `ultimo`
+        (intervalos) e `distancia_minima`; None sem contatos
+    """
+    if not len(animais):
+        return None
+
+    escala = math.pi / 180 * RAIO_TERRA
+    x = longitudes * escala * math.cos(math.radians(float(np.mean(latitudes))))
+    y = latitudes * escala
+
+    chaves, primeiros, distancias = [], [], []
+    # Em blocos de intervalos: agrupamentos densos (cocho, curral) geram muitos pares
+    for comeco in range(int(intervalos.min()), int(intervalos.max()) + 1, INTERVALOS_POR_BLOCO):
+        bloco = np.flatnonzero((intervalos >= comeco) & (intervalos < comeco + INTERVALOS_POR_BLOCO))
+        if len(bloco) < 2:
+            continue
+        i, j, distancia = pares_proximos(intervalos[bloco], x[bloco], y[bloco], raio)
+        i, j = bloco[i], bloco[j]
+        a = np.minimum(animais[i], animais[j])
+        b = np.maximum(animais[i], animais[j])
+        chaves.append(np.stack([a, b], axis=1))
+        primeiros.append(intervalos[i])
+        distancias.append(distancia)
+
+    if not chaves:
+        return None
+    chaves = np.concatenate(chaves)
+    momentos = np.concatenate(primeiros)
+    distancias = np.concatenate(distancias)
+    if not len(chaves):
+        return None
+
+    pares, grupo = np.unique(chaves, axis=0, return_inverse=True)
+    grupo = grupo.ravel()
+    quantidade = len(pares)
+    primeiro = np.full(quantidade, np.iinfo(np.int64).max)
+    ultimo = np.full(quantidade, np.iinfo(np.int64).min)
+    minima = np.full(quantidade, np.inf)
+    np.minimum.at(primeiro, grupo, momentos)
+    np.maximum.at(ultimo, grupo, momentos)
+    np.minimum.at(minima, grupo, distancias)
+    return {
+        'animal_a': pares[:, 0],
+        'animal_b': pares[:, 1],
+        'encontros': np.bincount(grupo, minlength=quantidade),
+        'primeiro': primeiro,
+        'ultimo': ultimo,
+        'distancia_minima': minima,
+    }
+
+
+def recalcular_contatos(inicio, fim):
+    """
+    Recalcula os contatos diários entre animais
+
+    Args:
+        inicio (date): Primeiro dia
+        fim (date): Último dia (inclusive)
+
+    Returns:
+        int: Número de registros (animal x contato x dia) gravados
+    """
+    comeco = datetime.now()
+    raio = app.config.get('CONTATO_RAIO_METROS', 10.0)
+    minutos = app.config.get('CONTATO_INTERVALO_MINUTOS', 5)
+    intervalo = np.timedelta64(minutos * 60, 's')
+
+    total = posicoes = 0
+    dia = inicio
+    while dia <= fim:
+        abertura = datetime.combine(dia, time.min)
+        # Posições do fim do dia anterior ainda valem nos primeiros intervalos
+        animais, tempos, latitudes, longitudes = _carregar_posicoes(
+            abertura - timedelta(minutes=minutos * VALIDADE_POSICAO), abertura + timedelta(days=1)
+        )
+        posicoes += len(animais)
+
+        resumo = None
+        if len(animais):
+            intervalos = (tempos - np.datetime64(abertura, 's')) // intervalo
+            indices, ocupados = ocupacao_intervalos(animais, intervalos)
+            no_dia = (ocupados >= 0) & (ocupados < 24 * 60 // minutos)
+            indices, ocupados = indices[no_dia], ocupados[no_dia]
+            resumo = contatos_do_dia(animais[indices], ocupados, latitudes[indices], longitudes[indices], raio)
+
+        db.session.execute(delete(ContatoAnimal).where(ContatoAnimal.data == dia))
+        if resumo is not None:
+            registros = []
+            for k in range(len(resumo['animal_a'])):
+                comum = {
+                    'data': dia,
+                    'encontros': int(resumo['encontros'][k]),
+                    'duracao': int(resumo['encontros'][k]) * minutos,
+                    'primeiro_contato': abertura + timedelta(minutes=int(resumo['primeiro'][k]) * minutos),
+                    'ultimo_contato': abertura + timedelta(minutes=(int(resumo['ultimo'][k]) + 1) * minutos),
+                    'distancia_minima': _valor(resumo['distancia_minima'], k, 1),
+                    'data_calculo': comeco
+                }
+                a, b = int(resumo['animal_a'][k]), int(resumo['animal_b'][k])
+                registros.append({'animal_id': a, 'contato_id': b, **comum})
+                registros.append({'animal_id': b, 'contato_id': a, **comum})
+            db.session.execute(insert(ContatoAnimal), registros)
+            total += len(registros)
+        db.session.commit()
+        dia += timedelta(days=1)
+
+    logger.info(
+        f"Contatos entre animais recalculados de {inicio} a {fim}: {posicoes} posições, "
+        f"{total} registros em {(datetime.now() - comeco).total_seconds():.1f}s"
+    )
+    return total
+
+
+def atualizar_contatos():
+    """Recalcula os últimos dias (ou a carga inicial, se ainda não houver contatos)"""
+    hoje = datetime.now().date()
+    if db.session.query(ContatoAnimal.id).first() is None:
+        return recalcular_contatos(hoje - timedelta(days=DIAS_CARGA_INICIAL), hoje)
+    return recalcular_contatos(hoje - timedelta(days=DIAS_RECALCULO - 1), hoje)
+
+
+def rastrear_contatos(animal_id, inicio, fim, niveis=1, duracao_minima=0):
+    """
+    Animais que estiveram em contato com um animal no período
+
+    Args:
+        animal_id (int): Animal de origem
+        inicio, fim (date): Período (dias inclusivos)
+        niveis (int): 1 para contatos diretos; 2 ou 3 incluem os contatos
+            dos contatos
+        duracao_minima (int): Duração mínima somada no período, em minutos
+
+    Returns:
+        list: Dicts por animal contatado (nível, animal pelo qual foi
+        alcançado, duração, encontros, primeiro/último contato e menor
+        distância), por nível e da maior para a menor duração
+    """
+    resultado = []
+    visitados = {animal_id}
+    fronteira = [animal_id]
+    for nivel in range(1, min(niveis, NIVEIS_MAXIMOS) + 1):
+        linhas = db.session.query(
+            ContatoAnimal.animal_id, ContatoAnimal.contato_id, Animal.codigo, Animal.nome, Animal.status,
+            Lote.nome.label('lote'),
+            func.sum(ContatoAnimal.duracao).label('duracao'),
+            func.sum(ContatoAnimal.encontros).label('encontros'),
+            func.min(ContatoAnimal.primeiro_contato).label('primeiro_contato'),
+            func.max(ContatoAnimal.ultimo_contato).label('ultimo_contato'),
+            func.min(ContatoAnimal.distancia_minima).label('distancia_minima')
+        ).join(Animal, ContatoAnimal.contato_id == Animal.id)\
+            .outerjoin(Lote, Animal.lote_id == Lote.id)\
+            .filter(
+                ContatoAnimal.animal_id.in_(fronteira),
+                ContatoAnimal.data >= inicio,
+                ContatoAnimal.data <= fim
+            ).group_by(
+                ContatoAnimal.animal_id, ContatoAnimal.contato_id, Animal.codigo, Animal.nome,
+                Animal.status, Lote.nome
+            ).having(func.sum(ContatoAnimal.duracao) >= duracao_minima)\
+            .order_by(func.sum(ContatoAnimal.duracao).desc()).all()
+
+        # Cada animal novo entra uma vez, pelo contato mais longo
+        novos = []
+        for linha in linhas:
+            if linha.contato_id in visitados:
+                continue
+            visitados.add(linha.contato_id)
+            novos.append(linha.contato_id)
+            resultado.append({
+                'nivel': nivel,
+                'animal_id': linha.contato_id,
+                'codigo': linha.codigo,
+                'nome': linha.nome,
+                'status': linha.status,
+                'lote': linha.lote,
+                'via_animal_id': linha.animal_id,
+                'duracao': int(linha.duracao),
+                'encontros': int(linha.encontros),
+                'primeiro_contato': linha.primeiro_contato.isoformat(),
+                'ultimo_contato': linha.ultimo_contato.isoformat(),
+                'distancia_minima': linha.distancia_minima
+            })
+        if not novos:
+            break
+        fronteira = novos
+    return resultado
+
+
+def init_app(app):
+    """Agenda o recálculo dos contatos entre animais dos últimos dias"""
+    from agendador import agendador
+
+    agendador.agendar('contatos_animais', 60 * 60, atualizar_contatos)
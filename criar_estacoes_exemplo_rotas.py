@@ -14,6 +14,7 @@ import flask
 from flask import Blueprint, jsonify, request, redirect, url_for, flash
 from app import app, db
 from models import EstacaoMeteorologica, LeituraMeteorologica, BalancaDigital, Propriedade
+from leituras_estacoes import recalcular_resumos
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
@@ -99,6 +100,7 @@ def criar_estacao_exemplo():
             db.session.add(leitura)
         
         db.session.commit()
+        recalcular_resumos([estacao.id])
         
         logger.info(f"Estação meteorológica de exemplo criada: {estacao.nome}")
         
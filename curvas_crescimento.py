@@ -0,0 +1,206 @@
+"""
+Ajuste de curvas de crescimento (Gompertz e von Bertalanffy) em lote.
+
+Módulo puramente numérico (somente NumPy, sem Flask nem banco), para que
+possa ser importado pelos processos do pool de ajuste.
+
+Os dados de várias séries (animais ou lotes) são empacotados em matrizes
+(séries x pesagens) com máscara, e o ajuste por mínimos quadrados não
+lineares (Levenberg-Marquardt) é feito para todas as séries ao mesmo tempo:
+cada iteração resolve um sistema 3x3 por série com `np.linalg.solve`
+vetorizado.
+
+Os parâmetros são ajustados em escala logarítmica (log A, log b, log k),
+o que os mantém positivos. Animais com poucas pesagens são regularizados
+em direção à curva do seu lote (penalidade `peso_prior`), de modo que duas
+ou três pesagens ainda produzem uma curva plausível.
+
+Idade `t` em dias desde o nascimento; pesos em kg.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+
+# Peso da penalidade que puxa os parâmetros do animal para os do lote:
+# (erro típico de pesagem em kg / desvio aceito em log-parâmetros) ** 2
+PESO_PRIOR_PADRAO = (10 / 0.25) ** 2
+
+ITERACOES_PADRAO = 60
+
+
+def _gompertz(theta, t):
+    """W = A * exp(-b * exp(-k t)) e jacobiano em relação a (log A, log b, log k)"""
+    a, b, k = (np.exp(theta[:, i])[:, None] for i in range(3))
+    e = np.exp(-k * t)
+    w = a * np.exp(-b * e)
+    jacobiano = np.stack((w, -w * b * e, w * b * e * k * t), axis=-1)
+    return w, jacobiano
+
+
+def _bertalanffy(theta, t):
+    """W = A * (1 - b * exp(-k t)) ** 3 e jacobiano em relação a (log A, log b, log k)"""
+    a, b, k = (np.exp(theta[:, i])[:, None] for i in range(3))
+    e = np.exp(-k * t)
+    u = np.clip(1 - b * e, 1e-6, None)
+    w = a * u ** 3
+    derivada_u = 3 * a * u ** 2
+    jacobiano = np.stack((w, -derivada_u * b * e, derivada_u * b * e * k * t), axis=-1)
+    return w, jacobiano
+
+
+MODELOS = {'gompertz': _gompertz, 'bertalanffy': _bertalanffy}
+
+
+def empacotar(serie, t, peso):
+    """
+    Converte arrays planos em matrizes (séries x pesagens) com máscara
+
+    Args:
+        serie (np.ndarray): Identificador da série de cada ponto (ordenado)
+        t (np.ndarray): Idade em dias
+        peso (np.ndarray): Peso em kg
+
+    Returns:
+        tuple: (ids das séries, T, Y, máscara)
+    """
+    ids, inicio, contagem = np.unique(serie, return_index=True, return_counts=True)
+    largura = int(contagem.max()) if len(contagem) else 0
+    linha = np.repeat(np.arange(len(ids)), contagem)
+    coluna = np.arange(len(serie)) - np.repeat(inicio, contagem)
+
+    T = np.zeros((len(ids), largura))
+    Y = np.zeros((len(ids), largura))
+    M = np.zeros((len(ids), largura), dtype=bool)
+    T[linha, coluna] = t
+    Y[linha, coluna] = peso
+    M[linha, coluna] = True
+    return ids, T, Y, M
+
+
+def chute_inicial(modelo, T, Y, M):
+    """Parâmetros iniciais (em log) a partir do maior peso e do ponto médio de cada série"""
+    pontos = np.maximum(M.sum(axis=1), 1)
+    t_medio = (T * M).sum(axis=1) / pontos
+    y_medio = (Y * M).sum(axis=1) / pontos
+    a = np.maximum(1.4 * np.where(M, Y, 0).max(axis=1), 450.0)
+    k = np.full(len(T), 0.004 if modelo == 'gompertz' else 0.003)
+
+    razao = np.clip(y_medio / a, 1e-3, 0.999)
+    if modelo == 'gompertz':
+        b = -np.log(razao) * np.exp(k * t_medio)
+    else:
+        b = (1 - np.cbrt(razao)) * np.exp(k * t_medio)
+    return np.log(np.column_stack((a, np.clip(b, 1e-3, None), k)))
+
+
+def _custo(funcao, theta, T, Y, M, prior, peso_prior):
+    w, _ = funcao(theta, T)
+    custo = (((Y - w) * M) ** 2).sum(axis=1)
+    if prior is not None:
+        custo += peso_prior * ((theta - prior) ** 2).sum(axis=1)
+    return custo
+
+
+def ajustar(modelo, T, Y, M, theta0=None, prior=None, peso_prior=PESO_PRIOR_PADRAO, iteracoes=ITERACOES_PADRAO):
+    """
+    Ajusta a curva a todas as séries simultaneamente (Levenberg-Marquardt)
+
+    Args:
+        modelo (str): 'gompertz' ou 'bertalanffy'
+        T, Y, M (np.ndarray): Matrizes de `empacotar`
+        theta0 (np.ndarray): Parâmetros iniciais em log (séries x 3)
+        prior (np.ndarray): Parâmetros de referência em log (séries x 3), opcional
+        peso_prior (float): Peso da penalidade em relação ao prior
+        iteracoes (int): Número de iterações
+
+    Returns:
+        tuple: (theta em log (séries x 3), RMSE em kg por série)
+    """
+    funcao = MODELOS[modelo]
+    theta = chute_inicial(modelo, T, Y, M) if theta0 is None else theta0.copy()
+    amortecimento = np.full(len(T), 1e-2)
+    custo = _custo(funcao, theta, T, Y, M, prior, peso_prior)
+    identidade = np.eye(3)
+
+    with np.errstate(over='ignore', invalid='ignore'):
+        for _ in range(iteracoes):
+            w, jacobiano = funcao(theta, T)
+            residuo = (Y - w) * M
+            jacobiano = jacobiano * M[..., None]
+
+            jtj = np.einsum('snp,snq->spq', jacobiano, jacobiano)
+            jtr = np.einsum('snp,sn->sp', jacobiano, residuo)
+            if prior is not None:
+                jtj = jtj + peso_prior * identidade
+                jtr = jtr - peso_prior * (theta - prior)
+
+            diagonal = np.einsum('spp->sp', jtj)[:, :, None] * identidade
+            sistema = jtj + amortecimento[:, None, None] * (diagonal + 1e-9 * identidade)
+            passo = np.linalg.solve(sistema, jtr[..., None])[..., 0]
+
+            candidato = theta + passo
+            novo_custo = _custo(funcao, candidato, T, Y, M, prior, peso_prior)
+            melhorou = np.isfinite(novo_custo) & (novo_custo < custo)
+
+            theta[melhorou] = candidato[melhorou]
+            custo[melhorou] = novo_custo[melhorou]
+            amortecimento = np.clip(np.where(melhorou, amortecimento * 0.3, amortecimento * 10), 1e-7, 1e7)
+
+    w, _ = funcao(theta, T)
+    rmse = np.sqrt((((Y - w) * M) ** 2).sum(axis=1) / np.maximum(M.sum(axis=1), 1))
+    return theta, rmse
+
+
+def ajustar_em_paralelo(modelo, T, Y, M, prior=None, processos=None, tamanho_bloco=2000, **kwargs):
+    """
+    Divide as séries em blocos e ajusta cada bloco em um processo
+
+    As séries são independentes e, como em `ajustar` com `theta0=prior`, cada
+    bloco parte do prior (ou do chute inicial, sem prior), então o resultado é
+    o mesmo do ajuste serial. Usa o método 'spawn' para não herdar threads e
+    conexões do worker web.
+    """
+    blocos = range(0, len(T), tamanho_bloco)
+    argumentos = [(
+        modelo, T[i:i + tamanho_bloco], Y[i:i + tamanho_bloco], M[i:i + tamanho_bloco],
+        None if prior is None else prior[i:i + tamanho_bloco].copy(),
+        None if prior is None else prior[i:i + tamanho_bloco]
+    ) for i in blocos]
+
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as pool:
+        resultados = list(pool.map(_ajustar_bloco, argumentos, [kwargs] * len(argumentos)))
+
+    return (
+        np.concatenate([theta for theta, _ in resultados]),
+        np.concatenate([rmse for _, rmse in resultados]),
+    )
+
+
+def _ajustar_bloco(argumentos, kwargs):
+    return ajustar(*argumentos, **kwargs)
+
+
+def peso_na_idade(modelo, theta, t):
+    """Peso previsto por série na idade `t` (dias; escalar ou array por série)"""
+    w, _ = MODELOS[modelo](theta, np.broadcast_to(np.asarray(t, dtype=float), (len(theta),))[:, None])
+    return w[:, 0]
+
+
+def idade_para_peso(modelo, theta, peso):
+    """
+    Idade (dias) em que cada série atinge o peso informado
+
+    Returns:
+        np.ndarray: Idade em dias; NaN se o peso não é atingível (>= peso assintótico A)
+    """
+    a, b, k = (np.exp(theta[:, i]) for i in range(3))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        razao = peso / a
+        if modelo == 'gompertz':
+            idade = -np.log(-np.log(razao) / b) / k
+        else:
+            idade = -np.log((1 - np.cbrt(razao)) / b) / k
+    return np.where(razao < 1, idade, np.nan)
@@ -0,0 +1,393 @@
+"""
+Estresse térmico do rebanho: ITU, ponto de orvalho e carga térmica.
+
+Para cada leitura com temperatura e umidade são calculados, de forma
+vetorizada, o Índice de Temperatura e Umidade (ITU) e o ponto de orvalho
+(fórmula de Magnus). As leituras são agregadas em médias horárias e as horas
+em resumos diários por estação (`EstresseTermicoDiario`), com a carga
+térmica do dia (soma do ITU horário acima de `LIMIAR_CARGA_TERMICA`) e as
+horas em cada categoria de estresse.
+
+A exposição de cada animal vem da estação mais próxima da sua última posição
+conhecida. O mapa animal -> estação é calculado de uma vez (matriz de
+distâncias em blocos) e fica em cache; a carga acumulada por animal e por
+lote sai da soma dos resumos diários das estações no período.
+"""
+
+import logging
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+
+from app import db
+from cache_memoria import CacheTemporario
+from models import Animal, EstacaoMeteorologica, EstresseTermicoDiario, LeituraMeteorologica
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Categorias por ITU horário (Livestock Weather Safety Index)
+CATEGORIAS_ITU = ('Normal', 'Alerta', 'Perigo', 'Emergência')
+LIMIARES_ITU = (75, 79, 84)
+
+# Início do desconforto térmico: base da carga térmica diária
+LIMIAR_CARGA_TERMICA = 72
+
+# Animais mais distantes que isto da estação mais próxima ficam sem exposição
+DISTANCIA_MAXIMA_KM = 30
+
+# Período recalculado a cada execução e carga inicial (uma estação do ano)
+DIAS_RECALCULO = 2
+DIAS_CARGA_INICIAL = 120
+
+# Linhas por bloco lidas do cursor no servidor
+TAMANHO_BLOCO = 10000
+
+# Animais por bloco da matriz de distâncias animais x estações
+TAMANHO_BLOCO_DISTANCIAS = 20000
+
+RAIO_TERRA_KM = 6371.0
+
+# Mapa animal -> estação mais próxima (posições mudam pouco entre execuções)
+cache_mapa_estacoes = CacheTemporario(ttl=15 * 60)
+
+# A carga inicial é verificada só na primeira execução do processo
+_carga_inicial_verificada = False
+
+
+def _valor(array, i, casas=2):
+    return None if np.isnan(array[i]) else round(float(array[i]), casas)
+
+
+def indice_temperatura_umidade(temperatura, umidade):
+    """ITU = 0,8 T + (UR/100) (T - 14,4) + 46,4 (T em °C, UR em %)"""
+    return 0.8 * temperatura + (umidade / 100.0) * (temperatura - 14.4) + 46.4
+
+
+def ponto_orvalho(temperatura, umidade):
+    """Ponto de orvalho em °C pela fórmula de Magnus"""
+    a, b = 17.62, 243.12
+    gama = np.log(np.clip(umidade, 1.0, 100.0) / 100.0) + a * temperatura / (b + temperatura)
+    return b * gama / (a - gama)
+
+
+def categoria_itu(itu):
+    """Índice em `CATEGORIAS_ITU` de cada valor de ITU"""
+    return np.digitize(itu, LIMIARES_ITU)
+
+
+def _inicios_grupos(*chaves):
+    """Índices onde começa cada grupo de chaves consecutivas iguais (dados ordenados)"""
+    mudou = np.zeros(len(chaves[0]), dtype=bool)
+    mudou[0] = True
+    for chave in chaves:
+        mudou[1:] |= chave[1:] != chave[:-1]
+    return np.flatnonzero(mudou)
+
+
+def resumir_por_dia(estacao, tempos, temperatura, umidade):
+    """
+    Agrega as leituras em horas e as horas em dias, por estação
+
+    Args:
+        estacao (np.ndarray): Estação de cada leitura
+        tempos (np.ndarray): datetime64 de cada leitura (ordenado dentro da estação)
+        temperatura, umidade (np.ndarray): Valores das leituras (sem NaN)
+
+    Returns:
+        dict: Arrays por (estação, dia): estacao, data, leituras, horas,
+        itu_medio, itu_maximo, ponto_orvalho_medio, temperatura_maxima,
+        carga_termica e horas por categoria
+    """
+    if not len(estacao):
+        return None
+
+    itu = indice_temperatura_umidade(temperatura, umidade)
+    orvalho = ponto_orvalho(temperatura, umidade)
+    hora = tempos.astype('datetime64[h]').astype(np.int64)
+
+    # Médias horárias
+    inicio = _inicios_grupos(estacao, hora)
+    contagem = np.diff(np.append(inicio, len(estacao)))
+    estacao_h = estacao[inicio]
+    hora_h = hora[inicio]
+    itu_h = np.add.reduceat(itu, inicio) / contagem
+    orvalho_h = np.add.reduceat(orvalho, inicio) / contagem
+    temperatura_h = np.maximum.reduceat(temperatura, inicio)
+    categoria_h = categoria_itu(itu_h)
+
+    # Resumo diário a partir das horas
+    dia_h = hora_h // 24
+    inicio_d = _inicios_grupos(estacao_h, dia_h)
+    horas = np.diff(np.append(inicio_d, len(estacao_h)))
+
+    resumo = {
+        'estacao': estacao_h[inicio_d],
+        'data': dia_h[inicio_d].astype('datetime64[D]'),
+        'leituras': np.add.reduceat(contagem, inicio_d),
+        'horas': horas,
+        'itu_medio': np.add.reduceat(itu_h, inicio_d) / horas,
+        'itu_maximo': np.maximum.reduceat(itu_h, inicio_d),
+        'ponto_orvalho_medio': np.add.reduceat(orvalho_h, inicio_d) / horas,
+        'temperatura_maxima': np.maximum.reduceat(temperatura_h, inicio_d),
+        'carga_termica': np.add.reduceat(np.maximum(itu_h - LIMIAR_CARGA_TERMICA, 0), inicio_d),
+        'categoria': np.maximum.reduceat(categoria_h, inicio_d),
+    }
+    for indice, nome in enumerate(('horas_alerta', 'horas_perigo', 'horas_emergencia'), start=1):
+        resumo[nome] = np.add.reduceat((categoria_h == indice).astype(np.int64), inicio_d)
+    return resumo
+
+
+def _carregar_leituras(inicio, fim):
+    """Leituras com temperatura e umidade de todas as estações, ordenadas por estação e data"""
+    consulta = (
+        select(
+            LeituraMeteorologica.estacao_id, LeituraMeteorologica.data_hora,
+            LeituraMeteorologica.temperatura, LeituraMeteorologica.umidade
+        )
+        .where(
+            LeituraMeteorologica.data_hora >= inicio,
+            LeituraMeteorologica.data_hora < fim,
+            LeituraMeteorologica.temperatura != None,
+            LeituraMeteorologica.umidade != None
+        )
+        .order_by(LeituraMeteorologica.estacao_id, LeituraMeteorologica.data_hora)
+        .execution_options(yield_per=TAMANHO_BLOCO)
+    )
+
+    estacoes, tempos, valores = [], [], []
+    for bloco in db.session.execute(consulta).partitions():
+        estacoes.append(np.fromiter((linha[0] for linha in bloco), dtype=np.int64, count=len(bloco)))
+        tempos.append(np.array([linha[1] for linha in bloco], dtype='datetime64[s]'))
+        valores.append(np.array([linha[2:] for linha in bloco], dtype=np.float64))
+
+    if not estacoes:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype='datetime64[s]'), np.empty((0, 2))
+    return np.concatenate(estacoes), np.concatenate(tempos), np.concatenate(valores)
+
+
+def recalcular_estresse_termico(inicio, fim):
+    """
+    Recalcula os resumos diários de estresse térmico de todas as estações
+
+    Args:
+        inicio (date): Primeiro dia
+        fim (date): Último dia (inclusive)
+
+    Returns:
+        int: Número de resumos (estação x dia) gravados
+    """
+    comeco = datetime.now()
+    estacao, tempos, valores = _carregar_leituras(
+        datetime.combine(inicio, time.min), datetime.combine(fim + timedelta(days=1), time.min)
+    )
+    resumo = resumir_por_dia(estacao, tempos, valores[:, 0], valores[:, 1])
+
+    db.session.execute(
+        delete(EstresseTermicoDiario)
+        .where(EstresseTermicoDiario.data >= inicio, EstresseTermicoDiario.data <= fim)
+    )
+    total = 0
+    if resumo is not None:
+        total = len(resumo['estacao'])
+        registros = [{
+            'estacao_id': int(resumo['estacao'][i]),
+            'data': resumo['data'][i].item(),
+            'leituras': int(resumo['leituras'][i]),
+            'horas': int(resumo['horas'][i]),
+            'itu_medio': _valor(resumo['itu_medio'], i),
+            'itu_maximo': _valor(resumo['itu_maximo'], i),
+            'ponto_orvalho_medio': _valor(resumo['ponto_orvalho_medio'], i),
+            'temperatura_maxima': _valor(resumo['temperatura_maxima'], i),
+            'carga_termica': _valor(resumo['carga_termica'], i),
+            'horas_alerta': int(resumo['horas_alerta'][i]),
+            'horas_perigo': int(resumo['horas_perigo'][i]),
+            'horas_emergencia': int(resumo['horas_emergencia'][i]),
+            'categoria': CATEGORIAS_ITU[resumo['categoria'][i]],
+            'data_calculo': comeco
+        } for i in range(total)]
+        db.session.execute(insert(EstresseTermicoDiario), registros)
+    db.session.commit()
+
+    logger.info(
+        f"Estresse térmico recalculado de {inicio} a {fim}: {len(estacao)} leituras, "
+        f"{total} resumos em {(datetime.now() - comeco).total_seconds():.1f}s"
+    )
+    return total
+
+
+def atualizar_estresse_termico():
+    """
+    Recalcula os últimos dias
+
+    Na primeira execução do processo, se ainda não houver resumos, faz a carga
+    inicial. A verificação não se repete: sem leituras a tabela continua vazia
+    e a carga inicial voltaria a ser feita a cada hora.
+    """
+    global _carga_inicial_verificada
+
+    hoje = datetime.now().date()
+    if not _carga_inicial_verificada:
+        vazia = db.session.query(EstresseTermicoDiario.id).first() is None
+        _carga_inicial_verificada = True
+        if vazia:
+            return recalcular_estresse_termico(hoje - timedelta(days=DIAS_CARGA_INICIAL), hoje)
+    return recalcular_estresse_termico(hoje - timedelta(days=DIAS_RECALCULO - 1), hoje)
+
+
+def estacao_mais_proxima(lat, lon, lat_estacoes, lon_estacoes):
+    """
+    Estação mais próxima de cada ponto (distância equiretangular)
+
+    Args:
+        lat, lon (np.ndarray): Coordenadas dos pontos, em graus
+        lat_estacoes, lon_estacoes (np.ndarray): Coordenadas das estações
+
+    Returns:
+        tuple: (índice da estação mais próxima, distância em km) por ponto
+    """
+    indices = np.empty(len(lat), dtype=np.int64)
+    distancias = np.empty(len(lat))
+    lat_e = np.radians(lat_estacoes)[None, :]
+    lon_e = np.radians(lon_estacoes)[None, :]
+
+    for i in range(0, len(lat), TAMANHO_BLOCO_DISTANCIAS):
+        bloco = slice(i, i + TAMANHO_BLOCO_DISTANCIAS)
+        lat_p = np.radians(lat[bloco])[:, None]
+        lon_p = np.radians(lon[bloco])[:, None]
+        dx = (lon_p - lon_e) * np.cos((lat_p + lat_e) / 2)
+        dy = lat_p - lat_e
+        quadrado = dx * dx + dy * dy
+        indices[bloco] = np.argmin(quadrado, axis=1)
+        distancias[bloco] = np.sqrt(quadrado[np.arange(len(quadrado)), indices[bloco]]) * RAIO_TERRA_KM
+    return indices, distancias
+
+
+def _calcular_mapa_estacoes():
+    estacoes = db.session.execute(
+        select(EstacaoMeteorologica.id, EstacaoMeteorologica.latitude, EstacaoMeteorologica.longitude)
+        .where(
+            EstacaoMeteorologica.latitude != None,
+            EstacaoMeteorologica.longitude != None,
+            EstacaoMeteorologica.sensor_temperatura == True,
+            EstacaoMeteorologica.sensor_umidade == True
+        )
+        .order_by(EstacaoMeteorologica.id)
+    ).all()
+    animais = db.session.execute(
+        select(Animal.id, Animal.codigo, Animal.lote_id, Animal.ultima_latitude, Animal.ultima_longitude)
+        .where(Animal.status == 'Ativo', Animal.ultima_latitude != None, Animal.ultima_longitude != None)
+        .order_by(Animal.id)
+    ).all()
+
+    mapa = {
+        'animal_id': np.fromiter((a[0] for a in animais), dtype=np.int64, count=len(animais)),
+        'codigo': [a[1] for a in animais],
+        'lote_id': np.fromiter((-1 if a[2] is None else a[2] for a in animais), dtype=np.int64, count=len(animais)),
+        'estacao_id': np.full(len(animais), -1, dtype=np.int64),
+        'distancia_km': np.full(len(animais), np.nan),
+    }
+    if estacoes and animais:
+        coordenadas = np.array([a[3:] for a in animais], dtype=np.float64)
+        posicoes = np.array([e[1:] for e in estacoes], dtype=np.float64)
+        indices, distancias = estacao_mais_proxima(
+            coordenadas[:, 0], coordenadas[:, 1], posicoes[:, 0], posicoes[:, 1]
+        )
+        ids_estacoes = np.array([e[0] for e in estacoes], dtype=np.int64)
+        proxima = distancias <= DISTANCIA_MAXIMA_KM
+        mapa['estacao_id'] = np.where(proxima, ids_estacoes[indices], -1)
+        mapa['distancia_km'] = distancias
+    return mapa
+
+
+def obter_mapa_estacoes():
+    """Mapa (em cache) da estação mais próxima de cada animal ativo com posição"""
+    return cache_mapa_estacoes.obter('mapa', _calcular_mapa_estacoes)
+
+
+def cargas_por_estacao(inicio, fim):
+    """Carga térmica e horas por categoria de cada estação no período (uma consulta)"""
+    linhas = db.session.execute(
+        select(
+            EstresseTermicoDiario.estacao_id,
+            func.sum(EstresseTermicoDiario.carga_termica),
+            func.sum(EstresseTermicoDiario.horas_alerta),
+            func.sum(EstresseTermicoDiario.horas_perigo),
+            func.sum(EstresseTermicoDiario.horas_emergencia),
+            func.max(EstresseTermicoDiario.itu_maximo),
+            func.count(EstresseTermicoDiario.id)
+        )
+        .where(EstresseTermicoDiario.data >= inicio, EstresseTermicoDiario.data <= fim)
+        .group_by(EstresseTermicoDiario.estacao_id)
+    ).all()
+    return {linha[0]: linha[1:] for linha in linhas}
+
+
+def exposicao_termica(inicio, fim, lote_id=None):
+    """
+    Carga térmica acumulada por animal e por lote no período
+
+    Args:
+        inicio, fim (date): Período (inclusive)
+        lote_id (int): Restringe os animais a um lote (opcional)
+
+    Returns:
+        tuple: (lista por animal, lista por lote)
+    """
+    mapa = obter_mapa_estacoes()
+    cargas = cargas_por_estacao(inicio, fim)
+
+    estacoes = np.array(sorted(cargas), dtype=np.int64)
+    valores = np.array([cargas[id] for id in estacoes], dtype=np.float64).reshape(len(estacoes), 6)
+
+    # Cargas da estação de cada animal (NaN: sem estação próxima ou sem dados)
+    por_animal = np.full((len(mapa['animal_id']), 6), np.nan)
+    if len(estacoes):
+        posicao = np.minimum(np.searchsorted(estacoes, mapa['estacao_id']), len(estacoes) - 1)
+        com_dados = estacoes[posicao] == mapa['estacao_id']
+        por_animal[com_dados] = valores[posicao[com_dados]]
+
+    selecionados = np.arange(len(mapa['animal_id']))
+    if lote_id is not None:
+        selecionados = np.flatnonzero(mapa['lote_id'] == lote_id)
+
+    animais = [{
+        'animal_id': int(mapa['animal_id'][i]),
+        'codigo': mapa['codigo'][i],
+        'lote_id': None if mapa['lote_id'][i] < 0 else int(mapa['lote_id'][i]),
+        'estacao_id': None if mapa['estacao_id'][i] < 0 else int(mapa['estacao_id'][i]),
+        'distancia_km': _valor(mapa['distancia_km'], i),
+        'carga_termica': _valor(por_animal[:, 0], i),
+        'horas_alerta': _valor(por_animal[:, 1], i, 0),
+        'horas_perigo': _valor(por_animal[:, 2], i, 0),
+        'horas_emergencia': _valor(por_animal[:, 3], i, 0),
+        'itu_maximo': _valor(por_animal[:, 4], i),
+    } for i in selecionados]
+
+    # Por lote: média e máximo da carga dos animais com exposição
+    lotes = []
+    grupos, inverso = np.unique(mapa['lote_id'][selecionados], return_inverse=True)
+    carga = por_animal[selecionados, 0]
+    validos = ~np.isnan(carga)
+    expostos = np.bincount(inverso[validos], minlength=len(grupos))
+    soma = np.bincount(inverso[validos], weights=carga[validos], minlength=len(grupos))
+    maximo = np.full(len(grupos), np.nan)
+    np.fmax.at(maximo, inverso[validos], carga[validos])
+    animais_lote = np.bincount(inverso, minlength=len(grupos))
+    for i, grupo in enumerate(grupos):
+        lotes.append({
+            'lote_id': None if grupo < 0 else int(grupo),
+            'animais': int(animais_lote[i]),
+            'animais_expostos': int(expostos[i]),
+            'carga_termica_media': round(float(soma[i] / expostos[i]), 2) if expostos[i] else None,
+            'carga_termica_maxima': _valor(maximo, i),
+        })
+    return animais, lotes
+
+
+def init_app(app):
+    """Agenda o recálculo dos resumos de estresse térmico dos últimos dias"""
+    from agendador import agendador
+
+    agendador.agendar('estresse_termico', 60 * 60, atualizar_estresse_termico)
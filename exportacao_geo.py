@@ -0,0 +1,310 @@
+"""
+Exportação de áreas e trilhas dos animais em KML, KMZ e GeoJSON.
+
+Como na exportação de relatórios, as linhas são lidas por um cursor no
+servidor, em blocos, e o arquivo é escrito e enviado aos pedaços na própria
+resposta: a memória do worker não depende do número de áreas nem de
+posições do período.
+
+- Áreas: um Placemark/Feature por `Area`, com os furos do polígono. No
+  GeoJSON a geometria gravada em `Area.coordenadas` é copiada sem
+  decodificar.
+- Trilhas: um Placemark/Feature por animal, com a LineString das posições de
+  `HistoricoLocalizacao` em ordem de data (um Point quando há uma única
+  posição). Uma consulta agregada por animal (início, fim e número de
+  posições) antecede o cursor, para que o cabeçalho de cada trilha seja
+  escrito antes das coordenadas.
+- KMZ: o KML é comprimido em fluxo (`zipfile` sobre um destino sem seek, com
+  descritores de dados), sem arquivo temporário.
+"""
+
+import io
+import json
+import zipfile
+from datetime import datetime
+from itertools import groupby
+from xml.sax.saxutils import escape
+
+from sqlalchemy import func, select
+
+from app import db
+from exportacao_relatorios import TAMANHO_BLOCO, TAMANHO_CHUNK
+from models import Animal, Area, HistoricoLocalizacao
+
+FORMATOS_GEO = {
+    'kml': 'application/vnd.google-earth.kml+xml',
+    'kmz': 'application/vnd.google-earth.kmz',
+    'geojson': 'application/geo+json',
+}
+
+# Opacidade do preenchimento das áreas no KML (aa de aabbggrr)
+OPACIDADE_AREA = '66'
+
+# Cor das trilhas no KML (aabbggrr)
+COR_TRILHA = 'ff00a5ff'
+
+_CABECALHO_KML = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<kml xmlns="http://www.opengis.net/kml/2.2"><Document><name>{}</name>\n'
+)
+_RODAPE_KML = '</Document></kml>\n'
+
+
+def _cor_kml(cor, opacidade='ff'):
+    """Converte '#rrggbb' para a cor KML (aabbggrr)"""
+    cor = (cor or '#3388ff').lstrip('#')
+    return f'{opacidade}{cor[4:6]}{cor[2:4]}{cor[0:2]}'.lower() if len(cor) == 6 else f'{opacidade}ff8833'
+
+
+def _data_kml(data_hora):
+    return data_hora.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _coordenadas_kml(pontos):
+    return ' '.join(f'{lng},{lat}' for lng, lat in pontos)
+
+
+def _agrupar_blocos(fragmentos):
+    """Junta fragmentos de texto em blocos de bytes de ~`TAMANHO_CHUNK`"""
+    buffer = io.StringIO()
+    for fragmento in fragmentos:
+        buffer.write(fragmento)
+        if buffer.tell() >= TAMANHO_CHUNK:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _DestinoZip:
+    """Destino sem seek do `zipfile`: acumula os bytes comprimidos até serem enviados"""
+
+    def __init__(self):
+        self.blocos = []
+
+    def write(self, dados):
+        self.blocos.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self.blocos)
+        self.blocos = []
+        return dados
+
+
+def _kmz(blocos_kml):
+    """Comprime em fluxo os blocos de um KML como doc.kml de um KMZ"""
+    destino = _DestinoZip()
+    with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED) as kmz:
+        with kmz.open('doc.kml', 'w') as doc:
+            for bloco in blocos_kml:
+                doc.write(bloco)
+                dados = destino.esvaziar()
+                if dados:
+                    yield dados
+    yield destino.esvaziar()
+
+
+def _linhas(consulta):
+    """Linhas de uma consulta lidas do cursor no servidor em blocos"""
+    for bloco in db.session.execute(consulta.execution_options(yield_per=TAMANHO_BLOCO)).partitions():
+        yield from bloco
+
+
+# Áreas
+
+def _consulta_areas(propriedade_id=None, tipo=None):
+    consulta = select(
+        Area.id, Area.nome, Area.tipo, Area.tamanho, Area.cor, Area.propriedade_id, Area.coordenadas
+    ).where(Area.coordenadas != None).order_by(Area.id)
+    if propriedade_id is not None:
+        consulta = consulta.where(Area.propriedade_id == propriedade_id)
+    if tipo:
+        consulta = consulta.where(Area.tipo == tipo)
+    return consulta
+
+
+def _kml_areas(consulta):
+    yield _CABECALHO_KML.format('Áreas')
+    for area in _linhas(consulta):
+        geometria = json.loads(area.coordenadas)
+        aneis = geometria.get('coordinates') or []
+        if geometria.get('type') != 'Polygon' or not aneis:
+            continue
+
+        descricao = ' - '.join(str(valor) for valor in (area.tipo, f'{area.tamanho} ha' if area.tamanho else None) if valor)
+        yield (
+            f'<Placemark id="area-{area.id}"><name>{escape(area.nome)}</name>'
+            f'<description>{escape(descricao)}</description>'
+            f'<Style><LineStyle><color>{_cor_kml(area.cor)}</color><width>2</width></LineStyle>'
+            f'<PolyStyle><color>{_cor_kml(area.cor, OPACIDADE_AREA)}</color></PolyStyle></Style>'
+            f'<Polygon><outerBoundaryIs><LinearRing><coordinates>{_coordenadas_kml(aneis[0])}'
+            '</coordinates></LinearRing></outerBoundaryIs>'
+        )
+        for furo in aneis[1:]:
+            yield (
+                f'<innerBoundaryIs><LinearRing><coordinates>{_coordenadas_kml(furo)}'
+                '</coordinates></LinearRing></innerBoundaryIs>'
+            )
+        yield '</Polygon></Placemark>\n'
+    yield _RODAPE_KML
+
+
+def _geojson_areas(consulta):
+    yield '{"type":"FeatureCollection","features":['
+    separador = ''
+    for area in _linhas(consulta):
+        propriedades = json.dumps({
+            'id': area.id,
+            'nome': area.nome,
+            'tipo': area.tipo,
+            'tamanho': area.tamanho,
+            'cor': area.cor,
+            'propriedade_id': area.propriedade_id
+        }, ensure_ascii=False)
+        yield f'{separador}\n{{"type":"Feature","geometry":{area.coordenadas},"properties":{propriedades}}}'
+        separador = ','
+    yield '\n]}\n'
+
+
+def exportar_areas(formato, propriedade_id=None, tipo=None):
+    """
+    Gera o arquivo das áreas em blocos de bytes
+
+    Args:
+        formato (str): 'kml', 'kmz' ou 'geojson'
+        propriedade_id (int): Restringe a uma propriedade (opcional)
+        tipo (str): Restringe a um tipo de área (opcional)
+    """
+    consulta = _consulta_areas(propriedade_id, tipo)
+    if formato == 'geojson':
+        return _agrupar_blocos(_geojson_areas(consulta))
+    blocos = _agrupar_blocos(_kml_areas(consulta))
+    return _kmz(blocos) if formato == 'kmz' else blocos
+
+
+# Trilhas
+
+def _filtrar_trilhas(consulta, inicio, fim, animal_id=None, lote_id=None):
+    consulta = consulta.where(HistoricoLocalizacao.data_hora >= inicio, HistoricoLocalizacao.data_hora < fim)
+    if animal_id is not None:
+        consulta = consulta.where(HistoricoLocalizacao.animal_id == animal_id)
+    if lote_id is not None:
+        consulta = consulta.where(
+            HistoricoLocalizacao.animal_id.in_(select(Animal.id).where(Animal.lote_id == lote_id))
+        )
+    return consulta
+
+
+def _trilhas(inicio, fim, animal_id=None, lote_id=None):
+    """
+    Trilhas do período, uma por animal
+
+    Yields:
+        tuple: (resumo do animal, iterador de (lng, lat) em ordem de data)
+    """
+    resumos = {
+        linha.animal_id: linha for linha in db.session.execute(
+            _filtrar_trilhas(
+                select(
+                    HistoricoLocalizacao.animal_id, Animal.codigo, Animal.nome,
+                    func.min(HistoricoLocalizacao.data_hora).label('inicio'),
+                    func.max(HistoricoLocalizacao.data_hora).label('fim'),
+                    func.count().label('pontos')
+                ).join(Animal, HistoricoLocalizacao.animal_id == Animal.id)
+                .group_by(HistoricoLocalizacao.animal_id, Animal.codigo, Animal.nome),
+                inicio, fim, animal_id, lote_id
+            )
+        )
+    }
+    if not resumos:
+        return
+
+    posicoes = _filtrar_trilhas(
+        select(HistoricoLocalizacao.animal_id, HistoricoLocalizacao.longitude, HistoricoLocalizacao.latitude),
+        inicio, fim, animal_id, lote_id
+    ).order_by(HistoricoLocalizacao.animal_id, HistoricoLocalizacao.data_hora)
+
+    for id, linhas in groupby(_linhas(posicoes), key=lambda linha: linha[0]):
+        # Animal com a primeira posição gravada entre as duas consultas
+        if id in resumos:
+            yield resumos[id], ((round(lng, 7), round(lat, 7)) for _, lng, lat in linhas)
+
+
+def _kml_trilhas(trilhas):
+    yield _CABECALHO_KML.format('Trilhas')
+    yield (
+        f'<Style id="trilha"><LineStyle><color>{COR_TRILHA}</color><width>2</width></LineStyle>'
+        f'<IconStyle><color>{COR_TRILHA}</color></IconStyle></Style>\n'
+    )
+    for resumo, pontos in trilhas:
+        nome = f'{resumo.codigo} - {resumo.nome}' if resumo.nome else resumo.codigo
+        yield (
+            f'<Placemark id="animal-{resumo.animal_id}"><name>{escape(nome)}</name>'
+            f'<description>{resumo.pontos} posições</description>'
+            f'<TimeSpan><begin>{_data_kml(resumo.inicio)}</begin><end>{_data_kml(resumo.fim)}</end></TimeSpan>'
+            '<styleUrl>#trilha</styleUrl>'
+        )
+        if resumo.pontos == 1:
+            lng, lat = next(pontos)
+            yield f'<Point><coordinates>{lng},{lat}</coordinates></Point></Placemark>\n'
+            continue
+
+        yield '<LineString><tessellate>1</tessellate><coordinates>'
+        for lng, lat in pontos:
+            yield f'{lng},{lat} '
+        yield '</coordinates></LineString></Placemark>\n'
+    yield _RODAPE_KML
+
+
+def _geojson_trilhas(trilhas):
+    yield '{"type":"FeatureCollection","features":['
+    separador = ''
+    for resumo, pontos in trilhas:
+        propriedades = json.dumps({
+            'animal_id': resumo.animal_id,
+            'codigo': resumo.codigo,
+            'nome': resumo.nome,
+            'inicio': resumo.inicio.isoformat(),
+            'fim': resumo.fim.isoformat(),
+            'pontos': resumo.pontos
+        }, ensure_ascii=False)
+        yield f'{separador}\n{{"type":"Feature","properties":{propriedades},"geometry":'
+        separador = ','
+
+        if resumo.pontos == 1:
+            lng, lat = next(pontos)
+            yield f'{{"type":"Point","coordinates":[{lng},{lat}]}}}}'
+            continue
+
+        yield '{"type":"LineString","coordinates":['
+        virgula = ''
+        for lng, lat in pontos:
+            yield f'{virgula}[{lng},{lat}]'
+            virgula = ','
+        yield ']}}'
+    yield '\n]}\n'
+
+
+def exportar_trilhas(formato, inicio, fim, animal_id=None, lote_id=None):
+    """
+    Gera o arquivo das trilhas dos animais em blocos de bytes
+
+    Args:
+        formato (str): 'kml', 'kmz' ou 'geojson'
+        inicio, fim (datetime): Período das posições (fim exclusivo)
+        animal_id (int): Restringe a um animal (opcional)
+        lote_id (int): Restringe aos animais de um lote (opcional)
+    """
+    trilhas = _trilhas(inicio, fim, animal_id, lote_id)
+    if formato == 'geojson':
+        return _agrupar_blocos(_geojson_trilhas(trilhas))
+    blocos = _agrupar_blocos(_kml_trilhas(trilhas))
+    return _kmz(blocos) if formato == 'kmz' else blocos
+
+
+def nome_arquivo_geo(nome, formato):
+    return f'{nome}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{formato}'
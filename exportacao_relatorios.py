@@ -0,0 +1,269 @@
+"""
+Exportação de relatórios (XLSX/CSV) com memória constante.
+
+As linhas são lidas por um cursor no servidor, em blocos, como tuplas (sem
+objetos ORM nem DataFrame), e escritas diretamente no arquivo de saída:
+
+- CSV: gerado e enviado bloco a bloco na própria resposta;
+- XLSX: escrito pelo xlsxwriter em modo `constant_memory` (cada linha vai
+  para disco assim que é escrita) em um arquivo temporário, enviado em
+  blocos e removido ao final. O formato ZIP do XLSX exige que a planilha
+  esteja completa antes do primeiro byte.
+
+A memória do worker não depende do número de linhas do relatório.
+"""
+
+import csv
+import io
+import os
+import tempfile
+from datetime import datetime
+from sqlalchemy import select
+
+import xlsxwriter
+
+from app import db
+from models import Animal, Area, Atividade, Lote, Raca
+
+# Linhas por bloco lidas do cursor no servidor
+TAMANHO_BLOCO = 2000
+
+# Tamanho dos blocos enviados na resposta
+TAMANHO_CHUNK = 64 * 1024
+
+FORMATOS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# Valores de formulário que significam "sem filtro"
+SEM_FILTRO = (None, '', 'Todos', '0')
+
+
+def _consulta_animais(filtros):
+    consulta = (
+        select(
+            Animal.codigo, Animal.nome, Raca.nome, Animal.sexo, Animal.data_nascimento,
+            Animal.peso_atual, Animal.status, Area.nome, Lote.nome
+        )
+        .outerjoin(Raca, Animal.raca_id == Raca.id)
+        .outerjoin(Area, Animal.area_id == Area.id)
+        .outerjoin(Lote, Animal.lote_id == Lote.id)
+        .order_by(Animal.id)
+    )
+    if 'status' in filtros:
+        consulta = consulta.where(Animal.status == filtros['status'])
+    if 'raca_id' in filtros:
+        consulta = consulta.where(Animal.raca_id == int(filtros['raca_id']))
+    if 'area_id' in filtros:
+        consulta = consulta.where(Animal.area_id == int(filtros['area_id']))
+    return consulta
+
+
+def _linha_animal(linha):
+    codigo, nome, raca, sexo, nascimento, peso, status, area, lote = linha
+    return (
+        codigo,
+        nome or '',
+        raca or '',
+        'Macho' if sexo == 'M' else 'Fêmea',
+        nascimento.strftime('%d/%m/%Y') if nascimento else '',
+        peso or 0,  # Evitar valores None
+        status,
+        area or 'Não atribuída',
+        lote or 'Não atribuído',
+    )
+
+
+def _consulta_atividades(filtros):
+    consulta = (
+        select(
+            Atividade.tipo, Atividade.descricao, Atividade.data_inicio, Atividade.data_fim,
+            Atividade.status, Atividade.responsavel, Atividade.custo, Area.nome
+        )
+        .outerjoin(Area, Atividade.area_id == Area.id)
+        .order_by(Atividade.id)
+    )
+    if 'data_inicio' in filtros:
+        consulta = consulta.where(
+            Atividade.data_inicio >= datetime.strptime(filtros['data_inicio'], '%Y-%m-%d')
+        )
+    if 'data_fim' in filtros:
+        # Ajustar para o final do dia
+        data_fim = datetime.strptime(filtros['data_fim'], '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+        consulta = consulta.where(Atividade.data_inicio <= data_fim)
+    if 'tipo' in filtros:
+        consulta = consulta.where(Atividade.tipo == filtros['tipo'])
+    if 'status' in filtros:
+        consulta = consulta.where(Atividade.status == filtros['status'])
+    return consulta
+
+
+def _linha_atividade(linha):
+    tipo, descricao, inicio, fim, status, responsavel, custo, area = linha
+    return (
+        tipo,
+        descricao,
+        inicio.strftime('%d/%m/%Y %H:%M'),
+        fim.strftime('%d/%m/%Y %H:%M') if fim else 'Não concluída',
+        status,
+        responsavel or 'Não definido',
+        float(custo or 0),
+        area or 'Geral',
+    )
+
+
+# Definição dos relatórios: planilha, colunas, filtros aceitos, consulta e
+# conversão de cada linha. Colunas: (título, largura, formato)
+RELATORIOS = {
+    'animais': {
+        'planilha': 'Animais',
+        'colunas': (
+            ('Código', 12, None), ('Nome', 20, None), ('Raça', 16, None),
+            ('Sexo', 8, None), ('Data Nascimento', 16, None), ('Peso Atual (kg)', 16, None),
+            ('Status', 10, None), ('Área', 20, None), ('Lote', 20, None),
+        ),
+        'filtros': ('status', 'raca_id', 'area_id'),
+        'consulta': _consulta_animais,
+        'linha': _linha_animal,
+    },
+    'atividades': {
+        'planilha': 'Atividades',
+        'colunas': (
+            ('Tipo', 16, None), ('Descrição', 40, None), ('Data Início', 18, None),
+            ('Data Fim', 18, None), ('Status', 12, None), ('Responsável', 20, None),
+            ('Custo (R$)', 14, 'moeda'), ('Área', 20, None),
+        ),
+        'filtros': ('data_inicio', 'data_fim', 'tipo', 'status'),
+        'consulta': _consulta_atividades,
+        'linha': _linha_atividade,
+    },
+}
+
+
+def normalizar_filtros(relatorio, valores):
+    """
+    Mantém apenas os filtros aceitos pelo relatório e com valor
+
+    Args:
+        relatorio (str): Nome do relatório em `RELATORIOS`
+        valores (dict): Valores recebidos (ex.: request.form)
+
+    Returns:
+        dict: Filtros efetivos, ordenados por nome
+    """
+    return {
+        nome: str(valores.get(nome))
+        for nome in sorted(RELATORIOS[relatorio]['filtros'])
+        if valores.get(nome) not in SEM_FILTRO
+    }
+
+
+def contar_linhas(relatorio, filtros):
+    """Número de linhas do relatório (para progresso e relatórios vazios)"""
+    consulta = RELATORIOS[relatorio]['consulta'](filtros).order_by(None)
+    return db.session.execute(select(db.func.count()).select_from(consulta.subquery())).scalar()
+
+
+def linhas_relatorio(relatorio, filtros):
+    """
+    Gera as linhas do relatório a partir de um cursor no servidor
+
+    Args:
+        relatorio (str): Nome do relatório em `RELATORIOS`
+        filtros (dict): Filtros normalizados por `normalizar_filtros`
+    """
+    definicao = RELATORIOS[relatorio]
+    consulta = definicao['consulta'](filtros).execution_options(yield_per=TAMANHO_BLOCO)
+    converter = definicao['linha']
+    for bloco in db.session.execute(consulta).partitions():
+        for linha in bloco:
+            yield converter(linha)
+
+
+def gerar_csv(relatorio, filtros, progresso=None):
+    """
+    Gera o CSV do relatório em blocos de bytes (separador ';', com BOM para o Excel)
+
+    Args:
+        relatorio (str): Nome do relatório em `RELATORIOS`
+        filtros (dict): Filtros normalizados por `normalizar_filtros`
+        progresso (callable): Chamada com o número de linhas escritas a cada bloco
+    """
+    titulos = [titulo for titulo, _, _ in RELATORIOS[relatorio]['colunas']]
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';')
+
+    buffer.write('\ufeff')
+    escritor.writerow(titulos)
+    for total, linha in enumerate(linhas_relatorio(relatorio, filtros), start=1):
+        escritor.writerow(linha)
+        if progresso and total % TAMANHO_BLOCO == 0:
+            progresso(total)
+        if buffer.tell() >= TAMANHO_CHUNK:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def escrever_xlsx(relatorio, filtros, caminho, progresso=None):
+    """
+    Escreve o relatório em um arquivo XLSX com memória constante
+
+    Args:
+        relatorio (str): Nome do relatório em `RELATORIOS`
+        filtros (dict): Filtros normalizados por `normalizar_filtros`
+        caminho (str): Arquivo de saída
+        progresso (callable): Chamada com o número de linhas escritas a cada bloco
+
+    Returns:
+        int: Número de linhas de dados escritas
+    """
+    definicao = RELATORIOS[relatorio]
+    workbook = xlsxwriter.Workbook(caminho, {'constant_memory': True, 'tmpdir': tempfile.gettempdir()})
+    try:
+        worksheet = workbook.add_worksheet(definicao['planilha'])
+        formato_cabecalho = workbook.add_format({
+            'bold': True,
+            'text_wrap': True,
+            'valign': 'top',
+            'bg_color': '#D8E4BC',
+            'border': 1
+        })
+        formatos = {'moeda': workbook.add_format({'num_format': 'R$ #,##0.00'})}
+
+        # Em constant_memory as linhas devem ser escritas em ordem: cabeçalho primeiro
+        colunas = definicao['colunas']
+        formatos_colunas = [formatos.get(formato) for _, _, formato in colunas]
+        for indice, (titulo, largura, _) in enumerate(colunas):
+            worksheet.set_column(indice, indice, largura)
+            worksheet.write(0, indice, titulo, formato_cabecalho)
+
+        total = 0
+        for total, linha in enumerate(linhas_relatorio(relatorio, filtros), start=1):
+            for indice, valor in enumerate(linha):
+                worksheet.write(total, indice, valor, formatos_colunas[indice])
+            if progresso and total % TAMANHO_BLOCO == 0:
+                progresso(total)
+    finally:
+        workbook.close()
+    return total
+
+
+def enviar_arquivo(caminho, remover=True):
+    """Lê um arquivo em blocos para a resposta e o remove ao final"""
+    try:
+        with open(caminho, 'rb') as arquivo:
+            while True:
+                bloco = arquivo.read(TAMANHO_CHUNK)
+                if not bloco:
+                    break
+                yield bloco
+    finally:
+        if remover:
+            os.remove(caminho)
+
+
+def nome_arquivo(relatorio, formato):
+    return f'relatorio_{relatorio}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{formato}'
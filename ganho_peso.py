@@ -0,0 +1,275 @@
+"""
+Análise de ganho médio diário (GMD) do rebanho a partir das pesagens.
+
+As pesagens de uma propriedade são carregadas em uma única consulta como
+arrays NumPy (ordenados por animal e data) e todas as métricas são
+calculadas de forma vetorizada, sem laços por animal:
+
+- GMD entre pesagens consecutivas (último intervalo e período total);
+- taxa de ganho por regressão linear (mínimos quadrados) de cada animal,
+  usada para projetar o peso em uma data alvo;
+- médias por lote, raça e área.
+
+O resultado fica em cache por propriedade e é recalculado apenas quando a
+versão das pesagens da propriedade (`Propriedade.versao_pesagens`) muda. A
+versão é incrementada no flush de qualquer pesagem incluída, alterada ou
+excluída e de qualquer troca de lote, raça ou área de um animal, e é lida a
+cada uso por uma consulta de uma linha.
+"""
+
+import logging
+from datetime import date, datetime
+
+import numpy as np
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app import db
+from cache_memoria import CacheTemporario
+from models import Animal, Propriedade, RegistroPeso
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Versão validada a cada uso; o TTL só limita a memória de propriedades inativas
+cache_ganho_peso = CacheTemporario(ttl=3600)
+
+# Horizonte padrão da projeção de peso, em dias
+DIAS_PROJECAO_PADRAO = 90
+
+# Agrupamentos disponíveis: nome -> índice da coluna de atributos
+AGRUPAMENTOS = {'lote': 0, 'raca': 1, 'area': 2}
+
+# Atributos do animal que mudam as agregações da análise
+ATRIBUTOS_AGRUPAMENTO = ('lote_id', 'raca_id', 'area_id', 'propriedade_id')
+
+# Referência para converter datas em dias (float)
+_EPOCA = np.datetime64('1970-01-01T00:00:00', 's')
+
+
+def _dias(valor):
+    """Converte datetime/date (ou arrays datetime64) em dias desde 1970"""
+    if isinstance(valor, (date, datetime)):
+        valor = np.datetime64(valor, 's')
+    return (valor - _EPOCA) / np.timedelta64(1, 'D')
+
+
+def _media_por_grupo(grupos, valores, total_grupos):
+    """Média e contagem de `valores` (ignorando NaN) por índice de grupo"""
+    validos = ~np.isnan(valores)
+    contagem = np.bincount(grupos[validos], minlength=total_grupos)
+    soma = np.bincount(grupos[validos], weights=valores[validos], minlength=total_grupos)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return soma / contagem, contagem
+
+
+def _valor(array, i, casas=3):
+    return None if np.isnan(array[i]) else round(float(array[i]), casas)
+
+
+class AnaliseGanhoPeso:
+    """Métricas de ganho de peso por animal de uma propriedade"""
+
+    def __init__(self, animal_id, t, peso, atributos):
+        """
+        Args:
+            animal_id (np.ndarray): Animal de cada pesagem (ordenado)
+            t (np.ndarray): Data de cada pesagem em dias (ordenada dentro do animal)
+            peso (np.ndarray): Peso em kg
+            atributos (np.ndarray): Matriz (pesagens x 3) com lote, raça e área (-1 se nulo)
+        """
+        self.ids, inicio, contagem = np.unique(animal_id, return_index=True, return_counts=True)
+        n = len(self.ids)
+        self.pesagens = contagem
+        self.atributos = atributos[inicio] if n else np.empty((0, 3), dtype=np.int64)
+        grupo = np.repeat(np.arange(n), contagem)
+        fim = inicio + contagem - 1
+
+        self.peso_inicial = peso[inicio]
+        self.peso_final = peso[fim]
+        self.data_inicial = t[inicio]
+        self.data_final = t[fim]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # GMD entre pesagens consecutivas do mesmo animal
+            dt = np.diff(t)
+            dp = np.diff(peso)
+            mesmo_animal = grupo[1:] == grupo[:-1]
+            gmd_intervalo = np.where(mesmo_animal & (dt > 0), dp / dt, np.nan)
+
+            # Último intervalo de cada animal (índice fim-1 em gmd_intervalo)
+            self.gmd_ultimo = np.full(n, np.nan)
+            com_intervalo = contagem > 1
+            self.gmd_ultimo[com_intervalo] = gmd_intervalo[fim[com_intervalo] - 1]
+
+            # GMD do período total
+            periodo = self.data_final - self.data_inicial
+            self.gmd_periodo = np.where(periodo > 0, (self.peso_final - self.peso_inicial) / periodo, np.nan)
+
+            # Regressão linear por animal (t centrado na primeira pesagem do animal)
+            tc = t - self.data_inicial[grupo]
+            soma_t = np.bincount(grupo, weights=tc, minlength=n)
+            soma_p = np.bincount(grupo, weights=peso, minlength=n)
+            soma_tt = np.bincount(grupo, weights=tc * tc, minlength=n)
+            soma_tp = np.bincount(grupo, weights=tc * peso, minlength=n)
+            denominador = contagem * soma_tt - soma_t ** 2
+            self.gmd_regressao = np.where(
+                denominador > 0, (contagem * soma_tp - soma_t * soma_p) / denominador, np.nan
+            )
+            self.intercepto = (soma_p - self.gmd_regressao * soma_t) / contagem
+
+        self._posicao = {int(id): i for i, id in enumerate(self.ids)}
+
+    def projetar(self, data_alvo):
+        """Peso projetado de cada animal na data alvo (NaN sem regressão)"""
+        return self.intercepto + self.gmd_regressao * (_dias(data_alvo) - self.data_inicial)
+
+    def _serializar(self, indices, projecao):
+        return [{
+            'animal_id': int(self.ids[i]),
+            'pesagens': int(self.pesagens[i]),
+            'peso_inicial': float(self.peso_inicial[i]),
+            'peso_final': float(self.peso_final[i]),
+            'gmd_ultimo': _valor(self.gmd_ultimo, i),
+            'gmd_periodo': _valor(self.gmd_periodo, i),
+            'gmd_regressao': _valor(self.gmd_regressao, i),
+            'peso_projetado': _valor(projecao, i, 1),
+        } for i in indices]
+
+    def animal(self, animal_id, data_alvo):
+        """Métricas de um animal (None se não tiver pesagens)"""
+        i = self._posicao.get(animal_id)
+        if i is None:
+            return None
+        return self._serializar([i], self.projetar(data_alvo))[0]
+
+    def animais(self, data_alvo, filtros=None):
+        """
+        Métricas dos animais, opcionalmente filtrados por grupo
+
+        Args:
+            data_alvo (date): Data da projeção de peso
+            filtros (dict): Agrupamento (`lote`, `raca`, `area`) -> id do grupo
+        """
+        mascara = np.ones(len(self.ids), dtype=bool)
+        for agrupamento, valor in (filtros or {}).items():
+            mascara &= self.atributos[:, AGRUPAMENTOS[agrupamento]] == valor
+        return self._serializar(np.flatnonzero(mascara), self.projetar(data_alvo))
+
+    def agregar(self, agrupamento, data_alvo):
+        """
+        Médias por lote, raça ou área
+
+        Args:
+            agrupamento (str): Chave de `AGRUPAMENTOS`
+            data_alvo (date): Data da projeção de peso
+
+        Returns:
+            list: Dicts com o id do grupo (None para animais sem grupo),
+            número de animais e médias de GMD e peso projetado
+        """
+        chaves = self.atributos[:, AGRUPAMENTOS[agrupamento]]
+        valores, grupos = np.unique(chaves, return_inverse=True)
+        total = len(valores)
+
+        animais = np.bincount(grupos, minlength=total)
+        gmd_regressao, com_regressao = _media_por_grupo(grupos, self.gmd_regressao, total)
+        gmd_periodo, _ = _media_por_grupo(grupos, self.gmd_periodo, total)
+        projetado, _ = _media_por_grupo(grupos, self.projetar(data_alvo), total)
+        peso_final, _ = _media_por_grupo(grupos, self.peso_final, total)
+
+        return [{
+            f'{agrupamento}_id': None if valores[i] < 0 else int(valores[i]),
+            'animais': int(animais[i]),
+            'animais_com_regressao': int(com_regressao[i]),
+            'peso_medio': _valor(peso_final, i, 1),
+            'gmd_periodo_medio': _valor(gmd_periodo, i),
+            'gmd_regressao_medio': _valor(gmd_regressao, i),
+            'peso_projetado_medio': _valor(projetado, i, 1),
+        } for i in range(total)]
+
+
+def _historico(objeto, atributo):
+    """Valores atual e anterior de um atributo alterado desde o último flush"""
+    historico = inspect(objeto).attrs[atributo].history
+    return [valor for valor in (historico.added or ()) + (historico.deleted or ()) if valor is not None]
+
+
+@event.listens_for(Session, 'after_flush')
+def _incrementar_versao_pesagens(sessao, contexto):
+    """Incrementa a versão das propriedades com pesagens ou animais alterados no flush"""
+    animal_ids = set()
+    propriedade_ids = set()
+    for objeto in sessao.new | sessao.deleted:
+        if isinstance(objeto, RegistroPeso):
+            animal_ids.add(objeto.animal_id)
+    for objeto in sessao.dirty:
+        if isinstance(objeto, RegistroPeso) and sessao.is_modified(objeto):
+            animal_ids.add(objeto.animal_id)
+            animal_ids.update(_historico(objeto, 'animal_id'))
+        elif isinstance(objeto, Animal):
+            for atributo in ATRIBUTOS_AGRUPAMENTO:
+                if inspect(objeto).attrs[atributo].history.has_changes():
+                    propriedade_ids.add(objeto.propriedade_id)
+                    propriedade_ids.update(_historico(objeto, 'propriedade_id'))
+                    break
+
+    animal_ids.discard(None)
+    propriedade_ids.discard(None)
+    if not animal_ids and not propriedade_ids:
+        return
+
+    filtro = Propriedade.id.in_(propriedade_ids)
+    if animal_ids:
+        filtro = filtro | Propriedade.id.in_(select(Animal.propriedade_id).where(Animal.id.in_(animal_ids)))
+    sessao.connection().execute(
+        update(Propriedade).where(filtro).values(versao_pesagens=Propriedade.versao_pesagens + 1)
+    )
+
+
+def _versao_pesagens(propriedade_id):
+    """Versão atual das pesagens e agrupamentos da propriedade"""
+    return db.session.execute(
+        select(Propriedade.versao_pesagens).where(Propriedade.id == propriedade_id)
+    ).scalar()
+
+
+def _calcular(propriedade_id):
+    linhas = db.session.execute(
+        select(
+            RegistroPeso.animal_id, RegistroPeso.data_pesagem, RegistroPeso.peso,
+            Animal.lote_id, Animal.raca_id, Animal.area_id
+        )
+        .join(Animal, RegistroPeso.animal_id == Animal.id)
+        .where(Animal.propriedade_id == propriedade_id, RegistroPeso.data_pesagem != None)
+        .order_by(RegistroPeso.animal_id, RegistroPeso.data_pesagem, RegistroPeso.id)
+    ).all()
+
+    total = len(linhas)
+    animal_id = np.fromiter((l[0] for l in linhas), dtype=np.int64, count=total)
+    t = _dias(np.array([l[1] for l in linhas], dtype='datetime64[s]')) if total else np.empty(0)
+    peso = np.fromiter((l[2] for l in linhas), dtype=np.float64, count=total)
+    atributos = np.array(
+        [[-1 if v is None else v for v in l[3:]] for l in linhas], dtype=np.int64
+    ).reshape(total, 3)
+
+    logger.info(f"Análise de ganho de peso recalculada: propriedade {propriedade_id}, {total} pesagens")
+    return AnaliseGanhoPeso(animal_id, t, peso, atributos)
+
+
+def obter_analise_ganho_peso(propriedade_id):
+    """
+    Análise de ganho de peso da propriedade, recalculada só quando há novas pesagens
+
+    Args:
+        propriedade_id (int): ID da propriedade
+
+    Returns:
+        AnaliseGanhoPeso: Métricas por animal e agregações
+    """
+    versao = _versao_pesagens(propriedade_id)
+    item = cache_ganho_peso.obter(propriedade_id, lambda: (versao, _calcular(propriedade_id)))
+    if item[0] != versao:
+        cache_ganho_peso.invalidar(propriedade_id)
+        item = cache_ganho_peso.obter(propriedade_id, lambda: (versao, _calcular(propriedade_id)))
+    return item[1]
@@ -19,6 +19,8 @@ PACOTES_ESSENCIAIS = [
     "flask-sqlalchemy",
     "flask-wtf",
     "gunicorn",
+    "gevent",
+    "psycogreen",
     "pandas",
     "psycopg2-binary",
     "email-validator",
@@ -0,0 +1,257 @@
+"""
+Importação de áreas a partir de arquivos KML/KMZ.
+
+O arquivo enviado é copiado para um arquivo temporário em disco
+(`SpooledTemporaryFile`, em memória só até `LIMITE_MEMORIA_UPLOAD`) e o KML,
+direto ou dentro do KMZ, é lido em fluxo com `lxml.etree.iterparse`: cada
+Placemark é processado e descartado da árvore assim que termina, então a
+memória usada não cresce com o tamanho do arquivo.
+
+Todos os polígonos de cada Placemark são extraídos, inclusive dentro de
+MultiGeometry e com furos (innerBoundaryIs), com o nome do Placemark e a cor
+do estilo (inline, `Style` ou `StyleMap` referenciados por `styleUrl`). Cada
+polígono vira uma `Area` (GeoJSON Polygon, com os furos como anéis
+internos), gravadas com um único INSERT em massa na mesma transação.
+"""
+
+import json
+import math
+import shutil
+import tempfile
+import zipfile
+
+from lxml import etree
+from sqlalchemy import insert
+
+from app import db
+from models import Area
+
+# Acima deste tamanho o upload é mantido em disco
+LIMITE_MEMORIA_UPLOAD = 1024 * 1024  # 1 MB
+
+# Cor usada quando o Placemark não tem estilo (padrão do mapa)
+COR_PADRAO = '#3388ff'
+
+# Raio médio da Terra, em metros
+RAIO_TERRA = 6371008.8
+
+_TAGS = ('{*}Placemark', '{*}Style', '{*}StyleMap')
+
+
+def _local(elemento):
+    """Nome da tag sem o namespace (KML 2.0, 2.1, 2.2 ou sem namespace)"""
+    return etree.QName(elemento).localname
+
+
+def _filho(elemento, nome):
+    return next((filho for filho in elemento.iterchildren('{*}' + nome)), None)
+
+
+def _texto(elemento, nome):
+    filho = _filho(elemento, nome)
+    return filho.text.strip() if filho is not None and filho.text else None
+
+
+def _cor_kml(valor):
+    """Converte a cor KML (aabbggrr) para '#rrggbb'"""
+    if not valor or len(valor) != 8:
+        return None
+    return f'#{valor[6:8]}{valor[4:6]}{valor[2:4]}'.lower()
+
+
+def _cor_estilo(estilo):
+    """Cor do preenchimento (PolyStyle) ou, sem ele, da linha (LineStyle)"""
+    for nome in ('PolyStyle', 'LineStyle'):
+        sub = _filho(estilo, nome)
+        if sub is not None:
+            cor = _cor_kml(_texto(sub, 'color'))
+            if cor:
+                return cor
+    return None
+
+
+def _anel(texto):
+    """Coordenadas 'lon,lat[,alt] ...' para um anel fechado [[lng, lat], ...]"""
+    if not texto:
+        return None
+    pontos = []
+    for tupla in texto.split():
+        partes = tupla.split(',')
+        if len(partes) >= 2:
+            pontos.append([round(float(partes[0]), 7), round(float(partes[1]), 7)])
+    if pontos and pontos[0] != pontos[-1]:
+        pontos.append(pontos[0])
+    return pontos if len(pontos) >= 4 else None
+
+
+def _aneis_poligono(poligono):
+    """Anel externo seguido dos furos de um elemento Polygon"""
+    aneis = []
+    for fronteira in ('outerBoundaryIs', 'innerBoundaryIs'):
+        for limite in poligono.iterchildren('{*}' + fronteira):
+            for anel in limite.iterchildren('{*}LinearRing'):
+                coordenadas = _anel(_texto(anel, 'coordinates'))
+                if coordenadas:
+                    aneis.append(coordenadas)
+        if not aneis:
+            # Sem anel externo válido o polígono é ignorado
+            return None
+    return aneis
+
+
+def area_hectares(aneis):
+    """
+    Área aproximada do polígono em hectares (projeção equirretangular local)
+
+    Args:
+        aneis (list): Anel externo e furos, cada um [[lng, lat], ...]
+    """
+    latitude_media = math.radians(sum(p[1] for p in aneis[0]) / len(aneis[0]))
+    escala_x = math.cos(latitude_media) * math.pi / 180 * RAIO_TERRA
+    escala_y = math.pi / 180 * RAIO_TERRA
+
+    total = 0.0
+    for i, anel in enumerate(aneis):
+        soma = sum(
+            (x1 * escala_x) * (y2 * escala_y) - (x2 * escala_x) * (y1 * escala_y)
+            for (x1, y1), (x2, y2) in zip(anel, anel[1:])
+        )
+        total += abs(soma) / 2 * (1 if i == 0 else -1)
+    return round(max(total, 0.0) / 10000, 4)
+
+
+def iterar_poligonos(fonte):
+    """
+    Lê um KML em fluxo e gera um dict por polígono
+
+    Args:
+        fonte: Arquivo (binário) com o documento KML
+
+    Yields:
+        dict: `nome`, `cor` e `aneis` (anel externo e furos, [[lng, lat], ...]),
+        na ordem do documento. A cor de um polígono cujo estilo é declarado
+        depois dele só é preenchida ao fim da leitura.
+    """
+    estilos = {}
+    mapas_estilo = {}
+    pendentes = []
+    sem_nome = 0
+
+    contexto = etree.iterparse(
+        fonte, events=('end',), tag=_TAGS, huge_tree=True, resolve_entities=False, no_network=True
+    )
+    for _, elemento in contexto:
+        tag = _local(elemento)
+        pai = elemento.getparent()
+        if tag != 'Placemark' and pai is not None and _local(pai) in ('Placemark', 'Pair'):
+            # Estilo inline: lido (e descartado) junto com o Placemark ou StyleMap
+            continue
+        if tag == 'Style' and elemento.get('id'):
+            estilos['#' + elemento.get('id')] = _cor_estilo(elemento)
+        elif tag == 'StyleMap' and elemento.get('id'):
+            for par in elemento.iterchildren('{*}Pair'):
+                if _texto(par, 'key') == 'normal':
+                    inline = _filho(par, 'Style')
+                    if inline is not None:
+                        estilos['#' + elemento.get('id')] = _cor_estilo(inline)
+                    else:
+                        mapas_estilo['#' + elemento.get('id')] = _texto(par, 'styleUrl')
+        elif tag == 'Placemark':
+            nome = _texto(elemento, 'name')
+            if not nome:
+                sem_nome += 1
+                nome = f'Área {sem_nome}'
+
+            inline = _filho(elemento, 'Style')
+            cor = _cor_estilo(inline) if inline is not None else None
+            url = _texto(elemento, 'styleUrl')
+
+            poligonos = [
+                aneis for aneis in (_aneis_poligono(p) for p in elemento.iter('{*}Polygon')) if aneis
+            ]
+            for parte, aneis in enumerate(poligonos, start=1):
+                poligono = {
+                    'nome': nome if len(poligonos) == 1 else f'{nome} ({parte})',
+                    'cor': cor,
+                    'aneis': aneis
+                }
+                if cor is None and url:
+                    pendentes.append((poligono, url))
+                yield poligono
+        else:
+            # Estilo compartilhado sem id: não pode ser referenciado
+            continue
+
+        # Libera o elemento processado e os irmãos anteriores já lidos
+        elemento.clear()
+        while elemento.getprevious() is not None:
+            del elemento.getparent()[0]
+
+    # Estilos podem ser declarados depois do Placemark que os usa
+    for poligono, url in pendentes:
+        poligono['cor'] = estilos.get(mapas_estilo.get(url, url))
+
+
+def _abrir_kml(arquivo):
+    """Arquivo KML direto ou o KML principal de um KMZ (lido do zip sob demanda)"""
+    arquivo.seek(0)
+    if arquivo.read(4) != b'PK\x03\x04':
+        arquivo.seek(0)
+        return arquivo, None
+
+    arquivo.seek(0)
+    kmz = zipfile.ZipFile(arquivo)
+    nomes = [nome for nome in kmz.namelist() if nome.lower().endswith('.kml')]
+    if not nomes:
+        kmz.close()
+        raise ValueError('Nenhum arquivo KML encontrado no KMZ')
+    # Pelo padrão o documento principal é doc.kml; senão, o primeiro KML da raiz
+    nomes.sort(key=lambda nome: (nome.lower() != 'doc.kml', nome.count('/'), nome))
+    return kmz.open(nomes[0]), kmz
+
+
+def ler_poligonos(arquivo_enviado):
+    """
+    Copia o upload para um arquivo temporário e extrai todos os polígonos
+
+    Args:
+        arquivo_enviado: Arquivo enviado (werkzeug FileStorage ou arquivo binário)
+
+    Returns:
+        list: Polígonos de `iterar_poligonos` com a cor resolvida
+    """
+    with tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA_UPLOAD) as temporario:
+        shutil.copyfileobj(getattr(arquivo_enviado, 'stream', arquivo_enviado), temporario)
+        fonte, kmz = _abrir_kml(temporario)
+        try:
+            return list(iterar_poligonos(fonte))
+        finally:
+            if kmz is not None:
+                fonte.close()
+                kmz.close()
+
+
+def importar_areas(poligonos, propriedade_id, tipo=None):
+    """
+    Cria uma `Area` por polígono em um único INSERT (sem commit)
+
+    Args:
+        poligonos (list): Resultado de `ler_poligonos`
+        propriedade_id (int): Propriedade das áreas
+        tipo (str): Tipo das áreas (pasto, curral...), opcional
+
+    Returns:
+        int: Número de áreas criadas
+    """
+    registros = [{
+        'nome': poligono['nome'][:100],
+        'tipo': tipo,
+        'tamanho': area_hectares(poligono['aneis']),
+        'coordenadas': json.dumps({'type': 'Polygon', 'coordinates': poligono['aneis']}),
+        'cor': poligono['cor'] or COR_PADRAO,
+        'propriedade_id': propriedade_id
+    } for poligono in poligonos]
+
+    if registros:
+        db.session.execute(insert(Area), registros)
+    return len(registros)
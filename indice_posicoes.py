@@ -0,0 +1,185 @@
+"""
+Índice espacial em memória das posições atuais do rebanho.
+
+Cada worker mantém as posições dos animais ativos em arrays NumPy. O índice
+é atualizado pelos ouvintes da ingestão (posições recebidas pelo próprio
+worker) e sincronizado periodicamente com o banco pela consulta incremental
+de `ultima_atualizacao`/`data_alteracao_mapa`, de modo que todos os workers
+convergem sem recarregar o rebanho inteiro.
+
+O agrupamento para o mapa é feito em grade sobre a projeção Web Mercator:
+cada célula tem `TAMANHO_CELULA_PX` pixels de lado no zoom pedido.
+"""
+
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import db
+from ingestao import registrar_ouvinte_posicoes
+from models import Animal
+
+TAMANHO_CELULA_PX = 60
+TAMANHO_TILE_PX = 256
+ZOOM_MAXIMO = 22
+
+# Mesma folga usada pelo cursor da API do mapa
+MARGEM_SINCRONIZACAO = timedelta(seconds=5)
+
+
+def mercator(lng, lat):
+    """Converte coordenadas em graus para x/y normalizados (0-1) em Web Mercator"""
+    lat = np.clip(lat, -85.05112878, 85.05112878)
+    x = (lng + 180.0) / 360.0
+    seno = np.sin(np.radians(lat))
+    y = 0.5 - np.log((1 + seno) / (1 - seno)) / (4 * math.pi)
+    return x, y
+
+
+class IndicePosicoes:
+    """Posições atuais (lng, lat, bateria) dos animais ativos"""
+
+    def __init__(self, intervalo_sincronizacao=5):
+        self.intervalo_sincronizacao = intervalo_sincronizacao
+        self._posicoes = {}  # animal_id -> (propriedade_id, lng, lat, bateria)
+        self._arrays = None
+        self._cursor = None
+        self._proxima_sincronizacao = 0
+        self._lock = threading.Lock()
+
+    def atualizar(self, eventos):
+        """Aplica posições recebidas pela ingestão (ouvinte de `ingestao`)"""
+        with self._lock:
+            for evento in eventos:
+                if evento['status'] != 'Ativo' or evento['latitude'] is None or evento['longitude'] is None:
+                    self._posicoes.pop(evento['animal_id'], None)
+                else:
+                    self._posicoes[evento['animal_id']] = (
+                        evento['propriedade_id'], evento['longitude'], evento['latitude'], evento['bateria']
+                    )
+            self._arrays = None
+
+    def sincronizar(self, forcar=False):
+        """Traz do banco as alterações desde a última sincronização"""
+        if not forcar and time.monotonic() < self._proxima_sincronizacao:
+            return
+
+        inicio = datetime.now()
+        query = db.session.query(
+            Animal.id, Animal.propriedade_id, Animal.ultima_longitude,
+            Animal.ultima_latitude, Animal.bateria, Animal.status
+        )
+        if self._cursor is None:
+            query = query.filter(
+                Animal.status == 'Ativo',
+                Animal.ultima_latitude != None,
+                Animal.ultima_longitude != None
+            )
+        else:
+            query = query.filter(db.or_(
+                Animal.ultima_atualizacao > self._cursor,
+                Animal.data_alteracao_mapa > self._cursor
+            ))
+        linhas = query.all()
+
+        with self._lock:
+            if self._cursor is None:
+                self._posicoes.clear()
+            for id, propriedade_id, lng, lat, bateria, status in linhas:
+                if status != 'Ativo' or lat is None or lng is None:
+                    self._posicoes.pop(id, None)
+                else:
+                    self._posicoes[id] = (propriedade_id, lng, lat, bateria)
+            self._arrays = None
+            self._cursor = inicio - MARGEM_SINCRONIZACAO
+            self._proxima_sincronizacao = time.monotonic() + self.intervalo_sincronizacao
+
+    def arrays(self):
+        """
+        Retorna as posições como arrays NumPy
+
+        Returns:
+            dict: Arrays `id`, `propriedade_id`, `lng`, `lat`, `bateria` (NaN se ausente)
+        """
+        with self._lock:
+            if self._arrays is None:
+                itens = list(self._posicoes.items())
+                self._arrays = {
+                    'id': np.fromiter((i for i, _ in itens), dtype=np.int64, count=len(itens)),
+                    'propriedade_id': np.fromiter((p[0] for _, p in itens), dtype=np.int64, count=len(itens)),
+                    'lng': np.fromiter((p[1] for _, p in itens), dtype=np.float64, count=len(itens)),
+                    'lat': np.fromiter((p[2] for _, p in itens), dtype=np.float64, count=len(itens)),
+                    'bateria': np.fromiter(
+                        (np.nan if p[3] is None else p[3] for _, p in itens), dtype=np.float64, count=len(itens)
+                    ),
+                }
+            return self._arrays
+
+    def agrupar(self, bbox, zoom, propriedade_id=None):
+        """
+        Agrupa em grade as posições dentro do retângulo visível do mapa
+
+        Args:
+            bbox (tuple): (lng_min, lat_min, lng_max, lat_max)
+            zoom (int): Nível de zoom do mapa (0-22)
+            propriedade_id (int): Restringe a uma propriedade (opcional)
+
+        Returns:
+            list: Dicts com `total`, `longitude`, `latitude` (centroide),
+            `bateria_min` e, para grupos de um único animal, `animal_id`
+        """
+        dados = self.arrays()
+        lng_min, lat_min, lng_max, lat_max = bbox
+
+        mascara = (
+            (dados['lng'] >= lng_min) & (dados['lng'] <= lng_max) &
+            (dados['lat'] >= lat_min) & (dados['lat'] <= lat_max)
+        )
+        if propriedade_id is not None:
+            mascara &= dados['propriedade_id'] == propriedade_id
+        if not mascara.any():
+            return []
+
+        ids = dados['id'][mascara]
+        lng = dados['lng'][mascara]
+        lat = dados['lat'][mascara]
+        bateria = dados['bateria'][mascara]
+
+        # Índice da célula de cada ponto na grade do zoom pedido
+        celulas_por_eixo = (TAMANHO_TILE_PX * 2 ** zoom) / TAMANHO_CELULA_PX
+        x, y = mercator(lng, lat)
+        cx = np.floor(x * celulas_por_eixo).astype(np.int64)
+        cy = np.floor(y * celulas_por_eixo).astype(np.int64)
+        chaves = cx * (int(celulas_por_eixo) + 1) + cy
+
+        _, grupo, totais = np.unique(chaves, return_inverse=True, return_counts=True)
+        soma_lng = np.bincount(grupo, weights=lng)
+        soma_lat = np.bincount(grupo, weights=lat)
+
+        bateria_min = np.full(len(totais), np.inf)
+        np.minimum.at(bateria_min, grupo, np.where(np.isnan(bateria), np.inf, bateria))
+
+        # Id do animal para grupos unitários
+        unico = np.full(len(totais), -1, dtype=np.int64)
+        unico[grupo] = ids
+
+        grupos = []
+        for i, total in enumerate(totais):
+            item = {
+                'total': int(total),
+                'longitude': float(soma_lng[i] / total),
+                'latitude': float(soma_lat[i] / total),
+                'bateria_min': None if np.isinf(bateria_min[i]) else round(float(bateria_min[i]), 1)
+            }
+            if total == 1:
+                item['animal_id'] = int(unico[i])
+            grupos.append(item)
+        return grupos
+
+
+# Índice compartilhado pelas requisições do worker
+indice_posicoes = IndicePosicoes()
+registrar_ouvinte_posicoes(indice_posicoes.atualizar)
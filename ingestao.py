@@ -0,0 +1,151 @@
+"""
+Caminho único de ingestão de posições dos dispositivos LoRa.
+
+Todas as fontes de posição (API HTTP, mensagens do gateway e o simulador)
+gravam por aqui, em lote: uma consulta para localizar os animais, uma para
+os dispositivos, um INSERT em massa no histórico e um único commit.
+
+Após o commit, os ouvintes registrados com `registrar_ouvinte_posicoes`
+recebem as novas posições atuais (índices em memória, streams ao vivo etc.).
+"""
+
+import logging
+from datetime import datetime
+from sqlalchemy import insert
+
+from app import db
+from models import Animal, DispositivoLora, HistoricoLocalizacao
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Funções chamadas com a lista de posições atualizadas após cada commit
+_ouvintes_posicoes = []
+
+
+def registrar_ouvinte_posicoes(funcao):
+    """
+    Registra uma função a ser chamada após cada lote de posições gravado
+
+    A função recebe uma lista de dicts com as chaves `animal_id`,
+    `propriedade_id`, `codigo`, `status`, `latitude`, `longitude`, `bateria`
+    e `data_hora` (posição atual de cada animal atualizado).
+    """
+    _ouvintes_posicoes.append(funcao)
+    return funcao
+
+
+def _eventos_posicoes(animais):
+    return [{
+        'animal_id': animal.id,
+        'propriedade_id': animal.propriedade_id,
+        'codigo': animal.codigo,
+        'status': animal.status,
+        'latitude': animal.ultima_latitude,
+        'longitude': animal.ultima_longitude,
+        'bateria': animal.bateria,
+        'data_hora': animal.ultima_atualizacao
+    } for animal in animais]
+
+
+def _notificar_ouvintes(eventos):
+    for ouvinte in _ouvintes_posicoes:
+        try:
+            ouvinte(eventos)
+        except Exception as e:
+            logger.error(f"Erro no ouvinte de posições {ouvinte.__name__}: {str(e)}", exc_info=True)
+
+
+def confirmar_posicoes(animais):
+    """
+    Confirma a transação e notifica os ouvintes das posições dos animais
+
+    Usado por quem registra posições com `commit=False` e grava outras
+    alterações na mesma transação: substitui o `db.session.commit()` final.
+
+    Args:
+        animais (list): Animais retornados por `registrar_posicoes`
+    """
+    # Eventos montados antes do commit, que expira os atributos carregados
+    eventos = _eventos_posicoes(animais) if _ouvintes_posicoes else []
+    db.session.commit()
+    if eventos:
+        _notificar_ouvintes(eventos)
+
+
+def registrar_posicoes(posicoes, commit=True):
+    """
+    Registra um lote de posições recebidas dos dispositivos
+
+    Args:
+        posicoes (list): Lista de dicts com as chaves `device_id`, `latitude`,
+            `longitude` e, opcionalmente, `bateria` e `data_hora`
+        commit (bool): Se deve confirmar a transação ao final. Sem o commit
+            aqui, confirme com `confirmar_posicoes` para notificar os ouvintes
+
+    Returns:
+        tuple: (animais atualizados, lista de device_ids não encontrados)
+    """
+    if not posicoes:
+        return [], []
+
+    device_ids = {p['device_id'] for p in posicoes}
+
+    animais = {
+        a.id_dispositivo: a
+        for a in Animal.query.filter(Animal.id_dispositivo.in_(device_ids)).all()
+    }
+    dispositivos = {
+        d.device_id: d
+        for d in DispositivoLora.query.filter(DispositivoLora.device_id.in_(device_ids)).all()
+    }
+
+    agora = datetime.now()
+    historicos = []
+    atualizados = {}
+    nao_encontrados = []
+
+    for posicao in posicoes:
+        device_id = posicao['device_id']
+        animal = animais.get(device_id)
+        if not animal:
+            nao_encontrados.append(device_id)
+            continue
+
+        data_hora = posicao.get('data_hora') or agora
+        bateria = posicao.get('bateria')
+
+        # Posições fora de ordem entram no histórico, mas não sobrescrevem a atual
+        if animal.ultima_atualizacao is None or data_hora >= animal.ultima_atualizacao:
+            animal.ultima_latitude = posicao['latitude']
+            animal.ultima_longitude = posicao['longitude']
+            animal.ultima_atualizacao = data_hora
+            if bateria is not None:
+                animal.bateria = bateria
+
+        dispositivo = dispositivos.get(device_id)
+        if dispositivo:
+            dispositivo.ultimo_contato = agora
+            if bateria is not None:
+                dispositivo.bateria = bateria
+
+        historicos.append({
+            'animal_id': animal.id,
+            'device_id': device_id,
+            'latitude': posicao['latitude'],
+            'longitude': posicao['longitude'],
+            'data_hora': data_hora,
+            'bateria': bateria
+        })
+        atualizados[animal.id] = animal
+
+    if historicos:
+        db.session.execute(insert(HistoricoLocalizacao), historicos)
+
+    if commit:
+        confirmar_posicoes(atualizados.values())
+
+    if nao_encontrados:
+        logger.warning(f"Dispositivos não encontrados na ingestão: {', '.join(nao_encontrados)}")
+
+    return list(atualizados.values()), nao_encontrados
@@ -142,7 +142,7 @@ source venv/bin/activate
 # Instala as dependências
 echo -e "\n${azul}Instalando dependências...${reset}"
 pip install --upgrade pip
-pip install flask flask-login flask-sqlalchemy flask-wtf gunicorn psycopg2-binary werkzeug pandas xlsxwriter email-validator
+pip install flask flask-login flask-sqlalchemy flask-wtf gunicorn gevent psycogreen psycopg2-binary werkzeug pandas xlsxwriter email-validator
 
 # Configura o banco de dados PostgreSQL
 if [ "$has_postgres" = true ]; then
@@ -198,6 +198,8 @@ import multiprocessing
 
 bind = "0.0.0.0:5000"
 workers = multiprocessing.cpu_count() * 2 + 1
+worker_class = "gevent"
+worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 50
 timeout = 30
@@ -386,7 +386,7 @@ extrair_instalar() {
     if [ -f "requirements.txt" ]; then
         pip install -r requirements.txt
     else
-        pip install flask flask-login flask-sqlalchemy flask-wtf gunicorn psycopg2-binary pykml lxml pandas requests sqlalchemy
+        pip install flask flask-login flask-sqlalchemy flask-wtf gunicorn psycopg2-binary lxml pandas requests sqlalchemy
     fi
     
     # Criar arquivo .env com configurações
@@ -132,6 +132,8 @@ def install_requirements():
         "flask-sqlalchemy", 
         "flask-wtf",
         "gunicorn",
+        "gevent",
+        "psycogreen",
         "psycopg2-binary",
         "werkzeug",
         "pandas",
@@ -262,6 +264,8 @@ def setup_cyberpanel_application():
 
 bind = "0.0.0.0:5000"
 workers = multiprocessing.cpu_count() * 2 + 1
+worker_class = "gevent"
+worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 50
 timeout = 30
@@ -0,0 +1,180 @@
+"""
+Caminho único de gravação de leituras das estações meteorológicas.
+
+Todas as fontes de leitura (API HTTP, leitura solicitada via LoRa e leitura
+manual) gravam por `registrar_leitura_estacao`, que avalia as regras de
+alerta (`regras_alertas`) e mantém o `ResumoEstacao` da estação: últimos
+valores conhecidos, mínimas/máximas e chuva das últimas 24 horas, alertas
+ativos e último contato. As telas de estações renderizam a partir do resumo,
+sem varrer as leituras; as leituras recentes ficam no buffer em memória de
+cada worker (`buffer_leituras`).
+
+A janela de 24 horas é recalculada a cada leitura (uma consulta agregada
+sobre o índice (estacao_id, data_hora)); para estações que deixaram de
+transmitir, uma tarefa periódica recalcula os resumos vencidos.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+
+from app import db
+from buffer_leituras import CAMPOS_BUFFER, buffers_estacoes
+from models import AlertaMeteorologico, EstacaoMeteorologica, LeituraMeteorologica, ResumoEstacao
+from regras_alertas import motor_alertas
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+CAMPOS_LEITURA = (
+    'temperatura', 'umidade', 'pressao', 'velocidade_vento', 'direcao_vento',
+    'precipitacao', 'radiacao_solar', 'umidade_solo', 'temperatura_solo',
+    'bateria', 'sinal_lora',
+)
+
+JANELA_RESUMO = timedelta(hours=24)
+
+# Idade máxima da janela de 24h antes de a tarefa periódica recalculá-la
+VALIDADE_RESUMO = timedelta(hours=1)
+
+
+def atualizar_resumo_estacao(estacao, leitura=None):
+    """
+    Atualiza o resumo de uma estação (sem commit)
+
+    Args:
+        estacao (EstacaoMeteorologica): Estação a atualizar
+        leitura (LeituraMeteorologica): Leitura recém-registrada, se houver;
+            seus valores não nulos passam a ser os últimos valores conhecidos
+    """
+    resumo = estacao.resumo
+    if resumo is None:
+        resumo = ResumoEstacao(estacao_id=estacao.id)
+        estacao.resumo = resumo
+
+    if leitura is not None and (resumo.data_hora is None or leitura.data_hora >= resumo.data_hora):
+        resumo.data_hora = leitura.data_hora
+        for campo in CAMPOS_LEITURA:
+            valor = getattr(leitura, campo)
+            if valor is not None:
+                setattr(resumo, campo, valor)
+
+    agora = datetime.now()
+    alertas_ativos = select(func.count(AlertaMeteorologico.id)).where(
+        AlertaMeteorologico.estacao_id == estacao.id,
+        AlertaMeteorologico.status != 'Finalizado'
+    ).scalar_subquery()
+
+    # Janela de 24h e alertas ativos em uma única consulta
+    janela = db.session.execute(
+        select(
+            func.min(LeituraMeteorologica.temperatura),
+            func.max(LeituraMeteorologica.temperatura),
+            func.min(LeituraMeteorologica.umidade),
+            func.max(LeituraMeteorologica.umidade),
+            func.sum(LeituraMeteorologica.precipitacao),
+            func.count(LeituraMeteorologica.id),
+            alertas_ativos
+        ).where(
+            LeituraMeteorologica.estacao_id == estacao.id,
+            LeituraMeteorologica.data_hora >= agora - JANELA_RESUMO
+        )
+    ).one()
+
+    (resumo.temperatura_min_24h, resumo.temperatura_max_24h,
+     resumo.umidade_min_24h, resumo.umidade_max_24h) = janela[:4]
+    resumo.precipitacao_24h = janela[4] or 0.0
+    resumo.leituras_24h = janela[5]
+    resumo.alertas_ativos = janela[6]
+    resumo.ultimo_contato = estacao.ultimo_contato
+    resumo.data_calculo = agora
+    return resumo
+
+
+def registrar_leitura_estacao(estacao, dados, data_hora=None, commit=True):
+    """
+    Registra uma leitura de estação e atualiza seu resumo
+
+    Args:
+        estacao (EstacaoMeteorologica): Estação que enviou a leitura
+        dados (dict): Valores por campo de `CAMPOS_LEITURA` (ausentes ficam nulos)
+        data_hora (datetime): Momento da leitura (padrão: agora)
+        commit (bool): Se deve confirmar a transação ao final
+
+    Returns:
+        LeituraMeteorologica: Leitura registrada
+    """
+    agora = datetime.now()
+    leitura = LeituraMeteorologica(
+        estacao_id=estacao.id,
+        data_hora=data_hora or agora,
+        **{campo: dados.get(campo) for campo in CAMPOS_LEITURA}
+    )
+    db.session.add(leitura)
+
+    estacao.ultimo_contato = agora
+    if leitura.bateria is not None:
+        estacao.bateria = leitura.bateria
+
+    # Regras de alerta (antes do resumo, que conta os alertas ativos)
+    anterior = estacao.resumo.data_hora if estacao.resumo is not None else None
+    motor_alertas.avaliar(estacao, leitura, anterior)
+
+    atualizar_resumo_estacao(estacao, leitura)
+
+    if commit:
+        # Valores para o buffer montados antes do commit, que expira os atributos
+        db.session.flush()
+        recente = (estacao.id, leitura.id, leitura.data_hora, [getattr(leitura, campo) for campo in CAMPOS_BUFFER])
+        db.session.commit()
+        buffers_estacoes.adicionar(recente)
+    return leitura
+
+
+def recalcular_resumos(estacao_ids=None):
+    """
+    Recalcula do zero os resumos (carga inicial e dados de exemplo)
+
+    Args:
+        estacao_ids (list): Estações a recalcular (padrão: todas)
+
+    Returns:
+        int: Número de resumos recalculados
+    """
+    query = EstacaoMeteorologica.query
+    if estacao_ids is not None:
+        query = query.filter(EstacaoMeteorologica.id.in_(estacao_ids))
+
+    total = 0
+    for estacao in query.all():
+        ultima = LeituraMeteorologica.query.filter_by(estacao_id=estacao.id)\
+            .order_by(LeituraMeteorologica.data_hora.desc()).first()
+        if estacao.resumo is not None:
+            estacao.resumo.data_hora = None
+        atualizar_resumo_estacao(estacao, ultima)
+        total += 1
+
+    db.session.commit()
+    return total
+
+
+def atualizar_resumos_vencidos():
+    """Recalcula a janela de 24h dos resumos não atualizados há `VALIDADE_RESUMO`"""
+    limite = datetime.now() - VALIDADE_RESUMO
+    estacoes = EstacaoMeteorologica.query.join(ResumoEstacao).filter(
+        db.or_(ResumoEstacao.data_calculo == None, ResumoEstacao.data_calculo < limite)
+    ).all()
+
+    for estacao in estacoes:
+        atualizar_resumo_estacao(estacao)
+    db.session.commit()
+
+    if estacoes:
+        logger.info(f"Resumos de estações recalculados: {len(estacoes)}")
+
+
+def init_app(app):
+    """Agenda o recálculo periódico dos resumos de estações"""
+    from agendador import agendador
+
+    agendador.agendar('resumos_estacoes', 15 * 60, atualizar_resumos_vencidos)
@@ -3,8 +3,8 @@ import json
 from datetime import datetime
 import time
 import random
-from models import Animal, HistoricoLocalizacao, DispositivoLora
-from app import db
+from models import Animal
+from ingestao import registrar_posicoes
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
@@ -102,39 +102,22 @@ def process_lora_message(message_json):
             logger.error("Mensagem LoRa sem device_id")
             return False
         
-        # Buscar o animal associado ao dispositivo
-        animal = Animal.query.filter_by(id_dispositivo=device_id).first()
+        if 'latitude' not in message or 'longitude' not in message:
+            return False
+        
+        animais, _ = registrar_posicoes([{
+            'device_id': device_id,
+            'latitude': message['latitude'],
+            'longitude': message['longitude'],
+            'bateria': message.get('battery')
+        }])
         
-        if not animal:
+        if not animais:
             logger.warning(f"Dispositivo {device_id} não está associado a nenhum animal")
             return False
         
-        # Atualizar localização do animal
-        if 'latitude' in message and 'longitude' in message:
-            animal.ultima_latitude = message['latitude']
-            animal.ultima_longitude = message['longitude']
-            animal.ultima_atualizacao = datetime.now()
-            
-            # Atualizar bateria se disponível
-            if 'battery' in message:
-                animal.bateria = message['battery']
-            
-            # Registrar no histórico
-            historico = HistoricoLocalizacao(
-                animal_id=animal.id,
-                device_id=device_id,
-                latitude=message['latitude'],
-                longitude=message['longitude'],
-                bateria=message.get('battery', 0)
-            )
-            
-            db.session.add(historico)
-            db.session.commit()
-            
-            logger.info(f"Localização do animal {animal.codigo} atualizada via LoRa")
-            return True
-        
-        return False
+        logger.info(f"Localização do animal {animais[0].codigo} atualizada via LoRa")
+        return True
         
     except Exception as e:
         logger.error(f"Erro ao processar mensagem LoRa: {str(e)}")
@@ -142,7 +125,10 @@ def process_lora_message(message_json):
 
 def simulate_lora_data(num_devices=5):
     """
-    Simula dados de localização de dispositivos LoRa para demonstração
+    Simula dados de localização de dispositivos LoRa para demonstração.
+    
+    As posições simuladas passam pelo mesmo caminho de ingestão em lote
+    usado pelos dispositivos reais.
     
     Args:
         num_devices (int): Número de dispositivos a simular
@@ -156,6 +142,7 @@ def simulate_lora_data(num_devices=5):
         logger.warning("Nenhum animal com dispositivo LoRa encontrado")
         return
     
+    posicoes = []
     for animal in animais:
         # Simular uma pequena variação na posição anterior
         if animal.ultima_latitude and animal.ultima_longitude:
@@ -171,16 +158,27 @@ def simulate_lora_data(num_devices=5):
         # Garantir que a bateria não fique negativa
         bat = max(0, bat)
         
-        # Criar mensagem simulada
-        message = {
+        posicoes.append({
             'device_id': animal.id_dispositivo,
             'latitude': lat,
             'longitude': lng,
-            'battery': bat,
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        # Processar a mensagem simulada
-        process_lora_message(json.dumps(message))
+            'bateria': bat
+        })
+    
+    registrar_posicoes(posicoes)
     
     logger.info("Simulação de dados LoRa concluída")
+
+def init_app(app):
+    """Agenda a simulação de telemetria, se habilitada na configuração"""
+    if not app.config.get('SIMULACAO_LORA_ATIVA'):
+        return
+    
+    from agendador import agendador
+    
+    num_devices = app.config.get('SIMULACAO_LORA_DISPOSITIVOS', 5)
+    agendador.agendar(
+        'simulacao_lora',
+        app.config.get('SIMULACAO_LORA_INTERVALO', 60),
+        lambda: simulate_lora_data(num_devices)
+    )
@@ -4,9 +4,33 @@ from app import app
 import routes 
 import criar_estacoes_exemplo_rotas  # Importando as novas rotas para estações meteorológicas
 import api_rotas  # Importando as rotas da API para dispositivos LoRa e balanças
+import agendador  # Tarefas periódicas em segundo plano
+import lora_communication
+import leituras_estacoes
+import buffer_leituras
+import regras_alertas
+import tarefas_relatorios
+import previsao_crescimento
+import previsao_baterias
+import monitor_conexao
+import estresse_termico
+import contatos_animais
 
 # Inicializar a API
 api_rotas.init_app(app)
 
+# Agendar tarefas em segundo plano
+lora_communication.init_app(app)
+leituras_estacoes.init_app(app)
+buffer_leituras.init_app(app)
+regras_alertas.init_app(app)
+tarefas_relatorios.init_app(app)
+previsao_crescimento.init_app(app)
+previsao_baterias.init_app(app)
+monitor_conexao.init_app(app)
+estresse_termico.init_app(app)
+contatos_animais.init_app(app)
+agendador.init_app(app)
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
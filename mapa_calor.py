@@ -0,0 +1,345 @@
+"""
+Mapa de calor da ocupação das pastagens (densidade de posições).
+
+As posições de `HistoricoLocalizacao` de uma propriedade em um período são
+contadas em uma grade fixa sobre a projeção Web Mercator: células de
+`CELULAS_POR_TILE` por tile no zoom `ZOOM_BASE` (cerca de 10 m no
+equador). A grade é esparsa — só as células com posições, como chaves
+ordenadas (linha, coluna) e contagens — e fica em memória no worker
+(`GradeDensidade`, por propriedade e período, com descarte das menos usadas).
+
+Cada tile (zoom, x, y) é montado da grade com `np.histogram2d` sobre as
+células da faixa de linhas do tile (busca ordenada nas chaves): em zooms
+menores as células são somadas, em zooms maiores o tile é recortado do tile
+do zoom base. As contagens dos tiles ficam em cache por grade e são
+atualizadas de forma incremental: novas posições (lidas por id desde a
+última sincronização, de imediato após uma ingestão no próprio worker ou a
+cada `INTERVALO_SINCRONIZACAO` segundos) são somadas à grade e aos tiles em
+cache, sem recontar o período. O PNG é gerado das contagens a cada pedido
+(escala logarítmica até o máximo da grade no zoom), de modo que todos os
+tiles usam a mesma escala.
+"""
+
+import math
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, time as hora, timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+from app import db
+from indice_posicoes import TAMANHO_TILE_PX, ZOOM_MAXIMO, mercator
+from ingestao import registrar_ouvinte_posicoes
+from models import Animal, HistoricoLocalizacao
+
+# Grade base: células por lado de um tile no zoom base
+ZOOM_BASE = 16
+CELULAS_POR_TILE = 64
+_BITS_COLUNA = 32  # colunas por chave (2^22 no zoom base)
+
+# Posições dos períodos que incluem hoje são sincronizadas a cada intervalo
+INTERVALO_SINCRONIZACAO = 30  # em segundos
+
+# Ids abaixo do maior já lido que ainda podem ser confirmados por outras
+# transações (INSERTs concorrentes); são relidos e somados uma única vez
+MARGEM_IDS = 2000
+
+# Limites do cache por worker
+GRADES_MAXIMAS = 8
+TILES_POR_GRADE = 256
+
+# Linhas por bloco lidas do cursor no servidor
+TAMANHO_BLOCO = 50000
+
+# Período máximo de um mapa de calor (a primeira grade é contada no pedido)
+PERIODO_MAXIMO = 31  # em dias
+
+
+def _paleta():
+    """Cores RGBA (256 níveis): azul translúcido -> verde -> amarelo -> vermelho"""
+    pontos = np.array([0, 0.25, 0.5, 0.75, 1.0])
+    cores = np.array([
+        [0, 0, 255, 0],
+        [0, 128, 255, 140],
+        [0, 200, 0, 180],
+        [255, 220, 0, 210],
+        [220, 0, 0, 235],
+    ], dtype=np.float64)
+    niveis = np.linspace(0, 1, 256)
+    paleta = np.stack([np.interp(niveis, pontos, cores[:, canal]) for canal in range(4)], axis=1)
+    return paleta.round().astype(np.uint8)
+
+
+PALETA = _paleta()
+
+
+def codificar_png(rgba):
+    """Codifica uma imagem RGBA (altura x largura x 4, uint8) como PNG"""
+    altura, largura, _ = rgba.shape
+    linhas = np.zeros((altura, largura * 4 + 1), dtype=np.uint8)
+    linhas[:, 1:] = rgba.reshape(altura, -1)  # filtro 0 (nenhum) em cada linha
+
+    def bloco(tipo, dados):
+        return struct.pack('>I', len(dados)) + tipo + dados + struct.pack('>I', zlib.crc32(tipo + dados))
+
+    return (
+        b'\x89PNG\r\n\x1a\n' +
+        bloco(b'IHDR', struct.pack('>IIBBBBB', largura, altura, 8, 6, 0, 0, 0)) +
+        bloco(b'IDAT', zlib.compress(linhas.tobytes(), 6)) +
+        bloco(b'IEND', b'')
+    )
+
+
+PNG_VAZIO = codificar_png(np.zeros((TAMANHO_TILE_PX, TAMANHO_TILE_PX, 4), dtype=np.uint8))
+
+
+def chaves_celulas(latitudes, longitudes):
+    """Chave da célula da grade base de cada posição (linha << 32 | coluna)"""
+    x, y = mercator(np.asarray(longitudes, dtype=np.float64), np.asarray(latitudes, dtype=np.float64))
+    celulas = CELULAS_POR_TILE * 2 ** ZOOM_BASE
+    coluna = np.clip(np.floor(x * celulas), 0, celulas - 1).astype(np.int64)
+    linha = np.clip(np.floor(y * celulas), 0, celulas - 1).astype(np.int64)
+    return (linha << _BITS_COLUNA) | coluna
+
+
+def _somar(chaves, contagens):
+    """Une chaves repetidas somando as contagens (resultado ordenado por chave)"""
+    unicas, grupo = np.unique(chaves, return_inverse=True)
+    return unicas, np.bincount(grupo.ravel(), weights=contagens, minlength=len(unicas)).astype(np.int64)
+
+
+class GradeDensidade:
+    """Contagem de posições por célula de uma propriedade em um período"""
+
+    def __init__(self, propriedade_id, inicio, fim):
+        self.propriedade_id = propriedade_id
+        self.inicio = inicio
+        self.fim = fim
+        self.chaves = np.empty(0, dtype=np.int64)
+        self.contagens = np.empty(0, dtype=np.int64)
+        self.total = 0
+        self.ultimo_id = 0
+        self.ids_recentes = np.empty(0, dtype=np.int64)
+        self.tiles = OrderedDict()
+        self.maximos = {}
+        self.proxima_sincronizacao = 0
+        # Posições ingeridas no worker desde a última leitura (ver `MapaCalor.notificar`)
+        self.pendente = False
+        self.lock = threading.Lock()
+
+    @property
+    def aberta(self):
+        """Se o período inclui hoje (ainda recebe posições)"""
+        return self.fim >= datetime.now().date()
+
+    def _consulta(self, id_minimo=None):
+        consulta = select(HistoricoLocalizacao.id, HistoricoLocalizacao.latitude, HistoricoLocalizacao.longitude)\
+            .where(
+                HistoricoLocalizacao.data_hora >= datetime.combine(self.inicio, hora.min),
+                HistoricoLocalizacao.data_hora < datetime.combine(self.fim + timedelta(days=1), hora.min)
+            )
+        consulta = consulta.where(
+            HistoricoLocalizacao.animal_id.in_(select(Animal.id).where(Animal.propriedade_id == self.propriedade_id))
+        )
+        if id_minimo is not None:
+            consulta = consulta.where(HistoricoLocalizacao.id > id_minimo)
+        return consulta.execution_options(yield_per=TAMANHO_BLOCO)
+
+    def _ler(self, consulta):
+        """Gera, por bloco da consulta, as chaves das células e os ids das posições"""
+        for bloco in db.session.execute(consulta).partitions():
+            linhas = np.array([tuple(linha) for linha in bloco], dtype=np.float64)
+            yield chaves_celulas(linhas[:, 1], linhas[:, 2]), linhas[:, 0].astype(np.int64)
+
+    def _avancar(self, ids):
+        """Registra os ids lidos, mantendo os da margem abaixo do maior"""
+        if len(ids):
+            self.ultimo_id = max(self.ultimo_id, int(ids.max()))
+        recentes = np.union1d(self.ids_recentes, ids)
+        self.ids_recentes = recentes[recentes > self.ultimo_id - MARGEM_IDS]
+
+    def carregar(self):
+        """Conta todas as posições do período"""
+        self.pendente = False
+        chaves, contagens = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        self.total = 0
+        for bloco_chaves, ids in self._ler(self._consulta()):
+            unicas, somas = _somar(bloco_chaves, np.ones(len(bloco_chaves)))
+            chaves.append(unicas)
+            contagens.append(somas)
+            self.total += len(ids)
+            self._avancar(ids)
+            # Une os blocos de tempos em tempos para limitar a memória
+            if len(chaves) >= 16:
+                unicas, somas = _somar(np.concatenate(chaves), np.concatenate(contagens))
+                chaves, contagens = [unicas], [somas]
+
+        self.chaves, self.contagens = _somar(np.concatenate(chaves), np.concatenate(contagens))
+        self.tiles.clear()
+        self.maximos.clear()
+        self.proxima_sincronizacao = time.monotonic() + INTERVALO_SINCRONIZACAO
+
+    def sincronizar(self):
+        """Soma à grade e aos tiles em cache as posições novas desde a última leitura"""
+        self.pendente = False
+        lidas = list(self._ler(self._consulta(max(self.ultimo_id - MARGEM_IDS, 0))))
+        self.proxima_sincronizacao = time.monotonic() + INTERVALO_SINCRONIZACAO
+        if not lidas:
+            return 0
+
+        chaves = np.concatenate([bloco for bloco, _ in lidas])
+        ids = np.concatenate([bloco for _, bloco in lidas])
+        # A consulta volta à margem de ids: ignora as posições já somadas
+        chaves = chaves[~np.isin(ids, self.ids_recentes)]
+        self._avancar(ids)
+        if not len(chaves):
+            return 0
+
+        novas_chaves, novas_contagens = _somar(chaves, np.ones(len(chaves)))
+        self.chaves, self.contagens = _somar(
+            np.concatenate([self.chaves, novas_chaves]), np.concatenate([self.contagens, novas_contagens])
+        )
+        self.total += len(chaves)
+        self.maximos.clear()
+        for (zoom, x, y), contagens in self.tiles.items():
+            contagens += self._contar(novas_chaves, novas_contagens, zoom, x, y)
+        return len(chaves)
+
+    def _contar(self, chaves, contagens, zoom, x, y):
+        """Contagens (CELULAS_POR_TILE x CELULAS_POR_TILE) de um tile a partir de células da grade base"""
+        n = CELULAS_POR_TILE
+        if zoom > ZOOM_BASE:
+            # Tile menor que a célula: recorte ampliado do tile do zoom base
+            fator = 2 ** min(zoom - ZOOM_BASE, int(math.log2(n)))
+            base = self._contar(chaves, contagens, ZOOM_BASE, x // fator, y // fator)
+            lado = n // fator
+            recorte = base[(y % fator) * lado:(y % fator + 1) * lado, (x % fator) * lado:(x % fator + 1) * lado]
+            return np.repeat(np.repeat(recorte, fator, axis=0), fator, axis=1)
+
+        deslocamento = ZOOM_BASE - zoom
+        linha_inicial = (y * n) << deslocamento
+        linha_final = ((y + 1) * n) << deslocamento
+        # Chaves ordenadas por linha: a faixa de linhas do tile é contígua
+        inicio = np.searchsorted(chaves, linha_inicial << _BITS_COLUNA)
+        fim = np.searchsorted(chaves, linha_final << _BITS_COLUNA)
+        if inicio == fim:
+            return np.zeros((n, n), dtype=np.int64)
+
+        faixa = chaves[inicio:fim]
+        linhas = (faixa >> _BITS_COLUNA) >> deslocamento
+        colunas = (faixa & ((1 << _BITS_COLUNA) - 1)) >> deslocamento
+        # Bordas em meia célula: cada índice inteiro cai em um único bin e as
+        # colunas dos tiles vizinhos ficam fora (a última borda é fechada)
+        contagem, _, _ = np.histogram2d(
+            linhas, colunas, bins=n, weights=contagens[inicio:fim],
+            range=[[y * n - 0.5, (y + 1) * n - 0.5], [x * n - 0.5, (x + 1) * n - 0.5]]
+        )
+        return contagem.astype(np.int64)
+
+    def tile(self, zoom, x, y):
+        """Contagens de um tile (em cache, atualizadas de forma incremental)"""
+        chave = (zoom, x, y)
+        contagens = self.tiles.get(chave)
+        if contagens is None:
+            contagens = self._contar(self.chaves, self.contagens, zoom, x, y)
+            self.tiles[chave] = contagens
+            if len(self.tiles) > TILES_POR_GRADE:
+                self.tiles.popitem(last=False)
+        else:
+            self.tiles.move_to_end(chave)
+        return contagens
+
+    def maximo(self, zoom):
+        """Maior contagem de uma célula de tile no zoom (escala comum aos tiles)"""
+        zoom = min(zoom, ZOOM_BASE)
+        if zoom not in self.maximos:
+            if not len(self.chaves):
+                self.maximos[zoom] = 0
+            else:
+                deslocamento = ZOOM_BASE - zoom
+                linhas = (self.chaves >> _BITS_COLUNA) >> deslocamento
+                colunas = (self.chaves & ((1 << _BITS_COLUNA) - 1)) >> deslocamento
+                _, somas = _somar((linhas << _BITS_COLUNA) | colunas, self.contagens)
+                self.maximos[zoom] = int(somas.max())
+        return self.maximos[zoom]
+
+
+class MapaCalor:
+    """Grades de densidade do worker, por propriedade e período"""
+
+    def __init__(self):
+        self._grades = OrderedDict()
+        self._lock = threading.Lock()
+
+    def notificar(self, eventos):
+        """Ouvinte da ingestão: sincroniza cada grade aberta no seu próximo pedido"""
+        if not eventos:
+            return
+        with self._lock:
+            for grade in self._grades.values():
+                if grade.aberta:
+                    grade.pendente = True
+
+    def grade(self, propriedade_id, inicio, fim):
+        """Grade do período (carregada ou sincronizada quando necessário)"""
+        chave = (propriedade_id, inicio, fim)
+        with self._lock:
+            grade = self._grades.get(chave)
+            if grade is None:
+                grade = self._grades[chave] = GradeDensidade(propriedade_id, inicio, fim)
+                if len(self._grades) > GRADES_MAXIMAS:
+                    self._grades.popitem(last=False)
+            else:
+                self._grades.move_to_end(chave)
+
+        with grade.lock:
+            if grade.proxima_sincronizacao == 0:
+                grade.carregar()
+            elif grade.aberta and (grade.pendente or time.monotonic() >= grade.proxima_sincronizacao):
+                grade.sincronizar()
+        return grade
+
+    def invalidar(self):
+        with self._lock:
+            self._grades.clear()
+
+
+def renderizar_tile(contagens, maximo):
+    """PNG do tile: escala logarítmica das contagens até o máximo do zoom"""
+    if maximo <= 0 or not contagens.any():
+        return PNG_VAZIO
+    niveis = np.log1p(contagens) / math.log1p(maximo)
+    indices = np.where(contagens > 0, np.clip((niveis * 255).round(), 1, 255), 0).astype(np.uint8)
+    rgba = PALETA[indices]
+    rgba[contagens == 0] = 0
+    fator = TAMANHO_TILE_PX // CELULAS_POR_TILE
+    return codificar_png(np.repeat(np.repeat(rgba, fator, axis=0), fator, axis=1))
+
+
+def obter_tile(zoom, x, y, inicio, fim, propriedade_id):
+    """
+    Contagens de posições de um tile do mapa de calor
+
+    Args:
+        zoom, x, y (int): Tile no esquema XYZ (Web Mercator)
+        inicio, fim (date): Período (dias inclusivos)
+        propriedade_id (int): Propriedade das posições
+
+    Returns:
+        tuple: (contagens CELULAS_POR_TILE x CELULAS_POR_TILE, máximo do
+        zoom, total de posições do período)
+    """
+    if not 0 <= zoom <= ZOOM_MAXIMO or not (0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom):
+        raise ValueError('tile fora da grade')
+    grade = mapa_calor.grade(propriedade_id, inicio, fim)
+    with grade.lock:
+        return grade.tile(zoom, x, y).copy(), grade.maximo(zoom), grade.total
+
+
+# Grades compartilhadas pelas requisições do worker
+mapa_calor = MapaCalor()
+registrar_ouvinte_posicoes(mapa_calor.notificar)
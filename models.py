@@ -49,6 +49,10 @@ class Propriedade(db.Model):
     # Token de API para integração com servidor LoRa
     api_token = db.Column(db.String(100))
     
+    # Incrementada a cada pesagem gravada, alterada ou excluída e a cada troca de
+    # lote, raça ou área de um animal (versão do cache da análise de ganho de peso)
+    versao_pesagens = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Relacionamentos
     areas = db.relationship('Area', backref='propriedade', lazy=True)
     animais = db.relationship('Animal', backref='propriedade', lazy=True)
@@ -93,6 +97,10 @@ class Raca(db.Model):
 
 class Animal(db.Model):
     __tablename__ = 'animais'
+    __table_args__ = (
+        # Paginação por chave (codigo, id) da listagem de animais
+        db.Index('ix_animais_codigo_id', 'codigo', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     codigo = db.Column(db.String(20), unique=True, nullable=False)
@@ -100,7 +108,7 @@ class Animal(db.Model):
     sexo = db.Column(db.String(1)) # M ou F
     data_nascimento = db.Column(db.Date)
     peso_atual = db.Column(db.Float) # em kg
-    status = db.Column(db.String(20), default='Ativo') # Ativo, Vendido, Morto
+    status = db.Column(db.String(20), default='Ativo', index=True) # Ativo, Vendido, Morto
     
     # Personalização
     cor = db.Column(db.String(7), default="#000000") # cor para exibição no mapa (formato hex #RRGGBB)
@@ -109,14 +117,17 @@ class Animal(db.Model):
     id_dispositivo = db.Column(db.String(36), unique=True)
     ultima_latitude = db.Column(db.Float)
     ultima_longitude = db.Column(db.Float)
-    ultima_atualizacao = db.Column(db.DateTime)
+    ultima_atualizacao = db.Column(db.DateTime, index=True)
     bateria = db.Column(db.Float) # percentual de bateria
     
+    # Última alteração cadastral que afeta o mapa (status, dispositivo, cor...)
+    data_alteracao_mapa = db.Column(db.DateTime, index=True)
+    
     # Relacionamentos
     propriedade_id = db.Column(db.Integer, db.ForeignKey('propriedades.id'), nullable=False)
-    raca_id = db.Column(db.Integer, db.ForeignKey('racas.id'), nullable=False)
-    area_id = db.Column(db.Integer, db.ForeignKey('areas.id'))
-    lote_id = db.Column(db.Integer, db.ForeignKey('lotes.id'))
+    raca_id = db.Column(db.Integer, db.ForeignKey('racas.id'), nullable=False, index=True)
+    area_id = db.Column(db.Integer, db.ForeignKey('areas.id'), index=True)
+    lote_id = db.Column(db.Integer, db.ForeignKey('lotes.id'), index=True)
     mae_id = db.Column(db.Integer, db.ForeignKey('animais.id'))
     pai_id = db.Column(db.Integer, db.ForeignKey('animais.id'))
     
@@ -191,6 +202,10 @@ class BalancaDigital(db.Model):
 
 class RegistroPeso(db.Model):
     __tablename__ = 'registros_peso'
+    __table_args__ = (
+        # Pesagens de cada animal em ordem cronológica (análise de ganho de peso)
+        db.Index('ix_registros_peso_animal_data', 'animal_id', 'data_pesagem'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     peso = db.Column(db.Float, nullable=False) # em kg
@@ -206,6 +221,12 @@ class RegistroPeso(db.Model):
 
 class RegistroSanitario(db.Model):
     __tablename__ = 'registros_sanitarios'
+    __table_args__ = (
+        # Agenda sanitária: doses vencendo em um intervalo de datas e o
+        # registro mais recente de cada animal e produto
+        db.Index('ix_registros_sanitarios_data_proxima', 'data_proxima'),
+        db.Index('ix_registros_sanitarios_animal_produto', 'animal_id', 'tipo', 'produto', 'data_aplicacao'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     tipo = db.Column(db.String(50), nullable=False) # vacinação, vermifugação, etc
@@ -247,7 +268,7 @@ class DispositivoLora(db.Model):
     device_id = db.Column(db.String(36), unique=True, nullable=False)
     tipo = db.Column(db.String(50)) # brinco, colar, etc
     data_ativacao = db.Column(db.DateTime, default=datetime.utcnow)
-    ultimo_contato = db.Column(db.DateTime)
+    ultimo_contato = db.Column(db.DateTime, index=True)
     status = db.Column(db.String(20), default='Ativo') # Ativo, Inativo, Manutenção
     bateria = db.Column(db.Float) # percentual de bateria
     firmware = db.Column(db.String(20))
@@ -258,6 +279,12 @@ class DispositivoLora(db.Model):
 
 class HistoricoLocalizacao(db.Model):
     __tablename__ = 'historico_localizacao'
+    __table_args__ = (
+        # Histórico de bateria de cada dispositivo (previsão de troca de baterias)
+        db.Index('ix_historico_localizacao_device_data', 'device_id', 'data_hora'),
+        # Trilhas de cada animal em ordem de data (exportação KML/GeoJSON)
+        db.Index('ix_historico_localizacao_animal_data', 'animal_id', 'data_hora'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     latitude = db.Column(db.Float, nullable=False)
@@ -271,6 +298,10 @@ class HistoricoLocalizacao(db.Model):
 
 class EstacaoMeteorologica(db.Model):
     __tablename__ = 'estacoes_meteorologicas'
+    __table_args__ = (
+        # Estações em atraso por intervalo de leitura (monitor de conexão)
+        db.Index('ix_estacoes_meteorologicas_intervalo_contato', 'intervalo_leitura', 'ultimo_contato'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
@@ -316,6 +347,10 @@ class EstacaoMeteorologica(db.Model):
 
 class LeituraMeteorologica(db.Model):
     __tablename__ = 'leituras_meteorologicas'
+    __table_args__ = (
+        # Séries por estação em um intervalo de datas
+        db.Index('ix_leituras_meteorologicas_estacao_data', 'estacao_id', 'data_hora'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     data_hora = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -341,6 +376,10 @@ class LeituraMeteorologica(db.Model):
 
 class AlertaMeteorologico(db.Model):
     __tablename__ = 'alertas_meteorologicos'
+    __table_args__ = (
+        # Alertas abertos por estação (detalhes da estação e regras de alerta)
+        db.Index('ix_alertas_meteorologicos_estacao_status', 'estacao_id', 'status'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     tipo = db.Column(db.String(50), nullable=False) # Chuva, Seca, Geada, Tempestade, etc
@@ -354,8 +393,292 @@ class AlertaMeteorologico(db.Model):
     valor_limite = db.Column(db.Float)
     unidade = db.Column(db.String(10)) # mm, °C, km/h, etc
     
+    # Ocorrências agrupadas no mesmo alerta enquanto ele está aberto
+    valor_pico = db.Column(db.Float)
+    ultima_ocorrencia = db.Column(db.DateTime)
+    ocorrencias = db.Column(db.Integer, default=1)
+    data_finalizacao = db.Column(db.DateTime)
+    
     estacao_id = db.Column(db.Integer, db.ForeignKey('estacoes_meteorologicas.id'), nullable=False)
     
     # Opcional - pessoa que reconheceu o alerta
     reconhecido_por = db.Column(db.String(100))
     data_reconhecimento = db.Column(db.DateTime)
+
+class ResumoEstacao(db.Model):
+    """Resumo de uma estação, mantido a cada leitura registrada"""
+    __tablename__ = 'resumos_estacoes'
+
+    estacao_id = db.Column(db.Integer, db.ForeignKey('estacoes_meteorologicas.id', ondelete='CASCADE'), primary_key=True)
+    estacao = db.relationship('EstacaoMeteorologica', backref=db.backref('resumo', uselist=False, cascade="all, delete-orphan"))
+
+    # Última leitura (mesmos nomes de LeituraMeteorologica)
+    data_hora = db.Column(db.DateTime)
+    temperatura = db.Column(db.Float)
+    umidade = db.Column(db.Float)
+    pressao = db.Column(db.Float)
+    velocidade_vento = db.Column(db.Float)
+    direcao_vento = db.Column(db.Float)
+    precipitacao = db.Column(db.Float)
+    radiacao_solar = db.Column(db.Float)
+    umidade_solo = db.Column(db.Float)
+    temperatura_solo = db.Column(db.Float)
+    bateria = db.Column(db.Float)
+    sinal_lora = db.Column(db.Float)
+
+    # Últimas 24 horas
+    temperatura_min_24h = db.Column(db.Float)
+    temperatura_max_24h = db.Column(db.Float)
+    umidade_min_24h = db.Column(db.Float)
+    umidade_max_24h = db.Column(db.Float)
+    precipitacao_24h = db.Column(db.Float)
+    leituras_24h = db.Column(db.Integer, default=0)
+
+    alertas_ativos = db.Column(db.Integer, default=0)
+    ultimo_contato = db.Column(db.DateTime)
+    data_calculo = db.Column(db.DateTime) # momento em que a janela de 24h foi calculada
+
+class EstresseTermicoDiario(db.Model):
+    """Índice de temperatura e umidade (ITU) e carga térmica diária de uma estação"""
+    __tablename__ = 'estresse_termico_diario'
+    __table_args__ = (
+        db.UniqueConstraint('estacao_id', 'data', name='uq_estresse_termico_estacao_data'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    estacao_id = db.Column(db.Integer, db.ForeignKey('estacoes_meteorologicas.id', ondelete='CASCADE'), nullable=False)
+    data = db.Column(db.Date, nullable=False, index=True)
+
+    leituras = db.Column(db.Integer)
+    horas = db.Column(db.Integer) # horas com leituras
+    itu_medio = db.Column(db.Float)
+    itu_maximo = db.Column(db.Float) # maior média horária
+    ponto_orvalho_medio = db.Column(db.Float) # em °C
+    temperatura_maxima = db.Column(db.Float)
+    carga_termica = db.Column(db.Float) # soma horária do ITU acima do limiar (ITU·h)
+    horas_alerta = db.Column(db.Integer)
+    horas_perigo = db.Column(db.Integer)
+    horas_emergencia = db.Column(db.Integer)
+    categoria = db.Column(db.String(20)) # pior categoria horária do dia
+    data_calculo = db.Column(db.DateTime, default=datetime.now)
+
+class RegraAlerta(db.Model):
+    """Regra de alerta meteorológico avaliada a cada leitura recebida"""
+    __tablename__ = 'regras_alertas'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False) # tipo do alerta gerado (Temperatura Alta, Geada...)
+    descricao = db.Column(db.Text)
+    nivel = db.Column(db.String(20), nullable=False, default='Atenção') # Informativo, Atenção, Alerta, Emergência
+    unidade = db.Column(db.String(10))
+
+    # Condição: campo da leitura (ou sua variação na janela) comparado ao limite
+    campo = db.Column(db.String(30), nullable=False) # temperatura, precipitacao, etc
+    operador = db.Column(db.String(2), nullable=False, default='>') # >, >=, <, <=
+    limite = db.Column(db.Float, nullable=False)
+    leituras_consecutivas = db.Column(db.Integer, default=1) # leituras seguidas na condição
+    janela_variacao = db.Column(db.Integer) # em minutos; se definida, compara a variação na janela
+
+    # Escopo: estação, propriedade ou todas (ambos nulos). A regra mais
+    # específica de um mesmo tipo substitui as demais
+    estacao_id = db.Column(db.Integer, db.ForeignKey('estacoes_meteorologicas.id', ondelete='CASCADE'), index=True)
+    propriedade_id = db.Column(db.Integer, db.ForeignKey('propriedades.id'), index=True)
+
+    ativa = db.Column(db.Boolean, default=True)
+    data_criacao = db.Column(db.DateTime, default=datetime.now)
+    data_alteracao = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'descricao': self.descricao,
+            'nivel': self.nivel,
+            'unidade': self.unidade,
+            'campo': self.campo,
+            'operador': self.operador,
+            'limite': self.limite,
+            'leituras_consecutivas': self.leituras_consecutivas,
+            'janela_variacao': self.janela_variacao,
+            'estacao_id': self.estacao_id,
+            'propriedade_id': self.propriedade_id,
+            'ativa': self.ativa
+        }
+
+class TarefaRelatorio(db.Model):
+    """Exportação de relatório executada em segundo plano"""
+    __tablename__ = 'tarefas_relatorios'
+
+    id = db.Column(db.Integer, primary_key=True)
+    relatorio = db.Column(db.String(30), nullable=False) # animais, atividades
+    formato = db.Column(db.String(10), nullable=False) # xlsx, csv
+    filtros = db.Column(db.Text) # JSON com os filtros normalizados
+    chave = db.Column(db.String(64), nullable=False, index=True) # hash de relatório + formato + filtros
+    status = db.Column(db.String(20), default='Pendente', index=True) # Pendente, Executando, Concluído, Erro
+
+    total_linhas = db.Column(db.Integer)
+    linhas_processadas = db.Column(db.Integer, default=0)
+    arquivo = db.Column(db.String(255)) # caminho do arquivo gerado
+    nome_arquivo = db.Column(db.String(100)) # nome sugerido para download
+    erro = db.Column(db.Text)
+
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
+    data_criacao = db.Column(db.DateTime, default=datetime.now)
+    data_inicio = db.Column(db.DateTime)
+    data_conclusao = db.Column(db.DateTime)
+    data_expiracao = db.Column(db.DateTime, index=True)
+
+    @property
+    def progresso(self):
+        """Percentual concluído (0-100)"""
+        if self.status == 'Concluído':
+            return 100
+        if not self.total_linhas:
+            return 0
+        return min(99, int(100 * (self.linhas_processadas or 0) / self.total_linhas))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'relatorio': self.relatorio,
+            'formato': self.formato,
+            'filtros': json.loads(self.filtros or '{}'),
+            'status': self.status,
+            'progresso': self.progresso,
+            'total_linhas': self.total_linhas,
+            'linhas_processadas': self.linhas_processadas,
+            'erro': self.erro,
+            'data_criacao': self.data_criacao.isoformat() if self.data_criacao else None,
+            'data_conclusao': self.data_conclusao.isoformat() if self.data_conclusao else None,
+            'data_expiracao': self.data_expiracao.isoformat() if self.data_expiracao else None,
+        }
+
+class PrevisaoCrescimento(db.Model):
+    """Curva de crescimento ajustada e data prevista de peso alvo de um animal"""
+    __tablename__ = 'previsoes_crescimento'
+
+    animal_id = db.Column(db.Integer, db.ForeignKey('animais.id', ondelete='CASCADE'), primary_key=True)
+    lote_id = db.Column(db.Integer, db.ForeignKey('lotes.id'), index=True)
+
+    # Parâmetros da curva: W(t) = A * exp(-b * exp(-k t)) (gompertz) ou
+    # A * (1 - b * exp(-k t)) ** 3 (bertalanffy), t = idade em dias
+    modelo = db.Column(db.String(20), nullable=False)
+    peso_assintotico = db.Column(db.Float) # A, em kg
+    parametro_b = db.Column(db.Float)
+    taxa_k = db.Column(db.Float) # por dia
+    rmse = db.Column(db.Float) # erro do ajuste, em kg
+    pesagens = db.Column(db.Integer)
+
+    peso_alvo = db.Column(db.Float) # em kg
+    data_peso_alvo = db.Column(db.Date, index=True) # nula se o alvo não é atingível pela curva
+    data_calculo = db.Column(db.DateTime, default=datetime.now)
+
+class PrevisaoBateria(db.Model):
+    """Taxa de descarga e data prevista de bateria baixa de um dispositivo"""
+    __tablename__ = 'previsoes_baterias'
+    __table_args__ = (
+        db.UniqueConstraint('tipo', 'referencia_id', name='uq_previsoes_baterias_tipo_referencia'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False) # lora, estacao, balanca
+    referencia_id = db.Column(db.Integer, nullable=False) # id do dispositivo LoRa, estação ou balança
+    codigo = db.Column(db.String(50)) # device_id ou código da estação/balança
+    descricao = db.Column(db.String(100)) # animal, estação ou balança
+
+    # Localização para planejar as trocas por propriedade e área
+    propriedade_id = db.Column(db.Integer, db.ForeignKey('propriedades.id', ondelete='CASCADE'), index=True)
+    area_id = db.Column(db.Integer, db.ForeignKey('areas.id', ondelete='SET NULL'))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+
+    bateria = db.Column(db.Float) # último percentual conhecido
+    data_bateria = db.Column(db.DateTime)
+    taxa_descarga = db.Column(db.Float) # em pontos percentuais por dia; nula sem histórico suficiente
+    pontos = db.Column(db.Integer) # leituras usadas no ajuste (desde a última troca/recarga)
+    limite = db.Column(db.Float)
+    data_limite = db.Column(db.DateTime, index=True) # nula se a bateria não está descarregando
+    data_calculo = db.Column(db.DateTime, default=datetime.now)
+
+    def to_dict(self):
+        return {
+            'tipo': self.tipo,
+            'referencia_id': self.referencia_id,
+            'codigo': self.codigo,
+            'descricao': self.descricao,
+            'propriedade_id': self.propriedade_id,
+            'area_id': self.area_id,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'bateria': self.bateria,
+            'data_bateria': self.data_bateria.isoformat() if self.data_bateria else None,
+            'taxa_descarga': self.taxa_descarga,
+            'pontos': self.pontos,
+            'limite': self.limite,
+            'data_limite': self.data_limite.isoformat() if self.data_limite else None
+        }
+
+class EventoConexao(db.Model):
+    """Período em que um dispositivo ficou sem comunicação além do intervalo esperado"""
+    __tablename__ = 'eventos_conexao'
+    __table_args__ = (
+        db.Index('ix_eventos_conexao_dispositivo', 'tipo_dispositivo', 'referencia_id', 'data_fim'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo_dispositivo = db.Column(db.String(20), nullable=False) # estacao, lora
+    referencia_id = db.Column(db.Integer, nullable=False) # id da estação ou do dispositivo LoRa
+    codigo = db.Column(db.String(50))
+    propriedade_id = db.Column(db.Integer, db.ForeignKey('propriedades.id', ondelete='CASCADE'))
+    intervalo_esperado = db.Column(db.Integer) # em minutos
+
+    data_inicio = db.Column(db.DateTime, nullable=False) # último contato antes do silêncio
+    data_deteccao = db.Column(db.DateTime, nullable=False)
+    data_fim = db.Column(db.DateTime, index=True) # primeiro contato após o silêncio; nula enquanto offline
+    duracao = db.Column(db.Float) # em segundos
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'tipo_dispositivo': self.tipo_dispositivo,
+            'referencia_id': self.referencia_id,
+            'codigo': self.codigo,
+            'propriedade_id': self.propriedade_id,
+            'intervalo_esperado': self.intervalo_esperado,
+            'data_inicio': self.data_inicio.isoformat(),
+            'data_deteccao': self.data_deteccao.isoformat(),
+            'data_fim': self.data_fim.isoformat() if self.data_fim else None,
+            'duracao': self.duracao
+        }
+
+class DisponibilidadeDispositivo(db.Model):
+    """Estatísticas acumuladas de conexão de um dispositivo (mantidas pelo monitor de conexão)"""
+    __tablename__ = 'disponibilidade_dispositivos'
+
+    tipo_dispositivo = db.Column(db.String(20), primary_key=True)
+    referencia_id = db.Column(db.Integer, primary_key=True)
+    eventos_offline = db.Column(db.Integer, default=0)
+    tempo_offline = db.Column(db.Float, default=0.0) # eventos encerrados, em segundos
+    maior_interrupcao = db.Column(db.Float, default=0.0) # em segundos
+    offline_desde = db.Column(db.DateTime) # nula enquanto online
+    data_atualizacao = db.Column(db.DateTime, default=datetime.now)
+
+class ContatoAnimal(db.Model):
+    """Contato diário entre dois animais (um registro em cada sentido)"""
+    __tablename__ = 'contatos_animais'
+    __table_args__ = (
+        # Contatos de um animal em um período (rastreamento a partir de um animal)
+        db.Index('ix_contatos_animais_animal_data', 'animal_id', 'data'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.Date, nullable=False, index=True)
+    animal_id = db.Column(db.Integer, db.ForeignKey('animais.id', ondelete='CASCADE'), nullable=False)
+    contato_id = db.Column(db.Integer, db.ForeignKey('animais.id', ondelete='CASCADE'), nullable=False)
+
+    encontros = db.Column(db.Integer) # intervalos de tempo em contato
+    duracao = db.Column(db.Integer) # em minutos
+    primeiro_contato = db.Column(db.DateTime)
+    ultimo_contato = db.Column(db.DateTime)
+    distancia_minima = db.Column(db.Float) # em metros
+    data_calculo = db.Column(db.DateTime, default=datetime.now)
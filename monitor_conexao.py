@@ -0,0 +1,265 @@
+"""
+Monitor de conexão dos dispositivos (estações e dispositivos LoRa).
+
+Cada dispositivo tem um intervalo esperado entre contatos: o
+`intervalo_leitura` da estação ou `DISPOSITIVOS_INTERVALO_LORA` para os
+dispositivos LoRa. Um dispositivo sem contato há mais de
+`DISPOSITIVOS_FATOR_ATRASO` intervalos é considerado offline.
+
+A varredura roda a cada minuto e só lê os dispositivos que mudaram de
+estado: para cada intervalo, os que ficaram em atraso desde a varredura
+anterior são uma faixa de `ultimo_contato` (entre o corte anterior e o
+atual), lida pelos índices (intervalo_leitura, ultimo_contato) das estações
+e ultimo_contato dos dispositivos LoRa. Cada um gera um `EventoConexao`
+aberto; na varredura seguinte a um novo contato o evento é encerrado com a
+duração da interrupção. `DisponibilidadeDispositivo` acumula, por
+dispositivo, o número de interrupções e o tempo offline.
+
+A primeira varredura de um worker (ou de um novo líder do agendador) não
+tem corte anterior e lê toda a faixa em atraso; dispositivos que já têm um
+evento aberto são ignorados.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import exists, insert, select
+
+from app import app, db
+from cache_memoria import CacheTemporario
+from models import (
+    Animal, DispositivoLora, DisponibilidadeDispositivo, EstacaoMeteorologica, EventoConexao
+)
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+TIPOS_MONITORADOS = ('estacao', 'lora')
+
+# Intervalo assumido para estações sem intervalo de leitura cadastrado
+INTERVALO_ESTACAO_PADRAO = 15  # em minutos
+
+# Intervalos de leitura distintos das estações (muda só ao editar estações)
+cache_intervalos = CacheTemporario(ttl=600)
+
+
+def _modelo(tipo):
+    return EstacaoMeteorologica if tipo == 'estacao' else DispositivoLora
+
+
+class MonitorConexao:
+    """Detecta dispositivos em atraso e encerra as interrupções ao novo contato"""
+
+    def __init__(self):
+        # (tipo, intervalo) -> corte da última varredura
+        self._cortes = {}
+
+    def _intervalos(self, tipo):
+        """Grupos de intervalo esperado do tipo: lista de (chave, intervalo em minutos, filtro)"""
+        if tipo == 'lora':
+            return [(None, app.config.get('DISPOSITIVOS_INTERVALO_LORA', 15), None)]
+
+        distintos = cache_intervalos.obter('estacoes', lambda: [
+            intervalo for intervalo, in
+            db.session.query(EstacaoMeteorologica.intervalo_leitura).distinct().all()
+        ])
+        return [(
+            intervalo,
+            intervalo or INTERVALO_ESTACAO_PADRAO,
+            EstacaoMeteorologica.intervalo_leitura == None if intervalo is None
+            else EstacaoMeteorologica.intervalo_leitura == intervalo
+        ) for intervalo in distintos]
+
+    def _em_atraso(self, tipo, filtro, corte, anterior):
+        """Dispositivos cujo último contato ficou em atraso entre `anterior` e `corte`"""
+        modelo = _modelo(tipo)
+        aberto = exists().where(
+            EventoConexao.tipo_dispositivo == tipo,
+            EventoConexao.referencia_id == modelo.id,
+            EventoConexao.data_fim == None
+        )
+        if tipo == 'estacao':
+            consulta = select(modelo.id, modelo.codigo, modelo.propriedade_id, modelo.ultimo_contato)
+        else:
+            consulta = select(modelo.id, modelo.device_id, Animal.propriedade_id, modelo.ultimo_contato)\
+                .outerjoin(Animal, modelo.animal_id == Animal.id)
+
+        consulta = consulta.where(modelo.ultimo_contato < corte, modelo.status != 'Inativo', ~aberto)
+        if filtro is not None:
+            consulta = consulta.where(filtro)
+        if anterior is not None:
+            consulta = consulta.where(modelo.ultimo_contato >= anterior)
+        return db.session.execute(consulta).all()
+
+    def _encerrar_reconectados(self, tipo, agora):
+        """Encerra os eventos abertos de dispositivos que voltaram a se comunicar"""
+        modelo = _modelo(tipo)
+        reconectados = db.session.query(EventoConexao, modelo.ultimo_contato)\
+            .join(modelo, EventoConexao.referencia_id == modelo.id)\
+            .filter(
+                EventoConexao.tipo_dispositivo == tipo,
+                EventoConexao.data_fim == None,
+                modelo.ultimo_contato > EventoConexao.data_inicio
+            ).all()
+
+        for evento, contato in reconectados:
+            evento.data_fim = contato
+            evento.duracao = (contato - evento.data_inicio).total_seconds()
+
+            disponibilidade = db.session.get(DisponibilidadeDispositivo, (tipo, evento.referencia_id))
+            if disponibilidade is not None:
+                disponibilidade.tempo_offline = (disponibilidade.tempo_offline or 0) + evento.duracao
+                disponibilidade.maior_interrupcao = max(disponibilidade.maior_interrupcao or 0, evento.duracao)
+                disponibilidade.offline_desde = None
+                disponibilidade.data_atualizacao = agora
+        return len(reconectados)
+
+    def _registrar_offline(self, tipo, intervalo, dispositivos, agora):
+        db.session.execute(insert(EventoConexao), [{
+            'tipo_dispositivo': tipo,
+            'referencia_id': id,
+            'codigo': codigo,
+            'propriedade_id': propriedade_id,
+            'intervalo_esperado': intervalo,
+            'data_inicio': contato,
+            'data_deteccao': agora
+        } for id, codigo, propriedade_id, contato in dispositivos])
+
+        existentes = {
+            d.referencia_id: d for d in DisponibilidadeDispositivo.query.filter(
+                DisponibilidadeDispositivo.tipo_dispositivo == tipo,
+                DisponibilidadeDispositivo.referencia_id.in_([d[0] for d in dispositivos])
+            )
+        }
+        for id, _, _, contato in dispositivos:
+            disponibilidade = existentes.get(id)
+            if disponibilidade is None:
+                disponibilidade = DisponibilidadeDispositivo(
+                    tipo_dispositivo=tipo, referencia_id=id, eventos_offline=0,
+                    tempo_offline=0.0, maior_interrupcao=0.0
+                )
+                db.session.add(disponibilidade)
+            disponibilidade.eventos_offline += 1
+            disponibilidade.offline_desde = contato
+            disponibilidade.data_atualizacao = agora
+
+    def varrer(self):
+        """
+        Registra os dispositivos que ficaram offline e encerra as interrupções
+        dos que voltaram desde a última varredura
+
+        Returns:
+            tuple: (novos eventos offline, eventos encerrados)
+        """
+        agora = datetime.now()
+        fator = app.config.get('DISPOSITIVOS_FATOR_ATRASO', 3)
+        novos = encerrados = 0
+
+        for tipo in TIPOS_MONITORADOS:
+            encerrados += self._encerrar_reconectados(tipo, agora)
+
+            for valor, intervalo, filtro in self._intervalos(tipo):
+                corte = agora - timedelta(minutes=intervalo * fator)
+                chave = (tipo, valor)
+                dispositivos = self._em_atraso(tipo, filtro, corte, self._cortes.get(chave))
+                if dispositivos:
+                    self._registrar_offline(tipo, intervalo, dispositivos, agora)
+                    novos += len(dispositivos)
+                self._cortes[chave] = corte
+
+        db.session.commit()
+        if novos or encerrados:
+            logger.info(f"Monitor de conexão: {novos} dispositivos offline, {encerrados} reconectados")
+        return novos, encerrados
+
+
+# Monitor compartilhado pelas varreduras do worker líder do agendador
+monitor_conexao = MonitorConexao()
+
+
+def eventos_abertos(tipo=None, propriedade_id=None):
+    """Dispositivos offline no momento (eventos abertos), do mais antigo ao mais recente"""
+    query = EventoConexao.query.filter(EventoConexao.data_fim == None)
+    if tipo:
+        query = query.filter(EventoConexao.tipo_dispositivo == tipo)
+    if propriedade_id is not None:
+        query = query.filter(EventoConexao.propriedade_id == propriedade_id)
+    return query.order_by(EventoConexao.data_inicio).all()
+
+
+def disponibilidade_periodo(inicio, fim, tipo=None, propriedade_id=None):
+    """
+    Disponibilidade de cada dispositivo com interrupções no período
+
+    Args:
+        inicio, fim (datetime): Período analisado
+        tipo (str): 'estacao' ou 'lora' (opcional)
+        propriedade_id (int): Restringe a uma propriedade (opcional)
+
+    Returns:
+        list: Dicts com o dispositivo, interrupções e tempo offline no
+        período, percentual de disponibilidade e os totais acumulados,
+        do menos para o mais disponível (dispositivos sem interrupções no
+        período têm disponibilidade de 100% e não são listados)
+    """
+    query = db.session.query(
+        EventoConexao.tipo_dispositivo, EventoConexao.referencia_id, EventoConexao.codigo,
+        EventoConexao.propriedade_id, EventoConexao.data_inicio, EventoConexao.data_fim,
+        DisponibilidadeDispositivo.eventos_offline, DisponibilidadeDispositivo.tempo_offline,
+        DisponibilidadeDispositivo.maior_interrupcao
+    ).outerjoin(
+        DisponibilidadeDispositivo,
+        (DisponibilidadeDispositivo.tipo_dispositivo == EventoConexao.tipo_dispositivo) &
+        (DisponibilidadeDispositivo.referencia_id == EventoConexao.referencia_id)
+    ).filter(
+        EventoConexao.data_inicio < fim,
+        db.or_(EventoConexao.data_fim == None, EventoConexao.data_fim > inicio)
+    )
+    if tipo:
+        query = query.filter(EventoConexao.tipo_dispositivo == tipo)
+    if propriedade_id is not None:
+        query = query.filter(EventoConexao.propriedade_id == propriedade_id)
+    linhas = query.order_by(
+        EventoConexao.tipo_dispositivo, EventoConexao.referencia_id, EventoConexao.data_inicio
+    ).all()
+    if not linhas:
+        return []
+
+    # Tempo offline de cada evento recortado ao período, somado por dispositivo
+    inicio_np, fim_np = np.datetime64(inicio, 's'), np.datetime64(fim, 's')
+    comeco = np.maximum(np.array([l.data_inicio for l in linhas], dtype='datetime64[s]'), inicio_np)
+    termino = np.minimum(
+        np.array([fim if l.data_fim is None else l.data_fim for l in linhas], dtype='datetime64[s]'), fim_np
+    )
+    segundos = np.maximum((termino - comeco).astype(np.float64), 0)
+
+    chaves = [(l.tipo_dispositivo, l.referencia_id) for l in linhas]
+    novo = np.r_[True, [a != b for a, b in zip(chaves[1:], chaves[:-1])]]
+    inicios = np.flatnonzero(novo)
+    offline = np.add.reduceat(segundos, inicios)
+    fins = np.r_[inicios[1:], len(linhas)] - 1
+    interrupcoes = fins - inicios + 1
+    periodo = (fim - inicio).total_seconds()
+
+    resultado = [{
+        'tipo_dispositivo': linhas[i].tipo_dispositivo,
+        'referencia_id': linhas[i].referencia_id,
+        'codigo': linhas[i].codigo,
+        'propriedade_id': linhas[i].propriedade_id,
+        'interrupcoes': int(interrupcoes[k]),
+        'tempo_offline': round(float(offline[k]), 1),
+        'disponibilidade': round(100 * max(0.0, 1 - offline[k] / periodo), 2),
+        'offline': linhas[fins[k]].data_fim is None,
+        'total_interrupcoes': linhas[i].eventos_offline,
+        'total_tempo_offline': linhas[i].tempo_offline,
+        'maior_interrupcao': linhas[i].maior_interrupcao
+    } for k, i in enumerate(inicios)]
+    return sorted(resultado, key=lambda item: item['disponibilidade'])
+
+
+def init_app(app):
+    """Agenda a varredura de dispositivos em atraso"""
+    from agendador import agendador
+
+    agendador.agendar('monitor_conexao', 60, monitor_conexao.varrer)
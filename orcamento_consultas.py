@@ -0,0 +1,131 @@
+"""
+Orçamento de consultas SQL por rota.
+
+Cada rota sensível a N+1 declara, com o decorador `orcamento_consultas`,
+quantas consultas pode executar por requisição (incluindo o carregamento do
+usuário logado). O auxiliar `verificar_orcamento` executa a rota com o cliente
+de testes do Flask e falha se o orçamento for excedido; com
+`VERIFICAR_ORCAMENTO_CONSULTAS` ativo, o excesso também é registrado em log
+durante o uso normal da aplicação.
+
+Exemplo de uso em um teste (com um usuário logado na sessão do cliente):
+
+    with app.test_client() as cliente:
+        verificar_orcamento(cliente, '/api/mapa/animais')
+
+Os testes em `tests/test_orcamento_consultas.py` verificam todas as rotas que
+declaram um orçamento.
+"""
+
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class OrcamentoExcedido(AssertionError):
+    """Rota executou mais consultas do que o orçamento declarado"""
+
+
+class ContadorConsultas:
+    """Acumula as consultas executadas na thread atual"""
+
+    def __init__(self):
+        self.consultas = []
+
+    @property
+    def total(self):
+        return len(self.consultas)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _registrar_consulta(conn, cursor, statement, parameters, context, executemany):
+    for contador in getattr(_local, 'contadores', ()):
+        contador.consultas.append(statement)
+
+
+@contextmanager
+def contar_consultas():
+    """Conta as consultas SQL executadas pela thread atual dentro do bloco"""
+    contadores = _local.__dict__.setdefault('contadores', [])
+    contador = ContadorConsultas()
+    contadores.append(contador)
+    try:
+        yield contador
+    finally:
+        contadores.remove(contador)
+
+
+def orcamento_consultas(maximo):
+    """
+    Declara o número máximo de consultas SQL de uma rota
+
+    Deve ser aplicado logo abaixo de `@app.route` e acima de `@login_required`,
+    para que o carregamento do usuário logado entre na contagem, como em
+    `verificar_orcamento`.
+    """
+    def decorador(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get('VERIFICAR_ORCAMENTO_CONSULTAS'):
+                return view(*args, **kwargs)
+
+            with contar_consultas() as contador:
+                resposta = view(*args, **kwargs)
+            if contador.total > maximo:
+                logger.warning(
+                    f"Rota {view.__name__} executou {contador.total} consultas "
+                    f"(orçamento: {maximo})"
+                )
+            return resposta
+
+        wrapper.orcamento_consultas = maximo
+        return wrapper
+    return decorador
+
+
+def verificar_orcamento(cliente, url, metodo='GET', **kwargs):
+    """
+    Executa uma requisição pelo cliente de testes e valida o orçamento da rota
+
+    Args:
+        cliente: `app.test_client()`
+        url (str): URL da rota (com query string, se necessário)
+        metodo (str): Método HTTP
+        **kwargs: Repassados ao cliente (data, json, headers...). A resposta
+            é lida por completo, para que as consultas de respostas em fluxo
+            também sejam contadas
+
+    Returns:
+        A resposta da requisição
+
+    Raises:
+        OrcamentoExcedido: Se a rota executar mais consultas do que o declarado
+        ValueError: Se a rota não declarar um orçamento
+    """
+    app = cliente.application
+    endpoint, _ = app.url_map.bind('localhost').match(urlsplit(url).path, method=metodo)
+    maximo = getattr(app.view_functions[endpoint], 'orcamento_consultas', None)
+    if maximo is None:
+        raise ValueError(f"A rota {endpoint} não declara um orçamento de consultas")
+
+    kwargs.setdefault('buffered', True)
+    with contar_consultas() as contador:
+        resposta = cliente.open(url, method=metodo, **kwargs)
+
+    if contador.total > maximo:
+        detalhes = '\n'.join(f"  {i + 1}. {sql}" for i, sql in enumerate(contador.consultas))
+        raise OrcamentoExcedido(
+            f"{endpoint} executou {contador.total} consultas (orçamento: {maximo}):\n{detalhes}"
+        )
+    return resposta
@@ -0,0 +1,133 @@
+"""
+Agregações do dashboard.
+
+Os indicadores do dashboard (página HTML e API JSON) são calculados a partir
+de uma única consulta agrupada por tabela e guardados em um snapshot de vida
+curta, compartilhado entre as duas rotas.
+"""
+
+import logging
+from sqlalchemy import case, func
+
+from app import app, db
+from cache_memoria import CacheTemporario
+from models import Animal, Area, Raca, Atividade
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Snapshot compartilhado entre dashboard() e api_dashboard_dados()
+cache_painel = CacheTemporario(ttl=app.config.get('PAINEL_CACHE_TTL', 30))
+
+STATUS_ANIMAL = ('Ativo', 'Vendido', 'Morto')
+
+
+def _calcular_snapshot():
+    """
+    Calcula todos os indicadores do dashboard
+
+    Returns:
+        dict: Snapshot com totais, gráficos e atividades recentes
+    """
+    # Uma única varredura de animais, agrupada pelas dimensões dos gráficos
+    grupos = db.session.query(
+        Animal.status,
+        Animal.sexo,
+        Animal.raca_id,
+        Animal.area_id,
+        func.count(Animal.id).label('total'),
+        func.count(Animal.peso_atual).label('total_com_peso'),
+        func.coalesce(func.sum(Animal.peso_atual), 0).label('soma_peso'),
+        func.coalesce(func.sum(case(
+            ((Animal.id_dispositivo != None) & (Animal.bateria < 20), 1),
+            else_=0
+        )), 0).label('bateria_baixa')
+    ).group_by(Animal.status, Animal.sexo, Animal.raca_id, Animal.area_id).all()
+
+    nomes_racas = dict(db.session.query(Raca.id, Raca.nome).all())
+    nomes_areas = dict(db.session.query(Area.id, Area.nome).all())
+
+    atividades_por_status = dict(db.session.query(
+        Atividade.status, func.count(Atividade.id)
+    ).group_by(Atividade.status).all())
+
+    atividades_recentes = [{
+        'id': a.id,
+        'tipo': a.tipo,
+        'descricao': a.descricao,
+        'data_inicio': a.data_inicio.strftime('%d/%m/%Y'),
+        'status': a.status
+    } for a in db.session.query(
+        Atividade.id, Atividade.tipo, Atividade.descricao,
+        Atividade.data_inicio, Atividade.status
+    ).order_by(Atividade.data_inicio.desc()).limit(5)]
+
+    total_animais = 0
+    bateria_baixa = 0
+    por_status = {status: 0 for status in STATUS_ANIMAL}
+    por_sexo = {'M': 0, 'F': 0}
+    por_sexo_ativos = {'M': 0, 'F': 0}
+    pesos_raca = {}        # raca_id -> [soma, quantidade] (todos os animais)
+    pesos_raca_ativos = {}  # raca_id -> [soma, quantidade] (apenas ativos)
+    por_area = {area_id: 0 for area_id in nomes_areas}
+    por_area_ativos = {}
+
+    for g in grupos:
+        total_animais += g.total
+        bateria_baixa += int(g.bateria_baixa)
+        por_status[g.status] = por_status.get(g.status, 0) + g.total
+        if g.sexo in por_sexo:
+            por_sexo[g.sexo] += g.total
+
+        if g.total_com_peso:
+            acumulado = pesos_raca.setdefault(g.raca_id, [0.0, 0])
+            acumulado[0] += g.soma_peso
+            acumulado[1] += g.total_com_peso
+
+        if g.area_id is not None:
+            por_area[g.area_id] = por_area.get(g.area_id, 0) + g.total
+
+        if g.status == 'Ativo':
+            if g.sexo in por_sexo_ativos:
+                por_sexo_ativos[g.sexo] += g.total
+            if g.total_com_peso:
+                acumulado = pesos_raca_ativos.setdefault(g.raca_id, [0.0, 0])
+                acumulado[0] += g.soma_peso
+                acumulado[1] += g.total_com_peso
+            if g.area_id is not None:
+                por_area_ativos[g.area_id] = por_area_ativos.get(g.area_id, 0) + g.total
+
+    def medias(acumulados):
+        return sorted(
+            (nomes_racas.get(raca_id, ''), round(soma / quantidade, 2))
+            for raca_id, (soma, quantidade) in acumulados.items()
+        )
+
+    return {
+        'total_animais': total_animais,
+        'total_areas': len(nomes_areas),
+        'total_atividades': sum(atividades_por_status.values()),
+        'por_status': por_status,
+        'por_sexo': por_sexo,
+        'por_sexo_ativos': por_sexo_ativos,
+        'bateria_baixa': bateria_baixa,
+        'racas_pesos': medias(pesos_raca),
+        'racas_pesos_ativos': medias(pesos_raca_ativos),
+        'areas_totais': [(nomes_areas[area_id], total) for area_id, total in por_area.items()],
+        'areas_totais_ativos': [
+            (nomes_areas[area_id], total)
+            for area_id, total in por_area_ativos.items()
+            if area_id in nomes_areas and total > 0
+        ],
+        'atividades_recentes': atividades_recentes
+    }
+
+
+def obter_snapshot_painel():
+    """Retorna o snapshot do dashboard, recalculando-o se estiver expirado"""
+    return cache_painel.obter('painel', _calcular_snapshot)
+
+
+def invalidar_snapshot_painel():
+    """Descarta o snapshot atual (chamado após alterações no rebanho)"""
+    cache_painel.invalidar('painel')
@@ -0,0 +1,271 @@
+"""
+Previsão de descarga e de troca de baterias dos dispositivos.
+
+As baterias chegam em `HistoricoLocalizacao.bateria` (brincos/colares LoRa)
+e `LeituraMeteorologica.bateria` (estações); para cada dispositivo é ajustada
+uma reta (mínimos quadrados) do percentual de bateria no tempo, usando só as
+leituras desde a última troca ou recarga (um salto para cima de mais de
+`SALTO_RECARGA` pontos inicia um novo trecho). A data em que a bateria
+atinge `BATERIA_LIMITE` é extrapolada da última leitura pela taxa ajustada.
+
+Todo o histórico da janela (`BATERIA_JANELA_DIAS`) é lido em uma passagem,
+por um cursor no servidor ordenado por dispositivo e data, e ajustado em
+blocos com somas por grupo (`np.bincount`), sem laço por dispositivo. As
+balanças só informam o nível atual (sem histórico) e entram na lista pela
+bateria atual.
+
+O resultado fica em `previsoes_baterias`, de onde sai a lista de trocas
+ordenada pela data prevista, agrupável por propriedade e área.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+
+from app import app, db
+from models import (
+    Animal, BalancaDigital, DispositivoLora, EstacaoMeteorologica, HistoricoLocalizacao,
+    LeituraMeteorologica, PrevisaoBateria
+)
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Aumento de bateria entre leituras consecutivas que indica troca ou recarga
+SALTO_RECARGA = 5.0  # em pontos percentuais
+
+# Mínimo de leituras e de duração do trecho para ajustar a taxa
+PONTOS_MINIMOS = 3
+DURACAO_MINIMA = 6 / 24  # em dias
+
+# Taxas menores que esta são tratadas como bateria estável (sem previsão)
+TAXA_MINIMA = 0.01  # pontos percentuais por dia
+
+# Previsões além deste horizonte não são gravadas como data
+HORIZONTE_MAXIMO = 5 * 365  # em dias
+
+# Linhas por bloco lidas do cursor no servidor
+TAMANHO_BLOCO = 50000
+
+TIPOS_DISPOSITIVOS = ('lora', 'estacao', 'balanca')
+
+# Origem da escala de tempo em dias usada no ajuste (datas sem fuso, como no banco)
+EPOCA = datetime(1970, 1, 1)
+
+
+def ajustar_descarga(chaves, dias, bateria):
+    """
+    Taxa de descarga do último trecho (desde a última troca/recarga) de cada dispositivo
+
+    Args:
+        chaves (np.ndarray): Dispositivo de cada leitura (ordenado por dispositivo e data)
+        dias (np.ndarray): Momento de cada leitura, em dias
+        bateria (np.ndarray): Percentual de bateria
+
+    Returns:
+        dict: Arrays por dispositivo: `chave`, `pontos` (leituras do trecho),
+        `taxa` (pontos percentuais por dia, positiva descarregando; NaN sem
+        dados suficientes), `bateria` e `dias` da última leitura
+    """
+    total = len(chaves)
+    novo = np.ones(total, dtype=bool)
+    novo[1:] = chaves[1:] != chaves[:-1]
+    recarga = np.zeros(total, dtype=bool)
+    recarga[1:] = (np.diff(bateria) > SALTO_RECARGA) & ~novo[1:]
+
+    grupo = np.cumsum(novo) - 1
+    trecho = np.cumsum(novo | recarga) - 1
+    ultima = np.r_[np.flatnonzero(novo)[1:], total] - 1
+
+    # Só o último trecho de cada dispositivo, com o tempo relativo à última leitura
+    mascara = trecho == trecho[ultima][grupo]
+    g = grupo[mascara]
+    t = dias[mascara] - dias[ultima][g]
+    y = bateria[mascara]
+
+    quantidade = len(ultima)
+    n = np.bincount(g, minlength=quantidade).astype(np.float64)
+    soma_t = np.bincount(g, weights=t, minlength=quantidade)
+    soma_y = np.bincount(g, weights=y, minlength=quantidade)
+    soma_tt = np.bincount(g, weights=t * t, minlength=quantidade)
+    soma_ty = np.bincount(g, weights=t * y, minlength=quantidade)
+    duracao = np.zeros(quantidade)
+    np.minimum.at(duracao, g, t)
+
+    denominador = n * soma_tt - soma_t ** 2
+    validos = (n >= PONTOS_MINIMOS) & (-duracao >= DURACAO_MINIMA) & (denominador > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        inclinacao = (n * soma_ty - soma_t * soma_y) / denominador
+
+    return {
+        'chave': chaves[ultima],
+        'pontos': n.astype(np.int64),
+        'taxa': np.where(validos, -inclinacao, np.nan),
+        'bateria': bateria[ultima],
+        'dias': dias[ultima],
+    }
+
+
+def _ajustar_historico(consulta):
+    """
+    Ajusta todos os dispositivos de uma consulta (chave, data_hora, bateria)
+    ordenada por chave e data, lendo em blocos
+
+    As leituras do último dispositivo de cada bloco passam para o bloco
+    seguinte, de modo que cada dispositivo é ajustado com todo o seu histórico.
+    """
+    resultados = []
+    resto = None
+    for bloco in db.session.execute(consulta.execution_options(yield_per=TAMANHO_BLOCO)).partitions():
+        chaves = np.array([linha[0] for linha in bloco], dtype=object)
+        dias = np.array([linha[1] for linha in bloco], dtype='datetime64[s]').astype(np.int64) / 86400.0
+        bateria = np.fromiter((linha[2] for linha in bloco), dtype=np.float64, count=len(bloco))
+        if resto is not None:
+            chaves, dias, bateria = (np.concatenate(par) for par in zip(resto, (chaves, dias, bateria)))
+
+        inicio_ultimo = np.flatnonzero(chaves != chaves[-1])
+        inicio_ultimo = inicio_ultimo[-1] + 1 if len(inicio_ultimo) else 0
+        resto = (chaves[inicio_ultimo:], dias[inicio_ultimo:], bateria[inicio_ultimo:])
+        if inicio_ultimo:
+            resultados.append(ajustar_descarga(chaves[:inicio_ultimo], dias[:inicio_ultimo], bateria[:inicio_ultimo]))
+
+    if resto is not None:
+        resultados.append(ajustar_descarga(*resto))
+
+    ajustes = {}
+    for resultado in resultados:
+        for i, chave in enumerate(resultado['chave']):
+            ajustes[chave] = (
+                int(resultado['pontos'][i]), float(resultado['taxa'][i]),
+                float(resultado['bateria'][i]), float(resultado['dias'][i])
+            )
+    return ajustes
+
+
+def _previsao(ajuste, bateria, data_bateria, limite):
+    """Campos de bateria, taxa e data limite a partir do ajuste (ou só do nível atual)"""
+    pontos, taxa = 0, None
+    if ajuste is not None:
+        pontos, taxa, bateria, dias = ajuste
+        data_bateria = EPOCA + timedelta(days=dias)
+        taxa = None if np.isnan(taxa) else round(taxa, 3)
+
+    data_limite = None
+    if bateria is not None and data_bateria is not None:
+        if bateria <= limite:
+            data_limite = data_bateria
+        elif taxa is not None and taxa >= TAXA_MINIMA and (bateria - limite) / taxa <= HORIZONTE_MAXIMO:
+            data_limite = data_bateria + timedelta(days=(bateria - limite) / taxa)
+
+    return {
+        'bateria': bateria,
+        'data_bateria': data_bateria,
+        'taxa_descarga': taxa,
+        'pontos': pontos,
+        'limite': limite,
+        'data_limite': data_limite,
+    }
+
+
+def recalcular_previsoes_baterias(limite=None):
+    """
+    Ajusta as taxas de descarga de todos os dispositivos e grava as previsões
+
+    Args:
+        limite (float): Percentual de bateria que exige troca (padrão: `BATERIA_LIMITE`)
+
+    Returns:
+        int: Número de dispositivos com previsão gravada
+    """
+    limite = limite if limite is not None else app.config.get('BATERIA_LIMITE', 20.0)
+    inicio = datetime.now()
+    desde = inicio - timedelta(days=app.config.get('BATERIA_JANELA_DIAS', 30))
+
+    ajustes_lora = _ajustar_historico(
+        select(HistoricoLocalizacao.device_id, HistoricoLocalizacao.data_hora, HistoricoLocalizacao.bateria)
+        .where(HistoricoLocalizacao.data_hora >= desde, HistoricoLocalizacao.bateria != None)
+        .order_by(HistoricoLocalizacao.device_id, HistoricoLocalizacao.data_hora)
+    )
+    ajustes_estacoes = _ajustar_historico(
+        select(LeituraMeteorologica.estacao_id, LeituraMeteorologica.data_hora, LeituraMeteorologica.bateria)
+        .where(LeituraMeteorologica.data_hora >= desde, LeituraMeteorologica.bateria != None)
+        .order_by(LeituraMeteorologica.estacao_id, LeituraMeteorologica.data_hora)
+    )
+
+    registros = []
+    dispositivos = db.session.execute(
+        select(
+            DispositivoLora.id, DispositivoLora.device_id, DispositivoLora.tipo, DispositivoLora.bateria,
+            DispositivoLora.ultimo_contato, Animal.codigo, Animal.propriedade_id, Animal.area_id,
+            Animal.ultima_latitude, Animal.ultima_longitude
+        )
+        .outerjoin(Animal, DispositivoLora.animal_id == Animal.id)
+        .where(DispositivoLora.status != 'Inativo')
+    ).all()
+    for d in dispositivos:
+        registros.append(dict(
+            tipo='lora', referencia_id=d.id, codigo=d.device_id,
+            descricao=f"{d.tipo or 'Dispositivo'} {d.codigo}" if d.codigo else d.tipo,
+            propriedade_id=d.propriedade_id, area_id=d.area_id,
+            latitude=d.ultima_latitude, longitude=d.ultima_longitude,
+            **_previsao(ajustes_lora.get(d.device_id), d.bateria, d.ultimo_contato, limite)
+        ))
+
+    estacoes = db.session.execute(
+        select(
+            EstacaoMeteorologica.id, EstacaoMeteorologica.codigo, EstacaoMeteorologica.nome,
+            EstacaoMeteorologica.propriedade_id, EstacaoMeteorologica.latitude, EstacaoMeteorologica.longitude,
+            EstacaoMeteorologica.bateria, EstacaoMeteorologica.ultimo_contato
+        ).where(EstacaoMeteorologica.status != 'Inativo')
+    ).all()
+    for e in estacoes:
+        registros.append(dict(
+            tipo='estacao', referencia_id=e.id, codigo=e.codigo, descricao=e.nome,
+            propriedade_id=e.propriedade_id, area_id=None, latitude=e.latitude, longitude=e.longitude,
+            **_previsao(ajustes_estacoes.get(e.id), e.bateria, e.ultimo_contato, limite)
+        ))
+
+    balancas = db.session.execute(
+        select(
+            BalancaDigital.id, BalancaDigital.codigo, BalancaDigital.nome, BalancaDigital.propriedade_id,
+            BalancaDigital.bateria, BalancaDigital.ultimo_contato
+        ).where(BalancaDigital.status != 'Inativo')
+    ).all()
+    for b in balancas:
+        registros.append(dict(
+            tipo='balanca', referencia_id=b.id, codigo=b.codigo, descricao=b.nome,
+            propriedade_id=b.propriedade_id, area_id=None, latitude=None, longitude=None,
+            **_previsao(None, b.bateria, b.ultimo_contato, limite)
+        ))
+
+    for registro in registros:
+        registro['data_calculo'] = inicio
+
+    db.session.execute(delete(PrevisaoBateria))
+    if registros:
+        db.session.execute(insert(PrevisaoBateria), registros)
+    db.session.commit()
+
+    logger.info(
+        f"Previsão de baterias: {len(registros)} dispositivos "
+        f"({len(ajustes_lora) + len(ajustes_estacoes)} com histórico) em "
+        f"{(datetime.now() - inicio).total_seconds():.1f}s"
+    )
+    return len(registros)
+
+
+def verificar_recalculo():
+    """Recalcula as previsões a cada `BATERIA_INTERVALO_HORAS`"""
+    ultimo_calculo = db.session.query(func.max(PrevisaoBateria.data_calculo)).scalar()
+    intervalo = timedelta(hours=app.config.get('BATERIA_INTERVALO_HORAS', 6))
+    if ultimo_calculo is None or datetime.now() - ultimo_calculo >= intervalo:
+        recalcular_previsoes_baterias()
+
+
+def init_app(app):
+    """Agenda a verificação de recálculo das previsões de bateria"""
+    from agendador import agendador
+
+    agendador.agendar('previsao_baterias', 15 * 60, verificar_recalculo)
@@ -0,0 +1,245 @@
+"""
+Previsão de crescimento e de embarque por lote.
+
+Ajusta curvas de crescimento (ver `curvas_crescimento`) para todos os
+animais ativos com data de nascimento e pesagens: primeiro uma curva por
+lote, com os pontos de todos os animais do lote, e depois uma curva por
+animal regularizada em direção à do seu lote. Rebanhos grandes são
+ajustados em blocos em um pool de processos.
+
+Os parâmetros e a data prevista para o peso alvo são gravados em
+`previsoes_crescimento`; a previsão de embarque do lote é calculada a partir
+dessa tabela. O recálculo roda de madrugada e também ao fim de cada sessão
+de pesagem (novas pesagens sem nenhuma outra há `FIM_SESSAO_PESAGEM`).
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+
+from app import app, db
+from curvas_crescimento import ajustar, ajustar_em_paralelo, empacotar, idade_para_peso
+from models import Animal, Lote, PrevisaoCrescimento, RegistroPeso
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Intervalo sem novas pesagens que indica o fim de uma sessão de pesagem
+FIM_SESSAO_PESAGEM = timedelta(minutes=30)
+
+# Lote usado como referência para animais sem lote
+SEM_LOTE = -1
+
+
+def _carregar_pesagens():
+    """Pesagens dos animais ativos com data de nascimento: arrays planos ordenados por animal"""
+    linhas = db.session.execute(
+        select(
+            RegistroPeso.animal_id, Animal.lote_id, Animal.data_nascimento,
+            RegistroPeso.data_pesagem, RegistroPeso.peso
+        )
+        .join(Animal, RegistroPeso.animal_id == Animal.id)
+        .where(
+            Animal.status == 'Ativo',
+            Animal.data_nascimento != None,
+            RegistroPeso.data_pesagem != None
+        )
+        .order_by(RegistroPeso.animal_id, RegistroPeso.data_pesagem)
+    ).all()
+
+    total = len(linhas)
+    animal_id = np.fromiter((l[0] for l in linhas), dtype=np.int64, count=total)
+    lote_id = np.fromiter((SEM_LOTE if l[1] is None else l[1] for l in linhas), dtype=np.int64, count=total)
+    nascimento = np.array([l[2] for l in linhas], dtype='datetime64[D]')
+    pesagem = np.array([l[3] for l in linhas], dtype='datetime64[s]')
+    idade = (pesagem - nascimento.astype('datetime64[s]')) / np.timedelta64(1, 'D')
+    peso = np.fromiter((l[4] for l in linhas), dtype=np.float64, count=total)
+
+    # Pesagens anteriores ao nascimento (cadastro inconsistente) não entram no ajuste
+    validas = idade >= 0
+    return animal_id[validas], lote_id[validas], nascimento[validas], idade[validas], peso[validas]
+
+
+def recalcular_previsoes(modelo=None, peso_alvo=None):
+    """
+    Ajusta as curvas de todos os animais e grava as previsões
+
+    Args:
+        modelo (str): 'gompertz' ou 'bertalanffy' (padrão: `CRESCIMENTO_MODELO`)
+        peso_alvo (float): Peso alvo em kg (padrão: `PESO_ABATE_ALVO`)
+
+    Returns:
+        int: Número de animais com previsão gravada
+    """
+    modelo = modelo or app.config.get('CRESCIMENTO_MODELO', 'gompertz')
+    peso_alvo = peso_alvo or app.config.get('PESO_ABATE_ALVO', 540.0)
+    inicio = datetime.now()
+
+    animal_id, lote_id, nascimento, idade, peso = _carregar_pesagens()
+    if not len(animal_id):
+        db.session.execute(delete(PrevisaoCrescimento))
+        db.session.commit()
+        return 0
+
+    # Curva de cada lote com todos os pontos do lote (referência dos animais)
+    ordem = np.argsort(lote_id, kind='stable')
+    lotes, TL, YL, ML = empacotar(lote_id[ordem], idade[ordem], peso[ordem])
+    theta_lotes, _ = ajustar(modelo, TL, YL, ML)
+
+    # Curva de cada animal, regularizada pela curva do lote
+    ids, T, Y, M = empacotar(animal_id, idade, peso)
+    primeiro = np.searchsorted(animal_id, ids)
+    lote_animal = lote_id[primeiro]
+    prior = theta_lotes[np.searchsorted(lotes, lote_animal)]
+
+    if len(ids) > app.config.get('CRESCIMENTO_LIMITE_PROCESSOS', 5000):
+        theta, rmse = ajustar_em_paralelo(
+            modelo, T, Y, M, prior=prior, processos=app.config.get('CRESCIMENTO_PROCESSOS')
+        )
+    else:
+        theta, rmse = ajustar(modelo, T, Y, M, theta0=prior.copy(), prior=prior)
+
+    # Data em que cada animal atinge o peso alvo (nunca antes de hoje)
+    dias = idade_para_peso(modelo, theta, peso_alvo)
+    hoje = np.datetime64(inicio.date(), 'D')
+    previstas = nascimento[primeiro] + np.where(np.isnan(dias), 0, np.ceil(dias)).astype('timedelta64[D]')
+    previstas = np.maximum(previstas, hoje)
+
+    parametros = np.exp(theta)
+    registros = [{
+        'animal_id': int(ids[i]),
+        'lote_id': None if lote_animal[i] == SEM_LOTE else int(lote_animal[i]),
+        'modelo': modelo,
+        'peso_assintotico': float(parametros[i, 0]),
+        'parametro_b': float(parametros[i, 1]),
+        'taxa_k': float(parametros[i, 2]),
+        'rmse': float(rmse[i]),
+        'pesagens': int(M[i].sum()),
+        'peso_alvo': float(peso_alvo),
+        'data_peso_alvo': None if np.isnan(dias[i]) else previstas[i].item(),
+        'data_calculo': inicio
+    } for i in range(len(ids))]
+
+    db.session.execute(delete(PrevisaoCrescimento))
+    if registros:
+        db.session.execute(insert(PrevisaoCrescimento), registros)
+    db.session.commit()
+
+    logger.info(
+        f"Curvas de crescimento ({modelo}) ajustadas para {len(ids)} animais em "
+        f"{(datetime.now() - inicio).total_seconds():.1f}s"
+    )
+    return len(registros)
+
+
+def carregar_previsoes(lote_id=None):
+    """
+    Previsões gravadas com os dados do animal, em uma consulta
+
+    Args:
+        lote_id (int): Restringe a um lote (opcional)
+
+    Returns:
+        list: Linhas com os campos de `PrevisaoCrescimento`, codigo,
+        data_nascimento e peso_atual do animal e o nome do lote (`lote`)
+    """
+    consulta = (
+        select(
+            PrevisaoCrescimento.animal_id, PrevisaoCrescimento.lote_id, PrevisaoCrescimento.modelo,
+            PrevisaoCrescimento.peso_assintotico, PrevisaoCrescimento.parametro_b, PrevisaoCrescimento.taxa_k,
+            PrevisaoCrescimento.rmse, PrevisaoCrescimento.pesagens, PrevisaoCrescimento.peso_alvo,
+            PrevisaoCrescimento.data_peso_alvo, PrevisaoCrescimento.data_calculo,
+            Animal.codigo, Animal.data_nascimento, Animal.peso_atual, Lote.nome.label('lote')
+        )
+        .join(Animal, PrevisaoCrescimento.animal_id == Animal.id)
+        .outerjoin(Lote, PrevisaoCrescimento.lote_id == Lote.id)
+        .order_by(PrevisaoCrescimento.data_peso_alvo, PrevisaoCrescimento.animal_id)
+    )
+    if lote_id is not None:
+        consulta = consulta.where(PrevisaoCrescimento.lote_id == lote_id)
+    return db.session.execute(consulta).all()
+
+
+def datas_para_peso(previsoes, peso_alvo):
+    """
+    Recalcula pelas curvas gravadas as datas para outro peso alvo
+
+    Args:
+        previsoes (list): Linhas com `modelo`, parâmetros, `data_nascimento`
+        peso_alvo (float): Peso alvo em kg
+
+    Returns:
+        list: Data prevista (date ou None) de cada linha
+    """
+    if not previsoes:
+        return []
+    modelo = previsoes[0].modelo
+    theta = np.log([[p.peso_assintotico, p.parametro_b, p.taxa_k] for p in previsoes])
+    dias = idade_para_peso(modelo, theta, peso_alvo)
+    hoje = datetime.now().date()
+    return [
+        None if np.isnan(d) else max(p.data_nascimento + timedelta(days=int(np.ceil(d))), hoje)
+        for p, d in zip(previsoes, dias)
+    ]
+
+
+def previsao_embarque(datas, percentis=(50, 80, 100)):
+    """
+    Previsão de embarque de um lote a partir das datas por animal
+
+    Args:
+        datas (list): Data prevista de cada animal (None se não atingível)
+        percentis (tuple): Percentuais do lote para os quais informar a data
+
+    Returns:
+        dict: Animais por semana (acumulado), datas por percentual do lote
+        e número de animais sem previsão
+    """
+    validas = np.array(sorted(d for d in datas if d is not None), dtype='datetime64[D]')
+    total = len(datas)
+    resultado = {'animais': total, 'sem_previsao': total - len(validas), 'semanas': [], 'percentis': {}}
+    if not len(validas):
+        return resultado
+
+    # Semanas iniciando na segunda-feira
+    semanas = validas - ((validas.astype('datetime64[D]').view('int64') - 4) % 7).astype('timedelta64[D]')
+    inicio_semana, quantidade = np.unique(semanas, return_counts=True)
+    acumulado = np.cumsum(quantidade)
+    resultado['semanas'] = [{
+        'semana': str(s),
+        'animais': int(q),
+        'acumulado': int(a)
+    } for s, q, a in zip(inicio_semana, quantidade, acumulado)]
+
+    for percentual in percentis:
+        necessario = int(np.ceil(total * percentual / 100))
+        if necessario <= len(validas):
+            resultado['percentis'][str(percentual)] = str(validas[max(necessario - 1, 0)])
+    return resultado
+
+
+def verificar_recalculo():
+    """Recalcula de madrugada e ao fim de cada sessão de pesagem"""
+    agora = datetime.now()
+    ultimo_calculo = db.session.query(func.max(PrevisaoCrescimento.data_calculo)).scalar()
+    ultima_pesagem = db.session.query(func.max(RegistroPeso.data_pesagem)).scalar()
+
+    hora_noturna = agora.replace(hour=app.config.get('CRESCIMENTO_HORA_NOTURNA', 2), minute=0, second=0, microsecond=0)
+    noturno = agora >= hora_noturna and (ultimo_calculo is None or ultimo_calculo < hora_noturna)
+    fim_sessao = (
+        ultima_pesagem is not None
+        and (ultimo_calculo is None or ultima_pesagem > ultimo_calculo)
+        and agora - ultima_pesagem >= FIM_SESSAO_PESAGEM
+    )
+
+    if noturno or fim_sessao:
+        recalcular_previsoes()
+
+
+def init_app(app):
+    """Agenda a verificação de recálculo das curvas de crescimento"""
+    from agendador import agendador
+
+    agendador.agendar('previsao_crescimento', 10 * 60, verificar_recalculo)
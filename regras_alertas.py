@@ -0,0 +1,523 @@
+"""
+Motor de regras de alertas meteorológicos.
+
+As regras (`RegraAlerta`) são compiladas uma vez por worker e avaliadas a
+cada leitura registrada por `registrar_leitura_estacao`, qualquer que seja a
+origem (API, LoRa ou leitura manual). Três tipos de condição:
+
+- limite: o campo da leitura comparado ao limite;
+- duração: a condição vale em `leituras_consecutivas` leituras seguidas;
+- variação: a diferença entre o valor atual e o máximo (para `<`/`<=`) ou
+  o mínimo (para `>`/`>=`) dos últimos `janela_variacao` minutos comparada
+  ao limite (ex.: queda de 8 °C em 1 h: operador '<=', limite -8).
+
+Regras de campos cujo sensor está desativado na estação (`sensor_temperatura`,
+`sensor_chuva`...) não são avaliadas nela, como nos alertas fixos anteriores.
+
+Cada estação mantém em memória um pequeno estado por regra (contador de
+leituras e janela de valores), então a avaliação custa O(1) por leitura e
+regra, sem consultas. O estado é reconstruído a partir das últimas leituras
+da estação quando o worker ainda não a conhece ou quando outra leitura foi
+registrada por outro worker desde a última vista aqui (detectado pela data
+da última leitura no resumo da estação), a partir do buffer de leituras
+recentes do worker (`buffer_leituras`).
+
+Ocorrências de um mesmo tipo em uma estação são agrupadas no alerta aberto
+(valor de pico, última ocorrência e número de ocorrências) em vez de gerar
+novos registros. Os alertas abertos de cada estação ficam em um índice em
+memória, carregado com uma consulta quando a estação dispara pela primeira
+vez no worker; um alerta sem ocorrências por `ALERTAS_PERIODO_SILENCIO`
+minutos é finalizado.
+"""
+
+import logging
+import math
+import operator
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from app import app, db
+from buffer_leituras import buffers_estacoes
+from models import AlertaMeteorologico, LeituraMeteorologica, RegraAlerta, ResumoEstacao
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+OPERADORES = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+
+# Campos de leitura que podem ser usados em regras
+CAMPOS_REGRAS = (
+    'temperatura', 'umidade', 'pressao', 'velocidade_vento', 'precipitacao',
+    'radiacao_solar', 'umidade_solo', 'temperatura_solo', 'bateria', 'sinal_lora',
+)
+
+# Sensor da estação que mede cada campo: regras de campos cujo sensor está
+# desativado na estação não são avaliadas (bateria e sinal valem sempre)
+SENSORES_CAMPOS = {
+    'temperatura': 'sensor_temperatura',
+    'umidade': 'sensor_umidade',
+    'pressao': 'sensor_pressao',
+    'velocidade_vento': 'sensor_vento',
+    'precipitacao': 'sensor_chuva',
+    'radiacao_solar': 'sensor_radiacao',
+    'umidade_solo': 'sensor_solo',
+    'temperatura_solo': 'sensor_solo',
+}
+
+# Tempo máximo de uso das regras compiladas antes de recarregá-las do banco
+# (alterações feitas em outro worker)
+VALIDADE_REGRAS = 60  # em segundos
+
+# Máximo de leituras lidas para reconstruir o estado de uma estação
+LIMITE_AQUECIMENTO = 1000
+
+# Enquanto a condição persiste, a última ocorrência de um alerta aberto é
+# gravada no máximo neste intervalo (o pico é gravado sempre que muda)
+INTERVALO_GRAVACAO_OCORRENCIA = timedelta(minutes=5)
+
+# Regras criadas na instalação (equivalentes aos alertas fixos anteriores)
+REGRAS_PADRAO = (
+    {'tipo': 'Temperatura Alta', 'descricao': 'Temperatura acima do limite estabelecido',
+     'nivel': 'Atenção', 'unidade': '°C', 'campo': 'temperatura', 'operador': '>', 'limite': 30.0},
+    {'tipo': 'Chuva Forte', 'descricao': 'Precipitação acima do limite estabelecido',
+     'nivel': 'Alerta', 'unidade': 'mm', 'campo': 'precipitacao', 'operador': '>', 'limite': 10.0},
+)
+
+
+class RegraCompilada:
+    """Regra pronta para avaliação (sem acesso ao ORM)"""
+
+    __slots__ = (
+        'id', 'tipo', 'descricao', 'nivel', 'unidade', 'campo', 'comparar', 'limite',
+        'consecutivas', 'janela', 'queda', 'estacao_id', 'propriedade_id',
+    )
+
+    def __init__(self, regra):
+        if regra.campo not in CAMPOS_REGRAS:
+            raise ValueError(f'Campo inválido: {regra.campo}')
+        if regra.operador not in OPERADORES:
+            raise ValueError(f'Operador inválido: {regra.operador}')
+
+        self.id = regra.id
+        self.tipo = regra.tipo
+        self.descricao = regra.descricao
+        self.nivel = regra.nivel
+        self.unidade = regra.unidade
+        self.campo = regra.campo
+        self.comparar = OPERADORES[regra.operador]
+        self.limite = regra.limite
+        self.consecutivas = max(regra.leituras_consecutivas or 1, 1)
+        self.janela = timedelta(minutes=regra.janela_variacao) if regra.janela_variacao else None
+        self.queda = regra.operador in ('<', '<=')  # variação medida a partir do máximo da janela
+        self.estacao_id = regra.estacao_id
+        self.propriedade_id = regra.propriedade_id
+
+    @property
+    def especificidade(self):
+        return 2 if self.estacao_id is not None else 1 if self.propriedade_id is not None else 0
+
+    def aplica_a(self, estacao):
+        if self.estacao_id is not None:
+            return self.estacao_id == estacao.id
+        return self.propriedade_id is None or self.propriedade_id == estacao.propriedade_id
+
+    def medida_por(self, estacao):
+        """Se a estação tem o sensor do campo da regra ativo"""
+        sensor = SENSORES_CAMPOS.get(self.campo)
+        return sensor is None or bool(getattr(estacao, sensor))
+
+
+class EstadoRegra:
+    """Estado incremental de uma regra em uma estação"""
+
+    __slots__ = ('regra', 'seguidas', 'janela', 'disparada')
+
+    def __init__(self, regra):
+        self.regra = regra
+        self.seguidas = 0
+        self.janela = deque() if regra.janela else None
+        self.disparada = False
+
+    def avaliar(self, data_hora, valor):
+        """
+        Atualiza o estado com um valor e indica se a condição da regra vale
+
+        Returns:
+            tuple: (valor medido (valor ou variação), se é uma nova ocorrência)
+            enquanto a condição vale; senão None
+        """
+        regra = self.regra
+        medido = valor
+        if self.janela is not None:
+            # Fila monotônica: o primeiro item é o máximo (quedas) ou o mínimo
+            # (altas) da janela, com custo amortizado O(1)
+            janela = self.janela
+            if regra.queda:
+                while janela and janela[-1][1] <= valor:
+                    janela.pop()
+            else:
+                while janela and janela[-1][1] >= valor:
+                    janela.pop()
+            janela.append((data_hora, valor))
+            while janela[0][0] < data_hora - regra.janela:
+                janela.popleft()
+            medido = valor - janela[0][1]
+
+        if regra.comparar(medido, regra.limite):
+            self.seguidas += 1
+        else:
+            self.seguidas = 0
+            self.disparada = False
+
+        if self.seguidas < regra.consecutivas:
+            return None
+        nova = not self.disparada
+        self.disparada = True
+        return medido, nova
+
+
+class AlertaAberto:
+    """Entrada do índice em memória de alertas abertos de uma estação"""
+
+    __slots__ = ('id', 'pico', 'ultima_ocorrencia', 'ocorrencias', 'gravado_em')
+
+    def __init__(self, id, pico, ultima_ocorrencia, ocorrencias):
+        self.id = id
+        self.pico = pico
+        self.ultima_ocorrencia = ultima_ocorrencia
+        self.ocorrencias = ocorrencias or 1
+        self.gravado_em = ultima_ocorrencia
+
+
+def _sensores(estacao):
+    """Sensores ativos da estação (o estado é refeito quando mudam)"""
+    return frozenset(sensor for sensor in set(SENSORES_CAMPOS.values()) if getattr(estacao, sensor))
+
+
+class EstadoEstacao:
+    __slots__ = ('regras', 'sensores', 'ultima_data_hora', 'abertos', 'lock')
+
+    def __init__(self, regras, sensores):
+        self.regras = [EstadoRegra(regra) for regra in regras]
+        self.sensores = sensores
+        self.ultima_data_hora = None
+        self.abertos = None  # tipo -> AlertaAberto, carregado sob demanda
+        self.lock = threading.Lock()
+
+
+class MotorAlertas:
+    """Regras compiladas e estado por estação do worker"""
+
+    def __init__(self):
+        self._regras = None
+        self._assinatura = None
+        self._carregadas_em = 0.0
+        self._estados = {}
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        """Descarta regras compiladas e estados (após alterar regras)"""
+        with self._lock:
+            self._regras = None
+            self._assinatura = None
+            self._estados = {}
+
+    def _regras_ativas(self):
+        if self._regras is None or time.monotonic() - self._carregadas_em > VALIDADE_REGRAS:
+            regras = []
+            cadastradas = RegraAlerta.query.filter_by(ativa=True).order_by(RegraAlerta.id).all()
+            for regra in cadastradas:
+                try:
+                    regras.append(RegraCompilada(regra))
+                except ValueError as e:
+                    logger.warning(f"Regra de alerta {regra.id} ignorada: {str(e)}")
+            assinatura = tuple((regra.id, regra.data_alteracao) for regra in cadastradas)
+
+            with self._lock:
+                # Regras alteradas: o estado das estações é reconstruído
+                if assinatura != self._assinatura:
+                    self._estados = {}
+                    self._assinatura = assinatura
+                self._regras = regras
+                self._carregadas_em = time.monotonic()
+        return self._regras
+
+    def _regras_da_estacao(self, estacao):
+        """
+        Regras aplicáveis: por tipo, a mais específica (estação > propriedade >
+        todas), desde que a estação tenha o sensor do campo da regra
+        """
+        por_tipo = {}
+        for regra in self._regras_ativas():
+            if regra.aplica_a(estacao):
+                atual = por_tipo.get(regra.tipo)
+                if atual is None or regra.especificidade > atual.especificidade:
+                    por_tipo[regra.tipo] = regra
+        return [regra for regra in por_tipo.values() if regra.medida_por(estacao)]
+
+    def _aquecer(self, estacao, estado, ate):
+        """Reconstrói o estado a partir das últimas leituras da estação (sem gerar alertas)"""
+        necessarias = max(e.regra.consecutivas for e in estado.regras)
+        janelas = [e.regra.janela for e in estado.regras if e.regra.janela]
+        if janelas:
+            intervalo = timedelta(minutes=estacao.intervalo_leitura or 15)
+            necessarias = max(necessarias, math.ceil(max(janelas) / intervalo) + 1)
+
+        necessarias = min(necessarias, LIMITE_AQUECIMENTO)
+
+        # Leituras recentes do buffer do worker; o banco só quando ele não tem leituras suficientes
+        leituras = buffers_estacoes.ultimas(estacao.id, necessarias, referencia=ate, ate=ate)
+        if leituras is None:
+            leituras = db.session.execute(
+                select(LeituraMeteorologica.data_hora, *(getattr(LeituraMeteorologica, campo) for campo in CAMPOS_REGRAS))
+                .where(LeituraMeteorologica.estacao_id == estacao.id, LeituraMeteorologica.data_hora <= ate)
+                .order_by(LeituraMeteorologica.data_hora.desc())
+                .limit(necessarias)
+            ).all()[::-1]
+
+        for leitura in leituras:
+            self._aplicar(estado, leitura)
+        estado.ultima_data_hora = ate
+
+    def _aplicar(self, estado, leitura):
+        disparos = []
+        for estado_regra in estado.regras:
+            valor = getattr(leitura, estado_regra.regra.campo)
+            if valor is None:
+                continue
+            resultado = estado_regra.avaliar(leitura.data_hora, valor)
+            if resultado is not None:
+                disparos.append((estado_regra.regra, *resultado))
+        estado.ultima_data_hora = leitura.data_hora
+        return disparos
+
+    def avaliar(self, estacao, leitura, ultima_data_hora=None):
+        """
+        Avalia as regras da estação para uma leitura recém-registrada (sem commit)
+
+        Args:
+            estacao (EstacaoMeteorologica): Estação da leitura
+            leitura (LeituraMeteorologica): Leitura a avaliar
+            ultima_data_hora (datetime): Data da leitura anterior da estação
+                (do resumo); se diferente da última vista neste worker, o
+                estado é reconstruído antes da avaliação
+
+        Returns:
+            list: Alertas criados (adicionados à sessão); ocorrências agrupadas
+            em alertas abertos são gravadas diretamente
+        """
+        self._regras_ativas()
+        estado = self._estados.get(estacao.id)
+        sensores = _sensores(estacao)
+        if estado is None or estado.sensores != sensores:
+            estado = EstadoEstacao(self._regras_da_estacao(estacao), sensores)
+            self._estados[estacao.id] = estado
+        if not estado.regras:
+            return []
+
+        with estado.lock:
+            # Leituras atrasadas não alteram o estado
+            if estado.ultima_data_hora is not None and leitura.data_hora < estado.ultima_data_hora:
+                return []
+            if ultima_data_hora is not None and estado.ultima_data_hora != ultima_data_hora:
+                estado.regras = [EstadoRegra(e.regra) for e in estado.regras]
+                estado.abertos = None
+                self._aquecer(estacao, estado, ultima_data_hora)
+
+            disparos = self._aplicar(estado, leitura)
+            if not disparos:
+                return []
+            if estado.abertos is None:
+                estado.abertos = self._carregar_abertos(estacao.id)
+
+            alertas = []
+            for regra, medido, nova in disparos:
+                if not self._agrupar(estado, regra, medido, nova, leitura.data_hora) and nova:
+                    alertas.append(self._abrir(estado, estacao, regra, medido, leitura.data_hora))
+            return alertas
+
+    def _carregar_abertos(self, estacao_id):
+        """Índice tipo -> alerta aberto da estação (o mais recente de cada tipo)"""
+        abertos = {}
+        linhas = db.session.execute(
+            select(
+                AlertaMeteorologico.id, AlertaMeteorologico.tipo, AlertaMeteorologico.valor_pico,
+                AlertaMeteorologico.valor_medido, AlertaMeteorologico.ultima_ocorrencia,
+                AlertaMeteorologico.data_hora, AlertaMeteorologico.ocorrencias
+            )
+            .where(AlertaMeteorologico.estacao_id == estacao_id, AlertaMeteorologico.status != 'Finalizado')
+            .order_by(AlertaMeteorologico.data_hora)
+        ).all()
+        for id, tipo, pico, medido, ultima, data_hora, ocorrencias in linhas:
+            abertos[tipo] = AlertaAberto(
+                id, medido if pico is None else pico, ultima or data_hora, ocorrencias
+            )
+        return abertos
+
+    def _agrupar(self, estado, regra, medido, nova, data_hora):
+        """
+        Agrupa a ocorrência no alerta aberto do mesmo tipo
+
+        Returns:
+            bool: Se havia um alerta aberto (e ele foi atualizado)
+        """
+        aberto = estado.abertos.get(regra.tipo)
+        if aberto is None:
+            return False
+
+        silencio = timedelta(minutes=app.config.get('ALERTAS_PERIODO_SILENCIO', 60))
+        if data_hora - aberto.ultima_ocorrencia > silencio:
+            # Silêncio longo: encerra o alerta anterior e abre outro
+            db.session.execute(
+                update(AlertaMeteorologico)
+                .where(AlertaMeteorologico.id == aberto.id, AlertaMeteorologico.status != 'Finalizado')
+                .values(status='Finalizado', data_finalizacao=aberto.ultima_ocorrencia + silencio)
+            )
+            del estado.abertos[regra.tipo]
+            return False
+
+        pico = medido if regra.comparar(medido, aberto.pico) else aberto.pico
+        ocorrencias = aberto.ocorrencias + (1 if nova else 0)
+        aberto.ultima_ocorrencia = data_hora
+        if pico == aberto.pico and ocorrencias == aberto.ocorrencias \
+                and data_hora - aberto.gravado_em < INTERVALO_GRAVACAO_OCORRENCIA:
+            return True
+
+        atualizados = db.session.execute(
+            update(AlertaMeteorologico)
+            .where(AlertaMeteorologico.id == aberto.id, AlertaMeteorologico.status != 'Finalizado')
+            .values(valor_pico=pico, ultima_ocorrencia=data_hora, ocorrencias=ocorrencias)
+        ).rowcount
+        if not atualizados:
+            # Finalizado em outro lugar (usuário ou limpeza periódica)
+            del estado.abertos[regra.tipo]
+            return False
+
+        aberto.pico = pico
+        aberto.ocorrencias = ocorrencias
+        aberto.gravado_em = data_hora
+        return True
+
+    def _abrir(self, estado, estacao, regra, medido, data_hora):
+        alerta = AlertaMeteorologico(
+            estacao_id=estacao.id,
+            tipo=regra.tipo,
+            descricao=regra.descricao or f'{regra.campo} fora do limite estabelecido',
+            data_hora=data_hora,
+            nivel=regra.nivel,
+            valor_medido=medido,
+            valor_limite=regra.limite,
+            unidade=regra.unidade,
+            valor_pico=medido,
+            ultima_ocorrencia=data_hora,
+            ocorrencias=1
+        )
+        db.session.add(alerta)
+        db.session.flush()
+        estado.abertos[regra.tipo] = AlertaAberto(alerta.id, medido, data_hora, 1)
+        return alerta
+
+
+# Motor único por processo
+motor_alertas = MotorAlertas()
+
+
+def criar_regras_padrao():
+    """Cria as regras padrão se não houver nenhuma regra cadastrada"""
+    if RegraAlerta.query.first() is not None:
+        return 0
+    for dados in REGRAS_PADRAO:
+        db.session.add(RegraAlerta(**dados))
+    db.session.commit()
+    motor_alertas.invalidar()
+    return len(REGRAS_PADRAO)
+
+
+def validar_regra(dados, parcial=False):
+    """
+    Valida e normaliza os dados de uma regra recebidos pela API
+
+    Args:
+        dados (dict): Campos de `RegraAlerta`
+        parcial (bool): Se campos obrigatórios podem faltar (alteração)
+
+    Returns:
+        dict: Campos válidos para atribuir à regra
+
+    Raises:
+        ValueError: Se algum campo for inválido
+    """
+    obrigatorios = ('tipo', 'campo', 'limite')
+    if not parcial:
+        faltando = [campo for campo in obrigatorios if dados.get(campo) in (None, '')]
+        if faltando:
+            raise ValueError(f'Campos obrigatórios: {", ".join(faltando)}')
+
+    valores = {}
+    for campo in ('tipo', 'descricao', 'nivel', 'unidade'):
+        if campo in dados:
+            valores[campo] = dados[campo]
+    if 'campo' in dados:
+        if dados['campo'] not in CAMPOS_REGRAS:
+            raise ValueError(f'campo deve ser um de: {", ".join(CAMPOS_REGRAS)}')
+        valores['campo'] = dados['campo']
+    if 'operador' in dados:
+        if dados['operador'] not in OPERADORES:
+            raise ValueError(f'operador deve ser um de: {", ".join(OPERADORES)}')
+        valores['operador'] = dados['operador']
+    if 'limite' in dados:
+        valores['limite'] = float(dados['limite'])
+    if 'leituras_consecutivas' in dados:
+        valores['leituras_consecutivas'] = max(int(dados['leituras_consecutivas'] or 1), 1)
+    for campo in ('janela_variacao', 'estacao_id', 'propriedade_id'):
+        if campo in dados:
+            valores[campo] = int(dados[campo]) if dados[campo] not in (None, '') else None
+    if 'ativa' in dados:
+        valores['ativa'] = bool(dados['ativa'])
+    return valores
+
+
+def finalizar_alertas_silenciosos():
+    """Finaliza alertas sem ocorrências há `ALERTAS_PERIODO_SILENCIO` e atualiza os resumos"""
+    silencio = timedelta(minutes=app.config.get('ALERTAS_PERIODO_SILENCIO', 60))
+    limite = datetime.now() - silencio
+    ultima = func.coalesce(AlertaMeteorologico.ultima_ocorrencia, AlertaMeteorologico.data_hora)
+    silenciosos = db.session.execute(
+        select(AlertaMeteorologico.id, AlertaMeteorologico.estacao_id)
+        .where(AlertaMeteorologico.status != 'Finalizado', ultima < limite)
+    ).all()
+    if not silenciosos:
+        return 0
+
+    db.session.execute(
+        update(AlertaMeteorologico)
+        .where(AlertaMeteorologico.id.in_([id for id, _ in silenciosos]))
+        .values(status='Finalizado', data_finalizacao=datetime.now())
+    )
+
+    # Contagem de alertas ativos dos resumos das estações afetadas
+    estacoes = {estacao_id for _, estacao_id in silenciosos}
+    ativos = select(func.count(AlertaMeteorologico.id)).where(
+        AlertaMeteorologico.estacao_id == ResumoEstacao.estacao_id,
+        AlertaMeteorologico.status != 'Finalizado'
+    ).scalar_subquery()
+    db.session.execute(
+        update(ResumoEstacao)
+        .where(ResumoEstacao.estacao_id.in_(estacoes))
+        .values(alertas_ativos=ativos)
+    )
+    db.session.commit()
+
+    logger.info(f"Alertas finalizados por silêncio: {len(silenciosos)} em {len(estacoes)} estações")
+    return len(silenciosos)
+
+
+def init_app(app):
+    """Agenda a finalização dos alertas sem novas ocorrências"""
+    from agendador import agendador
+
+    agendador.agendar('alertas_silenciosos', 5 * 60, finalizar_alertas_silenciosos)
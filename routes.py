@@ -1,27 +1,51 @@
 import os
 import json
+import math
+import hashlib
 import logging
 import random
 import io
-import re
-import zipfile
+import tempfile
 from lxml import etree
-from pykml import parser as kml_parser
 from datetime import datetime, timedelta
-from flask import render_template, request, jsonify, redirect, url_for, flash, send_file
+from flask import render_template, request, jsonify, redirect, url_for, flash, send_file, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash
-import pandas as pd
-from io import BytesIO
 
 from app import app, db
 from models import (
     Usuario, Propriedade, Area, Raca, Animal, Lote, 
     RegistroPeso, RegistroSanitario, Atividade, 
     DispositivoLora, HistoricoLocalizacao,
-    EstacaoMeteorologica, LeituraMeteorologica, AlertaMeteorologico
+    EstacaoMeteorologica, LeituraMeteorologica, AlertaMeteorologico, RegraAlerta,
+    TarefaRelatorio, EstresseTermicoDiario, PrevisaoBateria
 )
-from lora_communication import LoRaManager, simulate_lora_data
+from lora_communication import LoRaManager
+from ingestao import confirmar_posicoes, registrar_posicoes
+from importacao_kml import importar_areas, ler_poligonos
+from contatos_animais import NIVEIS_MAXIMOS, recalcular_contatos, rastrear_contatos
+from trilhas_animais import PRECISAO_POLILINHA, TOLERANCIA_PADRAO, obter_trilhas
+from exportacao_geo import FORMATOS_GEO, exportar_areas, exportar_trilhas, nome_arquivo_geo
+from consultas import FILTROS_ANIMAIS, com_perfil, listar_animais_paginado
+from orcamento_consultas import orcamento_consultas
+from indice_posicoes import ZOOM_MAXIMO, indice_posicoes
+from mapa_calor import CELULAS_POR_TILE, PERIODO_MAXIMO, obter_tile, renderizar_tile
+from stream_posicoes import hub_posicoes
+from leituras_estacoes import recalcular_resumos, registrar_leitura_estacao
+from regras_alertas import criar_regras_padrao, motor_alertas, validar_regra
+from exportacao_relatorios import (
+    FORMATOS, contar_linhas, enviar_arquivo, escrever_xlsx, gerar_csv, nome_arquivo, normalizar_filtros
+)
+from ganho_peso import AGRUPAMENTOS, DIAS_PROJECAO_PADRAO, obter_analise_ganho_peso
+from tarefas_relatorios import fila_relatorios
+from agenda_sanitaria import AGRUPAMENTOS_AGENDA, DIAS_AGENDA_PADRAO, agrupar_agenda, consultar_agenda
+from estresse_termico import LIMIAR_CARGA_TERMICA, exposicao_termica
+from monitor_conexao import TIPOS_MONITORADOS, disponibilidade_periodo, eventos_abertos
+from previsao_baterias import TIPOS_DISPOSITIVOS, recalcular_previsoes_baterias
+from previsao_crescimento import carregar_previsoes, datas_para_peso, previsao_embarque, recalcular_previsoes
+from buffer_leituras import CAMPOS_BUFFER, LEITURAS_RECENTES_PADRAO, buffers_estacoes
+from series_meteorologicas import MAX_PONTOS_PADRAO, obter_series_estacao
+from painel import STATUS_ANIMAL, obter_snapshot_painel, invalidar_snapshot_painel
 
 # Configuração de logging
 
@@ -34,88 +58,6 @@ logger = logging.getLogger(__name__)
 # Instância do gerenciador LoRa
 lora_manager = LoRaManager()
 
-# Funções auxiliares para processamento de KML/KMZ
-def processar_kml(arquivo_kml):
-    """
-    Processa um arquivo KML e extrai coordenadas de polígonos
-    
-    Args:
-        arquivo_kml: Objeto de arquivo KML
-        
-    Returns:
-        list: Lista de coordenadas no formato [[lng, lat], ...]
-    """
-    try:
-        # Analisar o arquivo KML
-        root = kml_parser.parse(arquivo_kml).getroot()
-        
-        # Encontrar o primeiro polígono no arquivo KML
-        # Procurar dentro do namespace correto
-        namespace = '{http://www.opengis.net/kml/2.2}'
-        polygon = root.findall('.//' + namespace + 'Polygon')
-        
-        if not polygon:
-            return None
-        
-        # Obter as coordenadas do polígono (primeiro encontrado)
-        coords_elem = polygon[0].findall('.//' + namespace + 'coordinates')
-        
-        if not coords_elem or not coords_elem[0].text:
-            return None
-        
-        # Processar string de coordenadas
-        coordenadas_str = coords_elem[0].text.strip()
-        
-        # Converter para lista de [lng, lat]
-        resultado = []
-        
-        # KML usa formato lon,lat,alt com espaços ou quebras de linha entre pontos
-        for ponto in re.split(r'\s+', coordenadas_str):
-            if ponto.strip():
-                partes = ponto.split(',')
-                if len(partes) >= 2:
-                    lon, lat = float(partes[0]), float(partes[1])
-                    resultado.append([lon, lat])
-        
-        return resultado
-    
-    except Exception as e:
-        logger.error(f"Erro ao processar arquivo KML: {str(e)}")
-        raise
-        
-def processar_kmz(arquivo_kmz):
-    """
-    Processa um arquivo KMZ (arquivo ZIP contendo KML)
-    
-    Args:
-        arquivo_kmz: Objeto de arquivo KMZ
-        
-    Returns:
-        list: Lista de coordenadas no formato [[lng, lat], ...]
-    """
-    try:
-        # Criar um arquivo ZIP em memória
-        kmz_zip = zipfile.ZipFile(arquivo_kmz)
-        
-        # Encontrar o arquivo KML dentro do KMZ
-        kml_file = None
-        for item in kmz_zip.namelist():
-            if item.lower().endswith('.kml'):
-                kml_file = item
-                break
-        
-        if not kml_file:
-            return None
-        
-        # Extrair o arquivo KML
-        with kmz_zip.open(kml_file) as kml_content:
-            # Processar o arquivo KML extraído
-            return processar_kml(kml_content)
-    
-    except Exception as e:
-        logger.error(f"Erro ao processar arquivo KMZ: {str(e)}")
-        raise
-
 # Rota inicial
 @app.route('/')
 def index():
@@ -153,73 +95,56 @@ def logout():
 
 # Dashboard principal
 @app.route('/dashboard')
+@orcamento_consultas(7)
 @login_required
 def dashboard():
-    # Estatísticas básicas
-    total_animais = Animal.query.count()
-    total_areas = Area.query.count()
-    total_atividades = Atividade.query.count()
-    
-    # Animais por status
-    animais_ativos = Animal.query.filter_by(status='Ativo').count()
-    animais_vendidos = Animal.query.filter_by(status='Vendido').count()
-    animais_mortos = Animal.query.filter_by(status='Morto').count()
-    
-    # Animais por sexo
-    animais_machos = Animal.query.filter_by(sexo='M', status='Ativo').count()
-    animais_femeas = Animal.query.filter_by(sexo='F', status='Ativo').count()
-    
-    # Animais com bateria baixa (dispositivos LoRa)
-    animais_bateria_baixa = Animal.query.filter(
-        Animal.id_dispositivo != None,
-        Animal.bateria < 20
-    ).count()
+    # Indicadores agregados (snapshot compartilhado com a API do dashboard)
+    snapshot = obter_snapshot_painel()
     
     # Atividades pendentes
-    atividades_pendentes = Atividade.query.filter(
+    atividades_pendentes = com_perfil(Atividade.query, 'atividade_area').filter(
         Atividade.status.in_(['Planejada', 'Em Andamento'])
     ).order_by(Atividade.data_inicio).limit(5).all()
     
-    # Simular novos dados dos dispositivos LoRa (em produção seria um processo separado)
-    simulate_lora_data()
-    
-    # Peso médio por raça (para o novo gráfico simplificado)
-    pesos_racas = db.session.query(
-        Raca.nome.label('raca'),
-        db.func.avg(Animal.peso_atual).label('peso_medio')
-    ).join(Animal).filter(Animal.peso_atual != None).group_by(Raca.nome).all()
-    
-    racas_pesos = [(r.raca, round(r.peso_medio, 2)) for r in pesos_racas]
-    
-    # Animais por área (para o novo gráfico simplificado)
-    animais_areas = db.session.query(
-        Area.nome.label('area'),
-        db.func.count(Animal.id).label('total')
-    ).outerjoin(Animal, Area.id == Animal.area_id).group_by(Area.nome).all()
-    
-    areas_totais = [(a.area, a.total) for a in animais_areas]
-    
     return render_template(
         'dashboard.html',
-        total_animais=total_animais,
-        total_areas=total_areas,
-        total_atividades=total_atividades,
-        animais_ativos=animais_ativos,
-        animais_vendidos=animais_vendidos,
-        animais_mortos=animais_mortos,
-        animais_machos=animais_machos,
-        animais_femeas=animais_femeas,
-        animais_bateria_baixa=animais_bateria_baixa,
+        total_animais=snapshot['total_animais'],
+        total_areas=snapshot['total_areas'],
+        total_atividades=snapshot['total_atividades'],
+        animais_ativos=snapshot['por_status']['Ativo'],
+        animais_vendidos=snapshot['por_status']['Vendido'],
+        animais_mortos=snapshot['por_status']['Morto'],
+        animais_machos=snapshot['por_sexo_ativos']['M'],
+        animais_femeas=snapshot['por_sexo_ativos']['F'],
+        animais_bateria_baixa=snapshot['bateria_baixa'],
         atividades_pendentes=atividades_pendentes,
-        racas_pesos=racas_pesos,
-        areas_totais=areas_totais
+        racas_pesos=snapshot['racas_pesos'],
+        areas_totais=snapshot['areas_totais']
     )
 
 # Rotas para gerenciamento de animais
+def _filtros_animais_da_requisicao():
+    """Extrai da query string os filtros aceitos pela listagem de animais"""
+    return {nome: request.args.get(nome) for nome in FILTROS_ANIMAIS}
+
 @app.route('/animais')
+@orcamento_consultas(5)
 @login_required
 def listar_animais():
-    animais = Animal.query.all()
+    filtros = _filtros_animais_da_requisicao()
+    ordem = request.args.get('ordem', 'codigo')
+    
+    try:
+        animais, proximo_cursor = listar_animais_paginado(
+            filtros=filtros,
+            ordem=ordem,
+            cursor=request.args.get('cursor'),
+            limite=request.args.get('limite', type=int)
+        )
+    except ValueError as e:
+        flash(str(e), 'warning')
+        animais, proximo_cursor = listar_animais_paginado()
+    
     racas = Raca.query.all()
     areas = Area.query.all()
     lotes = Lote.query.all()
@@ -227,11 +152,55 @@ def listar_animais():
     return render_template(
         'listar_animais.html',
         animais=animais,
+        proximo_cursor=proximo_cursor,
+        filtros=filtros,
+        ordem=ordem,
         racas=racas,
         areas=areas,
         lotes=lotes
     )
 
+@app.route('/api/animais')
+@orcamento_consultas(2)
+@login_required
+def api_listar_animais():
+    """
+    Lista animais paginados por chave, com filtros e ordenação no servidor.
+    
+    Parâmetros de URL:
+    - status, sexo, raca_id, area_id, lote_id: filtros (opcionais)
+    - ordem: codigo, nome, peso_atual ou data_nascimento ('-' para decrescente)
+    - cursor: valor de 'proximo_cursor' da página anterior
+    - limite: tamanho da página (padrão 50, máximo 200)
+    """
+    try:
+        animais, proximo_cursor = listar_animais_paginado(
+            filtros=_filtros_animais_da_requisicao(),
+            ordem=request.args.get('ordem', 'codigo'),
+            cursor=request.args.get('cursor'),
+            limite=request.args.get('limite', type=int)
+        )
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    
+    return jsonify({
+        'animais': [{
+            'id': animal.id,
+            'codigo': animal.codigo,
+            'nome': animal.nome,
+            'sexo': animal.sexo,
+            'data_nascimento': animal.data_nascimento.isoformat() if animal.data_nascimento else None,
+            'peso_atual': animal.peso_atual,
+            'status': animal.status,
+            'raca': animal.raca.nome,
+            'area': animal.area.nome if animal.area else None,
+            'lote': animal.lote.nome if animal.lote else None,
+            'bateria': animal.bateria,
+            'ultima_atualizacao': animal.ultima_atualizacao.isoformat() if animal.ultima_atualizacao else None
+        } for animal in animais],
+        'proximo_cursor': proximo_cursor
+    })
+
 @app.route('/animais/novo', methods=['GET', 'POST'])
 @login_required
 def cadastro_animal():
@@ -303,6 +272,7 @@ def cadastro_animal():
                 dispositivo.animal_id = animal.id
             
             db.session.commit()
+            invalidar_snapshot_painel()
             flash('Animal cadastrado com sucesso.', 'success')
             return redirect(url_for('listar_animais'))
             
@@ -337,15 +307,478 @@ def detalhes_animal(id):
     # Adicionar data atual para comparações no template
     now = datetime.now()
     
+    # GMD e peso projetado a partir da análise (em cache) da propriedade
+    data_projecao = now.date() + timedelta(days=DIAS_PROJECAO_PADRAO)
+    ganho_peso = obter_analise_ganho_peso(animal.propriedade_id).animal(animal.id, data_projecao)
+    
     return render_template(
         'detalhes_animal.html',
         animal=animal,
         registros_peso=registros_peso,
         registros_sanitarios=registros_sanitarios,
         historico_localizacao=historico_localizacao,
+        ganho_peso=ganho_peso,
+        data_projecao=data_projecao,
         now=now
     )
 
+def _data_projecao_da_requisicao():
+    """Data alvo da projeção de peso (?data_alvo=AAAA-MM-DD; padrão em 90 dias)"""
+    if request.args.get('data_alvo'):
+        return datetime.strptime(request.args['data_alvo'], '%Y-%m-%d').date()
+    return datetime.now().date() + timedelta(days=DIAS_PROJECAO_PADRAO)
+
+@app.route('/api/analise/ganho-peso')
+@orcamento_consultas(4)
+@login_required
+def api_analise_ganho_peso():
+    """
+    Ganho médio diário (GMD) por animal e médias por lote, raça e área.
+    
+    Parâmetros de URL:
+    - propriedade_id: propriedade analisada (padrão: a primeira cadastrada)
+    - data_alvo: data da projeção de peso, AAAA-MM-DD (padrão: em 90 dias)
+    - lote_id, raca_id, area_id: restringem a lista de animais (opcionais)
+    """
+    try:
+        data_alvo = _data_projecao_da_requisicao()
+    except ValueError:
+        return jsonify({'erro': 'Informe data_alvo no formato AAAA-MM-DD'}), 400
+    
+    propriedade_id = request.args.get('propriedade_id', type=int)
+    if propriedade_id is None:
+        propriedade = Propriedade.query.first()
+        if not propriedade:
+            return jsonify({'erro': 'Nenhuma propriedade cadastrada'}), 404
+        propriedade_id = propriedade.id
+    
+    analise = obter_analise_ganho_peso(propriedade_id)
+    
+    # Filtros por lote, raça ou área aplicados sobre os atributos já carregados
+    filtros = {
+        nome: request.args.get(f'{nome}_id', type=int)
+        for nome in AGRUPAMENTOS if request.args.get(f'{nome}_id', type=int) is not None
+    }
+    
+    return jsonify({
+        'propriedade_id': propriedade_id,
+        'data_alvo': data_alvo.isoformat(),
+        'animais': analise.animais(data_alvo, filtros),
+        'lotes': analise.agregar('lote', data_alvo),
+        'racas': analise.agregar('raca', data_alvo),
+        'areas': analise.agregar('area', data_alvo)
+    })
+
+@app.route('/api/animais/<int:id>/ganho-peso')
+@orcamento_consultas(3)
+@login_required
+def api_ganho_peso_animal(id):
+    """GMD e peso projetado de um animal (parâmetro opcional data_alvo=AAAA-MM-DD)"""
+    try:
+        data_alvo = _data_projecao_da_requisicao()
+    except ValueError:
+        return jsonify({'erro': 'Informe data_alvo no formato AAAA-MM-DD'}), 400
+    
+    animal = db.session.get(Animal, id)
+    if not animal:
+        return jsonify({'erro': 'Animal não encontrado'}), 404
+    
+    metricas = obter_analise_ganho_peso(animal.propriedade_id).animal(id, data_alvo)
+    return jsonify({
+        'animal_id': id,
+        'codigo': animal.codigo,
+        'data_alvo': data_alvo.isoformat(),
+        'ganho_peso': metricas
+    })
+
+# Período máximo de uma trilha pedida à API
+PERIODO_MAXIMO_TRILHA = timedelta(days=31)
+
+# Máximo de animais x dias (período arredondado para cima) de /api/trilhas
+LIMITE_ANIMAIS_DIAS_TRILHAS = 2000
+
+def _data_hora_local(valor):
+    """Data ISO 8601; com fuso, convertida para a hora local sem fuso (como no banco)"""
+    data_hora = datetime.fromisoformat(valor)
+    if data_hora.tzinfo is not None:
+        data_hora = data_hora.astimezone().replace(tzinfo=None)
+    return data_hora
+
+def _parametros_trilha():
+    """Período (?start=&end=, ISO; padrão: últimas 24 horas) e tolerância em metros (?tolerance=)"""
+    fim = _data_hora_local(request.args['end']) if request.args.get('end') else datetime.now()
+    inicio = _data_hora_local(request.args['start']) if request.args.get('start') else fim - timedelta(hours=24)
+    if inicio > fim or fim - inicio > PERIODO_MAXIMO_TRILHA:
+        raise ValueError('período inválido')
+    tolerancia = max(0.0, request.args.get('tolerance', TOLERANCIA_PADRAO, type=float))
+    return inicio, fim, tolerancia
+
+def _resposta_trilhas(inicio, fim, tolerancia, **dados):
+    return jsonify({
+        'start': inicio.isoformat(),
+        'end': fim.isoformat(),
+        'tolerance': tolerancia,
+        'precisao': PRECISAO_POLILINHA,
+        **dados
+    })
+
+@app.route('/api/animais/<int:id>/trilha')
+@orcamento_consultas(3)
+@login_required
+def api_trilha_animal(id):
+    """
+    Trilha de um animal como polilinha codificada, para reprodução no mapa.
+    
+    Parâmetros de URL:
+    - start, end: período em ISO 8601 (padrão: últimas 24 horas; máximo 31 dias)
+    - tolerance: tolerância da simplificação em metros (padrão: 5; 0 desativa)
+    
+    `polilinha` segue o algoritmo de polilinhas do Google; `tempos` usa a
+    mesma codificação para os horários em segundos desde 1970 (o primeiro
+    valor absoluto, os demais como diferença ao ponto anterior).
+    """
+    try:
+        inicio, fim, tolerancia = _parametros_trilha()
+    except ValueError:
+        return jsonify({'erro': 'Informe start/end em ISO 8601 (start <= end, até 31 dias) e tolerance em metros'}), 400
+    
+    animal = db.session.get(Animal, id)
+    if not animal:
+        return jsonify({'erro': 'Animal não encontrado'}), 404
+    
+    return _resposta_trilhas(
+        inicio, fim, tolerancia,
+        animal_id=id,
+        codigo=animal.codigo,
+        trilha=obter_trilhas([id], inicio, fim, tolerancia).get(id)
+    )
+
+@app.route('/api/trilhas')
+@orcamento_consultas(3)
+@login_required
+def api_trilhas_animais():
+    """
+    Trilhas de vários animais para reprodução conjunta (ex.: um lote).
+    
+    Parâmetros de URL:
+    - lote_id: animais do lote, e/ou
+    - animais: ids separados por vírgula
+    - start, end, tolerance: como em /api/animais/<id>/trilha
+    
+    Animais x dias do período limitados a `LIMITE_ANIMAIS_DIAS_TRILHAS`.
+    """
+    try:
+        inicio, fim, tolerancia = _parametros_trilha()
+        ids = {int(valor) for valor in request.args.get('animais', '').split(',') if valor.strip()}
+    except ValueError:
+        return jsonify({'erro': 'Informe start/end em ISO 8601 (start <= end, até 31 dias), tolerance em metros e animais como ids separados por vírgula'}), 400
+    
+    lote_id = request.args.get('lote_id', type=int)
+    if lote_id is None and not ids:
+        return jsonify({'erro': 'Informe lote_id ou animais'}), 400
+    
+    dias = max(math.ceil((fim - inicio) / timedelta(days=1)), 1)
+    erro_limite = {'erro': f'Animais x dias do período excedem {LIMITE_ANIMAIS_DIAS_TRILHAS}; reduza o período ou os animais'}
+    if len(ids) * dias > LIMITE_ANIMAIS_DIAS_TRILHAS:
+        return jsonify(erro_limite), 400
+    
+    query = db.session.query(Animal.id, Animal.codigo, Animal.nome)
+    if lote_id is not None and ids:
+        query = query.filter(db.or_(Animal.lote_id == lote_id, Animal.id.in_(ids)))
+    elif lote_id is not None:
+        query = query.filter(Animal.lote_id == lote_id)
+    else:
+        query = query.filter(Animal.id.in_(ids))
+    animais = query.order_by(Animal.codigo).all()
+    if len(animais) * dias > LIMITE_ANIMAIS_DIAS_TRILHAS:
+        return jsonify(erro_limite), 400
+    
+    trilhas = obter_trilhas([animal.id for animal in animais], inicio, fim, tolerancia)
+    return _resposta_trilhas(
+        inicio, fim, tolerancia,
+        animais=[{
+            'animal_id': animal.id,
+            'codigo': animal.codigo,
+            'nome': animal.nome,
+            **trilhas[animal.id]
+        } for animal in animais if animal.id in trilhas]
+    )
+
+def _resposta_contatos(animal, inicio, fim, **dados):
+    """Contatos de um animal no período (?niveis=1..3, ?duracao_minima= em minutos)"""
+    niveis = min(max(request.args.get('niveis', 1, type=int), 1), NIVEIS_MAXIMOS)
+    duracao_minima = max(request.args.get('duracao_minima', 0, type=int), 0)
+    contatos = rastrear_contatos(animal.id, inicio, fim, niveis, duracao_minima)
+    return jsonify({
+        'animal_id': animal.id,
+        'codigo': animal.codigo,
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'raio': app.config['CONTATO_RAIO_METROS'],
+        'niveis': niveis,
+        'duracao_minima': duracao_minima,
+        **dados,
+        'total': len(contatos),
+        'contatos': contatos
+    })
+
+@app.route('/api/animais/<int:id>/contatos')
+@orcamento_consultas(2 + NIVEIS_MAXIMOS)
+@login_required
+def api_contatos_animal(id):
+    """
+    Animais que estiveram a até `CONTATO_RAIO_METROS` de um animal.
+    
+    Parâmetros de URL:
+    - inicio, fim: período AAAA-MM-DD (padrão: últimos `dias` até hoje)
+    - dias: tamanho do período padrão (padrão: 7)
+    - niveis: 1 para contatos diretos, até 3 para contatos dos contatos
+    - duracao_minima: duração mínima somada no período, em minutos
+    """
+    try:
+        fim = datetime.strptime(request.args['fim'], '%Y-%m-%d').date() if request.args.get('fim') else datetime.now().date()
+        inicio = datetime.strptime(request.args['inicio'], '%Y-%m-%d').date() if request.args.get('inicio') \
+            else fim - timedelta(days=max(request.args.get('dias', 7, type=int), 1) - 1)
+        if inicio > fim:
+            raise ValueError('inicio posterior ao fim')
+    except ValueError:
+        return jsonify({'erro': 'Informe inicio/fim no formato AAAA-MM-DD (inicio <= fim)'}), 400
+    
+    animal = db.session.get(Animal, id)
+    if not animal:
+        return jsonify({'erro': 'Animal não encontrado'}), 404
+    return _resposta_contatos(animal, inicio, fim)
+
+@app.route('/api/sanitario/<int:id>/contatos')
+@orcamento_consultas(3 + NIVEIS_MAXIMOS)
+@login_required
+def api_contatos_registro_sanitario(id):
+    """
+    Rastreamento de contatos a partir de um registro sanitário (diagnóstico):
+    contatos do animal nos `dias` (padrão: 14) até a data do registro.
+    Aceita os mesmos niveis e duracao_minima de /api/animais/<id>/contatos.
+    """
+    registro = db.session.get(RegistroSanitario, id)
+    if not registro:
+        return jsonify({'erro': 'Registro sanitário não encontrado'}), 404
+    
+    animal = db.session.get(Animal, registro.animal_id)
+    fim = (registro.data_aplicacao or datetime.now()).date()
+    inicio = fim - timedelta(days=max(request.args.get('dias', 14, type=int), 1) - 1)
+    return _resposta_contatos(
+        animal, inicio, fim,
+        registro_sanitario={'id': registro.id, 'tipo': registro.tipo, 'produto': registro.produto}
+    )
+
+@app.route('/api/contatos/recalcular', methods=['POST'])
+@login_required
+def api_recalcular_contatos():
+    """Recalcula o grafo de contatos dos últimos `dias` (padrão: 2)"""
+    try:
+        hoje = datetime.now().date()
+        dias = max(request.args.get('dias', 2, type=int), 1)
+        registros = recalcular_contatos(hoje - timedelta(days=dias - 1), hoje)
+        return jsonify({'sucesso': True, 'registros': registros})
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao recalcular contatos entre animais: {str(e)}")
+        return jsonify({'sucesso': False, 'erro': str(e)}), 500
+
+def _previsoes_com_datas(lote_id=None):
+    """Previsões gravadas e datas para o peso alvo da requisição (?peso_alvo=kg)"""
+    previsoes = carregar_previsoes(lote_id)
+    peso_alvo = request.args.get('peso_alvo', type=float)
+    if peso_alvo is None or not previsoes or peso_alvo == previsoes[0].peso_alvo:
+        peso_alvo = previsoes[0].peso_alvo if previsoes else app.config['PESO_ABATE_ALVO']
+        return previsoes, [p.data_peso_alvo for p in previsoes], peso_alvo
+    return previsoes, datas_para_peso(previsoes, peso_alvo), peso_alvo
+
+@app.route('/api/lotes/previsao')
+@orcamento_consultas(2)
+@login_required
+def api_previsao_lotes():
+    """Previsão de embarque de todos os lotes (parâmetro opcional peso_alvo em kg)"""
+    previsoes, datas, peso_alvo = _previsoes_com_datas()
+    
+    datas_por_lote = {}
+    nomes = {}
+    for previsao, data in zip(previsoes, datas):
+        datas_por_lote.setdefault(previsao.lote_id, []).append(data)
+        nomes[previsao.lote_id] = previsao.lote
+    
+    return jsonify({
+        'peso_alvo': peso_alvo,
+        'data_calculo': previsoes[0].data_calculo.isoformat() if previsoes else None,
+        'lotes': [
+            dict(lote_id=lote_id, nome=nomes.get(lote_id), **previsao_embarque(datas_lote))
+            for lote_id, datas_lote in datas_por_lote.items()
+        ]
+    })
+
+@app.route('/api/lotes/<int:id>/previsao')
+@orcamento_consultas(3)
+@login_required
+def api_previsao_lote(id):
+    """Curvas de crescimento, data prevista por animal e previsão de embarque de um lote"""
+    lote = db.session.get(Lote, id)
+    if not lote:
+        return jsonify({'erro': 'Lote não encontrado'}), 404
+    
+    previsoes, datas, peso_alvo = _previsoes_com_datas(id)
+    
+    return jsonify({
+        'lote_id': id,
+        'nome': lote.nome,
+        'peso_alvo': peso_alvo,
+        'data_calculo': previsoes[0].data_calculo.isoformat() if previsoes else None,
+        'embarque': previsao_embarque(datas),
+        'animais': [{
+            'animal_id': p.animal_id,
+            'codigo': p.codigo,
+            'peso_atual': p.peso_atual,
+            'pesagens': p.pesagens,
+            'modelo': p.modelo,
+            'peso_assintotico': round(p.peso_assintotico, 1),
+            'taxa_k': p.taxa_k,
+            'rmse': round(p.rmse, 2),
+            'data_peso_alvo': data.isoformat() if data else None
+        } for p, data in zip(previsoes, datas)]
+    })
+
+@app.route('/api/crescimento/recalcular', methods=['POST'])
+@login_required
+def api_recalcular_crescimento():
+    """Recalcula as curvas de crescimento (ex.: ao fim de uma sessão de pesagem)"""
+    try:
+        animais = recalcular_previsoes()
+        return jsonify({'sucesso': True, 'animais': animais})
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao recalcular curvas de crescimento: {str(e)}")
+        return jsonify({'sucesso': False, 'erro': str(e)}), 500
+
+@app.route('/api/baterias/substituicao')
+@orcamento_consultas(2)
+@login_required
+def api_substituicao_baterias():
+    """
+    Lista de troca de baterias ordenada pela data prevista de bateria baixa.
+    
+    Parâmetros de URL:
+    - dias: horizonte em dias (padrão 30); dispositivos já abaixo do limite sempre entram
+    - tipo: lora, estacao ou balanca (opcional)
+    - propriedade_id: restringe a uma propriedade (opcional)
+    - agrupar: 'area' para agrupar por propriedade e área (roteiro de troca)
+    """
+    dias = request.args.get('dias', 30, type=int)
+    tipo = request.args.get('tipo')
+    agrupar = request.args.get('agrupar')
+    if dias is None or dias < 0 or (tipo and tipo not in TIPOS_DISPOSITIVOS) or agrupar not in (None, 'area'):
+        return jsonify({'erro': f"Informe dias >= 0, tipo em {', '.join(TIPOS_DISPOSITIVOS)} e agrupar=area"}), 400
+    
+    query = db.session.query(PrevisaoBateria, Area.nome, Propriedade.nome)\
+        .outerjoin(Area, PrevisaoBateria.area_id == Area.id)\
+        .outerjoin(Propriedade, PrevisaoBateria.propriedade_id == Propriedade.id)\
+        .filter(PrevisaoBateria.data_limite <= datetime.now() + timedelta(days=dias))
+    if tipo:
+        query = query.filter(PrevisaoBateria.tipo == tipo)
+    if request.args.get('propriedade_id', type=int) is not None:
+        query = query.filter(PrevisaoBateria.propriedade_id == request.args.get('propriedade_id', type=int))
+    linhas = query.order_by(PrevisaoBateria.data_limite, PrevisaoBateria.bateria).all()
+    
+    dispositivos = []
+    for previsao, area, propriedade in linhas:
+        item = previsao.to_dict()
+        item['area'] = area
+        item['propriedade'] = propriedade
+        dispositivos.append(item)
+    
+    resposta = {
+        'horizonte_dias': dias,
+        'data_calculo': linhas[0][0].data_calculo.isoformat() if linhas else None,
+        'total': len(dispositivos)
+    }
+    if agrupar:
+        # Grupos na ordem da primeira troca de cada um
+        grupos = {}
+        for item in dispositivos:
+            grupo = grupos.setdefault((item['propriedade_id'], item['area_id']), {
+                'propriedade_id': item['propriedade_id'],
+                'propriedade': item['propriedade'],
+                'area_id': item['area_id'],
+                'area': item['area'],
+                'primeira_troca': item['data_limite'],
+                'dispositivos': []
+            })
+            grupo['dispositivos'].append(item)
+        resposta['grupos'] = list(grupos.values())
+    else:
+        resposta['dispositivos'] = dispositivos
+    return jsonify(resposta)
+
+@app.route('/api/baterias/recalcular', methods=['POST'])
+@login_required
+def api_recalcular_baterias():
+    """Recalcula as taxas de descarga e as previsões de troca de baterias"""
+    try:
+        dispositivos = recalcular_previsoes_baterias()
+        return jsonify({'sucesso': True, 'dispositivos': dispositivos})
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao recalcular previsões de baterias: {str(e)}")
+        return jsonify({'sucesso': False, 'erro': str(e)}), 500
+
+@app.route('/api/dispositivos/offline')
+@orcamento_consultas(2)
+@login_required
+def api_dispositivos_offline():
+    """
+    Dispositivos sem comunicação no momento (eventos de conexão abertos).
+    
+    Parâmetros de URL:
+    - tipo: estacao ou lora (opcional)
+    - propriedade_id: restringe a uma propriedade (opcional)
+    """
+    tipo = request.args.get('tipo')
+    if tipo and tipo not in TIPOS_MONITORADOS:
+        return jsonify({'erro': f"tipo deve ser um de: {', '.join(TIPOS_MONITORADOS)}"}), 400
+    
+    agora = datetime.now()
+    eventos = eventos_abertos(tipo, request.args.get('propriedade_id', type=int))
+    return jsonify({
+        'total': len(eventos),
+        'dispositivos': [
+            dict(evento.to_dict(), offline_ha=round((agora - evento.data_inicio).total_seconds()))
+            for evento in eventos
+        ]
+    })
+
+@app.route('/api/dispositivos/disponibilidade')
+@orcamento_consultas(2)
+@login_required
+def api_disponibilidade_dispositivos():
+    """
+    Disponibilidade dos dispositivos com interrupções no período.
+    
+    Parâmetros de URL:
+    - dias: período em dias até agora (padrão 30)
+    - tipo: estacao ou lora (opcional)
+    - propriedade_id: restringe a uma propriedade (opcional)
+    """
+    dias = request.args.get('dias', 30, type=int)
+    tipo = request.args.get('tipo')
+    if dias is None or dias < 1 or (tipo and tipo not in TIPOS_MONITORADOS):
+        return jsonify({'erro': f"Informe dias >= 1 e tipo em {', '.join(TIPOS_MONITORADOS)}"}), 400
+    
+    fim = datetime.now()
+    inicio = fim - timedelta(days=dias)
+    dispositivos = disponibilidade_periodo(inicio, fim, tipo, request.args.get('propriedade_id', type=int))
+    return jsonify({
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'dispositivos': dispositivos
+    })
+
 @app.route('/animais/<int:id>/editar', methods=['GET', 'POST'])
 @login_required
 def editar_animal(id):
@@ -393,7 +826,11 @@ def editar_animal(id):
                 animal.ultima_atualizacao = None
                 animal.bateria = None
             
+            # Sinaliza a alteração para os clientes do mapa (consulta incremental)
+            animal.data_alteracao_mapa = datetime.now()
+            
             db.session.commit()
+            invalidar_snapshot_painel()
             flash('Animal atualizado com sucesso!', 'success')
             return redirect(url_for('detalhes_animal', id=animal.id))
             
@@ -441,6 +878,7 @@ def registrar_peso(id):
         
         db.session.add(registro)
         db.session.commit()
+        invalidar_snapshot_painel()
         
         flash('Peso registrado com sucesso.', 'success')
     except Exception as e:
@@ -490,6 +928,94 @@ def registrar_sanitario(id):
     
     return redirect(url_for('detalhes_animal', id=id))
 
+def _parametros_agenda_sanitaria():
+    """Período, filtros e agrupamento da agenda sanitária a partir da URL"""
+    inicio = request.args.get('inicio')
+    fim = request.args.get('fim')
+    parametros = {
+        'inicio': datetime.strptime(inicio, '%Y-%m-%d').date() if inicio else None,
+        'fim': (
+            datetime.strptime(fim, '%Y-%m-%d').date() if fim
+            else datetime.now().date() + timedelta(days=DIAS_AGENDA_PADRAO)
+        ),
+        'tipo': request.args.get('tipo') or None,
+        'produto': request.args.get('produto') or None,
+        'lote_id': request.args.get('lote_id', type=int),
+        'area_id': request.args.get('area_id', type=int),
+        'propriedade_id': request.args.get('propriedade_id', type=int),
+    }
+    agrupamento = request.args.get('agrupar', 'lote')
+    if agrupamento not in AGRUPAMENTOS_AGENDA:
+        raise ValueError(f'agrupar deve ser um de: {", ".join(AGRUPAMENTOS_AGENDA)}')
+    return parametros, agrupamento
+
+@app.route('/api/sanitario/agenda')
+@orcamento_consultas(2)
+@login_required
+def api_agenda_sanitaria():
+    """
+    Agenda de doses vencidas e a vencer, agrupada por lote ou área.
+    
+    Considera apenas o registro mais recente de cada animal e produto.
+    
+    Parâmetros de URL:
+    - inicio, fim: período AAAA-MM-DD (padrão: vencidas e próximos 30 dias)
+    - tipo, produto: restringem o tipo de registro ou o produto
+    - lote_id, area_id, propriedade_id: restringem os animais
+    - agrupar: 'lote' (padrão) ou 'area'
+    """
+    try:
+        parametros, agrupamento = _parametros_agenda_sanitaria()
+    except ValueError as e:
+        return jsonify({'erro': f'Parâmetros inválidos: {str(e)}'}), 400
+    
+    linhas = consultar_agenda(**parametros)
+    hoje = datetime.now().date()
+    
+    return jsonify({
+        'inicio': parametros['inicio'].isoformat() if parametros['inicio'] else None,
+        'fim': parametros['fim'].isoformat(),
+        'total': len(linhas),
+        'vencidas': sum(1 for linha in linhas if linha.data_proxima < hoje),
+        'grupos': agrupar_agenda(linhas, agrupamento, hoje)
+    })
+
+@app.route('/api/sanitario/campanha')
+@orcamento_consultas(2)
+@login_required
+def api_campanha_sanitaria():
+    """
+    Planejamento de campanha: animais a tratar até `fim` e dose total por lote ou área.
+    
+    As doses são totalizadas por produto e unidade (ml, mg...), sem somar
+    unidades diferentes.
+    
+    Exige produto ou tipo; aceita os mesmos parâmetros da agenda.
+    """
+    try:
+        parametros, agrupamento = _parametros_agenda_sanitaria()
+    except ValueError as e:
+        return jsonify({'erro': f'Parâmetros inválidos: {str(e)}'}), 400
+    if not parametros['produto'] and not parametros['tipo']:
+        return jsonify({'erro': 'Informe o produto ou o tipo da campanha'}), 400
+    
+    grupos = agrupar_agenda(consultar_agenda(**parametros), agrupamento)
+    
+    # Totais da campanha por produto e unidade em todos os grupos
+    produtos = {}
+    for grupo in grupos:
+        for item in grupo['produtos']:
+            total = produtos.setdefault((item['produto'], item['unidade_dose']), dict(item, animais=0, dose_total=0.0))
+            total['animais'] += item['animais']
+            total['dose_total'] += item['dose_total']
+    
+    return jsonify({
+        'fim': parametros['fim'].isoformat(),
+        'animais': sum(grupo['vencidas'] + grupo['a_vencer'] for grupo in grupos),
+        'produtos': list(produtos.values()),
+        'grupos': grupos
+    })
+
 @app.route('/animais/<int:id>/solicitar-localizacao', methods=['POST'])
 @login_required
 def solicitar_localizacao(id):
@@ -507,23 +1033,13 @@ def solicitar_localizacao(id):
     localizacao = lora_manager.request_location(animal.id_dispositivo)
     
     if localizacao:
-        # Atualizar animal com novos dados
-        animal.ultima_latitude = localizacao['latitude']
-        animal.ultima_longitude = localizacao['longitude']
-        animal.bateria = localizacao['battery']
-        animal.ultima_atualizacao = datetime.now()
-        
-        # Registrar no histórico
-        historico = HistoricoLocalizacao(
-            animal_id=id,
-            device_id=animal.id_dispositivo,
-            latitude=localizacao['latitude'],
-            longitude=localizacao['longitude'],
-            bateria=localizacao['battery']
-        )
-        
-        db.session.add(historico)
-        db.session.commit()
+        # Atualizar animal com novos dados e registrar no histórico
+        registrar_posicoes([{
+            'device_id': animal.id_dispositivo,
+            'latitude': localizacao['latitude'],
+            'longitude': localizacao['longitude'],
+            'bateria': localizacao['battery']
+        }])
         
         flash('Localização atualizada com sucesso.', 'success')
     else:
@@ -533,10 +1049,11 @@ def solicitar_localizacao(id):
 
 # Rotas para mapa da propriedade
 @app.route('/mapa')
+@orcamento_consultas(4)
 @login_required
 def mapa_propriedade():
     areas = Area.query.all()
-    animais = Animal.query.filter(
+    animais = com_perfil(Animal.query, 'animal_mapa').filter(
         Animal.ultima_latitude != None,
         Animal.ultima_longitude != None,
         Animal.status == 'Ativo'
@@ -592,6 +1109,50 @@ def api_mapa_areas():
     return jsonify(collection)
 
 
+@app.route('/api/mapa/calor/<int:zoom>/<int:x>/<int:y>.<formato>')
+@orcamento_consultas(2)
+@login_required
+def api_mapa_calor(zoom, x, y, formato):
+    """
+    Tile do mapa de calor de ocupação (densidade de posições do período).
+    
+    Formatos: png (camada de tiles do mapa, ex.: L.tileLayer) ou json
+    (contagens por célula, `CELULAS_POR_TILE` por lado).
+    
+    Parâmetros de URL:
+    - propriedade_id: propriedade das posições (obrigatório)
+    - inicio, fim: período AAAA-MM-DD (padrão: últimos 7 dias)
+    """
+    if formato not in ('png', 'json'):
+        return jsonify({'erro': 'Formato inválido. Use png ou json'}), 400
+    propriedade_id = request.args.get('propriedade_id', type=int)
+    if propriedade_id is None:
+        return jsonify({'erro': 'Informe propriedade_id'}), 400
+    try:
+        fim = datetime.strptime(request.args['fim'], '%Y-%m-%d').date() if request.args.get('fim') else datetime.now().date()
+        inicio = datetime.strptime(request.args['inicio'], '%Y-%m-%d').date() if request.args.get('inicio') else fim - timedelta(days=6)
+        if inicio > fim or (fim - inicio).days >= PERIODO_MAXIMO:
+            raise ValueError('período inválido')
+        contagens, maximo, total = obter_tile(zoom, x, y, inicio, fim, propriedade_id)
+    except ValueError:
+        return jsonify({'erro': f'Informe um tile válido (zoom 0-{ZOOM_MAXIMO}) e inicio/fim AAAA-MM-DD (inicio <= fim, até {PERIODO_MAXIMO} dias)'}), 400
+    
+    if formato == 'png':
+        resposta = app.response_class(renderizar_tile(contagens, maximo), mimetype='image/png')
+    else:
+        linhas, colunas = contagens.nonzero()
+        resposta = jsonify({
+            'zoom': zoom, 'x': x, 'y': y,
+            'inicio': inicio.isoformat(),
+            'fim': fim.isoformat(),
+            'resolucao': CELULAS_POR_TILE,
+            'maximo': maximo,
+            'total_periodo': total,
+            'celulas': [[int(l), int(c), int(contagens[l, c])] for l, c in zip(linhas, colunas)]
+        })
+    resposta.headers['Cache-Control'] = 'private, max-age=60'
+    return resposta
+
 @app.route('/api/importar-kml', methods=['POST'])
 @login_required
 def importar_kml():
@@ -614,62 +1175,280 @@ def importar_kml():
         return jsonify({'success': False, 'message': 'Formato de arquivo inválido. Use KML ou KMZ'})
     
     try:
-        if filename.endswith('.kml'):
-            # Processar arquivo KML diretamente
-            coordenadas = processar_kml(file)
-        else:
-            # Processar arquivo KMZ (ZIP contendo KML)
-            coordenadas = processar_kmz(file)
-            
-        if not coordenadas:
+        poligonos = ler_poligonos(file)
+        if not poligonos:
             return jsonify({'success': False, 'message': 'Nenhum polígono encontrado no arquivo'})
-            
+
+        # `coordenadas` mantém o anel externo do primeiro polígono para o formulário de área
         return jsonify({
-            'success': True, 
-            'coordenadas': coordenadas,
+            'success': True,
+            'coordenadas': poligonos[0]['aneis'][0],
+            'poligonos': poligonos,
             'message': 'Arquivo importado com sucesso'
         })
-            
+
     except Exception as e:
         logger.error(f"Erro ao processar arquivo KML/KMZ: {str(e)}")
         return jsonify({'success': False, 'message': f'Erro ao processar arquivo: {str(e)}'})
 
+
+@app.route('/api/areas/importar', methods=['POST'])
+@orcamento_consultas(3)
+@login_required
+def importar_areas_kml():
+    """
+    Importa todos os polígonos de um arquivo KML/KMZ como áreas da propriedade
+
+    Form:
+        kmlFile: Arquivo KML ou KMZ
+        propriedade_id: Propriedade das áreas
+        tipo: Tipo das áreas (opcional)
+        previsualizar: Se informado, só retorna os polígonos sem gravar
+    """
+    file = request.files.get('kmlFile')
+    if file is None or file.filename == '':
+        return jsonify({'success': False, 'message': 'Nenhum arquivo enviado'}), 400
+
+    filename = file.filename.lower()
+    if not (filename.endswith('.kml') or filename.endswith('.kmz')):
+        return jsonify({'success': False, 'message': 'Formato de arquivo inválido. Use KML ou KMZ'}), 400
+
+    propriedade_id = request.form.get('propriedade_id', type=int)
+    if propriedade_id is None or db.session.get(Propriedade, propriedade_id) is None:
+        return jsonify({'success': False, 'message': 'Propriedade não encontrada'}), 400
+
+    try:
+        poligonos = ler_poligonos(file)
+    except Exception as e:
+        logger.error(f"Erro ao processar arquivo KML/KMZ: {str(e)}")
+        return jsonify({'success': False, 'message': f'Erro ao processar arquivo: {str(e)}'}), 400
+
+    if not poligonos:
+        return jsonify({'success': False, 'message': 'Nenhum polígono encontrado no arquivo'}), 400
+
+    if request.form.get('previsualizar'):
+        return jsonify({'success': True, 'poligonos': poligonos})
+
+    try:
+        total = importar_areas(poligonos, propriedade_id, request.form.get('tipo') or None)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao importar áreas: {str(e)}")
+        return jsonify({'success': False, 'message': f'Erro ao importar áreas: {str(e)}'}), 500
+
+    return jsonify({
+        'success': True,
+        'total': total,
+        'message': f'{total} áreas importadas com sucesso'
+    })
+
+def _resposta_geo(corpo, nome, formato):
+    return Response(
+        stream_with_context(corpo),
+        mimetype=FORMATOS_GEO[formato],
+        headers={'Content-Disposition': f'attachment; filename={nome_arquivo_geo(nome, formato)}'}
+    )
+
+@app.route('/api/exportar/areas')
+@orcamento_consultas(2)
+@login_required
+def exportar_areas_geo():
+    """
+    Exporta os polígonos das áreas para SIG (QGIS, Google Earth...)
+    
+    Parâmetros de URL:
+    - formato: kml, kmz ou geojson (padrão: kml)
+    - propriedade_id, tipo: filtros opcionais
+    """
+    formato = request.args.get('formato', 'kml').lower()
+    if formato not in FORMATOS_GEO:
+        return jsonify({'erro': f'Formato inválido. Use {", ".join(FORMATOS_GEO)}'}), 400
+    
+    corpo = exportar_areas(formato, request.args.get('propriedade_id', type=int), request.args.get('tipo'))
+    return _resposta_geo(corpo, 'areas', formato)
+
+@app.route('/api/exportar/trilhas')
+@orcamento_consultas(3)
+@login_required
+def exportar_trilhas_geo():
+    """
+    Exporta as trilhas (histórico de posições) dos animais para SIG
+    
+    Parâmetros de URL:
+    - formato: kml, kmz ou geojson (padrão: kml)
+    - inicio, fim: período AAAA-MM-DD, dias inclusivos (padrão: últimos 7 dias)
+    - animal_id, lote_id: filtros opcionais
+    """
+    formato = request.args.get('formato', 'kml').lower()
+    if formato not in FORMATOS_GEO:
+        return jsonify({'erro': f'Formato inválido. Use {", ".join(FORMATOS_GEO)}'}), 400
+    
+    try:
+        fim = datetime.strptime(request.args['fim'], '%Y-%m-%d') if request.args.get('fim') else datetime.combine(datetime.now().date(), datetime.min.time())
+        inicio = datetime.strptime(request.args['inicio'], '%Y-%m-%d') if request.args.get('inicio') else fim - timedelta(days=6)
+        if inicio > fim:
+            raise ValueError('inicio posterior ao fim')
+    except ValueError:
+        return jsonify({'erro': 'Informe inicio/fim no formato AAAA-MM-DD (inicio <= fim)'}), 400
+    
+    corpo = exportar_trilhas(
+        formato, inicio, fim + timedelta(days=1),
+        request.args.get('animal_id', type=int), request.args.get('lote_id', type=int)
+    )
+    return _resposta_geo(corpo, 'trilhas', formato)
+
+# Folga aplicada ao cursor do mapa para não perder posições gravadas por
+# transações que ainda não tinham sido confirmadas no momento da consulta
+MARGEM_CURSOR_MAPA = timedelta(seconds=5)
+
+def _feature_animal(animal):
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Point",
+            "coordinates": [animal.ultima_longitude, animal.ultima_latitude]
+        },
+        "properties": {
+            "id": animal.id,
+            "codigo": animal.codigo,
+            "nome": animal.nome or f"Animal {animal.codigo}",
+            "raca": animal.raca.nome,
+            "bateria": animal.bateria,
+            "cor": animal.cor,
+            "ultima_atualizacao": animal.ultima_atualizacao.isoformat() if animal.ultima_atualizacao else None
+        }
+    }
+
 @app.route('/api/mapa/animais')
+@orcamento_consultas(3)
 @login_required
 def api_mapa_animais():
-    animais = Animal.query.filter(
+    """
+    Posições atuais dos animais ativos (GeoJSON).
+    
+    Sem parâmetros retorna todos os animais. Com `since=<cursor>` (valor de
+    `cursor` da resposta anterior) retorna apenas os animais alterados desde
+    então e, em `removidos`, os ids que deixaram o mapa. Respostas trazem ETag;
+    `If-None-Match` com o mesmo valor resulta em 304.
+    """
+    since = request.args.get('since')
+    if since:
+        try:
+            since = datetime.fromisoformat(since)
+        except ValueError:
+            return jsonify({'erro': 'Cursor inválido'}), 400
+    
+    cursor = (datetime.now() - MARGEM_CURSOR_MAPA).isoformat()
+    
+    query = com_perfil(Animal.query, 'animal_mapa').filter(
         Animal.ultima_latitude != None,
         Animal.ultima_longitude != None,
         Animal.status == 'Ativo'
-    ).all()
+    )
     
-    features = []
+    removidos = []
+    if since:
+        query = query.filter(db.or_(
+            Animal.ultima_atualizacao > since,
+            Animal.data_alteracao_mapa > since
+        ))
+        removidos = [id for (id,) in db.session.query(Animal.id).filter(
+            Animal.data_alteracao_mapa > since,
+            db.or_(
+                Animal.status != 'Ativo',
+                Animal.ultima_latitude == None,
+                Animal.ultima_longitude == None
+            )
+        )]
+    
+    conteudo = {
+        "type": "FeatureCollection",
+        "features": [_feature_animal(animal) for animal in query.all()]
+    }
+    if since:
+        conteudo["removidos"] = removidos
+    
+    # ETag sobre o conteúdo (sem o cursor), para responder 304 quando nada mudou
+    etag = hashlib.md5(json.dumps(conteudo, sort_keys=True).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        resposta = app.response_class(status=304)
+    else:
+        resposta = jsonify(dict(conteudo, cursor=cursor))
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta
+
+@app.route('/api/mapa/animais/clusters')
+@orcamento_consultas(2)
+@login_required
+def api_mapa_animais_clusters():
+    """
+    Animais agrupados em grade para a área visível do mapa.
+    
+    Parâmetros de URL:
+    - bbox: lng_min,lat_min,lng_max,lat_max (ex.: map.getBounds().toBBoxString())
+    - zoom: nível de zoom do mapa (0-22)
+    - propriedade_id: restringe a uma propriedade (opcional)
+    """
+    try:
+        bbox = [float(v) for v in request.args.get('bbox', '').split(',')]
+        zoom = int(request.args.get('zoom', ''))
+        if len(bbox) != 4 or not 0 <= zoom <= ZOOM_MAXIMO:
+            raise ValueError
+    except ValueError:
+        return jsonify({'erro': 'Informe bbox=lng_min,lat_min,lng_max,lat_max e zoom entre 0 e 22'}), 400
+    
+    indice_posicoes.sincronizar()
+    grupos = indice_posicoes.agrupar(bbox, zoom, request.args.get('propriedade_id', type=int))
     
-    for animal in animais:
-        feature = {
+    return jsonify({
+        "type": "FeatureCollection",
+        "features": [{
             "type": "Feature",
             "geometry": {
                 "type": "Point",
-                "coordinates": [animal.ultima_longitude, animal.ultima_latitude]
+                "coordinates": [grupo.pop('longitude'), grupo.pop('latitude')]
             },
-            "properties": {
-                "id": animal.id,
-                "codigo": animal.codigo,
-                "nome": animal.nome or f"Animal {animal.codigo}",
-                "raca": animal.raca.nome,
-                "bateria": animal.bateria,
-                "cor": animal.cor,
-                "ultima_atualizacao": animal.ultima_atualizacao.isoformat() if animal.ultima_atualizacao else None
-            }
-        }
-        features.append(feature)
+            "properties": grupo
+        } for grupo in grupos]
+    })
+
+@app.route('/api/mapa/animais/stream')
+@login_required
+def api_mapa_animais_stream():
+    """
+    Stream ao vivo (Server-Sent Events) das posições dos animais.
     
-    collection = {
-        "type": "FeatureCollection",
-        "features": features
-    }
+    Eventos `posicoes` trazem uma lista com a posição mais recente de cada
+    animal alterado no intervalo (`{"id", "removido": true}` para animais que
+    saíram do mapa); `ressincronizar` pede ao cliente que recarregue
+    /api/mapa/animais.
     
-    return jsonify(collection)
+    Parâmetros de URL:
+    - propriedade_id: restringe a uma propriedade (opcional)
+    - bbox: lng_min,lat_min,lng_max,lat_max (opcional)
+    """
+    bbox = request.args.get('bbox')
+    if bbox:
+        try:
+            bbox = [float(v) for v in bbox.split(',')]
+            if len(bbox) != 4:
+                raise ValueError
+        except ValueError:
+            return jsonify({'erro': 'Informe bbox=lng_min,lat_min,lng_max,lat_max'}), 400
+    
+    assinatura = hub_posicoes.assinar(
+        propriedade_id=request.args.get('propriedade_id', type=int),
+        bbox=bbox or None,
+        max_pendentes=app.config['MAPA_STREAM_MAX_PENDENTES']
+    )
+    
+    return Response(
+        hub_posicoes.transmitir(assinatura, app),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/areas/nova', methods=['GET', 'POST'])
 @login_required
@@ -729,9 +1508,10 @@ def cadastro_area():
 
 # Rotas para atividades
 @app.route('/atividades')
+@orcamento_consultas(2)
 @login_required
 def listar_atividades():
-    atividades = Atividade.query.order_by(Atividade.data_inicio.desc()).all()
+    atividades = com_perfil(Atividade.query, 'atividade_area').order_by(Atividade.data_inicio.desc()).all()
     return render_template('listar_atividades.html', atividades=atividades)
 
 @app.route('/atividades/nova', methods=['GET', 'POST'])
@@ -793,272 +1573,133 @@ def relatorios():
     racas = Raca.query.all()
     areas = Area.query.all()
     
+    # Relatórios gerados em segundo plano ainda disponíveis
+    tarefas = TarefaRelatorio.query.filter(
+        db.or_(TarefaRelatorio.data_expiracao == None, TarefaRelatorio.data_expiracao > datetime.now())
+    ).order_by(TarefaRelatorio.id.desc()).limit(20).all()
+    
     return render_template(
         'relatorios.html',
         racas=racas,
-        areas=areas
+        areas=areas,
+        tarefas=tarefas
     )
 
-@app.route('/relatorios/animais', methods=['POST'])
+@app.route('/api/relatorios/tarefas/<int:id>')
+@orcamento_consultas(2)
 @login_required
-def gerar_relatorio_animais():
+def api_tarefa_relatorio(id):
+    """Situação e progresso de um relatório gerado em segundo plano"""
+    tarefa = db.session.get(TarefaRelatorio, id)
+    if not tarefa:
+        return jsonify({'erro': 'Tarefa não encontrada'}), 404
+    
+    dados = tarefa.to_dict()
+    if tarefa.status == 'Concluído':
+        dados['download'] = url_for('baixar_relatorio', id=tarefa.id)
+    return jsonify(dados)
+
+@app.route('/relatorios/tarefas/<int:id>/download')
+@login_required
+def baixar_relatorio(id):
+    tarefa = db.session.get(TarefaRelatorio, id)
+    if not tarefa or tarefa.status != 'Concluído' or not tarefa.arquivo or not os.path.exists(tarefa.arquivo):
+        flash('Relatório não disponível ou expirado.', 'warning')
+        return redirect(url_for('relatorios'))
+    
+    return send_file(
+        tarefa.arquivo,
+        as_attachment=True,
+        download_name=tarefa.nome_arquivo,
+        mimetype=FORMATOS[tarefa.formato]
+    )
+
+def _exportar_relatorio(relatorio):
+    """Exporta um relatório em XLSX (padrão) ou CSV, em blocos e com memória constante"""
     try:
-        # Obter os filtros do formulário
-        status = request.form.get('status')
-        raca_id = request.form.get('raca_id')
-        area_id = request.form.get('area_id')
+        filtros = normalizar_filtros(relatorio, request.form)
+        formato = request.form.get('formato', 'xlsx')
+        if formato not in FORMATOS:
+            formato = 'xlsx'
         
-        # Construir a consulta com filtros
-        query = Animal.query
-        
-        if status and status != 'Todos':
-            query = query.filter_by(status=status)
-        
-        if raca_id and raca_id != '0':
-            query = query.filter_by(raca_id=int(raca_id))
-        
-        if area_id and area_id != '0':
-            query = query.filter_by(area_id=int(area_id))
-        
-        # Executar a consulta
-        animais = query.all()
-        
-        # Preparar dados para o relatório
-        dados = []
-        for animal in animais:
-            dados.append({
-                'Código': animal.codigo,
-                'Nome': animal.nome or '',
-                'Raça': animal.raca.nome,
-                'Sexo': 'Macho' if animal.sexo == 'M' else 'Fêmea',
-                'Data Nascimento': animal.data_nascimento.strftime('%d/%m/%Y') if animal.data_nascimento else '',
-                'Peso Atual (kg)': animal.peso_atual or 0,  # Evitar valores None
-                'Status': animal.status,
-                'Área': animal.area.nome if animal.area else 'Não atribuída',
-                'Lote': animal.lote.nome if animal.lote else 'Não atribuído'
-            })
+        total = contar_linhas(relatorio, filtros)
+        if not total:
+            flash('Nenhum dado encontrado para os filtros selecionados.', 'warning')
+            return redirect(url_for('relatorios'))
         
-        # Criar DataFrame e exportar para Excel
-        if dados:
-            df = pd.DataFrame(dados)
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='Animais', index=False)
-                
-                # Formatação do arquivo Excel
-                workbook = writer.book
-                worksheet = writer.sheets['Animais']
-                
-                # Ajustar largura das colunas
-                for idx, col in enumerate(df.columns):
-                    column_width = max(df[col].astype(str).map(len).max(), len(col) + 2)
-                    worksheet.set_column(idx, idx, column_width)
-                
-                # Adicionar formatos
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'text_wrap': True,
-                    'valign': 'top',
-                    'bg_color': '#D8E4BC',
-                    'border': 1
-                })
-                
-                # Aplicar formato ao cabeçalho
-                for col_num, value in enumerate(df.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-            
-            output.seek(0)
-            return send_file(
-                output,
-                as_attachment=True,
-                download_name=f'relatorio_animais_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        # Relatórios grandes (ou pedidos explicitamente) vão para a fila em segundo plano
+        if total > app.config['RELATORIOS_LIMITE_SINCRONO'] or request.form.get('assincrono') == '1':
+            tarefa, criada = fila_relatorios.solicitar(
+                relatorio, formato, filtros, getattr(current_user, 'id', None)
             )
-        else:
-            flash('Nenhum dado encontrado para os filtros selecionados.', 'warning')
+            if criada:
+                flash(f'Relatório com {total} linhas em preparação. O download ficará disponível nesta página.', 'info')
+            else:
+                flash('Já existe um relatório com estes filtros; use o download desta página.', 'info')
             return redirect(url_for('relatorios'))
-            
+        
+        if formato == 'csv':
+            corpo = stream_with_context(gerar_csv(relatorio, filtros))
+        else:
+            descritor, caminho = tempfile.mkstemp(suffix='.xlsx')
+            os.close(descritor)
+            try:
+                escrever_xlsx(relatorio, filtros, caminho)
+            except Exception:
+                os.remove(caminho)
+                raise
+            corpo = enviar_arquivo(caminho)
+        
+        return Response(
+            corpo,
+            mimetype=FORMATOS[formato],
+            headers={'Content-Disposition': f'attachment; filename={nome_arquivo(relatorio, formato)}'}
+        )
+    
     except Exception as e:
         flash(f'Erro ao gerar relatório: {str(e)}', 'danger')
-        logger.error(f"Erro ao gerar relatório de animais: {str(e)}", exc_info=True)
+        logger.error(f"Erro ao gerar relatório de {relatorio}: {str(e)}", exc_info=True)
         return redirect(url_for('relatorios'))
 
+@app.route('/relatorios/animais', methods=['POST'])
+@orcamento_consultas(5)
+@login_required
+def gerar_relatorio_animais():
+    return _exportar_relatorio('animais')
+
 @app.route('/relatorios/atividades', methods=['POST'])
+@orcamento_consultas(5)
 @login_required
 def gerar_relatorio_atividades():
-    try:
-        # Obter os filtros do formulário
-        data_inicio = request.form.get('data_inicio')
-        data_fim = request.form.get('data_fim')
-        tipo = request.form.get('tipo')
-        status = request.form.get('status')
-        
-        # Construir a consulta com filtros
-        query = Atividade.query
-        
-        if data_inicio:
-            data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d')
-            query = query.filter(Atividade.data_inicio >= data_inicio)
-        
-        if data_fim:
-            data_fim = datetime.strptime(data_fim, '%Y-%m-%d')
-            # Ajustar para o final do dia
-            data_fim = data_fim.replace(hour=23, minute=59, second=59)
-            query = query.filter(Atividade.data_inicio <= data_fim)
-        
-        if tipo and tipo != 'Todos':
-            query = query.filter_by(tipo=tipo)
-        
-        if status and status != 'Todos':
-            query = query.filter_by(status=status)
-        
-        # Executar a consulta
-        atividades = query.all()
-        
-        # Preparar dados para o relatório
-        dados = []
-        for atividade in atividades:
-            dados.append({
-                'Tipo': atividade.tipo,
-                'Descrição': atividade.descricao,
-                'Data Início': atividade.data_inicio.strftime('%d/%m/%Y %H:%M'),
-                'Data Fim': atividade.data_fim.strftime('%d/%m/%Y %H:%M') if atividade.data_fim else 'Não concluída',
-                'Status': atividade.status,
-                'Responsável': atividade.responsavel or 'Não definido',
-                'Custo (R$)': atividade.custo if atividade.custo else 0,
-                'Área': atividade.area.nome if atividade.area else 'Geral'
-            })
-        
-        # Criar DataFrame e exportar para Excel
-        if dados:
-            df = pd.DataFrame(dados)
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='Atividades', index=False)
-                
-                # Formatação do arquivo Excel
-                workbook = writer.book
-                worksheet = writer.sheets['Atividades']
-                
-                # Ajustar largura das colunas
-                for idx, col in enumerate(df.columns):
-                    column_width = max(df[col].astype(str).map(len).max(), len(col) + 2)
-                    worksheet.set_column(idx, idx, column_width)
-                
-                # Adicionar formatos
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'text_wrap': True,
-                    'valign': 'top',
-                    'bg_color': '#D8E4BC',
-                    'border': 1
-                })
-                
-                # Formato para custos
-                money_format = workbook.add_format({'num_format': 'R$ #,##0.00'})
-                
-                # Aplicar formato ao cabeçalho
-                for col_num, value in enumerate(df.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-                    
-                # Aplicar formato de moeda à coluna de custos
-                if 'Custo (R$)' in df.columns:
-                    custo_idx = df.columns.get_loc('Custo (R$)')
-                    for row_num in range(1, len(df) + 1):  # +1 para pular o cabeçalho
-                        worksheet.write_number(row_num, custo_idx, 
-                                             float(df.iloc[row_num-1]['Custo (R$)'] or 0), 
-                                             money_format)
-            
-            output.seek(0)
-            return send_file(
-                output,
-                as_attachment=True,
-                download_name=f'relatorio_atividades_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        else:
-            flash('Nenhum dado encontrado para os filtros selecionados.', 'warning')
-            return redirect(url_for('relatorios'))
-            
-    except Exception as e:
-        flash(f'Erro ao gerar relatório: {str(e)}', 'danger')
-        logger.error(f"Erro ao gerar relatório de atividades: {str(e)}", exc_info=True)
-        return redirect(url_for('relatorios'))
+    return _exportar_relatorio('atividades')
 
 @app.route('/api/dashboard/dados')
+@orcamento_consultas(6)
 @login_required
 def api_dashboard_dados():
     try:
-        logger.info("Iniciando carregamento de dados do dashboard")
-        
-        # Total de animais por status
-        total_por_status = {
-            'Ativo': Animal.query.filter_by(status='Ativo').count(),
-            'Vendido': Animal.query.filter_by(status='Vendido').count(),
-            'Morto': Animal.query.filter_by(status='Morto').count()
-        }
-        logger.info(f"Dados de status: {total_por_status}")
-        
-        # Total de animais por sexo
-        total_por_sexo = {
-            'Macho': Animal.query.filter_by(sexo='M').count(),
-            'Fêmea': Animal.query.filter_by(sexo='F').count()
-        }
-        logger.info(f"Dados de sexo: {total_por_sexo}")
-        
-        # Dados de peso médio por raça
-        racas = Raca.query.all()
-        peso_por_raca = []
-        
-        for raca in racas:
-            animais = Animal.query.filter_by(raca_id=raca.id, status='Ativo').all()
-            if animais:
-                animais_com_peso = [a for a in animais if a.peso_atual is not None]
-                if animais_com_peso:
-                    peso_medio = sum(a.peso_atual for a in animais_com_peso) / len(animais_com_peso)
-                    peso_por_raca.append({
-                        'raca': raca.nome,
-                        'peso_medio': round(peso_medio, 2)
-                    })
-        logger.info(f"Dados de peso por raça: {peso_por_raca}")
-        
-        # Atividades recentes
-        atividades_recentes = []
-        atividades = Atividade.query.order_by(Atividade.data_inicio.desc()).limit(5).all()
-        
-        for atividade in atividades:
-            atividades_recentes.append({
-                'id': atividade.id,
-                'tipo': atividade.tipo,
-                'descricao': atividade.descricao,
-                'data_inicio': atividade.data_inicio.strftime('%d/%m/%Y'),
-                'status': atividade.status
-            })
-        logger.info(f"Atividades recentes encontradas: {len(atividades_recentes)}")
-        
-        # Animais por área
-        areas = Area.query.all()
-        animais_por_area = []
-        
-        for area in areas:
-            total = Animal.query.filter_by(area_id=area.id, status='Ativo').count()
-            if total > 0:
-                animais_por_area.append({
-                    'area': area.nome,
-                    'total': total
-                })
-        logger.info(f"Dados de animais por área: {animais_por_area}")
+        snapshot = obter_snapshot_painel()
         
         # Preparar resposta JSON
         resposta = {
-            'total_por_status': total_por_status,
-            'total_por_sexo': total_por_sexo,
-            'peso_por_raca': peso_por_raca,
-            'atividades_recentes': atividades_recentes,
-            'animais_por_area': animais_por_area
+            'total_por_status': {
+                status: snapshot['por_status'][status] for status in STATUS_ANIMAL
+            },
+            'total_por_sexo': {
+                'Macho': snapshot['por_sexo']['M'],
+                'Fêmea': snapshot['por_sexo']['F']
+            },
+            'peso_por_raca': [
+                {'raca': raca, 'peso_medio': peso_medio}
+                for raca, peso_medio in snapshot['racas_pesos_ativos']
+            ],
+            'atividades_recentes': snapshot['atividades_recentes'],
+            'animais_por_area': [
+                {'area': area, 'total': total}
+                for area, total in snapshot['areas_totais_ativos']
+            ]
         }
         
-        logger.info("Dados do dashboard gerados com sucesso")
         return jsonify(resposta)
     
     except Exception as e:
@@ -1265,24 +1906,18 @@ def api_lora_data():
         latitude = data.get('latitude')
         longitude = data.get('longitude')
         
+        animais = []
         if latitude and longitude and dispositivo.animal:
-            # Atualizar localização do animal
-            dispositivo.animal.ultima_latitude = latitude
-            dispositivo.animal.ultima_longitude = longitude
-            dispositivo.animal.ultima_atualizacao = datetime.now()
-            
-            # Registrar no histórico de localização
-            historico = HistoricoLocalizacao(
-                animal_id=dispositivo.animal.id,
-                device_id=device_id,
-                latitude=latitude,
-                longitude=longitude,
-                bateria=data.get('bateria', dispositivo.bateria)
-            )
-            db.session.add(historico)
+            # Atualizar localização do animal e registrar no histórico
+            animais, _ = registrar_posicoes([{
+                'device_id': device_id,
+                'latitude': latitude,
+                'longitude': longitude,
+                'bateria': data.get('bateria', dispositivo.bateria)
+            }], commit=False)
             
-        # Salvar todas as alterações
-        db.session.commit()
+        # Salvar todas as alterações (e notificar as posições novas)
+        confirmar_posicoes(animais)
         
         # Retornar resposta de sucesso
         return jsonify({
@@ -1623,6 +2258,8 @@ def init_db():
                 db.session.add(alerta)
         
         db.session.commit()
+        recalcular_resumos()
+        criar_regras_padrao()
         return "Banco de dados inicializado com sucesso!"
     
     except Exception as e:
@@ -1632,9 +2269,11 @@ def init_db():
 
 # Rotas para gerenciamento de estações meteorológicas
 @app.route('/estacoes-meteorologicas')
+@orcamento_consultas(2)
 @login_required
 def listar_estacoes():
-    estacoes = EstacaoMeteorologica.query.all()
+    # Últimos valores, janela de 24h e alertas vêm do resumo, na mesma consulta
+    estacoes = com_perfil(EstacaoMeteorologica.query, 'estacao_resumo').all()
     return render_template('listar_estacoes.html', estacoes=estacoes)
 
 @app.route('/estacoes-meteorologicas/nova', methods=['GET', 'POST'])
@@ -1725,25 +2364,44 @@ def cadastro_estacao():
     
     return render_template('cadastro_estacao.html')
 
+# Leituras do gráfico da página de detalhes da estação
+LEITURAS_GRAFICO_ESTACAO = 100
+
 @app.route('/estacoes-meteorologicas/<int:id>')
+@orcamento_consultas(4)
 @login_required
 def detalhes_estacao(id):
-    estacao = EstacaoMeteorologica.query.get_or_404(id)
-    
-    # Buscar última leitura
-    ultima_leitura = LeituraMeteorologica.query.filter_by(estacao_id=id).order_by(LeituraMeteorologica.data_hora.desc()).first()
-    
-    # Buscar histórico de leituras (últimas 100)
-    leituras = LeituraMeteorologica.query.filter_by(estacao_id=id).order_by(LeituraMeteorologica.data_hora.desc()).limit(100).all()
-    
-    # Buscar alertas ativos
-    alertas = AlertaMeteorologico.query.filter_by(estacao_id=id).filter(AlertaMeteorologico.status != 'Finalizado').order_by(AlertaMeteorologico.data_hora.desc()).all()
+    estacao = com_perfil(EstacaoMeteorologica.query, 'estacao_resumo').filter_by(id=id).first_or_404()
+    
+    # Última leitura, janela de 24h e contagem de alertas vêm do resumo. As
+    # leituras do gráfico (da mais recente para a mais antiga) vêm do buffer
+    # do worker quando as últimas 24h bastam, senão de uma consulta
+    resumo = estacao.resumo
+    leituras = []
+    if resumo and resumo.data_hora:
+        if LEITURAS_GRAFICO_ESTACAO <= min(resumo.leituras_24h or 0, buffers_estacoes.capacidade):
+            leituras = buffers_estacoes.ultimas(estacao.id, LEITURAS_GRAFICO_ESTACAO, resumo.data_hora)
+            leituras = leituras[::-1] if leituras is not None else None
+        if not leituras:
+            colunas = [getattr(LeituraMeteorologica, campo) for campo in CAMPOS_BUFFER]
+            leituras = db.session.query(LeituraMeteorologica.data_hora, *colunas)\
+                .filter_by(estacao_id=id)\
+                .order_by(LeituraMeteorologica.data_hora.desc())\
+                .limit(LEITURAS_GRAFICO_ESTACAO).all()
+    ultimas_leituras = leituras[:min(LEITURAS_RECENTES_PADRAO, resumo.leituras_24h or 0) if resumo else 0][::-1]
+    
+    # Buscar alertas ativos (apenas se o resumo indicar que existem)
+    alertas = []
+    if resumo and resumo.alertas_ativos:
+        alertas = AlertaMeteorologico.query.filter_by(estacao_id=id).filter(AlertaMeteorologico.status != 'Finalizado').order_by(AlertaMeteorologico.data_hora.desc()).all()
     
     return render_template(
         'detalhes_estacao.html',
         estacao=estacao,
-        ultima_leitura=ultima_leitura,
+        resumo=resumo,
+        ultima_leitura=resumo if resumo and resumo.data_hora else None,
         leituras=leituras,
+        ultimas_leituras=ultimas_leituras,
         alertas=alertas
     )
 
@@ -1856,55 +2514,8 @@ def solicitar_leitura(id):
             'sinal_lora': round(random.uniform(-100, -60), 1)
         }
         
-        # Criar registro da leitura
-        leitura = LeituraMeteorologica(
-            estacao_id=id,
-            temperatura=dados['temperatura'],
-            umidade=dados['umidade'],
-            pressao=dados['pressao'],
-            velocidade_vento=dados['velocidade_vento'],
-            direcao_vento=dados['direcao_vento'],
-            precipitacao=dados['precipitacao'],
-            radiacao_solar=dados['radiacao_solar'],
-            umidade_solo=dados['umidade_solo'],
-            temperatura_solo=dados['temperatura_solo'],
-            bateria=dados['bateria'],
-            sinal_lora=dados['sinal_lora']
-        )
-        
-        # Atualizar dados da estação
-        estacao.ultimo_contato = datetime.now()
-        estacao.bateria = dados['bateria']
-        
-        # Verificar se deve gerar alertas
-        # Exemplo: alerta de temperatura alta
-        if estacao.sensor_temperatura and dados['temperatura'] > 30:
-            alerta = AlertaMeteorologico(
-                estacao_id=id,
-                tipo='Temperatura Alta',
-                descricao=f'Temperatura acima do limite estabelecido',
-                nivel='Atenção',
-                valor_medido=dados['temperatura'],
-                valor_limite=30,
-                unidade='°C'
-            )
-            db.session.add(alerta)
-        
-        # Exemplo: alerta de chuva forte
-        if estacao.sensor_chuva and dados['precipitacao'] > 10:
-            alerta = AlertaMeteorologico(
-                estacao_id=id,
-                tipo='Chuva Forte',
-                descricao=f'Precipitação acima do limite estabelecido',
-                nivel='Alerta',
-                valor_medido=dados['precipitacao'],
-                valor_limite=10,
-                unidade='mm'
-            )
-            db.session.add(alerta)
-        
-        db.session.add(leitura)
-        db.session.commit()
+        # Registrar leitura (avalia as regras de alerta e atualiza contato, bateria e resumo da estação)
+        registrar_leitura_estacao(estacao, dados)
         
         flash('Leitura da estação solicitada com sucesso.', 'success')
     except Exception as e:
@@ -1950,22 +2561,8 @@ def registrar_leitura_manual(id):
             if request.form.get('temperatura_solo'):
                 dados['temperatura_solo'] = float(request.form.get('temperatura_solo'))
         
-        # Criar leitura manual
-        leitura = LeituraMeteorologica(
-            estacao_id=id,
-            temperatura=dados.get('temperatura'),
-            umidade=dados.get('umidade'),
-            pressao=dados.get('pressao'),
-            velocidade_vento=dados.get('velocidade_vento'),
-            direcao_vento=dados.get('direcao_vento'),
-            precipitacao=dados.get('precipitacao'),
-            radiacao_solar=dados.get('radiacao_solar'),
-            umidade_solo=dados.get('umidade_solo'),
-            temperatura_solo=dados.get('temperatura_solo')
-        )
-        
-        db.session.add(leitura)
-        db.session.commit()
+        # Registrar leitura manual (atualiza o resumo da estação)
+        registrar_leitura_estacao(estacao, dados)
         
         flash('Leitura manual registrada com sucesso.', 'success')
     except Exception as e:
@@ -1975,6 +2572,57 @@ def registrar_leitura_manual(id):
     
     return redirect(url_for('detalhes_estacao', id=id))
 
+@app.route('/api/regras-alertas')
+@orcamento_consultas(2)
+@login_required
+def api_regras_alertas():
+    """Regras de alerta meteorológico (filtros opcionais estacao_id e propriedade_id)"""
+    query = RegraAlerta.query
+    if request.args.get('estacao_id', type=int) is not None:
+        query = query.filter(RegraAlerta.estacao_id == request.args.get('estacao_id', type=int))
+    if request.args.get('propriedade_id', type=int) is not None:
+        query = query.filter(RegraAlerta.propriedade_id == request.args.get('propriedade_id', type=int))
+    
+    return jsonify([regra.to_dict() for regra in query.order_by(RegraAlerta.id).all()])
+
+@app.route('/api/regras-alertas', methods=['POST'])
+@login_required
+def api_criar_regra_alerta():
+    """Cria uma regra de alerta por estação, por propriedade ou para todas as estações"""
+    try:
+        regra = RegraAlerta(**validar_regra(request.get_json() or {}))
+    except (TypeError, ValueError) as e:
+        return jsonify({'erro': f'Regra inválida: {str(e)}'}), 400
+    
+    db.session.add(regra)
+    db.session.commit()
+    motor_alertas.invalidar()
+    return jsonify(regra.to_dict()), 201
+
+@app.route('/api/regras-alertas/<int:id>', methods=['PUT', 'DELETE'])
+@login_required
+def api_regra_alerta(id):
+    """Altera ou remove uma regra de alerta"""
+    regra = db.session.get(RegraAlerta, id)
+    if not regra:
+        return jsonify({'erro': 'Regra não encontrada'}), 404
+    
+    if request.method == 'DELETE':
+        db.session.delete(regra)
+        db.session.commit()
+        motor_alertas.invalidar()
+        return jsonify({'sucesso': True})
+    
+    try:
+        for campo, valor in validar_regra(request.get_json() or {}, parcial=True).items():
+            setattr(regra, campo, valor)
+    except (TypeError, ValueError) as e:
+        return jsonify({'erro': f'Regra inválida: {str(e)}'}), 400
+    
+    db.session.commit()
+    motor_alertas.invalidar()
+    return jsonify(regra.to_dict())
+
 @app.route('/criar_estacoes_exemplo')
 def criar_estacoes_exemplo():
     try:
@@ -2092,6 +2740,8 @@ def criar_estacoes_exemplo():
                 db.session.add(alerta)
         
         db.session.commit()
+        recalcular_resumos()
+        criar_regras_padrao()
         return "Estações meteorológicas de exemplo criadas com sucesso!"
     except Exception as e:
         db.session.rollback()
@@ -2287,17 +2937,37 @@ def criar_exemplos():
         return f"Erro ao criar exemplos: {str(e)}"
 
 @app.route('/api/estacao/<int:id>/leituras')
+@orcamento_consultas(4)
 @login_required
 def api_estacao_leituras(id):
-    """API para obter o histórico de leituras de uma estação."""
+    """
+    API para obter o histórico de leituras de uma estação.
+    
+    Cada série é reduzida a no máximo `max_points` pontos (LTTB), preservando
+    picos e vales para os gráficos.
+    
+    Parâmetros de URL:
+    - start: início do intervalo em ISO 8601 (padrão: 7 dias antes de `end`)
+    - end: fim do intervalo em ISO 8601 (padrão: agora)
+    - max_points: pontos máximos por série (padrão 500, máximo 5000)
+    
+    Datas com fuso horário são convertidas para a hora local.
+    """
+    try:
+        fim = _data_hora_local(request.args['end']) if request.args.get('end') else datetime.now()
+        inicio = _data_hora_local(request.args['start']) if request.args.get('start') else fim - timedelta(days=7)
+        max_pontos = request.args.get('max_points', MAX_PONTOS_PADRAO, type=int)
+        if inicio > fim:
+            raise ValueError
+    except ValueError:
+        return jsonify({'erro': 'Informe start/end em ISO 8601 (start <= end) e max_points inteiro'}), 400
+    
     try:
         # Verificar se a estação existe
-        estacao = EstacaoMeteorologica.query.get_or_404(id)
+        estacao = com_perfil(EstacaoMeteorologica.query, 'estacao_resumo').filter_by(id=id).first_or_404()
         
-        # Buscar as leituras da estação
-        leituras = LeituraMeteorologica.query.filter_by(estacao_id=id)\
-            .order_by(LeituraMeteorologica.data_hora.desc())\
-            .all()
+        ultima_leitura = estacao.resumo.data_hora if estacao.resumo is not None else None
+        total, series = obter_series_estacao(id, inicio, fim, max_pontos, ultima_leitura)
         
         # Preparar a resposta
         response = {
@@ -2306,21 +2976,10 @@ def api_estacao_leituras(id):
                 'nome': estacao.nome,
                 'codigo': estacao.codigo
             },
-            'leituras': [{
-                'id': leitura.id,
-                'data_hora': leitura.data_hora.isoformat(),
-                'temperatura': leitura.temperatura,
-                'umidade': leitura.umidade,
-                'pressao': leitura.pressao,
-                'velocidade_vento': leitura.velocidade_vento,
-                'direcao_vento': leitura.direcao_vento,
-                'precipitacao': leitura.precipitacao,
-                'radiacao_solar': leitura.radiacao_solar,
-                'umidade_solo': leitura.umidade_solo,
-                'temperatura_solo': leitura.temperatura_solo,
-                'bateria': leitura.bateria,
-                'sinal_lora': leitura.sinal_lora
-            } for leitura in leituras]
+            'inicio': inicio.isoformat(),
+            'fim': fim.isoformat(),
+            'total_leituras': total,
+            'series': series
         }
         
         return jsonify(response)
@@ -2328,3 +2987,133 @@ def api_estacao_leituras(id):
     except Exception as e:
         logger.error(f"Erro ao obter leituras da estação {id}: {str(e)}")
         return jsonify({'erro': f"Erro ao obter leituras: {str(e)}"}), 500
+
+@app.route('/api/estacao/<int:id>/recentes')
+@orcamento_consultas(4)
+@login_required
+def api_estacao_recentes(id):
+    """
+    Últimas leituras e estatísticas das últimas 24 horas de uma estação,
+    respondidas pelo buffer em memória do worker.
+    
+    Parâmetros de URL:
+    - n: número de leituras (padrão 10, máximo a capacidade do buffer)
+    """
+    n = request.args.get('n', LEITURAS_RECENTES_PADRAO, type=int)
+    if n < 1 or n > buffers_estacoes.capacidade:
+        return jsonify({'erro': f'n deve estar entre 1 e {buffers_estacoes.capacidade}'}), 400
+    
+    estacao = com_perfil(EstacaoMeteorologica.query, 'estacao_resumo').filter_by(id=id).first_or_404()
+    referencia = estacao.resumo.data_hora if estacao.resumo is not None else None
+    
+    leituras = buffers_estacoes.ultimas(id, n, referencia)
+    if leituras is None:
+        # Menos leituras no buffer do que as pedidas: completa pelo banco
+        colunas = [getattr(LeituraMeteorologica, campo) for campo in CAMPOS_BUFFER]
+        leituras = db.session.query(LeituraMeteorologica.data_hora, *colunas)\
+            .filter_by(estacao_id=id)\
+            .order_by(LeituraMeteorologica.data_hora.desc())\
+            .limit(n).all()[::-1]
+    
+    estatisticas = buffers_estacoes.estatisticas(id, referencia)
+    if estatisticas is None and estacao.resumo is not None:
+        # Buffer não cobre as 24 horas: usa a janela do resumo
+        resumo = estacao.resumo
+        estatisticas = {
+            'leituras': resumo.leituras_24h,
+            'precipitacao_total': resumo.precipitacao_24h,
+            'campos': {
+                'temperatura': {'minimo': resumo.temperatura_min_24h, 'maximo': resumo.temperatura_max_24h},
+                'umidade': {'minimo': resumo.umidade_min_24h, 'maximo': resumo.umidade_max_24h}
+            }
+        }
+    
+    return jsonify({
+        'estacao': {
+            'id': estacao.id,
+            'nome': estacao.nome,
+            'codigo': estacao.codigo
+        },
+        'leituras': [
+            dict(zip(leitura._fields, leitura), data_hora=leitura.data_hora.isoformat())
+            for leitura in leituras
+        ],
+        'estatisticas_24h': estatisticas
+    })
+
+def _periodo_estresse_termico():
+    """Período em dias (?inicio=&fim= AAAA-MM-DD; padrão: últimos 30 dias)"""
+    fim = datetime.strptime(request.args['fim'], '%Y-%m-%d').date() if request.args.get('fim') else datetime.now().date()
+    inicio = datetime.strptime(request.args['inicio'], '%Y-%m-%d').date() if request.args.get('inicio') else fim - timedelta(days=29)
+    if inicio > fim:
+        raise ValueError('inicio posterior ao fim')
+    return inicio, fim
+
+@app.route('/api/estresse-termico/estacoes')
+@orcamento_consultas(2)
+@login_required
+def api_estresse_termico_estacoes():
+    """
+    ITU, ponto de orvalho e carga térmica diária por estação.
+    
+    Parâmetros de URL:
+    - inicio, fim: período AAAA-MM-DD (padrão: últimos 30 dias)
+    - estacao_id: restringe a uma estação (opcional)
+    """
+    try:
+        inicio, fim = _periodo_estresse_termico()
+    except ValueError:
+        return jsonify({'erro': 'Informe inicio/fim no formato AAAA-MM-DD (inicio <= fim)'}), 400
+    
+    query = EstresseTermicoDiario.query.filter(
+        EstresseTermicoDiario.data >= inicio,
+        EstresseTermicoDiario.data <= fim
+    )
+    if request.args.get('estacao_id', type=int) is not None:
+        query = query.filter(EstresseTermicoDiario.estacao_id == request.args.get('estacao_id', type=int))
+    
+    return jsonify({
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'limiar_carga': LIMIAR_CARGA_TERMICA,
+        'dias': [{
+            'estacao_id': dia.estacao_id,
+            'data': dia.data.isoformat(),
+            'leituras': dia.leituras,
+            'horas': dia.horas,
+            'itu_medio': dia.itu_medio,
+            'itu_maximo': dia.itu_maximo,
+            'ponto_orvalho_medio': dia.ponto_orvalho_medio,
+            'temperatura_maxima': dia.temperatura_maxima,
+            'carga_termica': dia.carga_termica,
+            'horas_alerta': dia.horas_alerta,
+            'horas_perigo': dia.horas_perigo,
+            'horas_emergencia': dia.horas_emergencia,
+            'categoria': dia.categoria
+        } for dia in query.order_by(EstresseTermicoDiario.estacao_id, EstresseTermicoDiario.data).all()]
+    })
+
+@app.route('/api/estresse-termico/animais')
+@orcamento_consultas(4)
+@login_required
+def api_estresse_termico_animais():
+    """
+    Carga térmica acumulada por animal (pela estação mais próxima) e por lote.
+    
+    Parâmetros de URL:
+    - inicio, fim: período AAAA-MM-DD (padrão: últimos 30 dias)
+    - lote_id: restringe a um lote (opcional)
+    """
+    try:
+        inicio, fim = _periodo_estresse_termico()
+    except ValueError:
+        return jsonify({'erro': 'Informe inicio/fim no formato AAAA-MM-DD (inicio <= fim)'}), 400
+    
+    animais, lotes = exposicao_termica(inicio, fim, request.args.get('lote_id', type=int))
+    return jsonify({
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'limiar_carga': LIMIAR_CARGA_TERMICA,
+        'animais': animais,
+        'lotes': lotes
+    })
@@ -0,0 +1,153 @@
+"""
+Séries temporais das estações meteorológicas para gráficos.
+
+Além dos campos das leituras, inclui as séries derivadas de ITU e ponto de
+orvalho (ver `estresse_termico`).
+
+As leituras de um intervalo são lidas do banco por um cursor no servidor, em
+blocos, direto para arrays NumPy (sem instanciar objetos ORM). Cada série é
+então reduzida com Largest-Triangle-Three-Buckets (LTTB), que preserva picos
+e vales: o gráfico continua visualmente fiel com um número limitado de pontos.
+Intervalos dentro das últimas 24 horas são lidos do buffer em memória do
+worker (`buffer_leituras`), sem consultar o banco.
+"""
+
+import numpy as np
+from sqlalchemy import select
+
+from app import db
+from buffer_leituras import buffers_estacoes
+from estresse_termico import indice_temperatura_umidade, ponto_orvalho
+from models import LeituraMeteorologica
+
+MAX_PONTOS_PADRAO = 500
+MAX_PONTOS_LIMITE = 5000
+
+# Linhas por bloco lidas do cursor no servidor
+TAMANHO_BLOCO = 5000
+
+CAMPOS_SERIES = (
+    'temperatura', 'umidade', 'pressao', 'velocidade_vento', 'direcao_vento',
+    'precipitacao', 'radiacao_solar', 'umidade_solo', 'temperatura_solo',
+    'bateria', 'sinal_lora',
+)
+
+# Séries calculadas a partir de temperatura e umidade
+SERIES_DERIVADAS = {
+    'itu': indice_temperatura_umidade,
+    'ponto_orvalho': ponto_orvalho,
+}
+
+
+def lttb(x, y, max_pontos):
+    """
+    Reduz uma série com Largest-Triangle-Three-Buckets
+
+    O primeiro e o último ponto são mantidos; os demais são divididos em
+    `max_pontos - 2` baldes e de cada balde fica o ponto que forma o maior
+    triângulo com o ponto escolhido no balde anterior e a média do seguinte.
+
+    Args:
+        x (np.ndarray): Abscissas crescentes (ex.: tempo em ms)
+        y (np.ndarray): Valores, sem NaN
+        max_pontos (int): Número máximo de pontos da série reduzida
+
+    Returns:
+        np.ndarray: Índices dos pontos mantidos, em ordem crescente
+    """
+    n = len(x)
+    if max_pontos >= n or max_pontos < 3:
+        return np.arange(n)
+
+    # Limites dos baldes sobre os pontos internos (1 .. n-2)
+    limites = (np.linspace(1, n - 1, max_pontos - 1)).astype(np.int64)
+    inicio, fim = limites[:-1], limites[1:]
+
+    # Médias de cada balde, calculadas de uma vez
+    tamanhos = fim - inicio
+    media_x = np.add.reduceat(x[:n - 1], inicio) / tamanhos
+    media_y = np.add.reduceat(y[:n - 1], inicio) / tamanhos
+    # O "balde seguinte" do último balde é o último ponto
+    proximo_x = np.append(media_x[1:], x[-1])
+    proximo_y = np.append(media_y[1:], y[-1])
+
+    indices = np.empty(max_pontos, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    anterior = 0
+    for i in range(max_pontos - 2):
+        bx = x[inicio[i]:fim[i]]
+        by = y[inicio[i]:fim[i]]
+        # Dobro da área do triângulo (anterior, candidato, média do seguinte)
+        areas = np.abs(
+            (x[anterior] - proximo_x[i]) * (by - y[anterior])
+            - (x[anterior] - bx) * (proximo_y[i] - y[anterior])
+        )
+        anterior = inicio[i] + int(np.argmax(areas))
+        indices[i + 1] = anterior
+    return indices
+
+
+def _carregar_leituras(estacao_id, inicio, fim):
+    """Lê as leituras do intervalo em blocos: (tempos datetime64[ms], matriz de valores)"""
+    colunas = [getattr(LeituraMeteorologica, campo) for campo in CAMPOS_SERIES]
+    consulta = (
+        select(LeituraMeteorologica.data_hora, *colunas)
+        .where(
+            LeituraMeteorologica.estacao_id == estacao_id,
+            LeituraMeteorologica.data_hora >= inicio,
+            LeituraMeteorologica.data_hora <= fim
+        )
+        .order_by(LeituraMeteorologica.data_hora.asc())
+        .execution_options(yield_per=TAMANHO_BLOCO)
+    )
+
+    tempos, valores = [], []
+    for bloco in db.session.execute(consulta).partitions():
+        tempos.append(np.array([linha[0] for linha in bloco], dtype='datetime64[ms]'))
+        # None vira NaN na conversão para float
+        valores.append(np.array([linha[1:] for linha in bloco], dtype=np.float64))
+
+    if not tempos:
+        return np.empty(0, dtype='datetime64[ms]'), np.empty((0, len(CAMPOS_SERIES)))
+    return np.concatenate(tempos), np.concatenate(valores)
+
+
+def obter_series_estacao(estacao_id, inicio, fim, max_pontos=MAX_PONTOS_PADRAO, ultima_leitura=None):
+    """
+    Séries reduzidas das leituras de uma estação em um intervalo
+
+    Args:
+        estacao_id (int): ID da estação
+        inicio (datetime): Início do intervalo (inclusive)
+        fim (datetime): Fim do intervalo (inclusive)
+        max_pontos (int): Pontos máximos por série (limitado a `MAX_PONTOS_LIMITE`)
+        ultima_leitura (datetime): Data da última leitura da estação (resumo);
+            se informada, intervalos recentes são lidos do buffer em memória
+
+    Returns:
+        tuple: (total de leituras no intervalo, dict campo -> {'data_hora': [...],
+        'valores': [...]}; campos sem dados no intervalo são omitidos)
+    """
+    max_pontos = max(3, min(int(max_pontos), MAX_PONTOS_LIMITE))
+    dados = None
+    if ultima_leitura is not None:
+        dados = buffers_estacoes.intervalo(estacao_id, inicio, fim, ultima_leitura, CAMPOS_SERIES)
+    tempos, valores = dados if dados is not None else _carregar_leituras(estacao_id, inicio, fim)
+    x = tempos.astype(np.int64).astype(np.float64)
+
+    temperatura = valores[:, CAMPOS_SERIES.index('temperatura')]
+    umidade = valores[:, CAMPOS_SERIES.index('umidade')]
+    colunas = [valores[:, coluna] for coluna in range(len(CAMPOS_SERIES))]
+    colunas += [calcular(temperatura, umidade) for calcular in SERIES_DERIVADAS.values()]
+
+    series = {}
+    for campo, y in zip(CAMPOS_SERIES + tuple(SERIES_DERIVADAS), colunas):
+        presentes = ~np.isnan(y)
+        if not presentes.any():
+            continue
+        indices = lttb(x[presentes], y[presentes], max_pontos)
+        series[campo] = {
+            'data_hora': np.datetime_as_string(tempos[presentes][indices], unit='s').tolist(),
+            'valores': np.round(y[presentes][indices], 2).tolist()
+        }
+    return len(tempos), series
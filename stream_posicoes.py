@@ -0,0 +1,238 @@
+"""
+Transmissão ao vivo (Server-Sent Events) das posições do rebanho.
+
+Um hub por worker distribui as posições para os clientes conectados. Cada
+cliente tem uma fila limitada que coalesce por animal: entre dois envios
+apenas a posição mais recente de cada animal é mantida, e o cliente recebe
+no máximo uma atualização por animal a cada `MAPA_STREAM_INTERVALO` segundos.
+Se a fila transbordar, o cliente recebe um evento `ressincronizar` e deve
+recarregar `/api/mapa/animais`.
+
+As posições chegam ao hub de duas formas: pelo ouvinte da ingestão (posições
+gravadas pelo próprio worker) e por uma consulta incremental ao banco, feita
+no máximo uma vez por intervalo por worker, independentemente do número de
+clientes, que traz as posições gravadas pelos demais workers.
+
+O hub não cria threads: cada conexão espera em um `threading.Event` próprio.
+O gunicorn roda com workers gevent (Dockerfile e .replit), então cada conexão
+é uma greenlet e milhares de painéis abertos cabem em poucos workers; com
+workers síncronos cada conexão ocuparia um worker inteiro. O stream é
+encerrado após `MAPA_STREAM_DURACAO` segundos e o EventSource do navegador
+reconecta sozinho, o que redistribui as conexões entre os workers.
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app import db
+from ingestao import registrar_ouvinte_posicoes
+from models import Animal
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Mesma folga usada pelo cursor da API do mapa
+MARGEM_SINCRONIZACAO = timedelta(seconds=5)
+
+# Intervalo entre comentários de keep-alive para proxies
+INTERVALO_HEARTBEAT = 15
+
+
+class Assinatura:
+    """Cliente conectado ao stream, com filtros e fila coalescida por animal"""
+
+    def __init__(self, propriedade_id=None, bbox=None, max_pendentes=5000):
+        self.propriedade_id = propriedade_id
+        self.bbox = bbox
+        self.max_pendentes = max_pendentes
+        self.pendentes = {}  # animal_id -> evento mais recente
+        self.visiveis = set()  # animais já enviados dentro do bbox
+        self.transbordou = False
+        self.sinal = threading.Event()
+        self._lock = threading.Lock()
+
+    def _dentro_do_bbox(self, evento):
+        if self.bbox is None:
+            return True
+        lng_min, lat_min, lng_max, lat_max = self.bbox
+        return lng_min <= evento['lng'] <= lng_max and lat_min <= evento['lat'] <= lat_max
+
+    def publicar(self, evento):
+        if self.propriedade_id is not None and evento['propriedade_id'] != self.propriedade_id:
+            return
+
+        id = evento['id']
+        fora = evento.get('removido') or not self._dentro_do_bbox(evento)
+        if fora and self.bbox is not None:
+            # Saiu da área visível: só interessa a quem já recebeu o animal
+            if id not in self.visiveis and id not in self.pendentes:
+                return
+            evento = {'id': id, 'propriedade_id': evento['propriedade_id'], 'removido': True}
+
+        with self._lock:
+            if id not in self.pendentes and len(self.pendentes) >= self.max_pendentes:
+                self.transbordou = True
+            else:
+                self.pendentes[id] = evento
+        self.sinal.set()
+
+    def coletar(self):
+        """Retorna e esvazia a fila: (eventos, transbordou)"""
+        with self._lock:
+            eventos = list(self.pendentes.values())
+            transbordou = self.transbordou
+            self.pendentes = {}
+            self.transbordou = False
+            self.sinal.clear()
+
+        for evento in eventos:
+            if evento.get('removido'):
+                self.visiveis.discard(evento['id'])
+            else:
+                self.visiveis.add(evento['id'])
+        return eventos, transbordou
+
+
+class HubPosicoes:
+    """Distribui eventos de posição para todas as assinaturas do worker"""
+
+    def __init__(self):
+        self.assinaturas = set()
+        self._lock = threading.Lock()
+        self._lock_sincronizacao = threading.Lock()
+        self._ultimo_por_animal = {}  # animal_id -> data_hora já publicada (protegido por _lock)
+        self._cursor = None
+        self._proxima_sincronizacao = 0
+
+    def assinar(self, **filtros):
+        assinatura = Assinatura(**filtros)
+        with self._lock:
+            self.assinaturas.add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._lock:
+            self.assinaturas.discard(assinatura)
+
+    def publicar(self, eventos):
+        """Distribui eventos (formato dos ouvintes de `ingestao` ou do banco)"""
+        mensagens = []
+        with self._lock:
+            if not self.assinaturas:
+                return
+            assinaturas = list(self.assinaturas)
+
+            for evento in eventos:
+                removido = (
+                    evento['status'] != 'Ativo'
+                    or evento['latitude'] is None
+                    or evento['longitude'] is None
+                )
+                id = evento['animal_id']
+                marca = 'removido' if removido else evento['data_hora']
+
+                # Mesma posição pode chegar pelo ouvinte e pela consulta incremental
+                if self._ultimo_por_animal.get(id) == marca:
+                    continue
+                self._ultimo_por_animal[id] = marca
+
+                if removido:
+                    mensagens.append({'id': id, 'propriedade_id': evento['propriedade_id'], 'removido': True})
+                else:
+                    mensagens.append({
+                        'id': id,
+                        'propriedade_id': evento['propriedade_id'],
+                        'codigo': evento['codigo'],
+                        'lat': evento['latitude'],
+                        'lng': evento['longitude'],
+                        'bateria': evento['bateria'],
+                        'data_hora': evento['data_hora'].isoformat() if evento['data_hora'] else None
+                    })
+
+        for mensagem in mensagens:
+            for assinatura in assinaturas:
+                assinatura.publicar(mensagem)
+
+    def sincronizar(self, intervalo):
+        """Consulta incremental ao banco, no máximo uma vez por intervalo"""
+        if not self.assinaturas or time.monotonic() < self._proxima_sincronizacao:
+            return
+        if not self._lock_sincronizacao.acquire(blocking=False):
+            return  # outra conexão já está sincronizando
+        try:
+            inicio = datetime.now()
+            if self._cursor is not None:
+                linhas = db.session.query(
+                    Animal.id, Animal.propriedade_id, Animal.codigo, Animal.status,
+                    Animal.ultima_latitude, Animal.ultima_longitude, Animal.bateria,
+                    Animal.ultima_atualizacao
+                ).filter(db.or_(
+                    Animal.ultima_atualizacao > self._cursor,
+                    Animal.data_alteracao_mapa > self._cursor
+                )).all()
+                db.session.rollback()  # libera a conexão enquanto o stream espera
+
+                self.publicar([{
+                    'animal_id': l.id,
+                    'propriedade_id': l.propriedade_id,
+                    'codigo': l.codigo,
+                    'status': l.status,
+                    'latitude': l.ultima_latitude,
+                    'longitude': l.ultima_longitude,
+                    'bateria': l.bateria,
+                    'data_hora': l.ultima_atualizacao
+                } for l in linhas])
+
+            self._cursor = inicio - MARGEM_SINCRONIZACAO
+            self._proxima_sincronizacao = time.monotonic() + intervalo
+        finally:
+            self._lock_sincronizacao.release()
+
+    def transmitir(self, assinatura, app):
+        """
+        Gera o corpo `text/event-stream` de uma assinatura
+
+        Args:
+            assinatura (Assinatura): Assinatura criada por `assinar`
+            app: Aplicação Flask (para o contexto das consultas incrementais)
+        """
+        intervalo = app.config.get('MAPA_STREAM_INTERVALO', 2)
+        fim = time.monotonic() + app.config.get('MAPA_STREAM_DURACAO', 100)
+        ultimo_envio = 0
+        ultimo_heartbeat = time.monotonic()
+
+        try:
+            yield "retry: 3000\n\n"
+            while time.monotonic() < fim:
+                with app.app_context():
+                    self.sincronizar(intervalo)
+
+                if not assinatura.sinal.wait(timeout=intervalo):
+                    if time.monotonic() - ultimo_heartbeat >= INTERVALO_HEARTBEAT:
+                        ultimo_heartbeat = time.monotonic()
+                        yield ": ping\n\n"
+                    continue
+
+                # Coalescer: no máximo um envio por intervalo
+                espera = ultimo_envio + intervalo - time.monotonic()
+                if espera > 0:
+                    time.sleep(espera)
+
+                eventos, transbordou = assinatura.coletar()
+                ultimo_envio = time.monotonic()
+                ultimo_heartbeat = ultimo_envio
+
+                if transbordou:
+                    yield "event: ressincronizar\ndata: {}\n\n"
+                if eventos:
+                    yield f"event: posicoes\ndata: {json.dumps(eventos)}\n\n"
+        finally:
+            self.cancelar(assinatura)
+
+
+# Hub compartilhado pelas conexões do worker
+hub_posicoes = HubPosicoes()
+registrar_ouvinte_posicoes(hub_posicoes.publicar)
@@ -0,0 +1,208 @@
+"""
+Fila de exportação de relatórios em segundo plano.
+
+Relatórios grandes não rodam mais dentro da requisição: a tarefa é gravada em
+`tarefas_relatorios` e a requisição responde de imediato. A geração roda em
+um pool de threads (`RELATORIOS_WORKERS`) do próprio worker que recebeu o
+pedido. Com workers gevent são threads nativas (`threads_nativas`): o
+trabalho de CPU do xlsxwriter não trava o loop de eventos que atende as
+requisições e os streams do worker. O progresso é gravado a cada bloco de
+linhas, o arquivo fica em `RELATORIOS_DIR` até `data_expiracao` e o usuário
+baixa o resultado quando a tarefa termina.
+
+Pedidos com o mesmo relatório, formato e filtros reaproveitam a tarefa em
+andamento ou o arquivo ainda válido. Uma tarefa periódica remove arquivos
+expirados e retoma tarefas pendentes que ficaram sem executor (por exemplo,
+após o reinício de um worker).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import update
+
+from app import db
+from exportacao_relatorios import escrever_xlsx, gerar_csv, contar_linhas
+from models import TarefaRelatorio
+from threads_nativas import criar_pool_threads
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Tarefas ainda não iniciadas após este tempo são retomadas pela limpeza
+ESPERA_MAXIMA_PENDENTE = timedelta(minutes=2)
+
+# Tarefas em execução há mais que isto são dadas como interrompidas
+ESPERA_MAXIMA_EXECUCAO = timedelta(hours=1)
+
+
+def chave_tarefa(relatorio, formato, filtros):
+    """Identifica pedidos equivalentes (mesmo relatório, formato e filtros)"""
+    bruto = json.dumps([relatorio, formato, filtros], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(bruto.encode()).hexdigest()
+
+
+class FilaRelatorios:
+    """Pool de execução das tarefas de relatório do processo"""
+
+    def __init__(self):
+        self.app = None
+        self._executor = None
+
+    def iniciar(self, app):
+        self.app = app
+        if self._executor is None:
+            self._executor = criar_pool_threads(app.config.get('RELATORIOS_WORKERS', 2), 'relatorio')
+        os.makedirs(app.config['RELATORIOS_DIR'], exist_ok=True)
+
+    def solicitar(self, relatorio, formato, filtros, usuario_id=None):
+        """
+        Enfileira uma exportação, reaproveitando uma tarefa equivalente
+
+        Args:
+            relatorio (str): Nome do relatório em `RELATORIOS`
+            formato (str): 'xlsx' ou 'csv'
+            filtros (dict): Filtros normalizados por `normalizar_filtros`
+            usuario_id (int): Usuário que pediu o relatório
+
+        Returns:
+            tuple: (TarefaRelatorio, se foi criada agora)
+        """
+        chave = chave_tarefa(relatorio, formato, filtros)
+        existente = TarefaRelatorio.query.filter(
+            TarefaRelatorio.chave == chave,
+            db.or_(
+                TarefaRelatorio.status.in_(('Pendente', 'Executando')),
+                db.and_(
+                    TarefaRelatorio.status == 'Concluído',
+                    TarefaRelatorio.data_expiracao > datetime.now()
+                )
+            )
+        ).order_by(TarefaRelatorio.id.desc()).first()
+        if existente:
+            return existente, False
+
+        tarefa = TarefaRelatorio(
+            relatorio=relatorio,
+            formato=formato,
+            filtros=json.dumps(filtros, sort_keys=True),
+            chave=chave,
+            status='Pendente',
+            usuario_id=usuario_id
+        )
+        db.session.add(tarefa)
+        db.session.commit()
+
+        self._submeter(tarefa.id)
+        return tarefa, True
+
+    def _submeter(self, tarefa_id):
+        self._executor.submit(self._executar, tarefa_id)
+
+    def _executar(self, tarefa_id):
+        with self.app.app_context():
+            # Reivindicar a tarefa: apenas um executor passa daqui
+            reivindicada = db.session.execute(
+                update(TarefaRelatorio)
+                .where(TarefaRelatorio.id == tarefa_id, TarefaRelatorio.status == 'Pendente')
+                .values(status='Executando', data_inicio=datetime.now())
+            ).rowcount
+            db.session.commit()
+            if not reivindicada:
+                return
+
+            tarefa = db.session.get(TarefaRelatorio, tarefa_id)
+            filtros = json.loads(tarefa.filtros or '{}')
+            caminho = os.path.join(self.app.config['RELATORIOS_DIR'], f'{tarefa.id}_{tarefa.chave[:12]}.{tarefa.formato}')
+
+            try:
+                tarefa.total_linhas = contar_linhas(tarefa.relatorio, filtros)
+                db.session.commit()
+
+                progresso = lambda linhas: self._registrar_progresso(tarefa_id, linhas)
+                if tarefa.formato == 'csv':
+                    with open(caminho, 'wb') as arquivo:
+                        for bloco in gerar_csv(tarefa.relatorio, filtros, progresso):
+                            arquivo.write(bloco)
+                else:
+                    escrever_xlsx(tarefa.relatorio, filtros, caminho, progresso)
+
+                agora = datetime.now()
+                tarefa.status = 'Concluído'
+                tarefa.linhas_processadas = tarefa.total_linhas
+                tarefa.arquivo = caminho
+                tarefa.nome_arquivo = f'relatorio_{tarefa.relatorio}_{agora.strftime("%Y%m%d_%H%M%S")}.{tarefa.formato}'
+                tarefa.data_conclusao = agora
+                tarefa.data_expiracao = agora + timedelta(hours=self.app.config.get('RELATORIOS_VALIDADE_HORAS', 24))
+                db.session.commit()
+                logger.info(f"Relatório {tarefa.relatorio} #{tarefa.id} gerado ({tarefa.total_linhas} linhas)")
+
+            except Exception as e:
+                db.session.rollback()
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+                db.session.execute(
+                    update(TarefaRelatorio)
+                    .where(TarefaRelatorio.id == tarefa_id)
+                    .values(status='Erro', erro=str(e), data_conclusao=datetime.now())
+                )
+                db.session.commit()
+                logger.error(f"Erro ao gerar relatório #{tarefa_id}: {str(e)}", exc_info=True)
+
+    def _registrar_progresso(self, tarefa_id, linhas):
+        # Conexão própria: um commit na sessão fecharia o cursor do relatório
+        with db.engine.begin() as conn:
+            conn.execute(
+                update(TarefaRelatorio)
+                .where(TarefaRelatorio.id == tarefa_id)
+                .values(linhas_processadas=linhas)
+            )
+
+    def limpar(self):
+        """Remove tarefas expiradas e retoma ou encerra tarefas abandonadas"""
+        agora = datetime.now()
+
+        expiradas = TarefaRelatorio.query.filter(TarefaRelatorio.data_expiracao <= agora).all()
+        for tarefa in expiradas:
+            if tarefa.arquivo and os.path.exists(tarefa.arquivo):
+                os.remove(tarefa.arquivo)
+            db.session.delete(tarefa)
+
+        TarefaRelatorio.query.filter(
+            TarefaRelatorio.status == 'Executando',
+            TarefaRelatorio.data_inicio < agora - ESPERA_MAXIMA_EXECUCAO
+        ).update({'status': 'Erro', 'erro': 'Execução interrompida'}, synchronize_session=False)
+
+        # Tarefas com erro também expiram, liberando um novo pedido igual
+        TarefaRelatorio.query.filter(
+            TarefaRelatorio.status == 'Erro',
+            TarefaRelatorio.data_expiracao == None
+        ).update({'data_expiracao': agora + timedelta(hours=1)}, synchronize_session=False)
+
+        abandonadas = [id for (id,) in db.session.query(TarefaRelatorio.id).filter(
+            TarefaRelatorio.status == 'Pendente',
+            TarefaRelatorio.data_criacao < agora - ESPERA_MAXIMA_PENDENTE
+        )]
+        db.session.commit()
+
+        for tarefa_id in abandonadas:
+            self._submeter(tarefa_id)
+
+        if expiradas or abandonadas:
+            logger.info(f"Relatórios: {len(expiradas)} expirados removidos, {len(abandonadas)} retomados")
+
+
+# Fila única por processo
+fila_relatorios = FilaRelatorios()
+
+
+def init_app(app):
+    app.config.setdefault('RELATORIOS_DIR', os.path.join(tempfile.gettempdir(), 'farmgestor-relatorios'))
+    fila_relatorios.iniciar(app)
+
+    from agendador import agendador
+
+    agendador.agendar('limpeza_relatorios', 5 * 60, fila_relatorios.limpar)
@@ -0,0 +1,143 @@
+"""
+Configuração comum dos testes.
+
+A aplicação é importada com um banco SQLite temporário e sem o agendador de
+tarefas em segundo plano; o banco é populado uma vez por sessão de testes com
+uma propriedade pequena (animais, pesagens, posições, estação e leituras).
+"""
+
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+_DIRETORIO = tempfile.mkdtemp(prefix='farmgestor-testes-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_DIRETORIO, 'testes.db')}"
+os.environ.setdefault('SESSION_SECRET', 'testes')
+os.environ['AGENDADOR_ATIVO'] = '0'
+os.environ['BUFFER_LEITURAS_AQUECER'] = '0'
+os.environ['RELATORIOS_DIR'] = os.path.join(_DIRETORIO, 'relatorios')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jinja2 import ChoiceLoader, FunctionLoader  # noqa: E402
+
+import main  # noqa: E402,F401
+from app import app as aplicacao, db  # noqa: E402
+from models import (  # noqa: E402
+    Animal, Area, Atividade, DispositivoLora, EstacaoMeteorologica, HistoricoLocalizacao,
+    Lote, Propriedade, Raca, RegistroPeso, RegistroSanitario, TarefaRelatorio, Usuario
+)
+
+EMAIL_USUARIO = 'testes@farmgestor.local'
+SENHA_USUARIO = 'testes'
+
+
+def _popular():
+    random.seed(42)
+    agora = datetime.now()
+
+    usuario = Usuario(nome='Testes', email=EMAIL_USUARIO, cargo='Administrador')
+    usuario.set_password(SENHA_USUARIO)
+    propriedade = Propriedade(nome='Fazenda Teste', latitude=-22.9, longitude=-47.06, area_total=100, api_token='token-testes')
+    db.session.add_all([usuario, propriedade])
+    db.session.flush()
+
+    racas = [Raca(nome=f'Raça {i}', especie='Bovino') for i in range(2)]
+    areas = [Area(nome=f'Pasto {i}', tipo='pasto', propriedade_id=propriedade.id) for i in range(2)]
+    lotes = [Lote(nome=f'Lote {i}') for i in range(2)]
+    db.session.add_all(racas + areas + lotes)
+    db.session.flush()
+
+    for i in range(20):
+        animal = Animal(
+            codigo=f'BOV{i:04d}', nome=f'Animal {i}', sexo='MF'[i % 2], peso_atual=300 + i,
+            status='Ativo' if i % 5 else 'Vendido', raca_id=racas[i % 2].id, area_id=areas[i % 2].id,
+            lote_id=lotes[i % 2].id, propriedade_id=propriedade.id,
+            data_nascimento=(agora - timedelta(days=500 + 10 * i)).date()
+        )
+        animal.gerar_dispositivo_lora()
+        animal.ultima_latitude = -22.9 + random.random() * 0.002
+        animal.ultima_longitude = -47.06 + random.random() * 0.002
+        animal.ultima_atualizacao = agora
+        animal.bateria = random.uniform(20, 100)
+        db.session.add(animal)
+        db.session.flush()
+
+        db.session.add(DispositivoLora(device_id=animal.id_dispositivo, animal_id=animal.id, tipo='Brinco', bateria=animal.bateria))
+        for k in range(6):
+            db.session.add(RegistroPeso(
+                animal_id=animal.id, peso=200 + 25 * k + i + random.random(),
+                data_pesagem=agora - timedelta(days=30 * (6 - k))
+            ))
+        for k in range(12):
+            db.session.add(HistoricoLocalizacao(
+                animal_id=animal.id, device_id=animal.id_dispositivo,
+                latitude=animal.ultima_latitude + random.random() * 0.0002,
+                longitude=animal.ultima_longitude + random.random() * 0.0002,
+                data_hora=agora - timedelta(minutes=30 * k), bateria=animal.bateria
+            ))
+        db.session.add(RegistroSanitario(
+            animal_id=animal.id, tipo='Vacinação', produto='Aftosa', dose=5, unidade_dose='ml',
+            data_aplicacao=agora - timedelta(days=170), data_proxima=(agora + timedelta(days=i)).date()
+        ))
+
+    for i in range(4):
+        db.session.add(Atividade(
+            tipo='Manejo', descricao=f'Atividade {i}', data_inicio=agora, status='Planejada',
+            propriedade_id=propriedade.id, area_id=areas[i % 2].id
+        ))
+    db.session.add(TarefaRelatorio(relatorio='animais', formato='csv', chave='testes', status='Pendente'))
+
+    estacao = EstacaoMeteorologica(
+        nome='Estação Teste', codigo='EST-TESTE', propriedade_id=propriedade.id,
+        latitude=-22.9, longitude=-47.06
+    )
+    db.session.add(estacao)
+    db.session.commit()
+
+    from leituras_estacoes import registrar_leitura_estacao
+    for i in range(96, 0, -1):
+        registrar_leitura_estacao(estacao, {
+            'temperatura': 20 + 10 * random.random(),
+            'umidade': 50 + 40 * random.random(),
+            'precipitacao': random.random(),
+            'bateria': 90.0
+        }, data_hora=agora - timedelta(minutes=15 * i), commit=False)
+    db.session.commit()
+
+    from contatos_animais import recalcular_contatos
+    from estresse_termico import recalcular_estresse_termico
+    from previsao_baterias import recalcular_previsoes_baterias
+    from previsao_crescimento import recalcular_previsoes
+    from regras_alertas import criar_regras_padrao
+    criar_regras_padrao()
+    recalcular_previsoes()
+    recalcular_previsoes_baterias()
+    recalcular_estresse_termico(agora.date() - timedelta(days=2), agora.date())
+    recalcular_contatos(agora.date() - timedelta(days=1), agora.date())
+    db.session.commit()
+
+
+@pytest.fixture(scope='session')
+def app():
+    aplicacao.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    # Os templates HTML não fazem parte do orçamento: os ausentes renderizam vazio
+    aplicacao.jinja_loader = ChoiceLoader([aplicacao.jinja_loader, FunctionLoader(lambda nome: '')])
+    with aplicacao.app_context():
+        db.drop_all()
+        db.create_all()
+        _popular()
+    return aplicacao
+
+
+@pytest.fixture
+def cliente(app):
+    """Cliente de testes com o usuário de testes logado"""
+    with app.test_client() as cliente:
+        resposta = cliente.post('/login', data={'email': EMAIL_USUARIO, 'senha': SENHA_USUARIO})
+        assert resposta.status_code == 302
+        yield cliente
@@ -0,0 +1,65 @@
+"""
+Leitura em fluxo de polígonos KML: nomes e cores por estilo inline,
+compartilhado (`Style`, declarado antes ou depois do Placemark) e `StyleMap`.
+"""
+
+import io
+
+from importacao_kml import ler_poligonos
+
+_ANEL = """<Polygon><outerBoundaryIs><LinearRing><coordinates>
+-47.06,-22.9 -47.05,-22.9 -47.05,-22.89 -47.06,-22.9
+</coordinates></LinearRing></outerBoundaryIs></Polygon>"""
+
+
+def _estilo(cor, id=None):
+    atributo = f' id="{id}"' if id else ''
+    return f'<Style{atributo}><PolyStyle><color>{cor}</color></PolyStyle></Style>'
+
+
+def _ler(*elementos):
+    kml = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>'
+        + ''.join(elementos) +
+        '</Document></kml>'
+    )
+    return {poligono['nome']: poligono['cor'] for poligono in ler_poligonos(io.BytesIO(kml.encode()))}
+
+
+def test_estilo_inline():
+    cores = _ler(
+        f'<Placemark><name>Sem id</name>{_estilo("ff0000ff")}{_ANEL}</Placemark>',
+        f'<Placemark><name>Com id</name>{_estilo("ff00ff00", "inline")}{_ANEL}</Placemark>',
+    )
+    assert cores == {'Sem id': '#ff0000', 'Com id': '#00ff00'}
+
+
+def test_estilo_compartilhado_antes_e_depois():
+    cores = _ler(
+        _estilo('ffff0000', 'antes'),
+        f'<Placemark><name>Antes</name><styleUrl>#antes</styleUrl>{_ANEL}</Placemark>',
+        f'<Placemark><name>Depois</name><styleUrl>#depois</styleUrl>{_ANEL}</Placemark>',
+        _estilo('ff00ffff', 'depois'),
+    )
+    assert cores == {'Antes': '#0000ff', 'Depois': '#ffff00'}
+
+
+def test_style_map():
+    cores = _ler(
+        _estilo('ff0000ff', 'normal'),
+        _estilo('ff00ff00', 'destaque'),
+        '<StyleMap id="mapa">'
+        '<Pair><key>normal</key><styleUrl>#normal</styleUrl></Pair>'
+        '<Pair><key>highlight</key><styleUrl>#destaque</styleUrl></Pair>'
+        '</StyleMap>',
+        f'<StyleMap id="mapa_inline"><Pair><key>normal</key>{_estilo("ffff0000", "par")}</Pair></StyleMap>',
+        f'<Placemark><name>Mapa</name><styleUrl>#mapa</styleUrl>{_ANEL}</Placemark>',
+        f'<Placemark><name>Mapa inline</name><styleUrl>#mapa_inline</styleUrl>{_ANEL}</Placemark>',
+    )
+    assert cores == {'Mapa': '#ff0000', 'Mapa inline': '#0000ff'}
+
+
+def test_sem_estilo():
+    cores = _ler(f'<Placemark>{_ANEL}</Placemark>', f'<Placemark><styleUrl>#inexistente</styleUrl>{_ANEL}</Placemark>')
+    assert cores == {'Área 1': None, 'Área 2': None}
@@ -0,0 +1,87 @@
+"""
+Orçamento de consultas de todas as rotas que declaram `orcamento_consultas`.
+
+Cada rota é executada com o usuário de testes logado (o carregamento do
+usuário entra na contagem, como no decorador em tempo de execução). Uma rota
+nova com orçamento precisa ser incluída em `ROTAS`.
+"""
+
+import io
+from datetime import date, timedelta
+
+import pytest
+
+from indice_posicoes import mercator
+from orcamento_consultas import verificar_orcamento
+
+_hoje = date.today()
+_x, _y = mercator(-47.059, -22.899)
+_TILE = f'16/{int(_x * 2 ** 16)}/{int(_y * 2 ** 16)}'
+
+_KML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2"><Document>
+<Placemark><name>Pasto importado</name><Polygon><outerBoundaryIs><LinearRing><coordinates>
+-47.06,-22.9 -47.05,-22.9 -47.05,-22.89 -47.06,-22.9
+</coordinates></LinearRing></outerBoundaryIs></Polygon></Placemark>
+</Document></kml>"""
+
+
+def _kml():
+    return {'data': {'kmlFile': (io.BytesIO(_KML), 'areas.kml'), 'propriedade_id': '1'}}
+
+
+# endpoint -> (método, URL, argumentos do cliente)
+ROTAS = {
+    'dashboard': ('GET', '/dashboard', {}),
+    'listar_animais': ('GET', '/animais', {}),
+    'api_listar_animais': ('GET', '/api/animais?status=Ativo', {}),
+    'api_analise_ganho_peso': ('GET', '/api/analise/ganho-peso?agrupar=lote', {}),
+    'api_ganho_peso_animal': ('GET', '/api/animais/2/ganho-peso', {}),
+    'api_trilha_animal': ('GET', '/api/animais/2/trilha', {}),
+    'api_trilhas_animais': ('GET', '/api/trilhas?lote_id=1', {}),
+    'api_contatos_animal': ('GET', '/api/animais/2/contatos?niveis=3', {}),
+    'api_contatos_registro_sanitario': ('GET', '/api/sanitario/2/contatos?niveis=3', {}),
+    'api_previsao_lotes': ('GET', '/api/lotes/previsao?peso_alvo=500', {}),
+    'api_previsao_lote': ('GET', '/api/lotes/1/previsao?peso_alvo=500', {}),
+    'api_substituicao_baterias': ('GET', '/api/baterias/substituicao', {}),
+    'api_dispositivos_offline': ('GET', '/api/dispositivos/offline', {}),
+    'api_disponibilidade_dispositivos': ('GET', '/api/dispositivos/disponibilidade', {}),
+    'api_agenda_sanitaria': ('GET', f'/api/sanitario/agenda?fim={_hoje + timedelta(days=30)}', {}),
+    'api_campanha_sanitaria': ('GET', '/api/sanitario/campanha?produto=Aftosa', {}),
+    'mapa_propriedade': ('GET', '/mapa', {}),
+    'api_mapa_calor': ('GET', f'/api/mapa/calor/{_TILE}.json?propriedade_id=1', {}),
+    'importar_areas_kml': ('POST', '/api/areas/importar', _kml),
+    'exportar_areas_geo': ('GET', '/api/exportar/areas?formato=kmz', {}),
+    'exportar_trilhas_geo': ('GET', '/api/exportar/trilhas?formato=geojson', {}),
+    'api_mapa_animais': ('GET', '/api/mapa/animais', {}),
+    'api_mapa_animais_clusters': ('GET', '/api/mapa/animais/clusters?zoom=12&bbox=-47.1,-22.95,-47.0,-22.85', {}),
+    'listar_atividades': ('GET', '/atividades', {}),
+    'api_tarefa_relatorio': ('GET', '/api/relatorios/tarefas/1', {}),
+    'gerar_relatorio_animais': ('POST', '/relatorios/animais', {'data': {'status': 'Todos', 'formato': 'csv'}}),
+    'gerar_relatorio_atividades': ('POST', '/relatorios/atividades', {'data': {'formato': 'csv'}}),
+    'api_dashboard_dados': ('GET', '/api/dashboard/dados', {}),
+    'listar_estacoes': ('GET', '/estacoes-meteorologicas', {}),
+    'detalhes_estacao': ('GET', '/estacoes-meteorologicas/1', {}),
+    'api_regras_alertas': ('GET', '/api/regras-alertas', {}),
+    'api_estacao_leituras': ('GET', '/api/estacao/1/leituras?periodo=24h', {}),
+    'api_estacao_recentes': ('GET', '/api/estacao/1/recentes', {}),
+    'api_estresse_termico_estacoes': ('GET', '/api/estresse-termico/estacoes', {}),
+    'api_estresse_termico_animais': ('GET', '/api/estresse-termico/animais', {}),
+}
+
+
+def test_todas_as_rotas_com_orcamento_sao_verificadas(app):
+    declaradas = {
+        endpoint for endpoint, view in app.view_functions.items()
+        if getattr(view, 'orcamento_consultas', None) is not None
+    }
+    assert declaradas == set(ROTAS)
+
+
+@pytest.mark.parametrize('endpoint', sorted(ROTAS))
+def test_orcamento_consultas(cliente, endpoint):
+    metodo, url, argumentos = ROTAS[endpoint]
+    if callable(argumentos):
+        argumentos = argumentos()
+    resposta = verificar_orcamento(cliente, url, metodo, **argumentos)
+    assert resposta.status_code < 500
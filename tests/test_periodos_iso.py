@@ -0,0 +1,37 @@
+"""
+Períodos em ISO 8601 com fuso horário (`Z`, `+00:00`) nas APIs de séries:
+convertidos para a hora local, nunca comparados com datas sem fuso (500).
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+_INICIO = (datetime.now(timezone.utc) - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S')
+_FIM = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+ROTAS = ('/api/estacao/1/leituras', '/api/animais/2/trilha', '/api/trilhas?lote_id=1')
+
+
+def _url(rota, **parametros):
+    separador = '&' if '?' in rota else '?'
+    return rota + separador + '&'.join(f'{nome}={valor}' for nome, valor in parametros.items())
+
+
+@pytest.mark.parametrize('rota', ROTAS)
+def test_start_com_fuso_sem_end(cliente, rota):
+    resposta = cliente.get(_url(rota, start=_INICIO + 'Z'))
+    assert resposta.status_code == 200
+    assert datetime.fromisoformat(resposta.get_json()['start' if 'trilha' in rota else 'inicio']).tzinfo is None
+
+
+@pytest.mark.parametrize('rota', ROTAS)
+def test_start_e_end_com_fuso(cliente, rota):
+    resposta = cliente.get(_url(rota, start=_INICIO + '%2B00:00', end=_FIM + 'Z'))
+    assert resposta.status_code == 200
+
+
+@pytest.mark.parametrize('rota', ROTAS)
+def test_fusos_com_start_posterior_ao_end(cliente, rota):
+    resposta = cliente.get(_url(rota, start=_FIM + 'Z', end=_INICIO + '-03:00'))
+    assert resposta.status_code == 400
@@ -0,0 +1,66 @@
+"""
+Threads do sistema operacional para o trabalho em segundo plano.
+
+Com workers gevent do gunicorn o processo passa pelo `monkey.patch_all()`:
+`threading.Thread` e `ThreadPoolExecutor` viram greenlets no loop de eventos
+do worker. Um trabalho que usa CPU (NumPy, xlsxwriter, listas de INSERT)
+nunca cede esse loop e trava todas as requisições e streams do worker até
+terminar, inclusive o aviso de vida ao gunicorn (que encerra o worker após
+`timeout`).
+
+Neste caso as tarefas agendadas e os relatórios rodam em threads nativas do
+gevent (`gevent.threadpool`): o loop segue atendendo as conexões enquanto a
+thread trabalha, alternando com ela pelo GIL. Fora do gevent (servidor de
+desenvolvimento, workers sync ou testes) são usadas as classes padrão.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+def gevent_ativo():
+    """Se o processo está sob o monkey patch do gevent"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def executar_em_thread(funcao, *args):
+    """
+    Executa `funcao` em uma thread nativa e aguarda o resultado
+
+    Sob o gevent a espera cede o loop de eventos (só a greenlet chamadora
+    aguarda); fora dele a função roda direto na thread atual.
+    """
+    if not gevent_ativo():
+        return funcao(*args)
+    from gevent import get_hub
+    return get_hub().threadpool.apply(funcao, args)
+
+
+def criar_pool_threads(max_workers, prefixo):
+    """
+    `ThreadPoolExecutor` com threads nativas mesmo sob o gevent
+
+    O pool do gevent só pode ser usado da thread do seu hub; pedidos vindos
+    de outra thread nativa (uma tarefa agendada, por exemplo) são repassados
+    ao hub e `submit` retorna None.
+    """
+    if not gevent_ativo():
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=prefixo)
+
+    from gevent import get_hub
+    from gevent.threadpool import ThreadPoolExecutor as ThreadPoolNativo
+
+    hub = get_hub()
+
+    class PoolThreadsNativas(ThreadPoolNativo):
+        def submit(self, funcao, *args, **kwargs):
+            if get_hub() is hub:
+                return super().submit(funcao, *args, **kwargs)
+            hub.loop.run_callback_threadsafe(partial(super().submit, funcao, *args, **kwargs))
+            return None
+
+    return PoolThreadsNativas(max_workers=max_workers)
@@ -0,0 +1,172 @@
+"""
+Trilhas dos animais para reprodução no mapa, em formato compacto.
+
+As posições de `HistoricoLocalizacao` são lidas como tuplas (sem objetos
+ORM) por um cursor em ordem de animal e data, pelo índice
+(animal_id, data_hora), e cada trilha é:
+
+1. simplificada por Douglas-Peucker com a tolerância pedida, em metros
+   (projeção equirretangular local), mantendo a primeira e a última posição;
+2. codificada como polilinha (algoritmo do Google: diferenças entre pontos
+   consecutivos em inteiros de 1e-5 grau, zigue-zague e blocos de 5 bits),
+   decodificável por Leaflet/Google Maps e bibliotecas comuns;
+3. acompanhada dos horários de cada ponto, codificados do mesmo modo: o
+   primeiro horário em segundos e as diferenças em segundos entre pontos.
+
+Cada posição ocupa tipicamente 6 a 10 caracteres (coordenadas e horário),
+contra 60 a 80 de um ponto GeoJSON com horário.
+"""
+
+import math
+from itertools import groupby
+
+import numpy as np
+from sqlalchemy import select
+
+from app import db
+from exportacao_relatorios import TAMANHO_BLOCO
+from models import HistoricoLocalizacao
+
+# Casas decimais das coordenadas na polilinha (padrão do formato)
+PRECISAO_POLILINHA = 5
+
+# Tolerância padrão da simplificação, em metros (0 desativa)
+TOLERANCIA_PADRAO = 5.0
+
+# Raio médio da Terra, em metros
+RAIO_TERRA = 6371008.8
+
+_EPOCA = np.datetime64('1970-01-01T00:00:00', 's')
+
+
+def codificar_inteiros(valores):
+    """
+    Codifica inteiros no formato de polilinha (zigue-zague e blocos de 5 bits)
+
+    Args:
+        valores (np.ndarray): Inteiros já em diferenças
+
+    Returns:
+        str: Texto ASCII (caracteres 63 a 126)
+    """
+    valores = np.asarray(valores, dtype=np.int64)
+    if not len(valores):
+        return ''
+    zigue = ((valores << 1) ^ (valores >> 63)).astype(np.uint64)
+
+    # Blocos de 5 bits de cada valor, do menos para o mais significativo
+    deslocados = zigue[:, None] >> (np.arange(13, dtype=np.uint64) * np.uint64(5))
+    quantidade = np.maximum(1, (deslocados > 0).sum(axis=1))
+    colunas = np.arange(13)
+    continua = colunas < (quantidade - 1)[:, None]
+    caracteres = (deslocados & np.uint64(31)) + np.where(continua, 0x20, 0).astype(np.uint64) + np.uint64(63)
+    return caracteres[colunas < quantidade[:, None]].astype(np.uint8).tobytes().decode('ascii')
+
+
+def codificar_polilinha(latitudes, longitudes, precisao=PRECISAO_POLILINHA):
+    """Codifica as coordenadas como polilinha (pares lat, lng em diferenças)"""
+    fator = 10 ** precisao
+    pontos = np.empty((len(latitudes), 2), dtype=np.int64)
+    pontos[:, 0] = np.round(np.asarray(latitudes) * fator)
+    pontos[:, 1] = np.round(np.asarray(longitudes) * fator)
+    diferencas = np.diff(pontos, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    return codificar_inteiros(diferencas.ravel())
+
+
+def simplificar(latitudes, longitudes, tolerancia):
+    """
+    Índices dos pontos mantidos pela simplificação de Douglas-Peucker
+
+    Args:
+        latitudes, longitudes (np.ndarray): Trilha em ordem de data
+        tolerancia (float): Distância máxima, em metros, de um ponto
+            descartado à trilha simplificada
+
+    Returns:
+        np.ndarray: Índices mantidos, em ordem
+    """
+    total = len(latitudes)
+    if total <= 2 or tolerancia <= 0:
+        return np.arange(total)
+
+    escala = math.pi / 180 * RAIO_TERRA
+    y = np.asarray(latitudes) * escala
+    x = np.asarray(longitudes) * escala * math.cos(math.radians(float(np.mean(latitudes))))
+
+    manter = np.zeros(total, dtype=bool)
+    manter[0] = manter[-1] = True
+    pilha = [(0, total - 1)]
+    while pilha:
+        inicio, fim = pilha.pop()
+        if fim - inicio < 2:
+            continue
+        dx, dy = x[fim] - x[inicio], y[fim] - y[inicio]
+        px, py = x[inicio + 1:fim] - x[inicio], y[inicio + 1:fim] - y[inicio]
+        comprimento = dx * dx + dy * dy
+        if comprimento > 0:
+            # Distância ao segmento (projeção limitada às extremidades)
+            t = np.clip((px * dx + py * dy) / comprimento, 0, 1)
+            distancias = np.hypot(px - t * dx, py - t * dy)
+        else:
+            distancias = np.hypot(px, py)
+
+        maior = int(np.argmax(distancias))
+        if distancias[maior] > tolerancia:
+            meio = inicio + 1 + maior
+            manter[meio] = True
+            pilha.append((inicio, meio))
+            pilha.append((meio, fim))
+    return np.flatnonzero(manter)
+
+
+def _codificar_trilha(tempos, latitudes, longitudes, tolerancia):
+    indices = simplificar(latitudes, longitudes, tolerancia)
+    segundos = (tempos[indices] - _EPOCA).astype(np.int64)
+    return {
+        'inicio': str(tempos[0]),
+        'fim': str(tempos[-1]),
+        'pontos_originais': len(tempos),
+        'pontos': len(indices),
+        'polilinha': codificar_polilinha(latitudes[indices], longitudes[indices]),
+        'tempos': codificar_inteiros(np.diff(segundos, prepend=0)),
+    }
+
+
+def obter_trilhas(animal_ids, inicio, fim, tolerancia=TOLERANCIA_PADRAO):
+    """
+    Trilhas codificadas de um ou mais animais no período
+
+    Args:
+        animal_ids (list): Animais
+        inicio, fim (datetime): Período das posições (inclusivo)
+        tolerancia (float): Tolerância da simplificação, em metros
+
+    Returns:
+        dict: animal_id -> trilha (`inicio`, `fim`, `pontos_originais`,
+        `pontos`, `polilinha` e `tempos`); animais sem posições no período
+        não aparecem
+    """
+    if not animal_ids:
+        return {}
+
+    consulta = select(
+        HistoricoLocalizacao.animal_id, HistoricoLocalizacao.data_hora,
+        HistoricoLocalizacao.latitude, HistoricoLocalizacao.longitude
+    ).where(
+        HistoricoLocalizacao.animal_id.in_(animal_ids),
+        HistoricoLocalizacao.data_hora >= inicio,
+        HistoricoLocalizacao.data_hora <= fim
+    ).order_by(HistoricoLocalizacao.animal_id, HistoricoLocalizacao.data_hora)
+
+    linhas = (
+        linha for bloco in db.session.execute(consulta.execution_options(yield_per=TAMANHO_BLOCO)).partitions()
+        for linha in bloco
+    )
+    trilhas = {}
+    for animal_id, posicoes in groupby(linhas, key=lambda linha: linha[0]):
+        posicoes = list(posicoes)
+        tempos = np.array([p[1] for p in posicoes], dtype='datetime64[s]')
+        latitudes = np.fromiter((p[2] for p in posicoes), dtype=np.float64, count=len(posicoes))
+        longitudes = np.fromiter((p[3] for p in posicoes), dtype=np.float64, count=len(posicoes))
+        trilhas[animal_id] = _codificar_trilha(tempos, latitudes, longitudes, tolerancia)
+    return trilhas